@@ -0,0 +1,91 @@
+"""add multi factor compact storage
+
+Revision ID: 3bd59d34dacc
+Revises: be1853ad7a6b
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3bd59d34dacc'
+down_revision: Union[str, Sequence[str], None] = 'be1853ad7a6b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+NEW_COLUMNS = ['storage_mode', 'input_id', 'scores_blob', 'stock_count', 'top_symbols', 'score_summary']
+
+multi_factor_scores = sa.table(
+    'multi_factor_scores',
+    sa.column('storage_mode', sa.String),
+)
+
+
+def _score_columns() -> set:
+    """multi_factor_scores 由 init_db 建表，未建表时返回空集合"""
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('multi_factor_scores'):
+        return set()
+    return {column['name'] for column in inspector.get_columns('multi_factor_scores')}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if not sa.inspect(op.get_bind()).has_table('multi_factor_inputs'):
+        op.create_table('multi_factor_inputs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('content_hash', sa.String(length=64), nullable=False, comment='输入内容SHA-256哈希'),
+        sa.Column('stock_count', sa.Integer(), nullable=True, comment='股票数量'),
+        sa.Column('stocks_data', sa.LargeBinary(), nullable=False, comment='压缩后的股票因子数据'),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True, comment='创建时间'),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index(op.f('ix_multi_factor_inputs_id'), 'multi_factor_inputs', ['id'], unique=False)
+        op.create_index(op.f('ix_multi_factor_inputs_content_hash'), 'multi_factor_inputs', ['content_hash'], unique=True)
+
+    columns = _score_columns()
+    if not columns or 'storage_mode' in columns:
+        return
+    with op.batch_alter_table('multi_factor_scores') as batch_op:
+        batch_op.add_column(sa.Column('storage_mode', sa.String(length=10), nullable=True, comment='存储模式(full/compact)'))
+        batch_op.add_column(sa.Column('input_id', sa.Integer(), nullable=True, comment='去重后的输入数据ID'))
+        batch_op.add_column(sa.Column('scores_blob', sa.LargeBinary(), nullable=True, comment='压缩后的列式股票评分(compact模式)'))
+        batch_op.add_column(sa.Column('stock_count', sa.Integer(), nullable=True, comment='评分股票数量'))
+        batch_op.add_column(sa.Column('top_symbols', sa.JSON(), nullable=True, comment='排名靠前的股票代码'))
+        batch_op.add_column(sa.Column('score_summary', sa.JSON(), nullable=True, comment='评分分布摘要'))
+        # compact 模式不再逐股保存输入与评分
+        batch_op.alter_column('stocks_data', existing_type=sa.JSON(), nullable=True,
+                              existing_comment='股票因子数据', comment='股票因子数据(full模式)')
+        batch_op.alter_column('stock_scores', existing_type=sa.JSON(), nullable=True,
+                              existing_comment='股票评分列表', comment='股票评分列表(full模式)')
+        batch_op.create_index(batch_op.f('ix_multi_factor_scores_input_id'), ['input_id'], unique=False)
+        batch_op.create_foreign_key(
+            'fk_multi_factor_scores_input_id_multi_factor_inputs', 'multi_factor_inputs', ['input_id'], ['id']
+        )
+    # 已有评分均为逐股JSON存储
+    op.execute(multi_factor_scores.update().values(storage_mode='full'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    columns = _score_columns()
+    if 'storage_mode' in columns:
+        # compact 模式的评分没有逐股数据，无法还原为非空列
+        op.execute(sa.text("DELETE FROM multi_factor_scores WHERE storage_mode = 'compact'"))
+        with op.batch_alter_table('multi_factor_scores') as batch_op:
+            batch_op.drop_constraint('fk_multi_factor_scores_input_id_multi_factor_inputs', type_='foreignkey')
+            batch_op.drop_index(batch_op.f('ix_multi_factor_scores_input_id'))
+            batch_op.alter_column('stock_scores', existing_type=sa.JSON(), nullable=False,
+                                  existing_comment='股票评分列表(full模式)', comment='股票评分列表')
+            batch_op.alter_column('stocks_data', existing_type=sa.JSON(), nullable=False,
+                                  existing_comment='股票因子数据(full模式)', comment='股票因子数据')
+            for column in reversed(NEW_COLUMNS):
+                batch_op.drop_column(column)
+    if sa.inspect(op.get_bind()).has_table('multi_factor_inputs'):
+        op.drop_index(op.f('ix_multi_factor_inputs_content_hash'), table_name='multi_factor_inputs')
+        op.drop_index(op.f('ix_multi_factor_inputs_id'), table_name='multi_factor_inputs')
+        op.drop_table('multi_factor_inputs')
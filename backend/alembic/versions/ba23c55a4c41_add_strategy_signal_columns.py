@@ -0,0 +1,62 @@
+"""add strategy signal columns
+
+Revision ID: ba23c55a4c41
+Revises: 3bd59d34dacc
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'ba23c55a4c41'
+down_revision: Union[str, Sequence[str], None] = '3bd59d34dacc'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _columns(table_name: str) -> set:
+    """信号表由 init_db 建表，未建表时返回空集合"""
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table(table_name):
+        return set()
+    return {column['name'] for column in inspector.get_columns(table_name)}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    columns = _columns('macro_timing_signals')
+    if columns and 'dedup_key' not in columns:
+        # 已有信号没有去重键（NULL 不参与唯一约束），只对新写入的信号去重
+        with op.batch_alter_table('macro_timing_signals') as batch_op:
+            batch_op.add_column(sa.Column('input_hash', sa.String(length=64), nullable=True, comment='输入参数哈希'))
+            batch_op.add_column(sa.Column('dedup_key', sa.String(length=64), nullable=True, comment='同一输入每日唯一键'))
+            batch_op.create_index(batch_op.f('ix_macro_timing_signals_input_hash'), ['input_hash'], unique=False)
+            batch_op.create_unique_constraint('uq_macro_timing_signals_dedup_key', ['dedup_key'])
+
+    columns = _columns('sector_rotation_signals')
+    if columns and 'signal_source' not in columns:
+        # 已有信号均由手工输入的行业评分生成，以服务端默认值回填
+        with op.batch_alter_table('sector_rotation_signals') as batch_op:
+            batch_op.add_column(sa.Column(
+                'signal_source', sa.String(length=20), server_default='manual', nullable=True,
+                comment='信号来源：manual(手工输入评分)/price_history(行情聚合)'
+            ))
+            batch_op.create_index(batch_op.f('ix_sector_rotation_signals_signal_source'), ['signal_source'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if 'signal_source' in _columns('sector_rotation_signals'):
+        with op.batch_alter_table('sector_rotation_signals') as batch_op:
+            batch_op.drop_index(batch_op.f('ix_sector_rotation_signals_signal_source'))
+            batch_op.drop_column('signal_source')
+    if 'dedup_key' in _columns('macro_timing_signals'):
+        with op.batch_alter_table('macro_timing_signals') as batch_op:
+            batch_op.drop_constraint('uq_macro_timing_signals_dedup_key', type_='unique')
+            batch_op.drop_index(batch_op.f('ix_macro_timing_signals_input_hash'))
+            batch_op.drop_column('dedup_key')
+            batch_op.drop_column('input_hash')
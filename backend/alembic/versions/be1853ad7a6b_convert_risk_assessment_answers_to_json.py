@@ -0,0 +1,79 @@
+"""convert risk assessment answers to json
+
+Revision ID: be1853ad7a6b
+Revises: 35c33444a862
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'be1853ad7a6b'
+down_revision: Union[str, Sequence[str], None] = '35c33444a862'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 以文本读写答案，转换不依赖列类型
+risk_assessments = sa.table(
+    'risk_assessments',
+    sa.column('id', sa.Integer),
+    sa.column('answers', sa.Text),
+)
+
+
+def _has_table() -> bool:
+    """risk_assessments 由 init_db 建表，未建表的数据库跳过本次迁移"""
+    return sa.inspect(op.get_bind()).has_table('risk_assessments')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if not _has_table():
+        return
+    # 原文本列由接口以 json.dumps 写入；无法解析的历史值编码为JSON字符串保留，重新评分时计为无效答卷
+    bind = op.get_bind()
+    invalid = []
+    for assessment_id, answers in bind.execute(
+        sa.select(risk_assessments.c.id, risk_assessments.c.answers).where(risk_assessments.c.answers.isnot(None))
+    ):
+        try:
+            json.loads(answers)
+        except ValueError:
+            invalid.append({'assessment_id': assessment_id, 'answers': json.dumps(answers, ensure_ascii=False)})
+    if invalid:
+        bind.execute(risk_assessments.update().where(
+            risk_assessments.c.id == sa.bindparam('assessment_id')
+        ).values(answers=sa.bindparam('answers')), invalid)
+
+    with op.batch_alter_table('risk_assessments') as batch_op:
+        batch_op.alter_column(
+            'answers', existing_type=sa.Text(), type_=sa.JSON(), existing_nullable=True,
+            postgresql_using='answers::json'
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if not _has_table():
+        return
+    with op.batch_alter_table('risk_assessments') as batch_op:
+        batch_op.alter_column(
+            'answers', existing_type=sa.JSON(), type_=sa.Text(), existing_nullable=True,
+            postgresql_using='answers::text'
+        )
+    # 还原升级时编码为JSON字符串的历史值
+    bind = op.get_bind()
+    restored = []
+    for assessment_id, answers in bind.execute(
+        sa.select(risk_assessments.c.id, risk_assessments.c.answers).where(risk_assessments.c.answers.like('"%'))
+    ):
+        restored.append({'assessment_id': assessment_id, 'answers': json.loads(answers)})
+    if restored:
+        bind.execute(risk_assessments.update().where(
+            risk_assessments.c.id == sa.bindparam('assessment_id')
+        ).values(answers=sa.bindparam('answers')), restored)
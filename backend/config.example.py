@@ -26,5 +26,13 @@ API_KEYS = {
     "tushare": "your-tushare-token"
 }
 
+# 每日策略运行配置（收盘后在进程内调度；多进程部署时只在一个进程中启用）
+DAILY_RUN_CONFIG = {
+    "enabled": False,
+    "run_time": "15:30",  # 收盘后开始运行的时间
+    "window_minutes": 60,  # 全部策略须在该时间窗口内完成
+    "max_workers": 4  # 并行运行的策略数
+}
+
 # 日志配置
 LOG_LEVEL = "INFO" 
\ No newline at end of file
@@ -33,6 +33,14 @@ API_KEYS: Dict[str, Any] = {
     "tushare": os.getenv("TUSHARE_TOKEN", "")
 }
 
+# 每日策略运行配置（收盘后在进程内调度；多进程部署时只在一个进程中启用）
+DAILY_RUN_CONFIG = {
+    "enabled": os.getenv("DAILY_RUN_ENABLED", "False").lower() in ("true", "1", "t"),
+    "run_time": os.getenv("DAILY_RUN_TIME", "15:30"),  # 收盘后开始运行的时间
+    "window_minutes": int(os.getenv("DAILY_RUN_WINDOW_MINUTES", "60")),  # 全部策略须在该时间窗口内完成
+    "max_workers": int(os.getenv("DAILY_RUN_MAX_WORKERS", "4"))  # 并行运行的策略数
+}
+
 # 日志配置
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 
@@ -0,0 +1,54 @@
+"""
+测试公共夹具
+各测试模块使用独立的 SQLite 数据库，模块级测试客户端在运行期间覆盖应用的数据库依赖
+"""
+import os
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from main import app
+from database import get_db, Base
+
+
+def sqlite_test_client(filename: str, name: str = "client", **connect_args):
+    """
+    创建模块独立的测试数据库
+
+    Args:
+        filename: 数据库文件名（位于当前目录，模块测试结束后删除）
+        name: 返回的测试客户端夹具名称
+        connect_args: 额外的 SQLite 连接参数（如 timeout）
+
+    Returns:
+        (engine, 会话工厂, 模块级测试客户端夹具)，夹具需赋值给测试模块中的同名变量
+    """
+    engine = create_engine(f"sqlite:///./{filename}", connect_args={"check_same_thread": False, **connect_args})
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def override_get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @pytest.fixture(scope="module", name=name)
+    def client():
+        Base.metadata.create_all(bind=engine)
+        previous_override = app.dependency_overrides.get(get_db)
+        app.dependency_overrides[get_db] = override_get_db
+        with TestClient(app) as c:
+            yield c
+        # 恢复其他测试模块设置的数据库依赖
+        if previous_override is not None:
+            app.dependency_overrides[get_db] = previous_override
+        else:
+            app.dependency_overrides.pop(get_db, None)
+        Base.metadata.drop_all(bind=engine)
+        engine.dispose()
+        if os.path.exists(filename):
+            os.remove(filename)
+
+    return engine, session_factory, client
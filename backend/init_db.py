@@ -3,21 +3,34 @@
 用于创建所有定义的数据库表
 """
 import logging
-from database import engine
-from models import Base, User
+from database import engine, SessionLocal
+from models import Base, User, QuestionnaireTemplate
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def init_db():
-    """创建所有数据库表"""
+    """创建所有数据库表并写入默认数据"""
     logger.info("正在创建数据库表...")
     
     # 使用Base.metadata.create_all()创建所有模型对应的表
     Base.metadata.create_all(bind=engine)
     
     logger.info("数据库表创建完成！")
+    seed_db()
+
+def seed_db():
+    """写入默认数据（已存在时跳过）"""
+    db = SessionLocal()
+    try:
+        # 默认风险测评问卷模板，查询模板列表的接口只读不再补建
+        QuestionnaireTemplate.ensure_default(db)
+        db.commit()
+    finally:
+        db.close()
+    
+    logger.info("默认数据写入完成！")
 
 if __name__ == "__main__":
     # 直接运行此脚本将初始化数据库
@@ -10,8 +10,11 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 if current_dir not in sys.path:
     sys.path.insert(0, current_dir)
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from config import DAILY_RUN_CONFIG
+from utils.scheduler import DailyScheduler
 from routers import users, auth  # 导入用户和认证路由
 from routers import portfolios  # 导入投资组合路由
 from routers import assets  # 导入资产路由
@@ -23,9 +26,25 @@ from routers import lineage  # 导入血缘关系路由
 from routers import user_profile  # 导入用户画像路由
 from routers import alternative_data  # 导入另类数据路由
 from routers import model_config  # 导入模型配置路由
+from routers import suitability  # 导入适当性检查路由
+from routers import stress_tests  # 导入压力测试路由
+from routers import model_portfolios  # 导入模型组合路由
+
+# 收盘后每日策略运行（默认关闭，由配置启用）
+daily_scheduler = DailyScheduler(DAILY_RUN_CONFIG["run_time"], strategy.run_daily_strategies)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：按配置启动/停止每日策略运行调度"""
+    if DAILY_RUN_CONFIG["enabled"]:
+        daily_scheduler.start()
+    yield
+    daily_scheduler.stop(timeout=5)
+
 
 # 创建FastAPI应用实例
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # 添加CORS中间件，允许前端跨域请求后端API
 app.add_middleware(
@@ -49,6 +68,9 @@ app.include_router(lineage.router)
 app.include_router(user_profile.router)
 app.include_router(alternative_data.router)
 app.include_router(model_config.router)
+app.include_router(suitability.router)
+app.include_router(stress_tests.router)
+app.include_router(model_portfolios.router)
 
 @app.get("/")
 def read_root():
@@ -11,15 +11,21 @@ from database import Base
 
 # 导入用户模型
 from .user import User
-from .user_profile import UserProfile, RiskAssessment, InvestmentGoal
+from .user_profile import (
+    UserProfile, RiskAssessment, InvestmentGoal, GoalPortfolioLink, GoalProjection, QuestionnaireTemplate,
+    RiskAssessmentScoring, ProfileSegmentation, ProfileSegment, UserSegment
+)
 
 # 导入投资组合模型
-from .portfolio import Portfolio, Asset, PortfolioAsset
+from .portfolio import (
+    Portfolio, Asset, PortfolioAsset, PortfolioNavSnapshot, ModelPortfolio, ModelPortfolioAsset, PortfolioModelLink,
+    PortfolioWeightOverride
+)
 from .asset_tag import Tag, AssetTag
-from .risk import RiskAssessmentResult
+from .risk import RiskAssessmentResult, SuitabilityCheck, StressScenario, StressTestResult
 
 # 导入市场数据模型
-from .market_data import MarketData, PriceHistory, MarketIndex, IndexHistory
+from .market_data import MarketData, PriceHistory, MarketIndex, IndexHistory, IndustryAggregate
 
 # 导入特征模型
 from .feature import Feature
@@ -28,8 +34,9 @@ from .feature_lineage import FeatureLineage
 # 导入策略模型
 from .strategy import (
     Strategy, StrategySignal, BacktestResult, PortfolioAllocation,
-    FactorModel, MarketRegime, StrategyType, SignalType, AssetClass,
-    MacroTimingSignal, SectorRotationSignal, MultiFactorScore
+    FactorModel, RiskModelVersion, MarketRegime, RegimeDetectionState, StrategyType, SignalType, AssetClass,
+    MacroTimingSignal, MacroIndicatorValue, SectorRotationSignal, MultiFactorScore, MultiFactorInput,
+    StrategyRunStep, RebalanceOrder
 )
 
 # 导入另类数据模型
@@ -45,13 +52,28 @@ __all__ = [
     'UserProfile',
     'RiskAssessment',
     'InvestmentGoal',
+    'GoalPortfolioLink',
+    'GoalProjection',
+    'QuestionnaireTemplate',
+    'RiskAssessmentScoring',
+    'ProfileSegmentation',
+    'ProfileSegment',
+    'UserSegment',
     # 'Portfolio',
     # 'Asset',
+    'ModelPortfolio',
+    'ModelPortfolioAsset',
+    'PortfolioModelLink',
+    'PortfolioWeightOverride',
     'RiskAssessmentResult',
+    'SuitabilityCheck',
+    'StressScenario',
+    'StressTestResult',
     'MarketData',
     'PriceHistory', 
     'MarketIndex',
     'IndexHistory',
+    'IndustryAggregate',
     'Feature',
     'FeatureLineage',
     'Strategy',
@@ -59,13 +81,19 @@ __all__ = [
     'BacktestResult',
     'PortfolioAllocation',
     'FactorModel',
+    'RiskModelVersion',
     'MarketRegime',
+    'RegimeDetectionState',
     'StrategyType',
     'SignalType',
     'AssetClass',
     'MacroTimingSignal',
+    'MacroIndicatorValue',
     'SectorRotationSignal',
     'MultiFactorScore',
+    'MultiFactorInput',
+    'StrategyRunStep',
+    'RebalanceOrder',
     'AlternativeData',
     'SatelliteData',
     'SupplyChainData',
@@ -4,9 +4,16 @@ AI模型实现模块
 """
 import numpy as np
 import pandas as pd
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
+from collections import OrderedDict
 from datetime import datetime, timedelta
+import hashlib
+import json
+import re
 import logging
+import threading
+import warnings
+from statistics import NormalDist
 
 logger = logging.getLogger(__name__)
 
@@ -14,28 +21,42 @@ logger = logging.getLogger(__name__)
 class MacroTimingModel:
     """宏观择时模型"""
     
+    CYCLE_SCORES = {
+        "复苏": 0.8,    # 经济复苏，适合股票
+        "过热": 0.6,    # 经济过热，通胀压力
+        "滞胀": 0.3,    # 经济滞胀，风险较高
+        "衰退": 0.1     # 经济衰退，防御为主
+    }
+    
+    SENTIMENT_SCORES = {
+        "乐观": 0.8,
+        "中性": 0.5,
+        "悲观": 0.2
+    }
+    
+    # 批量计算使用的配置分档：(综合评分下限, 配置风格, STOCK/BOND/COMMODITY/CASH权重, 置信度)，
+    # 与 generate_asset_allocation 的分档一致
+    ALLOCATION_BANDS = [
+        (0.7, "积极", [0.65, 0.20, 0.10, 0.05], 0.85),
+        (0.5, "均衡", [0.45, 0.35, 0.10, 0.10], 0.75),
+        (0.3, "防御", [0.25, 0.50, 0.10, 0.15], 0.80),
+        (-np.inf, "保守", [0.15, 0.60, 0.05, 0.20], 0.90),
+    ]
+    
+    # 参与额外因素评分与微调的数值指标
+    ADDITIONAL_FACTOR_KEYS = ["interest_rate", "inflation", "exchange_rate", "geopolitical_risk"]
+    
     def __init__(self):
         self.model_name = "MacroTimingModel_v1.0"
         self.asset_classes = ["STOCK", "BOND", "COMMODITY", "CASH"]
         
     def calculate_economic_cycle_score(self, economic_cycle: str) -> float:
         """计算经济周期评分"""
-        cycle_scores = {
-            "复苏": 0.8,    # 经济复苏，适合股票
-            "过热": 0.6,    # 经济过热，通胀压力
-            "滞胀": 0.3,    # 经济滞胀，风险较高
-            "衰退": 0.1     # 经济衰退，防御为主
-        }
-        return cycle_scores.get(economic_cycle, 0.5)
+        return self.CYCLE_SCORES.get(economic_cycle, 0.5)
     
     def calculate_sentiment_score(self, market_sentiment: str) -> float:
         """计算市场情绪评分"""
-        sentiment_scores = {
-            "乐观": 0.8,
-            "中性": 0.5,
-            "悲观": 0.2
-        }
-        return sentiment_scores.get(market_sentiment, 0.5)
+        return self.SENTIMENT_SCORES.get(market_sentiment, 0.5)
     
     def calculate_additional_factors_score(self, additional_factors: Dict) -> float:
         """计算额外因素评分"""
@@ -172,6 +193,116 @@ class MacroTimingModel:
                 adjusted[key] = adjusted[key] / total
         
         return adjusted
+    
+    @staticmethod
+    def infer_economic_cycles(pmi: np.ndarray,
+                              inflation: np.ndarray,
+                              lookback: int = 3,
+                              inflation_threshold: float = 3.0) -> np.ndarray:
+        """由PMI与通胀序列推断各期经济周期（投资时钟）
+        
+        增长向上：PMI高于荣枯线50与近lookback期变化之和为正；通胀偏高：通胀高于阈值。
+        复苏=增长上行+低通胀，过热=增长上行+高通胀，滞胀=增长下行+高通胀，衰退=增长下行+低通胀；
+        数据缺失的日期为None。
+        """
+        pmi = np.asarray(pmi, dtype=float)
+        inflation = np.asarray(inflation, dtype=float)
+        momentum = np.zeros_like(pmi)
+        if 0 < lookback < len(pmi):
+            momentum[lookback:] = pmi[lookback:] - pmi[:-lookback]
+        momentum = np.nan_to_num(momentum)
+        
+        growth_up = (pmi - 50.0) + momentum > 0
+        inflation_high = inflation > inflation_threshold
+        cycles = np.select(
+            [growth_up & ~inflation_high, growth_up & inflation_high, ~growth_up & inflation_high],
+            ["复苏", "过热", "滞胀"],
+            default="衰退"
+        ).astype(object)
+        cycles[np.isnan(pmi) | np.isnan(inflation)] = None
+        return cycles
+    
+    def compute_allocation_table(self,
+                                 indicators: pd.DataFrame,
+                                 lookback: int = 3,
+                                 inflation_threshold: float = 3.0) -> Dict[str, Any]:
+        """对全部历史日期一次性向量化计算资产配置
+        
+        indicators: 以日期为索引、列为 pmi / inflation / interest_rate / sentiment(0~1) /
+        exchange_rate / geopolitical_risk 的数值表，缺失值向前填充。
+        评分规则与 generate_asset_allocation 一致，可用于回测，最新一行即实时信号。
+        """
+        frame = indicators.sort_index().ffill()
+        n_dates = len(frame)
+        
+        def column(name: str) -> np.ndarray:
+            if name in frame.columns:
+                return frame[name].to_numpy(dtype=float)
+            return np.full(n_dates, np.nan)
+        
+        pmi, inflation = column("pmi"), column("inflation")
+        cycles = self.infer_economic_cycles(pmi, inflation, lookback, inflation_threshold)
+        cycle_scores = pd.Series(cycles, dtype=object).map(self.CYCLE_SCORES).fillna(0.5).to_numpy(dtype=float)
+        sentiment_scores = np.nan_to_num(column("sentiment"), nan=0.5)
+        
+        # 额外因素评分（与 calculate_additional_factors_score 相同的规则）
+        rate, geo = column("interest_rate"), column("geopolitical_risk")
+        factor_values = {key: column(key) for key in self.ADDITIONAL_FACTOR_KEYS}
+        valid = {key: ~np.isnan(values) for key, values in factor_values.items()}
+        factors_score = np.full(n_dates, 0.5)
+        factors_score += np.where(rate < 2.0, 0.2, np.where(rate > 5.0, -0.2, 0.0))
+        factors_score += np.where((inflation < 2.0) | (inflation > 4.0), 0.1, 0.0)
+        factors_score += np.where(valid["exchange_rate"], 0.05, 0.0)
+        factors_score += np.where(geo > 0.7, -0.2, 0.0)
+        factors_count = sum(mask.astype(int) for mask in valid.values())
+        factors_score = factors_score / np.maximum(factors_count, 1)
+        
+        composite_scores = cycle_scores * 0.4 + sentiment_scores * 0.4 + factors_score * 0.2
+        
+        # 按综合评分分档取基础配置
+        thresholds = np.array([band[0] for band in self.ALLOCATION_BANDS])
+        band_index = np.argmax(composite_scores[:, None] >= thresholds[None, :], axis=1)
+        allocations = np.array([band[2] for band in self.ALLOCATION_BANDS])[band_index]
+        confidence = np.array([band[3] for band in self.ALLOCATION_BANDS])[band_index]
+        
+        # 按额外因素微调（与 _adjust_allocation_by_factors 相同的规则）
+        adjusted = allocations.copy()
+        stock, bond, commodity, cash = (self.asset_classes.index(a) for a in ["STOCK", "BOND", "COMMODITY", "CASH"])
+        high_rate = rate > 5.0
+        adjusted[:, bond] = np.where(high_rate, np.minimum(0.7, adjusted[:, bond] + 0.1), adjusted[:, bond])
+        adjusted[:, stock] = np.where(high_rate, np.maximum(0.1, adjusted[:, stock] - 0.1), adjusted[:, stock])
+        high_inflation = inflation > 4.0
+        adjusted[:, commodity] = np.where(high_inflation, np.minimum(0.2, adjusted[:, commodity] + 0.05), adjusted[:, commodity])
+        adjusted[:, cash] = np.where(high_inflation, np.maximum(0.05, adjusted[:, cash] - 0.05), adjusted[:, cash])
+        high_risk = geo > 0.7
+        adjusted[:, cash] = np.where(high_risk, np.minimum(0.3, adjusted[:, cash] + 0.1), adjusted[:, cash])
+        adjusted[:, stock] = np.where(high_risk, np.maximum(0.05, adjusted[:, stock] - 0.1), adjusted[:, stock])
+        totals = adjusted.sum(axis=1, keepdims=True)
+        adjusted = np.where(np.abs(totals - 1.0) > 0.01, adjusted / totals, adjusted)
+        
+        has_factors = np.any(np.column_stack(list(valid.values())), axis=1) if n_dates else np.zeros(0, dtype=bool)
+        allocations = np.where(has_factors[:, None], adjusted, allocations)
+        
+        return {
+            "dates": list(frame.index),
+            "economic_cycles": cycles,
+            "sentiment_scores": sentiment_scores,
+            "composite_scores": composite_scores,
+            "styles": [self.ALLOCATION_BANDS[i][1] for i in band_index],
+            "allocations": allocations,
+            "confidence": confidence,
+            "asset_classes": list(self.asset_classes),
+            "indicators": frame,
+        }
+    
+    def describe_allocation(self, table: Dict[str, Any], row: int) -> str:
+        """生成配置表中某一日期的推荐理由"""
+        cycle = table["economic_cycles"][row] or "未知"
+        indicators = table["indicators"].iloc[row]
+        details = [f"{name}={indicators[name]:.2f}" for name in ["pmi", "inflation", "interest_rate"]
+                   if name in indicators.index and pd.notna(indicators[name])]
+        return (f"根据宏观指标（{', '.join(details) or '无'}）推断经济周期为{cycle}，"
+                f"综合评分{table['composite_scores'][row]:.2f}，建议{table['styles'][row]}配置。")
 
 
 class SectorRotationModel:
@@ -314,6 +445,175 @@ class SectorRotationModel:
                 adjusted[key] = adjusted[key] / total
         
         return adjusted
+    
+    # 行业综合评分中相对动量、上涨广度、资金流向的权重
+    SIGNAL_WEIGHTS = {"momentum": 0.5, "breadth": 0.3, "fund_flow": 0.2}
+    
+    # 前三名行业的配置权重，与 generate_industry_allocation 一致
+    TOP_WEIGHTS = [0.4, 0.3, 0.2]
+    
+    @staticmethod
+    def aggregate_industries(closes: np.ndarray,
+                             industries: List[str],
+                             market_caps: Optional[np.ndarray] = None,
+                             turnover: Optional[np.ndarray] = None,
+                             reference_closes: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        """将个股日线聚合为行业日度数据（全部日期一次完成）
+        
+        closes: T×N 收盘价（缺失为NaN）；industries: N 个股所属行业；
+        market_caps: N 最新市值，按收盘价回推历史市值，缺失时取已知市值的中位数；
+        turnover: T×N 成交额（缺失为NaN）；
+        reference_closes: N 与最新市值对应的收盘价，缺省为区间内最后收盘价（增量计算时应传入全局最新价）。
+        返回各行业 T×K 的市值加权收益、总市值、成交额、带方向成交额（按涨跌符号）、上涨家数与成分股数量。
+        """
+        closes = np.asarray(closes, dtype=float)
+        n_dates, n_stocks = closes.shape
+        names = sorted(set(industries))
+        membership = np.zeros((n_stocks, len(names)))
+        membership[np.arange(n_stocks), [names.index(name) for name in industries]] = 1.0
+        
+        # 按前值填充收盘价计算日收益，当日无行情的股票不参与
+        filled = pd.DataFrame(closes).ffill().to_numpy()
+        previous = np.vstack([np.full((1, n_stocks), np.nan), filled[:-1]])
+        traded = np.isfinite(closes) & np.isfinite(previous) & (previous > 0)
+        returns = np.where(traded, closes / np.where(traded, previous, 1.0) - 1.0, 0.0)
+        
+        # 历史市值 = 最新市值 × 当日价格 / 最新价格（股本视为不变）
+        caps = np.full(n_stocks, np.nan) if market_caps is None else np.asarray(market_caps, dtype=float)
+        known = np.isfinite(caps) & (caps > 0)
+        caps = np.where(known, caps, np.median(caps[known]) if known.any() else 1.0)
+        if reference_closes is not None:
+            last_close = np.asarray(reference_closes, dtype=float)
+        else:
+            last_close = filled[-1] if n_dates else np.ones(n_stocks)
+        scale = np.where(np.isfinite(last_close) & (last_close > 0), caps / np.where(last_close > 0, last_close, 1.0), 0.0)
+        stock_caps = np.nan_to_num(filled * scale)
+        previous_caps = np.nan_to_num(previous * scale)
+        
+        # 前一日市值加权的行业收益
+        weights = np.where(traded, previous_caps, 0.0)
+        weight_sum = weights @ membership
+        industry_returns = np.divide((weights * returns) @ membership, weight_sum,
+                                     out=np.full(weight_sum.shape, np.nan), where=weight_sum > 0)
+        
+        amounts = np.zeros_like(closes) if turnover is None else np.nan_to_num(np.asarray(turnover, dtype=float))
+        amounts = np.where(np.isfinite(closes), amounts, 0.0)
+        
+        return {
+            "industries": names,
+            "index_returns": industry_returns,
+            "market_caps": np.where(np.isfinite(closes), stock_caps, 0.0) @ membership,
+            "turnover": amounts @ membership,
+            "signed_turnover": (amounts * np.sign(returns)) @ membership,
+            "advancers": (traded & (returns > 0)).astype(float) @ membership,
+            "constituents": traded.astype(float) @ membership,
+        }
+    
+    @staticmethod
+    def _cross_section_zscore(values: np.ndarray) -> np.ndarray:
+        """按日期做截面Z-score（忽略NaN）"""
+        # 整行缺失的日期结果为NaN，忽略空切片警告
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            mean = np.nanmean(values, axis=1, keepdims=True)
+            std = np.nanstd(values, axis=1, keepdims=True)
+        return np.where(std > 0, (values - mean) / np.where(std > 0, std, 1.0), 0.0 * values)
+    
+    def compute_rotation_scores(self,
+                                panel: Dict[str, Any],
+                                lookback: int = 20,
+                                flow_window: int = 5) -> Dict[str, np.ndarray]:
+        """由行业日度数据计算相对动量、上涨广度、资金流向及综合评分（T×K，数据不足为NaN）
+        
+        相对动量：行业指数lookback期收益减去全市场（市值加权）同期收益；
+        上涨广度：lookback期内上涨家数占比的均值；
+        资金流向：flow_window期内带方向成交额占成交额的比例，取值-1~1。
+        """
+        returns = np.asarray(panel["index_returns"], dtype=float)
+        caps = np.asarray(panel["market_caps"], dtype=float)
+        n_dates = returns.shape[0]
+        
+        def rolling_sum(values: np.ndarray, window: int) -> np.ndarray:
+            # 首行没有前一日价格，不计入窗口：第t行为第 t-window+1..t 行之和（t >= window）
+            cumulative = np.vstack([np.zeros((1, values.shape[1])), np.cumsum(values, axis=0)])
+            result = np.full(values.shape, np.nan)
+            if window < n_dates:
+                result[window:] = cumulative[window + 1:] - cumulative[1:-window]
+            return result
+        
+        # 行业与全市场对数收益的滚动和
+        log_returns = np.log1p(np.nan_to_num(returns))
+        previous_caps = np.vstack([np.zeros((1, caps.shape[1])), caps[:-1]])
+        cap_sum = previous_caps.sum(axis=1, keepdims=True)
+        market_returns = np.divide((previous_caps * np.nan_to_num(returns)).sum(axis=1, keepdims=True), cap_sum,
+                                   out=np.zeros((n_dates, 1)), where=cap_sum > 0)
+        industry_momentum = np.expm1(rolling_sum(log_returns, lookback))
+        market_momentum = np.expm1(rolling_sum(np.log1p(market_returns), lookback))
+        momentum = industry_momentum - market_momentum
+        
+        advance_ratio = np.divide(panel["advancers"], panel["constituents"],
+                                  out=np.zeros(returns.shape), where=np.asarray(panel["constituents"]) > 0)
+        breadth = rolling_sum(advance_ratio, lookback) / lookback
+        
+        flow_total = rolling_sum(np.asarray(panel["turnover"], dtype=float), flow_window)
+        fund_flow = np.divide(rolling_sum(np.asarray(panel["signed_turnover"], dtype=float), flow_window), flow_total,
+                              out=np.zeros(returns.shape), where=flow_total > 0)
+        fund_flow = np.where(np.isnan(flow_total), np.nan, fund_flow)
+        
+        # 当日有成分股行情且回看期已满的行业参与评分
+        valid = (np.asarray(panel["constituents"]) > 0) & np.isfinite(momentum) & np.isfinite(fund_flow)
+        scores = (self.SIGNAL_WEIGHTS["momentum"] * self._cross_section_zscore(np.where(valid, momentum, np.nan))
+                  + self.SIGNAL_WEIGHTS["breadth"] * self._cross_section_zscore(np.where(valid, breadth, np.nan))
+                  + self.SIGNAL_WEIGHTS["fund_flow"] * self._cross_section_zscore(np.where(valid, fund_flow, np.nan)))
+        
+        return {
+            "momentum": np.where(valid, momentum, np.nan),
+            "breadth": np.where(valid, breadth, np.nan),
+            "fund_flow": np.where(valid, fund_flow, np.nan),
+            "scores": np.where(valid, scores, np.nan),
+        }
+    
+    def allocate_batch(self,
+                       scores: np.ndarray,
+                       fund_flows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """按日期批量生成行业配置（规则与 generate_industry_allocation 一致）
+        
+        scores: T×K 行业评分，NaN的行业当日不参与配置；fund_flows: T×K 资金流向。
+        返回 (配置矩阵 T×K, 置信度 T)。
+        """
+        scores = np.atleast_2d(np.asarray(scores, dtype=float))
+        valid = np.isfinite(scores)
+        n_valid = valid.sum(axis=1)
+        
+        # 与 calculate_industry_score 相同的Z-score再映射到0~1
+        z_scores = self._cross_section_zscore(scores)
+        low = np.nanmin(np.where(valid, z_scores, np.inf), axis=1, keepdims=True)
+        high = np.nanmax(np.where(valid, z_scores, -np.inf), axis=1, keepdims=True)
+        normalized = np.where(valid, (z_scores - low) / (high - low + 1e-8), np.nan)
+        
+        # 按评分降序排名（同分保持原顺序），无效行业排在最后
+        order = np.argsort(np.where(valid, -normalized, np.inf), axis=1, kind="stable")
+        ranks = np.empty_like(order)
+        np.put_along_axis(ranks, order, np.arange(scores.shape[1])[None, :].repeat(scores.shape[0], axis=0), axis=1)
+        
+        top_weights = np.array(self.TOP_WEIGHTS)
+        n_top = np.minimum(n_valid, len(top_weights))
+        remaining = (1.0 - np.cumsum(np.append(0.0, top_weights))[n_top]) / np.maximum(n_valid - n_top, 1)
+        allocation = np.where(ranks < len(top_weights), top_weights[np.minimum(ranks, len(top_weights) - 1)], remaining[:, None])
+        allocation = np.where(valid, allocation, 0.0)
+        
+        # 资金流入增加配置、流出减少配置，再归一化
+        if fund_flows is not None:
+            flows = np.where(valid, np.nan_to_num(np.asarray(fund_flows, dtype=float)), 0.0)
+            allocation = np.where(valid, np.maximum(0.0, allocation + np.clip(flows * 0.1, -0.2, 0.2)), 0.0)
+            totals = allocation.sum(axis=1, keepdims=True)
+            allocation = np.divide(allocation, totals, out=allocation, where=totals > 0)
+        
+        third = np.take_along_axis(normalized, order[:, min(2, scores.shape[1] - 1)][:, None], axis=1)[:, 0]
+        first = np.take_along_axis(normalized, order[:, :1], axis=1)[:, 0]
+        confidence = np.where(n_valid >= 3, np.minimum(0.95, 0.7 + (first - third) * 0.5), 0.6)
+        confidence = np.where(n_valid > 0, confidence, 0.0)
+        return allocation, confidence
 
 
 class MultiFactorModel:
@@ -408,38 +708,164 @@ class MultiFactorModel:
         
         return discovered_factors
     
+    def score_stocks(self,
+                     stocks_data: List[Dict],
+                     factor_weights: Dict[str, float],
+                     market_regime: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+        """向量化计算全部股票评分
+        
+        返回 (综合评分 N, 因子贡献矩阵 N×F（缺失因子为NaN）, 因子顺序)。
+        """
+        adjusted_weights = self._adjust_weights_by_regime(factor_weights, market_regime)
+        factors = list(adjusted_weights.keys())
+        weight_vector = np.array([adjusted_weights[f] for f in factors], dtype=float)
+        return self.score_with_vector(stocks_data, factors, weight_vector)
+    
+    def score_with_vector(self,
+                          stocks_data: List[Dict],
+                          factors: List[str],
+                          weight_vector: np.ndarray) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+        """使用已计算好的权重向量评分（如市场状态权重表中缓存的权重）"""
+        values = np.full((len(stocks_data), len(factors)), np.nan)
+        for i, stock_data in enumerate(stocks_data):
+            factor_values = stock_data.get("factor_values", {})
+            for j, factor in enumerate(factors):
+                if factor in factor_values:
+                    values[i, j] = factor_values[factor]
+        
+        contributions = values * weight_vector
+        total_scores = np.nansum(contributions, axis=1)
+        return total_scores, contributions, factors
+    
+    def score_tensor(self,
+                     values: np.ndarray,
+                     factors: List[str],
+                     factor_weights: Optional[Dict[str, float]] = None,
+                     market_regimes: Optional[List[Optional[str]]] = None) -> Tuple[np.ndarray, np.ndarray, Dict[Optional[str], Dict[str, float]]]:
+        """对 日期×股票×因子 张量一次性向量化评分
+        
+        values: D×N×F 因子值（缺失为NaN）；market_regimes: 每个日期的市场状态。
+        返回 (评分矩阵 D×N（无任何因子值的位置为NaN）, 因子贡献张量 D×N×F, 各市场状态下的调整后权重)。
+        """
+        values = np.asarray(values, dtype=float)
+        n_dates = values.shape[0]
+        regimes = market_regimes if market_regimes is not None else [None] * n_dates
+        weights = factor_weights or {factor: 1.0/len(factors) for factor in factors}
+        
+        # 每种市场状态只计算一次权重向量，未参与加权的因子记为NaN
+        regime_weights: Dict[Optional[str], Dict[str, float]] = {}
+        regime_vectors: Dict[Optional[str], np.ndarray] = {}
+        weight_matrix = np.empty((n_dates, len(factors)))
+        for d, regime in enumerate(regimes):
+            if regime not in regime_vectors:
+                adjusted = self._adjust_weights_by_regime(weights, regime)
+                regime_weights[regime] = adjusted
+                regime_vectors[regime] = np.array([adjusted.get(f, np.nan) for f in factors], dtype=float)
+            weight_matrix[d] = regime_vectors[regime]
+        
+        contributions = values * weight_matrix[:, None, :]
+        has_value = np.isfinite(contributions).any(axis=2)
+        scores = np.where(has_value, np.nansum(contributions, axis=2), np.nan)
+        return scores, contributions, regime_weights
+    
+    @staticmethod
+    def rank_matrix(scores: np.ndarray) -> np.ndarray:
+        """按行计算排名（1为最高分，同分按原始顺序，NaN排名为0）"""
+        scores = np.atleast_2d(scores)
+        sort_key = np.where(np.isnan(scores), np.inf, -scores)
+        order = np.argsort(sort_key, axis=1, kind="stable")
+        ranks = np.empty_like(order)
+        np.put_along_axis(ranks, order, np.arange(1, scores.shape[1] + 1)[None, :].repeat(scores.shape[0], axis=0), axis=1)
+        return np.where(np.isnan(scores), 0, ranks)
+    
+    @staticmethod
+    def select_top_k(total_scores: np.ndarray, top_k: Optional[int] = None) -> np.ndarray:
+        """按评分从高到低返回前K个下标（同分按原始顺序），K为空时返回完整排序"""
+        n_stocks = len(total_scores)
+        if top_k is None or top_k >= n_stocks:
+            return np.argsort(-total_scores, kind="stable")
+        if top_k <= 0:
+            return np.array([], dtype=int)
+        
+        # argpartition 只做O(N)划分，再对K个候选排序
+        candidates = np.argpartition(-total_scores, top_k - 1)[:top_k]
+        return candidates[np.lexsort((candidates, -total_scores[candidates]))]
+    
+    @staticmethod
+    def summarize_scores(total_scores: np.ndarray) -> Dict[str, float]:
+        """评分分布摘要统计"""
+        if len(total_scores) == 0:
+            return {"count": 0}
+        p25, median, p75 = np.percentile(total_scores, [25, 50, 75])
+        return {
+            "count": int(len(total_scores)),
+            "mean": float(np.mean(total_scores)),
+            "std": float(np.std(total_scores)),
+            "min": float(np.min(total_scores)),
+            "p25": float(p25),
+            "median": float(median),
+            "p75": float(p75),
+            "max": float(np.max(total_scores)),
+        }
+    
+    def iter_stock_ranking(self,
+                           stocks_data: List[Dict],
+                           total_scores: np.ndarray,
+                           contributions: np.ndarray,
+                           factors: List[str],
+                           order: np.ndarray):
+        """按排名顺序逐个生成股票评分字典，供截取或流式输出"""
+        for rank, idx in enumerate(order, start=1):
+            stock_data = stocks_data[idx]
+            row = contributions[idx]
+            yield {
+                "symbol": stock_data["symbol"],
+                "name": stock_data.get("name", f"股票{stock_data['symbol']}"),
+                "total_score": float(total_scores[idx]),
+                "factor_contribution": {
+                    factor: float(row[j]) for j, factor in enumerate(factors) if not np.isnan(row[j])
+                },
+                "rank": rank
+            }
+    
     def generate_stock_ranking(self,
                              stocks_data: List[Dict],
                              factor_weights: Optional[Dict[str, float]] = None,
                              market_regime: Optional[str] = None,
                              auto_discover: bool = False) -> Tuple[List[Dict], Dict[str, float], Optional[Dict[str, float]], str, float]:
         """生成股票排名"""
+        stock_scores, _, weights, discovered_factors, reasoning, confidence = self.generate_top_k_ranking(
+            stocks_data, None, factor_weights, market_regime, auto_discover
+        )
+        return stock_scores, weights, discovered_factors, reasoning, confidence
+    
+    def generate_top_k_ranking(self,
+                               stocks_data: List[Dict],
+                               top_k: Optional[int] = None,
+                               factor_weights: Optional[Dict[str, float]] = None,
+                               market_regime: Optional[str] = None,
+                               auto_discover: bool = False,
+                               regime_vector: Optional[Tuple[List[str], np.ndarray]] = None) -> Tuple[List[Dict], Dict[str, float], Dict[str, float], Optional[Dict[str, float]], str, float]:
+        """生成前K名股票排名及全体评分摘要
+        
+        只为前K名构建评分记录，排名与完整排序一致；top_k 为空时返回完整排名。
+        regime_vector 为市场状态权重表给出的 (因子顺序, 权重向量)，提供时直接用于评分。
+        """
         
         if not stocks_data:
-            return [], {}, None, "无股票数据", 0.0
+            return [], self.summarize_scores(np.array([])), {}, None, "无股票数据", 0.0
         
-        # 使用默认权重或提供的权重
-        weights = factor_weights or {factor: 1.0/len(self.default_factors) for factor in self.default_factors}
-        
-        # 计算每只股票的评分
-        stock_scores = []
-        for stock_data in stocks_data:
-            total_score, factor_contribution = self.calculate_stock_score(
-                stock_data, weights, market_regime
-            )
-            
-            stock_scores.append({
-                "symbol": stock_data["symbol"],
-                "name": stock_data.get("name", f"股票{stock_data['symbol']}"),
-                "total_score": total_score,
-                "factor_contribution": factor_contribution,
-                "rank": 0  # 临时排名
-            })
-        
-        # 根据总分排序
-        stock_scores.sort(key=lambda x: x["total_score"], reverse=True)
-        for i, score in enumerate(stock_scores):
-            score["rank"] = i + 1
+        # 计算每只股票的评分并选出前K名
+        if regime_vector is not None:
+            factors, weight_vector = regime_vector
+            weights = {factor: float(w) for factor, w in zip(factors, weight_vector)}
+            total_scores, contributions, factors = self.score_with_vector(stocks_data, factors, weight_vector)
+        else:
+            # 使用默认权重或提供的权重
+            weights = factor_weights or {factor: 1.0/len(self.default_factors) for factor in self.default_factors}
+            total_scores, contributions, factors = self.score_stocks(stocks_data, weights, market_regime)
+        order = self.select_top_k(total_scores, top_k)
+        stock_scores = list(self.iter_stock_ranking(stocks_data, total_scores, contributions, factors, order))
         
         # 因子挖掘
         discovered_factors = None
@@ -447,7 +873,9 @@ class MultiFactorModel:
             discovered_factors = self.discover_factors(stocks_data)
         
         # 生成推理说明
-        if market_regime:
+        if regime_vector is not None:
+            reasoning = f"基于{market_regime}市场状态的条件权重表（按转移概率混合）进行评分。"
+        elif market_regime:
             reasoning = f"基于{market_regime}市场状态，动态调整因子权重进行评分。"
         else:
             reasoning = "基于传统因子模型进行评分。"
@@ -456,12 +884,1589 @@ class MultiFactorModel:
             reasoning += f" 通过机器学习发现{len(discovered_factors)}个新因子。"
         
         # 计算置信度
-        if len(stock_scores) > 1:
+        if len(total_scores) > 1:
             # 基于评分分布计算置信度
-            scores = [s["total_score"] for s in stock_scores]
-            score_std = np.std(scores)
+            score_std = np.std(total_scores)
             confidence = min(0.95, 0.7 + score_std * 2)
         else:
             confidence = 0.6
         
-        return stock_scores, weights, discovered_factors, reasoning, confidence 
\ No newline at end of file
+        return stock_scores, self.summarize_scores(total_scores), weights, discovered_factors, reasoning, confidence
+
+
+class FactorRiskModel:
+    """因子风险模型：估计因子收益、因子协方差与个股特异方差"""
+    
+    def __init__(self,
+                 half_life: int = 90,
+                 newey_west_lags: int = 2,
+                 specific_half_life: Optional[int] = None,
+                 ridge: float = 1e-8):
+        self.model_name = "FactorRiskModel_v1.0"
+        self.half_life = half_life
+        self.newey_west_lags = newey_west_lags
+        self.specific_half_life = specific_half_life or half_life
+        self.ridge = ridge
+    
+    @staticmethod
+    def _ewma_weights(length: int, half_life: int) -> np.ndarray:
+        """生成指数衰减权重（最新一期权重最大，已归一化）"""
+        decay = 0.5 ** (1.0 / max(half_life, 1))
+        weights = decay ** np.arange(length - 1, -1, -1, dtype=float)
+        return weights / weights.sum()
+    
+    def estimate_factor_returns(self,
+                                exposures: np.ndarray,
+                                returns: np.ndarray,
+                                weights: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """逐日截面加权回归估计因子收益，所有日期一次性批量求解
+        
+        exposures: T×N×K 因子暴露；returns: T×N 个股收益（缺失为NaN）；
+        weights: N 或 T×N 回归权重（如市值平方根），缺省为等权。
+        返回 (因子收益 T×K, 残差 T×N，缺失位置为NaN)。
+        """
+        exposures = np.asarray(exposures, dtype=float)
+        returns = np.asarray(returns, dtype=float)
+        n_dates, n_stocks, n_factors = exposures.shape
+        
+        if weights is None:
+            w = np.ones((n_dates, n_stocks))
+        else:
+            w = np.broadcast_to(np.asarray(weights, dtype=float), (n_dates, n_stocks)).copy()
+        
+        # 缺失的收益或暴露不参与当日回归
+        valid = np.isfinite(returns) & np.isfinite(exposures).all(axis=2)
+        w = np.where(valid, w, 0.0)
+        x = np.where(valid[:, :, None], exposures, 0.0)
+        y = np.where(valid, returns, 0.0)
+        
+        # 批量正规方程：(X'WX) f = X'Wy
+        xtwx = np.einsum("tnk,tn,tnl->tkl", x, w, x)
+        xtwy = np.einsum("tnk,tn,tn->tk", x, w, y)
+        xtwx += self.ridge * np.eye(n_factors)[None, :, :]
+        factor_returns = np.linalg.solve(xtwx, xtwy[:, :, None])[:, :, 0]
+        
+        residuals = returns - np.einsum("tnk,tk->tn", x, factor_returns)
+        residuals = np.where(valid, residuals, np.nan)
+        return factor_returns, residuals
+    
+    def estimate_factor_covariance(self, factor_returns: np.ndarray) -> np.ndarray:
+        """EWMA因子协方差，并做Newey-West自相关调整"""
+        factor_returns = np.asarray(factor_returns, dtype=float)
+        n_dates = factor_returns.shape[0]
+        w = self._ewma_weights(n_dates, self.half_life)
+        
+        demeaned = factor_returns - w @ factor_returns
+        weighted = demeaned * w[:, None]
+        covariance = weighted.T @ demeaned
+        
+        lags = min(self.newey_west_lags, n_dates - 1)
+        for lag in range(1, lags + 1):
+            # 滞后项使用较新一期的权重，并按Bartlett核衰减
+            gamma = weighted[lag:].T @ demeaned[:-lag]
+            covariance += (1.0 - lag / (lags + 1.0)) * (gamma + gamma.T)
+        
+        return 0.5 * (covariance + covariance.T)
+    
+    def estimate_specific_variance(self, residuals: np.ndarray) -> np.ndarray:
+        """按个股计算残差平方的EWMA作为特异方差（忽略缺失值）"""
+        residuals = np.asarray(residuals, dtype=float)
+        w = self._ewma_weights(residuals.shape[0], self.specific_half_life)
+        valid = np.isfinite(residuals)
+        squared = np.where(valid, residuals, 0.0) ** 2
+        weight_sum = w @ valid
+        variance = (w @ squared) / np.where(weight_sum > 0, weight_sum, 1.0)
+        return np.where(weight_sum > 0, variance, np.nan)
+    
+    def build(self,
+              exposures: np.ndarray,
+              returns: np.ndarray,
+              weights: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+        """一次性估计完整风险模型"""
+        factor_returns, residuals = self.estimate_factor_returns(exposures, returns, weights)
+        return {
+            "factor_returns": factor_returns,
+            "factor_covariance": self.estimate_factor_covariance(factor_returns),
+            "specific_variance": self.estimate_specific_variance(residuals),
+        }
+
+
+class RegimeWeightTable:
+    """市场状态条件因子权重表
+    
+    按已存储的市场状态预计算各状态下的因子权重，再按转移概率混合，
+    结果按状态内容与基础权重的哈希缓存，评分时直接取用权重向量。
+    """
+    
+    # 转移概率键中的英文状态名与内置状态的对应关系
+    STATE_ALIASES = {"bull": "牛市", "bear": "熊市", "sideways": "震荡市"}
+    
+    def __init__(self, multi_factor_model: MultiFactorModel, max_entries: int = 32):
+        self.multi_factor_model = multi_factor_model
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # 每日运行时多个策略并行评分，缓存读写需加锁
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def canonical_state(cls, name: Optional[str]) -> Optional[str]:
+        """将状态名归一为内置状态（牛市/熊市/震荡市），无法识别时原样返回"""
+        if not name:
+            return name
+        if name in cls.STATE_ALIASES:
+            return cls.STATE_ALIASES[name]
+        for state in cls.STATE_ALIASES.values():
+            if name.startswith(state[:2]):
+                return state
+        return name
+    
+    @staticmethod
+    def cache_key(regimes: List[Dict], base_weights: Dict[str, float]) -> str:
+        """市场状态内容与基础权重的规范化哈希"""
+        payload = json.dumps([regimes, base_weights], sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def regime_weights(self, regime: Dict, base_weights: Dict[str, float]) -> Dict[str, float]:
+        """计算单个市场状态下的因子权重
+        
+        优先级：状态指标中的 factor_weights > 按 factor_expected_returns / factor_volatilities
+        求均值-方差最优权重 > factor_tilts 倍数 > 内置牛熊市调整规则。
+        """
+        indicators = regime.get("regime_indicators") or {}
+        weights = dict(base_weights)
+        
+        if isinstance(indicators.get("factor_weights"), dict):
+            weights.update(indicators["factor_weights"])
+        elif isinstance(indicators.get("factor_expected_returns"), dict):
+            expected = indicators["factor_expected_returns"]
+            volatilities = indicators.get("factor_volatilities") or {}
+            # 各因子独立时的均值-方差最优解：w ∝ μ/σ²，不做空
+            optimal = {
+                factor: max(float(mu), 0.0) / max(float(volatilities.get(factor, 1.0)), 1e-6) ** 2
+                for factor, mu in expected.items()
+            }
+            if sum(optimal.values()) > 0:
+                weights = optimal
+        elif isinstance(indicators.get("factor_tilts"), dict):
+            for factor, tilt in indicators["factor_tilts"].items():
+                weights[factor] = weights.get(factor, 0.0) * float(tilt)
+        else:
+            return self.multi_factor_model._adjust_weights_by_regime(
+                base_weights, self.canonical_state(regime.get("regime_name"))
+            )
+        
+        weights = {factor: max(float(w), 0.0) for factor, w in weights.items()}
+        total = sum(weights.values())
+        if total > 0:
+            weights = {factor: w / total for factor, w in weights.items()}
+        return weights
+    
+    def build(self, regimes: List[Dict], base_weights: Dict[str, float]) -> Dict[str, Any]:
+        """预计算全部市场状态的自身权重矩阵、转移矩阵与混合权重矩阵
+        
+        转移概率的目标优先按已存储状态的ID解析（状态检测按ID写入，状态名称在不同指数间会重复），
+        其次为状态名称或内置状态（bull/bear/sideways 等），未存储的内置状态按内置规则计算权重；
+        概率之和不足1的部分视为保持当前状态。
+        """
+        states: List[Dict] = list(regimes)
+        name_index: Dict[str, int] = {}
+        for i, regime in enumerate(regimes):
+            name_index[str(regime["id"])] = i
+            name_index.setdefault(regime.get("regime_name"), i)
+            name_index.setdefault(self.canonical_state(regime.get("regime_name")), i)
+        
+        # 解析转移概率，目标不在已存储状态中的内置状态作为虚拟状态加入
+        transitions: List[List[Tuple[int, float]]] = []
+        for regime in regimes:
+            row = []
+            for key, prob in (regime.get("transition_probabilities") or {}).items():
+                target = key.split("_to_")[-1]
+                if target not in name_index:
+                    canonical = self.canonical_state(target)
+                    if canonical in name_index:
+                        target = canonical
+                    elif canonical in self.STATE_ALIASES.values():
+                        name_index[canonical] = len(states)
+                        states.append({"id": None, "regime_name": canonical})
+                        target = canonical
+                    else:
+                        continue
+                row.append((name_index[target], float(prob)))
+            transitions.append(row)
+        
+        own_weights = [self.regime_weights(state, base_weights) for state in states]
+        factors = list(base_weights.keys())
+        for weights in own_weights:
+            factors.extend(f for f in weights if f not in factors)
+        
+        weight_matrix = np.array([[w.get(f, 0.0) for f in factors] for w in own_weights], dtype=float)
+        transition_matrix = np.zeros((len(regimes), len(states)))
+        for i, row in enumerate(transitions):
+            for j, prob in row:
+                transition_matrix[i, j] += max(prob, 0.0)
+            mass = transition_matrix[i].sum()
+            if mass > 1.0:
+                transition_matrix[i] /= mass
+            else:
+                transition_matrix[i, i] += 1.0 - mass
+        
+        blended = transition_matrix @ weight_matrix
+        totals = blended.sum(axis=1, keepdims=True)
+        blended = np.divide(blended, totals, out=np.zeros_like(blended), where=totals > 0)
+        
+        return {
+            "factors": factors,
+            "regime_ids": [regime["id"] for regime in regimes],
+            "regime_names": [regime.get("regime_name") for regime in regimes],
+            "states": [state.get("regime_name") for state in states],
+            "own_weights": weight_matrix[:len(regimes)],
+            "transition_matrix": transition_matrix,
+            "blended_weights": blended,
+        }
+    
+    def get_table(self, regimes: List[Dict], base_weights: Dict[str, float]) -> Dict[str, Any]:
+        """获取权重表，状态内容或基础权重未变化时直接返回缓存"""
+        key = self.cache_key(regimes, base_weights)
+        with self._lock:
+            table = self._cache.get(key)
+            if table is not None:
+                self._cache.move_to_end(key)
+                return table
+        table = self.build(regimes, base_weights)
+        with self._lock:
+            self._cache[key] = table
+            if len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return table
+    
+    def get_weight_vector(self,
+                          regimes: List[Dict],
+                          regime_id: int,
+                          base_weights: Dict[str, float]) -> Tuple[List[str], np.ndarray]:
+        """返回指定市场状态的 (因子顺序, 混合后权重向量)"""
+        table = self.get_table(regimes, base_weights)
+        row = table["regime_ids"].index(regime_id)
+        return table["factors"], table["blended_weights"][row]
+    
+    def invalidate(self):
+        """清空缓存"""
+        with self._lock:
+            self._cache.clear()
+
+
+class MarketRegimeHMM:
+    """
+    高斯隐马尔可夫市场状态模型
+    
+    以指数日对数收益率与滚动波动率为观测，对角协方差高斯发射，
+    Baum-Welch(EM) 拟合；前向后向在状态维度上向量化，并带缩放避免下溢。
+    拟合后可按日进行前向滤波，新增一个交易日只需 O(K²) 计算。
+    """
+    
+    TRADING_DAYS = 252
+    
+    def __init__(self, n_states: int = 3, vol_window: int = 20, n_iter: int = 100, tol: float = 1e-6):
+        self.n_states = n_states
+        self.vol_window = vol_window
+        self.n_iter = n_iter
+        self.tol = tol
+    
+    def features(self, closes: np.ndarray) -> np.ndarray:
+        """
+        由收盘点位计算观测序列
+        
+        第t行为 [第t日对数收益率, 截至第t日 vol_window 日收益率标准差]，
+        前 vol_window 个交易日不足窗口，返回 len(closes) - vol_window 行
+        """
+        closes = np.asarray(closes, dtype=float)
+        returns = np.diff(np.log(closes))
+        if len(returns) < self.vol_window:
+            return np.empty((0, 2))
+        windows = np.lib.stride_tricks.sliding_window_view(returns, self.vol_window)
+        return np.column_stack([returns[self.vol_window - 1:], windows.std(axis=1, ddof=1)])
+    
+    def observation(self, recent_returns: List[float]) -> np.ndarray:
+        """由最近 vol_window 个收益率计算最新一天的观测，与 features 逐行一致"""
+        window = np.asarray(recent_returns[-self.vol_window:], dtype=float)
+        return np.array([window[-1], window.std(ddof=1)])
+    
+    @staticmethod
+    def log_emission(X: np.ndarray, means: np.ndarray, variances: np.ndarray) -> np.ndarray:
+        """对角高斯对数似然，返回 (T, K)"""
+        X = np.atleast_2d(X)
+        diff = X[:, None, :] - means[None, :, :]
+        return -0.5 * (np.log(2 * np.pi * variances)[None, :, :] + diff ** 2 / variances[None, :, :]).sum(axis=2)
+    
+    @staticmethod
+    def forward_backward(log_b: np.ndarray,
+                         startprob: np.ndarray,
+                         transmat: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, float]:
+        """
+        缩放的前向后向算法
+        
+        返回 (滤波概率alpha, 平滑概率gamma, 转移期望计数xi, 对数似然)
+        """
+        T, K = log_b.shape
+        offsets = log_b.max(axis=1)
+        b = np.exp(log_b - offsets[:, None])
+        
+        alpha = np.empty((T, K))
+        scale = np.empty(T)
+        alpha[0] = startprob * b[0]
+        scale[0] = alpha[0].sum()
+        alpha[0] /= scale[0]
+        for t in range(1, T):
+            alpha[t] = (alpha[t - 1] @ transmat) * b[t]
+            scale[t] = alpha[t].sum()
+            alpha[t] /= scale[t]
+        
+        beta = np.empty((T, K))
+        beta[-1] = 1.0
+        for t in range(T - 2, -1, -1):
+            beta[t] = transmat @ (b[t + 1] * beta[t + 1]) / scale[t + 1]
+        
+        gamma = alpha * beta
+        gamma /= gamma.sum(axis=1, keepdims=True)
+        xi = transmat * np.einsum("ti,tj->ij", alpha[:-1], b[1:] * beta[1:] / scale[1:, None])
+        log_likelihood = float(np.log(scale).sum() + offsets.sum())
+        return alpha, gamma, xi, log_likelihood
+    
+    def _initial_params(self, X: np.ndarray) -> Dict[str, np.ndarray]:
+        """按收益率分位数分组初始化，结果确定、无需随机种子"""
+        K = self.n_states
+        order = np.argsort(X[:, 0], kind="stable")
+        groups = np.array_split(order, K)
+        means = np.array([X[g].mean(axis=0) for g in groups])
+        variances = np.array([X[g].var(axis=0) for g in groups]) + self._variance_floor(X)
+        transmat = np.full((K, K), 0.05 / max(K - 1, 1))
+        np.fill_diagonal(transmat, 0.95)
+        return {
+            "startprob": np.full(K, 1.0 / K),
+            "transmat": transmat,
+            "means": means,
+            "variances": variances,
+        }
+    
+    @staticmethod
+    def _variance_floor(X: np.ndarray) -> np.ndarray:
+        return 1e-4 * X.var(axis=0) + 1e-12
+    
+    def fit(self, X: np.ndarray) -> Dict[str, Any]:
+        """
+        Baum-Welch 拟合
+        
+        Args:
+            X: 观测序列 (T, 2)
+            
+        Returns:
+            参数字典（startprob/transmat/means/variances）及对数似然、迭代次数、是否收敛、
+            全样本滤波概率 filtered
+        """
+        K = self.n_states
+        if len(X) < max(10 * K, 2):
+            raise ValueError(f"观测数量不足，至少需要{max(10 * K, 2)}个交易日")
+        
+        params = self._initial_params(X)
+        floor = self._variance_floor(X)
+        previous = -np.inf
+        converged = False
+        iterations = 0
+        for iterations in range(1, self.n_iter + 1):
+            log_b = self.log_emission(X, params["means"], params["variances"])
+            _, gamma, xi, log_likelihood = self.forward_backward(log_b, params["startprob"], params["transmat"])
+            
+            occupancy = gamma.sum(axis=0) + 1e-12
+            means = gamma.T @ X / occupancy[:, None]
+            variances = gamma.T @ (X ** 2) / occupancy[:, None] - means ** 2
+            params = {
+                "startprob": gamma[0],
+                "transmat": xi / xi.sum(axis=1, keepdims=True),
+                "means": means,
+                "variances": np.maximum(variances, 0.0) + floor,
+            }
+            if log_likelihood - previous < self.tol:
+                converged = True
+                break
+            previous = log_likelihood
+        
+        log_b = self.log_emission(X, params["means"], params["variances"])
+        alpha, _, _, log_likelihood = self.forward_backward(log_b, params["startprob"], params["transmat"])
+        return {
+            **params,
+            "log_likelihood": log_likelihood,
+            "iterations": iterations,
+            "converged": converged,
+            "filtered": alpha,
+        }
+    
+    def filter_step(self,
+                    alpha_prev: np.ndarray,
+                    x: np.ndarray,
+                    transmat: np.ndarray,
+                    means: np.ndarray,
+                    variances: np.ndarray) -> np.ndarray:
+        """单日前向滤波：alpha_t ∝ (alpha_{t-1} A) ⊙ b(x_t)"""
+        log_b = self.log_emission(x, means, variances)[0]
+        predicted = alpha_prev @ transmat
+        alpha = predicted * np.exp(log_b - log_b.max())
+        return alpha / alpha.sum()
+    
+    def state_labels(self, means: np.ndarray) -> List[Dict[str, str]]:
+        """
+        按平均收益率为隐状态命名（低到高：熊市、震荡市、牛市，多个震荡状态按波动率编号），
+        并按平均波动率标注波动率状态；状态名以内置状态开头，便于条件权重表识别
+        """
+        K = len(means)
+        by_return = list(np.argsort(means[:, 0], kind="stable"))
+        names = [""] * K
+        names[by_return[0]] = "熊市"
+        names[by_return[-1]] = "牛市"
+        middle = sorted(by_return[1:-1], key=lambda k: means[k, 1])
+        if len(middle) == 1:
+            names[middle[0]] = "震荡市"
+        else:
+            for rank, k in enumerate(middle, start=1):
+                names[k] = f"震荡市{rank}"
+        
+        vol_rank = np.argsort(np.argsort(means[:, 1], kind="stable"), kind="stable")
+        sentiment = {"熊市": "悲观", "牛市": "乐观"}
+        labels = []
+        for k in range(K):
+            if vol_rank[k] == K - 1:
+                volatility = "高波动"
+            elif vol_rank[k] == 0:
+                volatility = "低波动"
+            else:
+                volatility = "中等波动"
+            labels.append({
+                "regime_name": names[k],
+                "market_sentiment": sentiment.get(names[k], "中性"),
+                "volatility_regime": volatility,
+            })
+        return labels
+
+
+class RebalanceEngine:
+    """组合再平衡引擎
+    
+    对同一策略下的全部组合一次性计算调仓：组合×标的的当前权重矩阵与目标权重矩阵求差，
+    按容忍带过滤小幅偏离、按换手率上限等比缩减，再按最小交易单位取整为股数。
+    """
+    
+    # 各资产类型默认最小交易单位（A股股票/ETF 100股一手，债券 10张一手）
+    DEFAULT_LOT_SIZES = {"STOCK": 100, "ETF": 100, "BOND": 10}
+    
+    def __init__(self, tolerance: float = 0.0, relative_tolerance: float = 0.0,
+                 max_turnover: Optional[float] = None, min_trade_value: float = 0.0,
+                 trade_to: str = "target"):
+        if trade_to not in ("target", "band"):
+            raise ValueError("trade_to 只能为 target 或 band")
+        self.tolerance = tolerance
+        self.relative_tolerance = relative_tolerance
+        self.max_turnover = max_turnover
+        self.min_trade_value = min_trade_value
+        self.trade_to = trade_to
+    
+    @classmethod
+    def lot_size(cls, asset_type: Optional[str]) -> int:
+        """资产类型对应的默认最小交易单位"""
+        return cls.DEFAULT_LOT_SIZES.get(asset_type, 1)
+    
+    def rebalance(self, current: np.ndarray, target: np.ndarray, values: np.ndarray,
+                  prices: np.ndarray, lot_sizes: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        计算调仓股数
+        
+        Args:
+            current: 当前权重矩阵 (组合数 × 标的数)
+            target: 目标权重矩阵 (组合数 × 标的数)
+            values: 各组合市值 (组合数)
+            prices: 各标的价格 (标的数)
+            lot_sizes: 各标的最小交易单位 (标的数)
+        
+        Returns:
+            quantity（正数买入、负数卖出）、amount、post_weights、turnover、breaches
+        """
+        drift = target - current
+        # 容忍带：绝对带宽与按目标权重比例的相对带宽取大者
+        band = np.maximum(self.tolerance, self.relative_tolerance * target)
+        breach = np.abs(drift) > band + 1e-12
+        if self.trade_to == "band":
+            # 只调回容忍带边缘，清仓的标的仍全部卖出
+            trade = np.where(target > 0, drift - np.sign(drift) * band, drift)
+            trade = np.where(breach, trade, 0.0)
+        else:
+            trade = np.where(breach, drift, 0.0)
+        
+        if self.max_turnover is not None:
+            turnover = np.abs(trade).sum(axis=1) / 2
+            scale = np.where(turnover > self.max_turnover, self.max_turnover / np.maximum(turnover, 1e-12), 1.0)
+            trade = trade * scale[:, None]
+        
+        # 按手数向零取整，保证买入不超出目标、卖出不超出持仓
+        shares = trade * values[:, None] / prices[None, :]
+        quantity = np.trunc(shares / lot_sizes[None, :] + np.sign(shares) * 1e-9) * lot_sizes[None, :]
+        # 清仓时零股可一次性卖出（换手率上限缩减后的部分卖出仍按整手）
+        held = np.floor(current * values[:, None] / prices[None, :] + 1e-9)
+        liquidate = breach & (target <= 0) & (current > 0) & (trade <= -current + 1e-12)
+        quantity = np.where(liquidate, -held, quantity)
+        
+        amount = quantity * prices[None, :]
+        if self.min_trade_value > 0:
+            small = (np.abs(amount) < self.min_trade_value) & ~liquidate
+            quantity = np.where(small, 0.0, quantity)
+            amount = np.where(small, 0.0, amount)
+        
+        traded = amount / values[:, None]
+        return {
+            "quantity": quantity,
+            "amount": amount,
+            "post_weights": current + traded,
+            "turnover": np.abs(traded).sum(axis=1) / 2,
+            "breaches": breach.sum(axis=1),
+        }
+
+
+class PortfolioOptimizer:
+    """组合优化器
+    
+    支持带约束的均值-方差、最小方差、风险平价与最大分散化四种方法。
+    协方差使用 Ledoit-Wolf 收缩估计；二次规划用 ADMM 求解（系数矩阵只求逆一次，
+    迭代只做矩阵-向量乘法），风险平价用阻尼牛顿法求解其凸等价问题。
+    """
+    
+    METHODS = ("mean_variance", "min_variance", "risk_parity", "max_diversification")
+    
+    def __init__(self, max_iter: int = 4000, tol: float = 1e-5, rho: float = 1.0, alpha: float = 1.6):
+        self.model_name = "PortfolioOptimizer_v1.0"
+        self.max_iter = max_iter
+        self.tol = tol
+        self.rho = rho
+        self.alpha = alpha
+        # 系数矩阵逆的缓存：协方差与约束结构相同的问题（如只有风险厌恶系数不同）共用一次求逆
+        self._inverse_cache: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+        self._inverse_lock = threading.Lock()
+    
+    def _inverse(self, K: np.ndarray) -> np.ndarray:
+        """求系数矩阵的逆，按矩阵内容缓存最近几个结果"""
+        key = hashlib.sha1(K.tobytes()).hexdigest()
+        with self._inverse_lock:
+            if key in self._inverse_cache:
+                self._inverse_cache.move_to_end(key)
+                return self._inverse_cache[key]
+        K_inv = np.linalg.inv(K)
+        with self._inverse_lock:
+            self._inverse_cache[key] = K_inv
+            while len(self._inverse_cache) > 4:
+                self._inverse_cache.popitem(last=False)
+        return K_inv
+    
+    @staticmethod
+    def ledoit_wolf(returns: np.ndarray) -> Tuple[np.ndarray, float]:
+        """Ledoit-Wolf 收缩协方差（收缩目标为等方差对角阵），返回 (协方差, 收缩强度)
+        
+        returns: T×N 收益率矩阵，缺失值按该资产均值填充（即视为零偏离）。
+        """
+        returns = np.asarray(returns, dtype=float)
+        n_obs = returns.shape[0]
+        x = returns - np.nanmean(returns, axis=0)
+        x = np.where(np.isfinite(x), x, 0.0)
+        sample = x.T @ x / n_obs
+        mu = np.trace(sample) / sample.shape[0]
+        # 收缩强度 = min(样本协方差估计误差 / 与目标的距离, 1)
+        delta = ((sample - mu * np.eye(sample.shape[0])) ** 2).sum()
+        x2 = x ** 2
+        beta = ((x2.T @ x2) / n_obs - sample ** 2).sum() / n_obs
+        shrinkage = float(min(beta, delta) / delta) if delta > 0 else 1.0
+        covariance = shrinkage * mu * np.eye(sample.shape[0]) + (1 - shrinkage) * sample
+        return covariance, shrinkage
+    
+    def solve_qp(self, P: np.ndarray, q: np.ndarray, L: np.ndarray, box_lower: np.ndarray, box_upper: np.ndarray,
+                 lower: np.ndarray, upper: np.ndarray, warm_start: Optional[Dict[str, np.ndarray]] = None) -> Dict[str, Any]:
+        """
+        ADMM 求解 min ½x'Px + q'x  s.t. box_lower ≤ x ≤ box_upper, lower ≤ Lx ≤ upper
+        
+        约束矩阵为 [I; L]，L 只有少量行（预算、分组、收益约束），矩阵乘法按分块计算，
+        每次迭代只有一次 N×N 矩阵-向量乘法。等式约束行使用较大的罚参数，并按原始/对偶残差
+        之比自适应调整一次罚参数。warm_start 可传入上次解的 x、z、y。
+        """
+        n = P.shape[0]
+        sigma = 1e-6
+        z_lower = np.concatenate([box_lower, lower])
+        z_upper = np.concatenate([box_upper, upper])
+        equality = z_upper - z_lower < 1e-10
+        
+        def A_dot(x):
+            return np.concatenate([x, L @ x])
+        
+        def At_dot(v):
+            return v[:n] + L.T @ v[n:]
+        
+        def factorize(rho_scalar):
+            rho = np.where(equality, rho_scalar * 1e3, rho_scalar)
+            K = P + np.diag(sigma + rho[:n]) + L.T @ (rho[n:, None] * L)
+            return rho, self._inverse(K)
+        
+        rho_scalar = self.rho
+        if warm_start and warm_start["z"].shape == z_lower.shape:
+            x, z, y = warm_start["x"].copy(), warm_start["z"].copy(), warm_start["y"].copy()
+            rho_scalar = warm_start.get("rho", rho_scalar)
+        elif warm_start:
+            # 约束行数不同（如增减了收益约束）时只沿用原始解
+            x = warm_start["x"].copy()
+            z, y = np.clip(A_dot(x), z_lower, z_upper), np.zeros(z_lower.shape)
+        else:
+            x, z, y = np.zeros(n), np.zeros(n + L.shape[0]), np.zeros(n + L.shape[0])
+        rho, K_inv = factorize(rho_scalar)
+        
+        converged = False
+        iterations = 0
+        q_norm = max(1.0, np.abs(q).max())
+        for iterations in range(1, self.max_iter + 1):
+            x_tilde = K_inv @ (sigma * x - q + At_dot(rho * z - y))
+            z_tilde = A_dot(x_tilde)
+            x = self.alpha * x_tilde + (1 - self.alpha) * x
+            z_relaxed = self.alpha * z_tilde + (1 - self.alpha) * z
+            z_next = np.clip(z_relaxed + y / rho, z_lower, z_upper)
+            y = y + rho * (z_relaxed - z_next)
+            z = z_next
+            # 每10次迭代检查一次原始/对偶残差
+            if iterations % 10 == 0:
+                Px, Aty = P @ x, At_dot(y)
+                primal = np.abs(A_dot(x) - z).max()
+                dual = np.abs(Px + q + Aty).max()
+                if primal < self.tol and dual < self.tol * q_norm:
+                    converged = True
+                    break
+                # 罚参数只在残差明显失衡时调整一次（重新求逆的代价与数十次迭代相当）
+                if iterations == 100:
+                    ratio = np.sqrt((primal / max(np.abs(z).max(), 1e-10)) /
+                                    max(dual / max(np.abs(Px).max(), np.abs(Aty).max(), q_norm), 1e-12))
+                    if ratio > 10 or ratio < 0.1:
+                        rho_scalar = float(np.clip(rho_scalar * ratio, 1e-6, 1e6))
+                        rho, K_inv = factorize(rho_scalar)
+        return {"x": x, "z": z, "y": y, "rho": rho_scalar, "iterations": iterations, "converged": converged}
+    
+    @staticmethod
+    def _constraints(n: int, groups: Optional[np.ndarray], group_limits: Optional[np.ndarray]):
+        """组装线性约束：权重和为1、分组权重上限"""
+        rows = [np.ones((1, n))]
+        lower = [np.ones(1)]
+        upper = [np.ones(1)]
+        if groups is not None and group_limits is not None and len(group_limits):
+            rows.append(np.asarray(groups, dtype=float))
+            lower.append(np.full(len(group_limits), -np.inf))
+            upper.append(np.asarray(group_limits, dtype=float))
+        return np.vstack(rows), np.concatenate(lower), np.concatenate(upper)
+    
+    def risk_parity(self, covariance: np.ndarray, budgets: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        """
+        风险预算组合：min ½y'Σy - Σ b_i log y_i（y > 0），w = y / Σy 的风险贡献与 b 成比例
+        """
+        n = covariance.shape[0]
+        budgets = np.full(n, 1.0 / n) if budgets is None else np.asarray(budgets, dtype=float) / np.sum(budgets)
+        scale = np.trace(covariance) / n
+        cov = covariance / scale
+        y = budgets / np.sqrt(np.diag(cov))
+        converged = False
+        iterations = 0
+        for iterations in range(1, 51):
+            gradient = cov @ y - budgets / y
+            hessian = cov + np.diag(budgets / y ** 2)
+            step = np.linalg.solve(hessian, gradient)
+            # 阻尼：保证迭代点始终为正
+            t = 1.0
+            while np.any(y - t * step <= 0):
+                t *= 0.5
+            y = y - t * step
+            if np.abs(gradient).max() < self.tol:
+                converged = True
+                break
+        return {"x": y / y.sum(), "iterations": iterations, "converged": converged}
+    
+    def optimize(self, method: str, covariance: np.ndarray, expected_returns: Optional[np.ndarray] = None,
+                 risk_aversion: float = 1.0, min_weight: float = 0.0, max_weight: float = 1.0,
+                 target_return: Optional[float] = None, groups: Optional[np.ndarray] = None,
+                 group_limits: Optional[np.ndarray] = None, risk_budgets: Optional[np.ndarray] = None,
+                 warm_start: Optional[Dict[str, np.ndarray]] = None) -> Dict[str, Any]:
+        """
+        求解组合权重
+        
+        Args:
+            method: mean_variance / min_variance / risk_parity / max_diversification
+            covariance: N×N 年化协方差
+            expected_returns: N 年化预期收益（均值-方差必需）
+            groups: G×N 分组归属矩阵，与 group_limits（各组权重上限）配合使用
+        
+        Returns:
+            weights、iterations、converged 以及供热启动使用的 state
+        """
+        if method not in self.METHODS:
+            raise ValueError(f"不支持的优化方法: {method}")
+        n = covariance.shape[0]
+        if min_weight * n > 1 + 1e-9 or max_weight * n < 1 - 1e-9:
+            raise ValueError("权重上下限与资产数量矛盾，无可行解")
+        
+        if method == "risk_parity":
+            result = self.risk_parity(covariance, risk_budgets)
+            return {"weights": result["x"], "iterations": result["iterations"],
+                    "converged": result["converged"], "state": None}
+        
+        # 目标函数按协方差平均对角元缩放，使 ADMM 罚参数与数据量纲无关
+        scale = np.trace(covariance) / n
+        P = covariance / scale
+        if method == "max_diversification":
+            # 等价问题：min y'Σy  s.t. σ'y = 1, y ≥ 0，w = y / Σy
+            vol = np.sqrt(np.diag(P))
+            result = self.solve_qp(P, np.zeros(n), vol[None, :], np.zeros(n), np.full(n, np.inf),
+                                   np.ones(1), np.ones(1), warm_start)
+            y = np.maximum(result["x"], 0.0)
+            weights = y / y.sum()
+        else:
+            q = np.zeros(n)
+            L, lower, upper = self._constraints(n, groups, group_limits)
+            if method == "mean_variance":
+                if expected_returns is None:
+                    raise ValueError("均值-方差优化需要预期收益")
+                mu = np.asarray(expected_returns, dtype=float)
+                # max μ'w - (λ/2)w'Σw 等价于 min ½w'(Σ/s)w - μ'w/(λs)
+                q = -mu / (risk_aversion * scale)
+                if target_return is not None:
+                    L = np.vstack([L, mu[None, :]])
+                    lower = np.append(lower, target_return)
+                    upper = np.append(upper, np.inf)
+            result = self.solve_qp(P, q, L, np.full(n, min_weight), np.full(n, max_weight), lower, upper, warm_start)
+            weights = np.clip(result["x"], min_weight, max_weight)
+            weights = weights / weights.sum()
+        
+        return {
+            "weights": weights,
+            "iterations": result["iterations"],
+            "converged": result["converged"],
+            "state": {"x": result["x"], "z": result["z"], "y": result["y"], "rho": result["rho"]},
+        }
+    
+    @staticmethod
+    def max_return(expected_returns: np.ndarray, min_weight: float = 0.0, max_weight: float = 1.0,
+                   groups: Optional[np.ndarray] = None, group_limits: Optional[np.ndarray] = None) -> float:
+        """约束下可达到的最高预期收益（分组互不重叠时按收益从高到低贪心填充即为最优）"""
+        n = len(expected_returns)
+        weights = np.full(n, min_weight)
+        budget = 1.0 - weights.sum()
+        group_of = np.full(n, -1)
+        remaining = np.array([])
+        if groups is not None and group_limits is not None and len(group_limits):
+            group_of = np.where(groups.any(axis=0), groups.argmax(axis=0), -1)
+            remaining = np.asarray(group_limits, dtype=float) - groups @ weights
+        for i in np.argsort(-expected_returns):
+            room = min(max_weight - weights[i], budget)
+            if group_of[i] >= 0:
+                room = min(room, max(remaining[group_of[i]], 0.0))
+            weights[i] += room
+            budget -= room
+            if group_of[i] >= 0:
+                remaining[group_of[i]] -= room
+        return float(weights @ expected_returns)
+    
+    def optimize_profile(self, covariance: np.ndarray, expected_returns: np.ndarray, risk_aversion: float,
+                         max_volatility: Optional[float] = None, target_return: Optional[float] = None,
+                         warm_start: Optional[Dict[str, np.ndarray]] = None,
+                         min_variance: Optional[Dict[str, Any]] = None, **constraints) -> Dict[str, Any]:
+        """
+        按客户约束求解均值-方差组合
+        
+        波动率超出上限时在对数尺度上加大风险厌恶系数（倍增后二分，每次从上次解热启动）；
+        目标收益超出约束下最高收益、或与波动率上限冲突时放弃目标收益；波动率上限低于最小方差组合
+        时直接返回最小方差组合。min_variance 可传入预先求得的最小方差结果供批量复用。
+        返回结果附带 risk_aversion（返回最小方差组合时为None）、volatility、expected_return、target_met、risk_met。
+        """
+        def volatility_of(result):
+            return float(np.sqrt(max(result["weights"] @ covariance @ result["weights"], 0.0)))
+        
+        def finish(result, lam):
+            volatility = volatility_of(result)
+            achieved = float(result["weights"] @ expected_returns)
+            result.update({
+                "risk_aversion": lam,
+                "volatility": volatility,
+                "expected_return": achieved,
+                "target_met": target_return is None or achieved >= target_return - 1e-4,
+                "risk_met": max_volatility is None or volatility <= max_volatility * (1 + 1e-3),
+            })
+            return result
+        
+        if max_volatility is not None:
+            min_variance = min_variance or self.optimize("min_variance", covariance, **constraints)
+            if volatility_of(min_variance) >= max_volatility:
+                return finish(dict(min_variance), None)
+        reachable = target_return is None or target_return <= self.max_return(
+            expected_returns, constraints.get("min_weight", 0.0), constraints.get("max_weight", 1.0),
+            constraints.get("groups"), constraints.get("group_limits")
+        )
+        
+        state = warm_start
+        for target in ([target_return, None] if target_return is not None and reachable else [None]):
+            def solve(lam):
+                nonlocal state
+                result = self.optimize("mean_variance", covariance, expected_returns, risk_aversion=lam,
+                                       target_return=target, warm_start=state, **constraints)
+                state = result["state"]
+                return result
+            
+            lam = risk_aversion
+            result = solve(lam)
+            if max_volatility is None or volatility_of(result) <= max_volatility:
+                return finish(result, lam)
+            # 倍增找到满足上限的风险厌恶系数，再在对数尺度上二分逼近上限
+            low, high, best = lam, None, None
+            for _ in range(16):
+                lam *= 4
+                result = solve(lam)
+                if volatility_of(result) <= max_volatility:
+                    high, best = lam, result
+                    break
+                low = lam
+            if best is None:
+                continue
+            for _ in range(4):
+                lam = np.sqrt(low * high)
+                result = solve(lam)
+                if volatility_of(result) <= max_volatility:
+                    high, best = lam, result
+                else:
+                    low = lam
+            return finish(best, high)
+        return finish(dict(min_variance), None)
+    
+    @staticmethod
+    def portfolio_metrics(weights: np.ndarray, covariance: np.ndarray,
+                          expected_returns: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        """组合波动率、风险贡献（占比）、分散化比率与预期收益"""
+        marginal = covariance @ weights
+        variance = float(weights @ marginal)
+        volatility = float(np.sqrt(max(variance, 0.0)))
+        contributions = weights * marginal / variance if variance > 0 else np.zeros_like(weights)
+        vol = np.sqrt(np.diag(covariance))
+        return {
+            "volatility": volatility,
+            "risk_contributions": contributions,
+            "diversification_ratio": float(weights @ vol / volatility) if volatility > 0 else None,
+            "expected_return": float(weights @ expected_returns) if expected_returns is not None else None,
+        }
+
+
+def _solve_profile_chunk(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """进程池任务：在一个进程内依次求解一组约束签名，相邻签名之间热启动"""
+    optimizer = PortfolioOptimizer(**payload["optimizer"])
+    covariance, expected_returns = payload["covariance"], payload["expected_returns"]
+    state = None
+    results = []
+    for profile in payload["profiles"]:
+        result = optimizer.optimize_profile(
+            covariance, expected_returns, profile["risk_aversion"], profile["max_volatility"],
+            profile["target_return"], warm_start=state, min_variance=payload["min_variance"], **payload["constraints"]
+        )
+        state = result["state"]
+        results.append({
+            "signature": profile["signature"],
+            "weights": result["weights"],
+            "risk_aversion": result["risk_aversion"],
+            "volatility": result["volatility"],
+            "expected_return": result["expected_return"],
+            "target_met": result["target_met"],
+            "risk_met": result["risk_met"],
+            "iterations": result["iterations"],
+        })
+    return results
+
+
+class BatchPortfolioOptimizer:
+    """
+    批量个性化组合优化
+    
+    客户约束（风险等级、目标收益、最大回撤容忍度）先离散为约束签名，相同签名的组合只求解一次；
+    签名按风险厌恶系数与目标收益排序后切块，同一块内顺序求解并热启动，各块在进程池中并行。
+    """
+    
+    # 风险等级（1保守-5激进）对应的风险厌恶系数
+    RISK_AVERSION_BY_LEVEL = {1: 16.0, 2: 8.0, 3: 4.0, 4: 2.0, 5: 1.0}
+    # 最大回撤容忍度换算年化波动率上限（一年内约两倍标准差的回撤）
+    DRAWDOWN_TO_VOLATILITY = 0.5
+    
+    def __init__(self, optimizer: Optional[PortfolioOptimizer] = None, max_workers: int = 1,
+                 return_step: float = 0.005, drawdown_step: float = 0.01):
+        self.optimizer = optimizer or PortfolioOptimizer()
+        self.max_workers = max_workers
+        self.return_step = return_step
+        self.drawdown_step = drawdown_step
+    
+    @staticmethod
+    def _as_ratio(value: Optional[float]) -> Optional[float]:
+        """兼容百分数与小数两种录入方式（20 与 0.2 均表示 20%）"""
+        if value is None:
+            return None
+        return value / 100 if abs(value) > 1 else value
+    
+    def signature(self, risk_level: int, target_return: Optional[float],
+                  max_drawdown: Optional[float]) -> Tuple[int, Optional[float], Optional[float]]:
+        """客户约束离散化后的签名"""
+        target_return = self._as_ratio(target_return)
+        max_drawdown = self._as_ratio(max_drawdown)
+        return (
+            int(min(max(risk_level, 1), 5)),
+            round(round(target_return / self.return_step) * self.return_step, 6) if target_return is not None else None,
+            round(round(abs(max_drawdown) / self.drawdown_step) * self.drawdown_step, 6) if max_drawdown else None,
+        )
+    
+    def profile(self, signature: Tuple[int, Optional[float], Optional[float]]) -> Dict[str, Any]:
+        """签名对应的优化参数"""
+        risk_level, target_return, max_drawdown = signature
+        return {
+            "signature": signature,
+            "risk_aversion": self.RISK_AVERSION_BY_LEVEL[risk_level],
+            "target_return": target_return,
+            "max_volatility": max_drawdown * self.DRAWDOWN_TO_VOLATILITY if max_drawdown else None,
+        }
+    
+    def solve(self, covariance: np.ndarray, expected_returns: np.ndarray,
+              signatures: List[Tuple], **constraints) -> Dict[Tuple, Dict[str, Any]]:
+        """求解全部签名，返回 签名 -> 结果"""
+        profiles = sorted(
+            (self.profile(signature) for signature in set(signatures)),
+            key=lambda p: (-p["risk_aversion"], p["max_volatility"] or np.inf, p["target_return"] or -np.inf)
+        )
+        if not profiles:
+            return {}
+        # 最小方差组合只求一次，用于判断各签名的波动率上限是否可行
+        min_variance = self.optimizer.optimize("min_variance", covariance, **constraints)
+        n_chunks = max(1, min(self.max_workers, len(profiles)))
+        chunk_size = int(np.ceil(len(profiles) / n_chunks))
+        payloads = [{
+            "optimizer": {"max_iter": self.optimizer.max_iter, "tol": self.optimizer.tol,
+                          "rho": self.optimizer.rho, "alpha": self.optimizer.alpha},
+            "covariance": covariance,
+            "expected_returns": expected_returns,
+            "constraints": constraints,
+            "min_variance": min_variance,
+            "profiles": profiles[i:i + chunk_size],
+        } for i in range(0, len(profiles), chunk_size)]
+        
+        if len(payloads) == 1:
+            chunks = [_solve_profile_chunk(payloads[0])]
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=len(payloads)) as executor:
+                chunks = list(executor.map(_solve_profile_chunk, payloads))
+        return {result["signature"]: result for chunk in chunks for result in chunk}
+
+
+def _unique_rows(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    矩阵去重后的行及各原始行对应的去重行号
+    
+    跟随同一模型组合的客户组合权重完全相同，按去重后的行计算再展开，计算量与模型数而非客户数成正比。
+    """
+    if matrix.shape[0] == 0:
+        return matrix, np.zeros(0, dtype=int)
+    unique, inverse = np.unique(matrix, axis=0, return_inverse=True)
+    return unique, inverse.reshape(-1)
+
+
+class PortfolioValuationEngine:
+    """组合估值引擎
+    
+    组合只记录静态目标权重，估值按恒定权重组合处理：每日收益 = Σ 权重 × 标的日收益，
+    未配置的权重视为现金（收益为0）。全部组合的权重矩阵与标的收益矩阵一次矩阵乘法得到各组合日收益，
+    再从各组合的基准日（最近一次净值快照）起连乘得到单位净值。
+    """
+    
+    BASE_NAV = 1.0
+    
+    @staticmethod
+    def asset_returns(closes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        由收盘价矩阵计算标的日收益
+        
+        当日收益相对前一个有价格的交易日计算；停牌或缺失价格的标的当日收益记为0且视为不可用。
+        
+        Returns:
+            (日收益矩阵 日期数×标的数，不可用处为0, 收益是否可用的布尔矩阵)
+        """
+        filled = pd.DataFrame(closes).ffill().to_numpy(dtype=float)
+        previous = np.vstack([np.full((1, filled.shape[1]), np.nan), filled[:-1]])
+        valid = np.isfinite(closes) & np.isfinite(previous) & (previous > 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            returns = np.where(valid, closes / np.where(valid, previous, 1.0) - 1.0, 0.0)
+        return returns, valid
+    
+    def valuate(self, weights: np.ndarray, closes: np.ndarray, base_rows: np.ndarray,
+                base_navs: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        批量计算组合净值
+        
+        Args:
+            weights: 组合×标的权重矩阵（小数），未匹配到行情的持仓不计入
+            closes: 日期×标的收盘价矩阵，缺失为NaN
+            base_rows: 各组合基准日所在行，基准日及之前的收益不计入净值
+            base_navs: 各组合基准日的单位净值
+        
+        Returns:
+            nav、daily_return、covered_weight（日期×组合，当日有可用收益的权重合计）、asset_returns（日期×标的）
+        """
+        asset_returns, valid = self.asset_returns(closes)
+        # 权重与基准日都相同的组合只计算一次单位净值，再按各自基准净值缩放
+        unique, inverse = _unique_rows(np.column_stack([weights, base_rows]))
+        unique_weights, unique_base_rows = unique[:, :-1], unique[:, -1]
+        daily = asset_returns @ unique_weights.T
+        after_base = np.arange(closes.shape[0])[:, None] > unique_base_rows[None, :]
+        daily = np.where(after_base, daily, 0.0)
+        nav = base_navs[None, :] * np.cumprod(1.0 + daily, axis=0)[:, inverse]
+        covered = valid.astype(float) @ unique_weights.T
+        return {"nav": nav, "daily_return": daily[:, inverse], "covered_weight": covered[:, inverse],
+                "asset_returns": asset_returns}
+
+
+class PortfolioRiskAnalyzer:
+    """组合风险分析
+    
+    历史法与参数法（正态）VaR/CVaR、年化波动率、相对基准的Beta、最大回撤及各资产风险贡献。
+    收益矩阵中的缺失值视为当日收益为0；多日持有期按平方根法则由日度指标放大。
+    """
+    
+    def __init__(self, confidence: float = 0.95, horizon_days: int = 1, trading_days: int = 252):
+        if not 0.5 < confidence < 1:
+            raise ValueError("置信水平需在0.5到1之间")
+        self.confidence = confidence
+        self.horizon_days = horizon_days
+        self.trading_days = trading_days
+    
+    def value_at_risk(self, daily_returns: np.ndarray, daily_volatility: float) -> Dict[str, float]:
+        """以组合收益率表示的损失（正数），历史法取经验分位数，参数法取正态分位数"""
+        scale = np.sqrt(self.horizon_days)
+        tail = 1.0 - self.confidence
+        mean = float(daily_returns.mean()) if len(daily_returns) else 0.0
+        
+        z = NormalDist().inv_cdf(self.confidence)
+        parametric_var = z * daily_volatility * scale - mean * self.horizon_days
+        parametric_cvar = daily_volatility * scale * NormalDist().pdf(z) / tail - mean * self.horizon_days
+        
+        if len(daily_returns):
+            cutoff = np.quantile(daily_returns, tail)
+            historical_var = -cutoff * scale
+            historical_cvar = -daily_returns[daily_returns <= cutoff].mean() * scale
+        else:
+            historical_var = historical_cvar = 0.0
+        return {
+            "historical_var": float(historical_var),
+            "historical_cvar": float(historical_cvar),
+            "parametric_var": float(parametric_var),
+            "parametric_cvar": float(parametric_cvar),
+        }
+    
+    @staticmethod
+    def beta(daily_returns: np.ndarray, benchmark_returns: np.ndarray) -> Optional[float]:
+        """对齐日期后的组合收益对基准收益的回归系数，基准缺失的日期剔除"""
+        mask = np.isfinite(benchmark_returns)
+        if mask.sum() < 2:
+            return None
+        benchmark = benchmark_returns[mask]
+        variance = benchmark.var(ddof=1)
+        if variance <= 0:
+            return None
+        return float(np.cov(daily_returns[mask], benchmark, ddof=1)[0, 1] / variance)
+    
+    @staticmethod
+    def max_drawdown(daily_returns: np.ndarray) -> float:
+        """按日收益连乘的净值序列最大回撤（正数）"""
+        if not len(daily_returns):
+            return 0.0
+        nav = np.cumprod(1.0 + daily_returns)
+        peak = np.maximum.accumulate(np.concatenate([[1.0], nav]))[1:]
+        return float((1.0 - nav / peak).max())
+    
+    def analyze(self, weights: np.ndarray, covariance: np.ndarray, returns: np.ndarray,
+                benchmark_returns: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        """
+        计算组合风险指标
+        
+        Args:
+            weights: 各资产权重（小数，合计可小于1，剩余视为现金）
+            covariance: 年化协方差矩阵
+            returns: 资产日收益矩阵 (日期数 × 资产数)，缺失为NaN
+            benchmark_returns: 与returns日期对齐的基准日收益，缺失为NaN
+        """
+        daily_returns = np.nan_to_num(returns) @ weights if returns.size else np.zeros(0)
+        metrics = PortfolioOptimizer.portfolio_metrics(weights, covariance)
+        marginal = covariance @ weights / metrics["volatility"] if metrics["volatility"] > 0 else np.zeros_like(weights)
+        
+        result = {
+            "volatility": metrics["volatility"],
+            "daily_returns": daily_returns,
+            "max_drawdown": self.max_drawdown(daily_returns),
+            "beta": self.beta(daily_returns, benchmark_returns) if benchmark_returns is not None else None,
+            "marginal_risk": marginal,
+            "risk_contributions": metrics["risk_contributions"],
+        }
+        result.update(self.value_at_risk(daily_returns, metrics["volatility"] / np.sqrt(self.trading_days)))
+        return result
+
+
+class SuitabilityEngine:
+    """适当性检查引擎
+    
+    对全部组合一次性计算实际风险（年化波动率与回看期最大回撤），再与持有人画像逐项比对：
+    风险等级是否超出风险承受评分允许的等级、波动率是否超出等级上限、
+    实际或预期回撤是否超出回撤容忍度、非上市资产权重是否超出流动性需求允许的比例。
+    """
+    
+    # 各风险等级的年化波动率上限
+    VOLATILITY_LIMITS = {1: 0.05, 2: 0.10, 3: 0.18, 4: 0.28, 5: np.inf}
+    # 流动性需求对应的非上市（无日行情）资产权重上限
+    LIQUIDITY_LIMITS = {"高": 0.1, "high": 0.1, "中": 0.3, "medium": 0.3, "低": 1.0, "low": 1.0}
+    # 每批计算的组合数，限制 组合×资产 权重矩阵的内存占用
+    CHUNK_SIZE = 1000
+    
+    def __init__(self, trading_days: int = 252):
+        self.trading_days = trading_days
+    
+    @staticmethod
+    def allowed_levels(tolerance_scores: np.ndarray) -> np.ndarray:
+        """风险承受评分（1-10）对应的最高风险等级（1-5），评分缺失为NaN"""
+        return np.clip(np.ceil(tolerance_scores / 2), 1, 5)
+    
+    @classmethod
+    def liquidity_limit(cls, liquidity_needs: Optional[str]) -> float:
+        """流动性需求对应的非上市资产权重上限，未填写时不限制"""
+        if not liquidity_needs:
+            return 1.0
+        return cls.LIQUIDITY_LIMITS.get(liquidity_needs.strip().lower(), 1.0)
+    
+    def measure(self, weights: np.ndarray, returns: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        按组合分批计算日收益序列的年化波动率与最大回撤
+        
+        Args:
+            weights: 组合×资产权重矩阵（小数）
+            returns: 日期×资产日收益矩阵，缺失为NaN（视为当日收益为0）
+        """
+        returns = np.nan_to_num(returns)
+        volatility = np.zeros(weights.shape[0])
+        drawdown = np.zeros(weights.shape[0])
+        if returns.shape[0] < 2:
+            return {"volatility": volatility, "max_drawdown": drawdown}
+        # 权重相同的组合（如跟随同一模型组合）只计算一次
+        unique, inverse = _unique_rows(weights)
+        volatility, drawdown = np.zeros(unique.shape[0]), np.zeros(unique.shape[0])
+        for start in range(0, unique.shape[0], self.CHUNK_SIZE):
+            block = slice(start, start + self.CHUNK_SIZE)
+            daily = returns @ unique[block].T
+            volatility[block] = daily.std(axis=0, ddof=1) * np.sqrt(self.trading_days)
+            nav = np.cumprod(1.0 + daily, axis=0)
+            peak = np.maximum(np.maximum.accumulate(nav, axis=0), 1.0)
+            drawdown[block] = (1.0 - nav / peak).max(axis=0)
+        return {"volatility": volatility[inverse], "max_drawdown": drawdown[inverse]}
+    
+    def evaluate(self, risk_levels: np.ndarray, volatility: np.ndarray, max_drawdown: np.ndarray,
+                 tolerance_scores: np.ndarray, drawdown_tolerances: np.ndarray,
+                 illiquid_weights: np.ndarray, liquidity_limits: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        逐项比对（画像字段缺失的项不判定）
+        
+        Returns:
+            allowed_level、expected_drawdown 及 risk_level、volatility、drawdown、liquidity 四项的越限布尔数组
+        """
+        allowed = self.allowed_levels(tolerance_scores)
+        effective = np.where(np.isnan(allowed), risk_levels, np.minimum(risk_levels, np.nan_to_num(allowed, nan=5)))
+        volatility_limits = np.array([self.VOLATILITY_LIMITS[int(level)] for level in effective], dtype=float)
+        # 由波动率推算的预期回撤，与最大回撤容忍度换算波动率上限的比例一致
+        expected_drawdown = volatility / BatchPortfolioOptimizer.DRAWDOWN_TO_VOLATILITY
+        worst_drawdown = np.maximum(max_drawdown, expected_drawdown)
+        return {
+            "allowed_level": allowed,
+            "expected_drawdown": expected_drawdown,
+            "risk_level": ~np.isnan(allowed) & (risk_levels > allowed),
+            "volatility": volatility > volatility_limits + 1e-12,
+            "drawdown": ~np.isnan(drawdown_tolerances) & (worst_drawdown > drawdown_tolerances + 1e-12),
+            "liquidity": illiquid_weights > liquidity_limits + 1e-12,
+        }
+
+
+class GoalProjectionEngine:
+    """投资目标蒙特卡洛预测引擎
+    
+    组合按月复利，月度对数收益服从正态分布（年化收益与波动率换算），每月末追加定投。
+    全部路径共用一组标准正态随机游走 W：累计对数收益 L_t = 漂移×t + 波动率×W_t，
+    期末价值 V_t = e^{L_t}·(V_0 + c·Σ_{k≤t} e^{-L_k})，对初始金额与定投金额是线性的，
+    因此收益分布相同（同一组合）的目标只需模拟一次，再按各自金额线性组合。
+    """
+    
+    DEFAULT_PATHS = 10000
+    PERCENTILES = (5, 25, 50, 75, 95)
+    # 最长预测期（月）
+    MAX_MONTHS = 600
+    # 单次模拟的路径数×月数上限，默认路径数在最长预测期下恰好不超限
+    MAX_CELLS = DEFAULT_PATHS * MAX_MONTHS
+    
+    def __init__(self, paths: int = DEFAULT_PATHS, seed: Optional[int] = None):
+        self.paths = paths
+        self.seed = seed
+    
+    def _factors(self, walk: np.ndarray, expected_return: float, volatility: float) -> Tuple[np.ndarray, np.ndarray]:
+        """(初始金额增长因子, 每月1元定投的累计价值)，形状均为 路径×月"""
+        months = np.arange(1, walk.shape[1] + 1)
+        drift = (expected_return - volatility ** 2 / 2) / 12
+        log_growth = walk * (volatility / np.sqrt(12))
+        log_growth += drift * months
+        contribution = np.exp(-log_growth)
+        np.cumsum(contribution, axis=1, out=contribution)
+        growth = np.exp(log_growth, out=log_growth)
+        contribution *= growth
+        return growth, contribution
+    
+    def project(self, expected_returns: np.ndarray, volatilities: np.ndarray, months: np.ndarray,
+                initial_amounts: np.ndarray, contributions: np.ndarray, targets: np.ndarray) -> List[Dict[str, Any]]:
+        """
+        批量预测多个目标
+        
+        Args:
+            expected_returns / volatilities: 各目标关联组合的年化收益与波动率
+            months: 距目标日期的月数（0表示已到期）
+            initial_amounts / contributions / targets: 当前金额、每月定投金额、目标金额
+        
+        Returns:
+            每个目标的 probability、expected_value、percentiles（期末分位数）、
+            bands（每12个月及到期月的分位数，月份从1起）
+        """
+        months = np.clip(months.astype(int), 0, self.MAX_MONTHS)
+        results: List[Optional[Dict[str, Any]]] = [None] * len(months)
+        horizon = int(months.max()) if len(months) else 0
+        if self.paths * horizon > self.MAX_CELLS:
+            raise ValueError(f"模拟规模超出上限：路径数×预测月数不能超过 {self.MAX_CELLS}（当前最长预测期 {horizon} 个月）")
+        walk = None
+        if horizon > 0:
+            rng = np.random.default_rng(self.seed)
+            walk = np.cumsum(rng.standard_normal((self.paths, horizon)), axis=1)
+        
+        groups: Dict[Tuple[float, float], List[int]] = {}
+        for i in range(len(months)):
+            if months[i] == 0:
+                # 已到期的目标只比较当前金额
+                value = float(initial_amounts[i])
+                results[i] = {
+                    "probability": float(value >= targets[i]),
+                    "expected_value": value,
+                    "percentiles": {f"p{q}": value for q in self.PERCENTILES},
+                    "bands": [],
+                }
+            else:
+                groups.setdefault((float(expected_returns[i]), float(volatilities[i])), []).append(i)
+        
+        for (expected_return, volatility), members in groups.items():
+            span = int(months[members].max())
+            growth, contribution = self._factors(walk[:, :span], expected_return, volatility)
+            for i in members:
+                checkpoints = sorted(set(range(12, int(months[i]) + 1, 12)) | {int(months[i])})
+                columns = np.array(checkpoints) - 1
+                values = initial_amounts[i] * growth[:, columns] + contributions[i] * contribution[:, columns]
+                bands = np.percentile(values, self.PERCENTILES, axis=0)
+                terminal = values[:, -1]
+                results[i] = {
+                    "probability": float((terminal >= targets[i]).mean()),
+                    "expected_value": float(terminal.mean()),
+                    "percentiles": {f"p{q}": float(bands[k, -1]) for k, q in enumerate(self.PERCENTILES)},
+                    "bands": [
+                        {"month": month, **{f"p{q}": float(bands[k, j]) for k, q in enumerate(self.PERCENTILES)}}
+                        for j, month in enumerate(checkpoints)
+                    ],
+                }
+        return results
+
+
+class StressTestEngine:
+    """压力测试引擎
+    
+    情景表示为 资产×情景 的标的冲击矩阵，全部组合的情景收益为一次矩阵乘法 权重 × 冲击。
+    标的冲击依次取：情景中指定的标的冲击 → 历史情景期间标的自身的实际收益（历史重放）
+    → 标的对各因子指数的Beta × 因子冲击。均无法确定的标的不计入覆盖率，按收益为0处理。
+    """
+    
+    # 估计Beta所需的最少有效观测数
+    MIN_OBSERVATIONS = 20
+    # 每批计算的组合数，限制亏损贡献矩阵的内存占用
+    CHUNK_SIZE = 1000
+    
+    @classmethod
+    def betas(cls, asset_returns: np.ndarray, factor_returns: np.ndarray) -> np.ndarray:
+        """
+        标的对各因子日收益的多元回归Beta（资产×因子）
+        
+        情景只冲击其中部分因子时应只对这些因子回归，避免偏Beta低估冲击。只使用全部因子都有收益的交易日；标的缺失日按去均值后为0处理，有效观测不足的标的为NaN。
+        """
+        n_assets, n_factors = asset_returns.shape[1], factor_returns.shape[1]
+        rows = np.isfinite(factor_returns).all(axis=1)
+        if rows.sum() < cls.MIN_OBSERVATIONS or n_assets == 0 or n_factors == 0:
+            return np.full((n_assets, n_factors), np.nan)
+        x = factor_returns[rows]
+        y = asset_returns[rows]
+        valid = np.isfinite(y)
+        x = x - x.mean(axis=0)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            y = np.where(valid, y - np.nanmean(y, axis=0), 0.0)
+        betas = np.linalg.lstsq(x, y, rcond=None)[0].T
+        betas[valid.sum(axis=0) < cls.MIN_OBSERVATIONS] = np.nan
+        return betas
+    
+    @staticmethod
+    def implied_shocks(betas: np.ndarray, factor_shocks: np.ndarray) -> np.ndarray:
+        """由 资产×因子 Beta 与 因子×情景 冲击推算 资产×情景 冲击，缺少Beta的标的为NaN"""
+        implied = np.nan_to_num(betas) @ factor_shocks
+        implied[np.isnan(betas).any(axis=1)] = np.nan
+        return implied
+    
+    @staticmethod
+    def asset_shocks(implied: np.ndarray, replayed: np.ndarray, overrides: np.ndarray) -> np.ndarray:
+        """按 指定冲击 → 历史重放收益 → 因子推算冲击 的顺序合成 资产×情景 冲击矩阵（均为NaN表示无法确定）"""
+        shocks = np.where(np.isnan(overrides), replayed, overrides)
+        return np.where(np.isnan(shocks), implied, shocks)
+    
+    def apply(self, weights: np.ndarray, shocks: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        全部组合在全部情景下的收益（组合×情景）
+        
+        Returns:
+            returns、coverage（有冲击的持仓权重）、worst_asset（亏损贡献最大的资产列号）、worst_contribution
+        """
+        if weights.shape[0] > 1:
+            # 权重相同的组合（如跟随同一模型组合）只计算一次
+            unique, inverse = _unique_rows(weights)
+            if unique.shape[0] < weights.shape[0]:
+                return {key: value[inverse] for key, value in self.apply(unique, shocks).items()}
+        covered = np.isfinite(shocks)
+        shocks = np.where(covered, shocks, 0.0)
+        n_portfolios, n_scenarios = weights.shape[0], shocks.shape[1]
+        returns = weights @ shocks
+        coverage = weights @ covered.astype(float)
+        worst_asset = np.full((n_portfolios, n_scenarios), -1, dtype=int)
+        worst_contribution = np.zeros((n_portfolios, n_scenarios))
+        if weights.shape[1] == 0:
+            return {"returns": returns, "coverage": coverage, "worst_asset": worst_asset,
+                    "worst_contribution": worst_contribution}
+        for start in range(0, n_portfolios, self.CHUNK_SIZE):
+            block = slice(start, start + self.CHUNK_SIZE)
+            for k in range(n_scenarios):
+                contributions = weights[block] * shocks[:, k]
+                worst = contributions.argmin(axis=1)
+                worst_contribution[block, k] = contributions[np.arange(len(worst)), worst]
+                worst_asset[block, k] = np.where(worst_contribution[block, k] < 0, worst, -1)
+        return {"returns": returns, "coverage": coverage, "worst_asset": worst_asset,
+                "worst_contribution": np.minimum(worst_contribution, 0.0)}
+
+
+class QuestionnaireScorer:
+    """风险测评问卷评分器
+    
+    模板编译为 选项×维度 的得分矩阵（选项分值×题目权重）。一批答卷编码为 答卷×选项 的指示矩阵，
+    各维度得分为一次矩阵乘法，总分为各维度之和；再按模板的分数区间与换算系数得到风险等级与风险承受能力。
+    """
+    
+    # 与风险测评记录的各维度得分字段对应，未归入维度的题目只计入总分
+    DIMENSIONS = ("investment_knowledge", "investment_experience", "financial_situation",
+                  "risk_attitude", "investment_horizon")
+    
+    def __init__(self, questions: List[Dict[str, Any]], bands: List[Dict[str, Any]], tolerance_divisor: float = 10.0):
+        if not questions:
+            raise ValueError("问卷至少需要一道题目")
+        if not bands:
+            raise ValueError("至少需要一个风险等级区间")
+        if tolerance_divisor <= 0:
+            raise ValueError("风险承受能力换算系数必须为正数")
+        self.question_ids: List[str] = []
+        self.option_index: Dict[Tuple[str, str], int] = {}
+        scores, question_of_option = [], []
+        for question in questions:
+            question_id = str(question["id"])
+            if question_id in self.question_ids:
+                raise ValueError(f"题目编号重复: {question_id}")
+            dimension = question.get("dimension")
+            if dimension is not None and dimension not in self.DIMENSIONS:
+                raise ValueError(f"未知维度: {dimension}")
+            options = question.get("options") or {}
+            if not options:
+                raise ValueError(f"题目 {question_id} 没有选项")
+            column = self.DIMENSIONS.index(dimension) if dimension is not None else len(self.DIMENSIONS)
+            for option, score in options.items():
+                self.option_index[(question_id, str(option))] = len(scores)
+                row = np.zeros(len(self.DIMENSIONS) + 1)
+                row[column] = float(score) * float(question.get("weight", 1.0))
+                scores.append(row)
+                question_of_option.append(len(self.question_ids))
+            self.question_ids.append(question_id)
+        self.weights = np.array(scores)
+        self.question_of_option = np.array(question_of_option)
+        self.dimension_used = self.weights.any(axis=0)[:len(self.DIMENSIONS)]
+        
+        upper = [band.get("max_score") for band in bands]
+        bounded = [value for value in upper if value is not None]
+        if None in upper[:-1] or any(a >= b for a, b in zip(bounded, bounded[1:])):
+            raise ValueError("风险等级区间须按分数上限递增，仅最后一个区间可不设上限")
+        self.thresholds = np.array([np.inf if value is None else float(value) for value in upper])
+        self.levels = [str(band["risk_level"]) for band in bands]
+        self.tolerance_divisor = float(tolerance_divisor)
+    
+    def encode(self, answers: List[Dict[str, Any]]) -> Tuple[np.ndarray, List[List[str]]]:
+        """答卷×选项 指示矩阵，以及各答卷未作答或选项无效的题目"""
+        indicator = np.zeros((len(answers), len(self.weights)))
+        problems = []
+        for i, answer in enumerate(answers):
+            answer = {str(key): str(value) for key, value in (answer or {}).items()}
+            invalid = []
+            for question_id in self.question_ids:
+                column = self.option_index.get((question_id, answer.get(question_id)))
+                if column is None:
+                    invalid.append(question_id)
+                else:
+                    indicator[i, column] = 1.0
+            problems.append(invalid)
+        return indicator, problems
+    
+    def score(self, answers: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        批量评分
+        
+        Returns:
+            total、dimensions（答卷×维度，模板未使用的维度为NaN）、risk_level、risk_tolerance、
+            invalid（各答卷未作答或选项无效的题目，非空时该答卷得分无效）
+        """
+        indicator, problems = self.encode(answers)
+        scores = indicator @ self.weights
+        total = scores.sum(axis=1)
+        dimensions = scores[:, :len(self.DIMENSIONS)]
+        dimensions[:, ~self.dimension_used] = np.nan
+        bands = np.minimum(np.searchsorted(self.thresholds, total, side="left"), len(self.levels) - 1)
+        return {
+            "total": total,
+            "dimensions": dimensions,
+            "risk_level": [self.levels[band] for band in bands],
+            "risk_tolerance": np.clip(total / self.tolerance_divisor, 1.0, 10.0),
+            "invalid": problems,
+        }
+
+
+class ProfileSegmenter:
+    """客户画像分群（小批量K均值）
+    
+    画像特征标准化后（缺失值按均值填充，即标准化后为0），以 k-means++ 初始化，
+    每轮随机抽取一个小批量，按样本到最近中心的分配以 1/累计样本数 的步长移动中心；
+    中心位移低于阈值或达到最大轮数后停止，最后对全部样本分块计算最近中心。
+    """
+    
+    # 参与分群的画像特征；年收入取对数，投资期限换算为年
+    FEATURES = ("risk_tolerance_score", "annual_income", "investment_horizon",
+                "loss_aversion_score", "disposition_effect_score", "overconfidence_score")
+    HORIZON_YEARS = {"短期": 1.0, "short": 1.0, "中期": 3.0, "medium": 3.0, "长期": 7.0, "long": 7.0}
+    # 每块计算距离的样本数
+    CHUNK_SIZE = 10000
+    
+    def __init__(self, n_clusters: int = 8, batch_size: int = 1024, max_iter: int = 200,
+                 tol: float = 1e-4, seed: Optional[int] = None):
+        self.n_clusters = n_clusters
+        self.batch_size = batch_size
+        self.max_iter = max_iter
+        self.tol = tol
+        self.seed = seed
+    
+    @classmethod
+    def horizon_years(cls, value: Optional[str]) -> float:
+        """投资期限文本换算为年数（"3-5年"取中值，"短期/中期/长期"按约定年数），无法识别为NaN"""
+        if not value:
+            return np.nan
+        text = str(value).strip().lower()
+        numbers = [float(number) for number in re.findall(r"\d+(?:\.\d+)?", text)]
+        if numbers:
+            years = float(np.mean(numbers))
+            return years / 12 if "月" in text or "month" in text else years
+        for key, years in cls.HORIZON_YEARS.items():
+            if key in text:
+                return years
+        return np.nan
+    
+    @classmethod
+    def features(cls, profiles: pd.DataFrame) -> np.ndarray:
+        """画像表（列为 FEATURES）转换为 样本×特征 矩阵，缺失为NaN；投资期限按取值去重后换算"""
+        columns = []
+        for name in cls.FEATURES:
+            if name == "investment_horizon":
+                values = profiles[name]
+                years = {value: cls.horizon_years(value) for value in values.dropna().unique()}
+                columns.append(values.map(years).to_numpy(dtype=float, na_value=np.nan))
+            else:
+                values = pd.to_numeric(profiles[name], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+                columns.append(np.log1p(np.maximum(values, 0.0)) if name == "annual_income" else values)
+        return np.column_stack(columns) if columns else np.empty((len(profiles), 0))
+    
+    @staticmethod
+    def standardize(matrix: np.ndarray, means: Optional[np.ndarray] = None,
+                    scales: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """按给定（或样本）均值与标准差标准化，缺失值填0；全缺失或无差异的特征标准差取1"""
+        if means is None:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)
+                means = np.nan_to_num(np.nanmean(matrix, axis=0))
+                scales = np.nan_to_num(np.nanstd(matrix, axis=0))
+            scales = np.where(scales > 1e-12, scales, 1.0)
+        standardized = np.nan_to_num((matrix - means) / scales)
+        return standardized, means, scales
+    
+    def assign(self, points: np.ndarray, centers: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """各样本最近的中心及距离（分块计算）"""
+        labels = np.zeros(len(points), dtype=int)
+        distances = np.zeros(len(points))
+        center_norms = (centers ** 2).sum(axis=1)
+        for start in range(0, len(points), self.CHUNK_SIZE):
+            block = points[start:start + self.CHUNK_SIZE]
+            squared = (block ** 2).sum(axis=1)[:, None] - 2 * block @ centers.T + center_norms
+            labels[start:start + len(block)] = squared.argmin(axis=1)
+            distances[start:start + len(block)] = np.sqrt(np.maximum(squared.min(axis=1), 0.0))
+        return labels, distances
+    
+    def _init_centers(self, points: np.ndarray, n_clusters: int, rng: np.random.Generator) -> np.ndarray:
+        """在样本子集上做 k-means++ 初始化"""
+        sample = points[rng.choice(len(points), min(len(points), max(self.batch_size, 10 * n_clusters)), replace=False)]
+        centers = [sample[rng.integers(len(sample))]]
+        squared = ((sample - centers[0]) ** 2).sum(axis=1)
+        for _ in range(1, n_clusters):
+            total = squared.sum()
+            index = rng.choice(len(sample), p=squared / total) if total > 0 else rng.integers(len(sample))
+            centers.append(sample[index])
+            squared = np.minimum(squared, ((sample - sample[index]) ** 2).sum(axis=1))
+        return np.array(centers)
+    
+    def fit(self, points: np.ndarray) -> Dict[str, Any]:
+        """
+        对标准化后的样本分群
+        
+        Returns:
+            centers（簇×特征）、labels、distances、inertia（样本到所属中心距离平方和）、iterations
+        """
+        rng = np.random.default_rng(self.seed)
+        n_clusters = min(self.n_clusters, len(points))
+        centers = self._init_centers(points, n_clusters, rng)
+        counts = np.zeros(n_clusters)
+        iterations = 0
+        for iterations in range(1, self.max_iter + 1):
+            batch = points[rng.choice(len(points), min(self.batch_size, len(points)), replace=False)]
+            labels, _ = self.assign(batch, centers)
+            sums = np.zeros_like(centers)
+            np.add.at(sums, labels, batch)
+            members = np.bincount(labels, minlength=n_clusters).astype(float)
+            counts += members
+            moved = members > 0
+            previous = centers.copy()
+            # 逐样本以 1/累计样本数 为步长更新中心，合并为按簇的批量更新
+            centers[moved] += (sums[moved] - members[moved, None] * centers[moved]) / counts[moved, None]
+            if np.sqrt(((centers - previous) ** 2).sum(axis=1)).max() < self.tol:
+                break
+        labels, distances = self.assign(points, centers)
+        return {"centers": centers, "labels": labels, "distances": distances,
+                "inertia": float((distances ** 2).sum()), "iterations": iterations}
@@ -2,11 +2,14 @@
 市场数据模型
 定义金融工具的基础数据结构，包括股票、债券、基金等
 """
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text, ForeignKey, Enum, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
 import enum
+import pandas as pd
 
 
 class AssetType(enum.Enum):
@@ -55,6 +58,10 @@ class MarketData(Base):
 class PriceHistory(Base):
     """价格历史数据模型"""
     __tablename__ = "price_history"
+    __table_args__ = (
+        # 按标的与日期范围取行情（协方差估计、估值、适当性检查）走索引，计数与最新日期只需扫描索引
+        Index("ix_price_history_market_data_date", "market_data_id", "date"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     market_data_id = Column(Integer, ForeignKey("market_data.id"), nullable=False)
@@ -85,6 +92,49 @@ class PriceHistory(Base):
     
     def __repr__(self):
         return f"<PriceHistory(symbol='{self.market_data.symbol}', date='{self.date}', close='{self.close_price}')>"
+    
+    @staticmethod
+    def close_panel(db, market_data_ids: List[int], start_date: datetime, end_date: datetime) -> pd.DataFrame:
+        """区间内的复权收盘价（日期×标的，列按 market_data_ids 顺序，缺失为NaN）"""
+        bars = pd.DataFrame(db.query(
+            PriceHistory.date, PriceHistory.market_data_id,
+            func.coalesce(PriceHistory.adjusted_close, PriceHistory.close_price)
+        ).filter(
+            PriceHistory.market_data_id.in_(market_data_ids),
+            PriceHistory.date >= start_date, PriceHistory.date <= end_date
+        ).all(), columns=["date", "market_data_id", "close"]) if market_data_ids else pd.DataFrame()
+        if bars.empty:
+            return pd.DataFrame(columns=market_data_ids)
+        return bars.pivot_table(index="date", columns="market_data_id", values="close", aggfunc="last").reindex(
+            columns=market_data_ids
+        ).sort_index()
+    
+    @staticmethod
+    def return_panel(db, market_data_ids: List[int], lookback_days: int,
+                     end_date: Optional[datetime] = None) -> pd.DataFrame:
+        """最近 lookback_days 个交易日的日收益（日期×标的，列按 market_data_ids 顺序，缺失为NaN）"""
+        if not market_data_ids:
+            return pd.DataFrame(columns=market_data_ids)
+        end = end_date or db.query(func.max(PriceHistory.date)).filter(
+            PriceHistory.market_data_id.in_(market_data_ids)
+        ).scalar()
+        if end is None:
+            return pd.DataFrame(columns=market_data_ids)
+        # 按自然日放宽取数区间，再截取最近 lookback_days 个交易日
+        closes = PriceHistory.close_panel(db, market_data_ids, end - timedelta(days=lookback_days * 2 + 10), end)
+        if closes.empty:
+            return closes
+        return closes.tail(lookback_days + 1).pct_change(fill_method=None).iloc[1:]
+    
+    @staticmethod
+    def latest_closes(db, market_data_ids: List[int]) -> Dict[int, float]:
+        """各股最新一根K线的收盘价（优先复权价）"""
+        latest = db.query(
+            PriceHistory.market_data_id, func.max(PriceHistory.date).label("date")
+        ).filter(PriceHistory.market_data_id.in_(market_data_ids)).group_by(PriceHistory.market_data_id).subquery()
+        return dict(db.query(
+            PriceHistory.market_data_id, func.coalesce(PriceHistory.adjusted_close, PriceHistory.close_price)
+        ).join(latest, (PriceHistory.market_data_id == latest.c.market_data_id) & (PriceHistory.date == latest.c.date)).all())
 
 
 class MarketIndex(Base):
@@ -135,4 +185,68 @@ class IndexHistory(Base):
     market_index = relationship("MarketIndex", back_populates="index_history")
     
     def __repr__(self):
-        return f"<IndexHistory(code='{self.market_index.code}', date='{self.date}', close='{self.close_value}')>" 
\ No newline at end of file
+        return f"<IndexHistory(code='{self.market_index.code}', date='{self.date}', close='{self.close_value}')>"
+    
+    @staticmethod
+    def close_panel(db, market_index_ids: List[int], start_date: datetime, end_date: datetime) -> pd.DataFrame:
+        """区间内的指数收盘值（日期×指数，列按 market_index_ids 顺序，缺失为NaN）"""
+        rows = pd.DataFrame(db.query(
+            IndexHistory.date, IndexHistory.market_index_id, IndexHistory.close_value
+        ).filter(
+            IndexHistory.market_index_id.in_(market_index_ids),
+            IndexHistory.date >= start_date, IndexHistory.date <= end_date
+        ).all(), columns=["date", "market_index_id", "close"]) if market_index_ids else pd.DataFrame()
+        if rows.empty:
+            return pd.DataFrame(columns=market_index_ids)
+        return rows.pivot_table(index="date", columns="market_index_id", values="close", aggfunc="last").reindex(
+            columns=market_index_ids
+        ).sort_index()
+
+
+class IndustryAggregate(Base):
+    """行业/板块日度聚合指数（由 services.industry_aggregates 按个股日线增量维护，供行业轮动、归因和看板按日期区间读取）"""
+    __tablename__ = "industry_aggregates"
+    __table_args__ = (
+        UniqueConstraint("group_type", "group_name", "date", name="uq_industry_aggregate"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    group_type = Column(String(20), nullable=False, comment="分组类型：industry(行业)/sector(板块)")
+    group_name = Column(String(50), nullable=False, index=True, comment="行业或板块名称")
+    date = Column(DateTime, nullable=False, index=True, comment="交易日期")
+    
+    # 指数数据
+    index_level = Column(Float, comment="市值加权指数点位（基点1000）")
+    daily_return = Column(Float, comment="当日市值加权收益")
+    market_cap = Column(Float, comment="成分股总市值")
+    turnover = Column(Float, comment="成交额")
+    signed_turnover = Column(Float, comment="按涨跌方向计的成交额（资金流向代理）")
+    advancers = Column(Integer, comment="上涨家数")
+    constituents = Column(Integer, comment="当日有行情的成分股数量")
+    
+    # 时间戳
+    updated_at = Column(DateTime, default=datetime.utcnow, comment="计算时间")
+    
+    BASE_LEVEL = 1000.0
+    # 增量计算时在起始日前额外加载的交易日数，用于计算首日收益
+    WARMUP_DAYS = 5
+    
+    @staticmethod
+    def group_column(group_type: str):
+        """分组类型对应的市场数据字段"""
+        return {"industry": MarketData.industry, "sector": MarketData.sector}[group_type]
+    
+    @staticmethod
+    def previous_levels(db, group_type: str, before: datetime) -> Dict[str, float]:
+        """各分组在指定日期之前最近一日的指数点位"""
+        latest = db.query(
+            IndustryAggregate.group_name, func.max(IndustryAggregate.date).label("date")
+        ).filter(
+            IndustryAggregate.group_type == group_type, IndustryAggregate.date < before
+        ).group_by(IndustryAggregate.group_name).subquery()
+        return dict(db.query(IndustryAggregate.group_name, IndustryAggregate.index_level).filter(
+            IndustryAggregate.group_type == group_type
+        ).join(latest, (IndustryAggregate.group_name == latest.c.group_name) & (IndustryAggregate.date == latest.c.date)).all())
+    
+    def __repr__(self):
+        return f"<IndustryAggregate(group='{self.group_type}:{self.group_name}', date='{self.date}', level='{self.index_level}')>"
@@ -1,12 +1,13 @@
 """
 投资组合相关模型
-包含Portfolio（投资组合）、Asset（资产）和PortfolioAsset（投资组合资产关联）
+包含Portfolio（投资组合）、Asset（资产）、PortfolioAsset（投资组合资产关联）、PortfolioNavSnapshot（组合净值快照），
+以及ModelPortfolio（模型组合）与客户组合的关联和权重偏离
 """
 from __future__ import annotations
-from sqlalchemy import String, Integer, Float, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import String, Integer, Float, Boolean, DateTime, ForeignKey, Text, JSON, UniqueConstraint, func
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from datetime import datetime
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Dict, Iterable
 
 from . import Base
 from .asset_tag import Tag, AssetTag
@@ -34,6 +35,14 @@ class Portfolio(Base):
     # 关系
     user: Mapped["User"] = relationship("User", back_populates="portfolios")  # 所属用户
     portfolio_assets: Mapped[list["PortfolioAsset"]] = relationship("PortfolioAsset", back_populates="portfolio", cascade="all, delete-orphan")  # 资产关联
+    nav_snapshots: Mapped[list["PortfolioNavSnapshot"]] = relationship("PortfolioNavSnapshot", cascade="all, delete-orphan")  # 净值快照
+    model_link: Mapped["PortfolioModelLink | None"] = relationship("PortfolioModelLink", uselist=False, cascade="all, delete-orphan")  # 关联的模型组合
+    weight_overrides: Mapped[list["PortfolioWeightOverride"]] = relationship("PortfolioWeightOverride", cascade="all, delete-orphan")  # 相对模型组合的权重偏离
+    rebalance_orders: Mapped[list["RebalanceOrder"]] = relationship("RebalanceOrder", cascade="all, delete-orphan")  # 再平衡调仓指令
+    suitability_checks: Mapped[list["SuitabilityCheck"]] = relationship("SuitabilityCheck", cascade="all, delete-orphan")  # 适当性检查结果
+    goal_links: Mapped[list["GoalPortfolioLink"]] = relationship("GoalPortfolioLink", cascade="all, delete-orphan")  # 关联的投资目标
+    goal_projections: Mapped[list["GoalProjection"]] = relationship("GoalProjection", cascade="all, delete-orphan")  # 投资目标达成预测
+    stress_test_results: Mapped[list["StressTestResult"]] = relationship("StressTestResult", cascade="all, delete-orphan")  # 压力测试结果
 
     def __repr__(self):
         """字符串表示：<Portfolio 名称>"""
@@ -88,4 +97,128 @@ class PortfolioAsset(Base):
 
     def __repr__(self):
         """字符串表示：<PortfolioAsset 投资组合ID-资产ID: 权重%>"""
-        return f"<PortfolioAsset {self.portfolio_id}-{self.asset_id}: {self.weight}%>" 
\ No newline at end of file
+        return f"<PortfolioAsset {self.portfolio_id}-{self.asset_id}: {self.weight}%>" 
+
+
+class PortfolioNavSnapshot(Base):
+    """
+    组合净值快照模型。
+    按交易日增量保存各组合的单位净值、日收益及各资产的收益贡献。
+    """
+    __tablename__ = "portfolio_nav_snapshots"
+    __table_args__ = (
+        UniqueConstraint("portfolio_id", "date", name="uq_portfolio_nav_date"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, index=True)  # 快照ID
+    portfolio_id: Mapped[int] = mapped_column(ForeignKey("portfolios.id", ondelete="CASCADE"), nullable=False, index=True)  # 投资组合ID
+    date: Mapped[datetime] = mapped_column(DateTime, nullable=False)  # 交易日期
+    nav: Mapped[float] = mapped_column(nullable=False)  # 单位净值（基准日为1）
+    daily_return: Mapped[float] = mapped_column(nullable=False)  # 当日收益
+    cumulative_return: Mapped[float] = mapped_column(nullable=False)  # 自基准日以来的累计收益
+    coverage: Mapped[float] = mapped_column(nullable=False)  # 有可用行情的权重占持仓权重的比例
+    contributions: Mapped[dict | None] = mapped_column(JSON, nullable=True)  # 各资产收益贡献（资产代码: 贡献）
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)  # 计算时间
+
+    def __repr__(self):
+        """字符串表示：<PortfolioNavSnapshot 投资组合ID@日期: 净值>"""
+        return f"<PortfolioNavSnapshot {self.portfolio_id}@{self.date:%Y-%m-%d}: {self.nav:.4f}>"
+
+    @staticmethod
+    def latest(db, portfolio_ids: Iterable[int]) -> Dict[int, "PortfolioNavSnapshot"]:
+        """各组合最近一条净值快照（一次查询）"""
+        portfolio_ids = list(portfolio_ids)
+        if not portfolio_ids:
+            return {}
+        latest = db.query(
+            PortfolioNavSnapshot.portfolio_id, func.max(PortfolioNavSnapshot.date).label("date")
+        ).filter(PortfolioNavSnapshot.portfolio_id.in_(portfolio_ids)).group_by(PortfolioNavSnapshot.portfolio_id).subquery()
+        snapshots = db.query(PortfolioNavSnapshot).join(
+            latest, (PortfolioNavSnapshot.portfolio_id == latest.c.portfolio_id) & (PortfolioNavSnapshot.date == latest.c.date)
+        ).all()
+        return {snapshot.portfolio_id: snapshot for snapshot in snapshots}
+
+
+class ModelPortfolio(Base):
+    """
+    模型组合模型。
+    多个客户组合共用的目标配置，客户组合只保存相对模型的权重偏离；
+    模型或偏离变化时按 (模型, 偏离) 去重计算有效权重，再批量写回各客户组合的持仓。
+    """
+    __tablename__ = "model_portfolios"
+
+    id: Mapped[int] = mapped_column(primary_key=True, index=True)  # 模型组合ID
+    name: Mapped[str] = mapped_column(String(100), nullable=False, unique=True)  # 模型组合名称
+    description: Mapped[str | None] = mapped_column(Text, nullable=True)  # 描述
+    risk_level: Mapped[int] = mapped_column(nullable=False)  # 1-5，风险等级
+    created_by: Mapped[int | None] = mapped_column(ForeignKey("users.id"), nullable=True)  # 创建人
+    is_active: Mapped[bool] = mapped_column(Boolean, default=True)  # 是否启用
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)  # 创建时间
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # 更新时间
+
+    # 关系
+    model_assets: Mapped[list["ModelPortfolioAsset"]] = relationship("ModelPortfolioAsset", cascade="all, delete-orphan")  # 目标权重
+
+    def __repr__(self):
+        """字符串表示：<ModelPortfolio 名称>"""
+        return f"<ModelPortfolio {self.name}>"
+
+
+class ModelPortfolioAsset(Base):
+    """
+    模型组合资产模型。
+    模型组合中各资产的目标权重。
+    """
+    __tablename__ = "model_portfolio_assets"
+    __table_args__ = (
+        UniqueConstraint("model_id", "asset_id", name="uq_model_portfolio_asset"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, index=True)  # 记录ID
+    model_id: Mapped[int] = mapped_column(ForeignKey("model_portfolios.id"), nullable=False, index=True)  # 模型组合ID
+    asset_id: Mapped[int] = mapped_column(ForeignKey("assets.id"), nullable=False)  # 资产ID
+    weight: Mapped[float] = mapped_column(nullable=False)  # 权重百分比
+
+    # 关系
+    asset: Mapped["Asset"] = relationship("Asset")  # 资产
+
+    def __repr__(self):
+        """字符串表示：<ModelPortfolioAsset 模型组合ID-资产ID: 权重%>"""
+        return f"<ModelPortfolioAsset {self.model_id}-{self.asset_id}: {self.weight}%>"
+
+
+class PortfolioModelLink(Base):
+    """
+    组合模型关联模型。
+    客户组合跟随的模型组合，每个组合最多关联一个模型。
+    """
+    __tablename__ = "portfolio_model_links"
+
+    id: Mapped[int] = mapped_column(primary_key=True, index=True)  # 关联ID
+    portfolio_id: Mapped[int] = mapped_column(ForeignKey("portfolios.id", ondelete="CASCADE"), nullable=False, unique=True)  # 投资组合ID
+    model_id: Mapped[int] = mapped_column(ForeignKey("model_portfolios.id"), nullable=False, index=True)  # 模型组合ID
+    linked_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)  # 关联时间
+
+    def __repr__(self):
+        """字符串表示：<PortfolioModelLink 投资组合ID->模型组合ID>"""
+        return f"<PortfolioModelLink {self.portfolio_id}->{self.model_id}>"
+
+
+class PortfolioWeightOverride(Base):
+    """
+    组合权重偏离模型。
+    客户组合相对所关联模型组合的资产权重偏离（百分点，正数加仓、负数减仓）。
+    """
+    __tablename__ = "portfolio_weight_overrides"
+    __table_args__ = (
+        UniqueConstraint("portfolio_id", "asset_id", name="uq_portfolio_weight_override"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, index=True)  # 记录ID
+    portfolio_id: Mapped[int] = mapped_column(ForeignKey("portfolios.id", ondelete="CASCADE"), nullable=False, index=True)  # 投资组合ID
+    asset_id: Mapped[int] = mapped_column(ForeignKey("assets.id"), nullable=False)  # 资产ID
+    weight_delta: Mapped[float] = mapped_column(nullable=False)  # 权重偏离（百分点）
+
+    def __repr__(self):
+        """字符串表示：<PortfolioWeightOverride 投资组合ID-资产ID: 偏离>"""
+        return f"<PortfolioWeightOverride {self.portfolio_id}-{self.asset_id}: {self.weight_delta:+}>"
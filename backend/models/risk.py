@@ -1,4 +1,4 @@
-from sqlalchemy import Integer, ForeignKey, DateTime
+from sqlalchemy import Integer, String, Float, Boolean, ForeignKey, DateTime, UniqueConstraint, insert
 from sqlalchemy.orm import Mapped, mapped_column
 from sqlalchemy.types import JSON
 from datetime import datetime
@@ -13,4 +13,109 @@ class RiskAssessmentResult(Base):
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False, index=True)
     answers: Mapped[dict] = mapped_column(JSON, nullable=False)
-    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow) 
\ No newline at end of file
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+class SuitabilityCheck(Base):
+    """
+    适当性检查结果模型。
+    每个检查日对每个活跃组合保存一条记录：实际风险、持有人画像限额及越限项。
+    """
+    __tablename__ = "suitability_checks"
+    __table_args__ = (
+        UniqueConstraint("run_date", "portfolio_id", name="uq_suitability_check"),
+    )
+    id: Mapped[int] = mapped_column(primary_key=True, index=True)
+    run_date: Mapped[datetime] = mapped_column(DateTime, nullable=False, index=True)  # 检查日
+    portfolio_id: Mapped[int] = mapped_column(ForeignKey("portfolios.id", ondelete="CASCADE"), nullable=False, index=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False, index=True)
+    risk_level: Mapped[int] = mapped_column(Integer, nullable=False)  # 组合风险等级
+    allowed_risk_level: Mapped[int | None] = mapped_column(Integer, nullable=True)  # 风险承受评分允许的最高等级
+    volatility: Mapped[float] = mapped_column(Float, nullable=False)  # 年化波动率
+    max_drawdown: Mapped[float] = mapped_column(Float, nullable=False)  # 回看期最大回撤
+    expected_drawdown: Mapped[float] = mapped_column(Float, nullable=False)  # 由波动率推算的预期回撤
+    drawdown_tolerance: Mapped[float | None] = mapped_column(Float, nullable=True)  # 最大回撤容忍度（小数）
+    illiquid_weight: Mapped[float] = mapped_column(Float, nullable=False)  # 非上市资产权重
+    liquidity_needs: Mapped[str | None] = mapped_column(String(50), nullable=True)  # 流动性需求
+    status: Mapped[str] = mapped_column(String(20), nullable=False, index=True)  # pass/breach/unassessed
+    breaches: Mapped[list] = mapped_column(JSON, nullable=False, default=list)  # 越限项
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    BREACH_TYPES = ("risk_level", "volatility", "drawdown", "liquidity")
+
+
+class StressScenario(Base):
+    """
+    压力测试情景模型。
+    historical 情景重放基准指数在历史区间内的走势，factor 情景为用户自定义的指数（因子）冲击；
+    两类情景都可另行指定个别标的的冲击。
+    """
+    __tablename__ = "stress_scenarios"
+    id: Mapped[int] = mapped_column(primary_key=True, index=True)
+    name: Mapped[str] = mapped_column(String(100), nullable=False, unique=True)
+    description: Mapped[str | None] = mapped_column(String(500), nullable=True)
+    scenario_type: Mapped[str] = mapped_column(String(20), nullable=False)  # historical/factor
+    index_code: Mapped[str | None] = mapped_column(String(20), nullable=True)  # 历史情景的基准指数
+    start_date: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)  # 历史区间起点
+    end_date: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)  # 历史区间终点
+    factor_shocks: Mapped[dict] = mapped_column(JSON, nullable=False, default=dict)  # 指数代码 -> 区间收益冲击
+    symbol_shocks: Mapped[dict] = mapped_column(JSON, nullable=False, default=dict)  # 标的代码 -> 区间收益冲击
+    is_builtin: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    created_by: Mapped[int | None] = mapped_column(ForeignKey("users.id"), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    SCENARIO_TYPES = ("historical", "factor")
+    # 内置历史情景：沪深300在各次大幅下跌中的区间
+    BUILTIN_SCENARIOS = [
+        ("2008年全球金融危机", "2008-01-14", "2008-11-04"),
+        ("2015年股市异常波动", "2015-06-12", "2015-08-26"),
+        ("2016年初熔断", "2016-01-04", "2016-01-28"),
+        ("2018年贸易摩擦", "2018-01-24", "2019-01-03"),
+        ("2020年新冠疫情冲击", "2020-01-14", "2020-03-23"),
+    ]
+    BUILTIN_INDEX_CODE = "000300"
+
+    @staticmethod
+    def ensure_builtin(db) -> None:
+        """补齐缺少的内置历史情景（未提交）"""
+        existing = {name for (name,) in db.query(StressScenario.name).filter(
+            StressScenario.name.in_([name for name, _, _ in StressScenario.BUILTIN_SCENARIOS])
+        ).all()}
+        rows = [
+            {
+                "name": name,
+                "description": f"重放沪深300 {start} 至 {end} 的走势",
+                "scenario_type": "historical",
+                "index_code": StressScenario.BUILTIN_INDEX_CODE,
+                "start_date": datetime.strptime(start, "%Y-%m-%d"),
+                "end_date": datetime.strptime(end, "%Y-%m-%d"),
+                "factor_shocks": {},
+                "symbol_shocks": {},
+                "is_builtin": True,
+                "created_at": datetime.utcnow(),
+            }
+            for name, start, end in StressScenario.BUILTIN_SCENARIOS if name not in existing
+        ]
+        if rows:
+            db.execute(insert(StressScenario), rows)
+
+
+class StressTestResult(Base):
+    """
+    压力测试结果模型。
+    每个测试日对每个情景、每个活跃组合保存一条记录：情景收益、冲击覆盖的持仓权重及亏损贡献最大的标的。
+    """
+    __tablename__ = "stress_test_results"
+    __table_args__ = (
+        UniqueConstraint("run_date", "scenario_id", "portfolio_id", name="uq_stress_test_result"),
+    )
+    id: Mapped[int] = mapped_column(primary_key=True, index=True)
+    run_date: Mapped[datetime] = mapped_column(DateTime, nullable=False, index=True)  # 测试日
+    scenario_id: Mapped[int] = mapped_column(ForeignKey("stress_scenarios.id"), nullable=False, index=True)
+    portfolio_id: Mapped[int] = mapped_column(ForeignKey("portfolios.id", ondelete="CASCADE"), nullable=False, index=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
+    portfolio_return: Mapped[float] = mapped_column(Float, nullable=False)  # 情景收益
+    coverage: Mapped[float] = mapped_column(Float, nullable=False)  # 有冲击的持仓权重
+    worst_symbol: Mapped[str | None] = mapped_column(String(20), nullable=True)  # 亏损贡献最大的标的
+    worst_contribution: Mapped[float] = mapped_column(Float, nullable=False)  # 该标的的亏损贡献
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
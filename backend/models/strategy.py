@@ -2,11 +2,17 @@
 AI投资策略引擎模型
 定义投资策略、信号、回测结果等数据结构
 """
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text, ForeignKey, Enum, JSON
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text, ForeignKey, Enum, JSON, UniqueConstraint, LargeBinary, insert
+from sqlalchemy.orm import relationship, deferred
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.sql import func
 from database import Base
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime
 import enum
+import hashlib
+import json
+import zlib
 
 
 class StrategyType(enum.Enum):
@@ -91,6 +97,49 @@ class StrategySignal(Base):
     # 关联关系
     strategy = relationship("Strategy", back_populates="signals")
     market_data = relationship("MarketData")
+    
+    @staticmethod
+    def fan_out(db,
+                intents: List[Dict[str, Any]],
+                market_data_ids: Optional[Dict[str, int]] = None) -> Tuple[List[Tuple[int, Dict[str, Any]]], List[str]]:
+        """
+        将逐标的信号意图批量写入策略信号
+        
+        intents 中每项包含 strategy_id、symbol、signal_type、signal_date 以及可选的强度/权重/推理等字段；
+        未提供 market_data_ids 时按代码集合一次查询市场数据。使用多行 INSERT ... RETURNING 批量写入，
+        不经过逐对象的ORM flush。不提交，由调用方提交。
+        
+        Returns:
+            ([(信号ID, 信号因子)]，未知代码列表)；返回行不保证与 intents 顺序一致
+        """
+        from models.market_data import MarketData
+        
+        if market_data_ids is None:
+            symbols = {intent["symbol"] for intent in intents}
+            market_data_ids = dict(
+                db.query(MarketData.symbol, MarketData.id).filter(MarketData.symbol.in_(symbols)).all()
+            ) if symbols else {}
+        
+        rows = []
+        unknown: List[str] = []
+        for intent in intents:
+            market_data_id = market_data_ids.get(intent["symbol"])
+            if market_data_id is None:
+                if intent["symbol"] not in unknown:
+                    unknown.append(intent["symbol"])
+                continue
+            # 批量插入要求各行字段一致
+            row = {"signal_strength": 1.0, "target_weight": None, "confidence_score": None, "reasoning": None, "factors": None}
+            row.update({key: value for key, value in intent.items() if key != "symbol"})
+            row["market_data_id"] = market_data_id
+            rows.append(row)
+        if not rows:
+            return [], unknown
+        
+        inserted = db.execute(
+            insert(StrategySignal).returning(StrategySignal.id, StrategySignal.factors), rows
+        ).all()
+        return [(row.id, row.factors) for row in inserted], unknown
 
 
 class BacktestResult(Base):
@@ -186,6 +235,43 @@ class FactorModel(Base):
     is_active = Column(Boolean, default=True, comment="是否活跃")
     last_updated = Column(DateTime, comment="最后更新时间")
     created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
+    
+    # 关联关系
+    risk_model_versions = relationship(
+        "RiskModelVersion", back_populates="factor_model",
+        cascade="all, delete-orphan", order_by="RiskModelVersion.version"
+    )
+
+
+class RiskModelVersion(Base):
+    """因子风险模型版本（因子收益、因子协方差、特异方差矩阵）"""
+    __tablename__ = "risk_model_versions"
+    __table_args__ = (
+        UniqueConstraint("factor_model_id", "version", name="uq_risk_model_version"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    factor_model_id = Column(Integer, ForeignKey("factor_models.id"), nullable=False, index=True, comment="因子模型ID")
+    version = Column(Integer, nullable=False, comment="版本号")
+    
+    # 估计范围
+    factors = Column(JSON, nullable=False, comment="因子列表(矩阵列顺序)")
+    symbols = Column(JSON, nullable=False, comment="证券代码列表(特异方差顺序)")
+    start_date = Column(DateTime, comment="估计窗口开始日期")
+    end_date = Column(DateTime, comment="估计窗口结束日期")
+    
+    # 估计结果
+    factor_returns = Column(JSON, comment="因子收益矩阵(T×K)")
+    factor_covariance = Column(JSON, nullable=False, comment="因子协方差矩阵(K×K)")
+    specific_variance = Column(JSON, nullable=False, comment="个股特异方差(N)")
+    
+    # 元数据
+    parameters = Column(JSON, comment="估计参数")
+    model_version = Column(String(20), comment="模型版本")
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
+    
+    # 关联关系
+    factor_model = relationship("FactorModel", back_populates="risk_model_versions")
 
 
 class MarketRegime(Base):
@@ -211,10 +297,38 @@ class MarketRegime(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
 
 
+class RegimeDetectionState(Base):
+    """指数市场状态识别模型的拟合参数与最新滤波状态，用于逐日增量滤波"""
+    __tablename__ = "regime_detection_states"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    market_index_id = Column(Integer, ForeignKey("market_index.id"), nullable=False, unique=True, comment="指数ID")
+    n_states = Column(Integer, nullable=False, comment="隐状态数量")
+    vol_window = Column(Integer, nullable=False, comment="波动率窗口")
+    
+    # 模型参数：startprob/transmat/means/variances
+    parameters = Column(JSON, nullable=False, comment="HMM参数")
+    regime_ids = Column(JSON, nullable=False, comment="各隐状态对应的市场状态ID")
+    log_likelihood = Column(Float, comment="拟合对数似然")
+    
+    # 增量滤波所需的最新状态
+    filtered_probabilities = Column(JSON, nullable=False, comment="最新交易日的滤波概率")
+    recent_returns = Column(JSON, nullable=False, comment="最近波动率窗口内的对数收益率")
+    last_close = Column(Float, nullable=False, comment="最新收盘点位")
+    last_date = Column(DateTime, nullable=False, comment="最新交易日")
+    current_state = Column(Integer, nullable=False, comment="当前最可能的隐状态")
+    
+    fitted_at = Column(DateTime, default=datetime.utcnow, comment="拟合时间")
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, comment="更新时间")
+
+
 # === 宏观择时模型相关模型 ===
 class MacroTimingSignal(Base):
     """宏观择时信号模型"""
     __tablename__ = "macro_timing_signals"
+    __table_args__ = (
+        UniqueConstraint("dedup_key", name="uq_macro_timing_signals_dedup_key"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     strategy_id = Column(Integer, ForeignKey("strategies.id"), nullable=True, comment="关联策略ID")
@@ -234,12 +348,55 @@ class MacroTimingSignal(Base):
     signal_date = Column(DateTime, nullable=False, comment="信号生成日期")
     created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
     
+    # 去重：输入（含模型配置）的规范化哈希，以及 输入+策略+日期 的唯一键
+    input_hash = Column(String(64), index=True, comment="输入参数哈希")
+    dedup_key = Column(String(64), comment="同一输入每日唯一键")
+    
     # 关联关系
     strategy = relationship("Strategy", backref="macro_timing_signals")
     
     # 可选：关联到由此信号生成的策略信号
     derived_signal_id = Column(Integer, ForeignKey("strategy_signals.id"), comment="派生的策略信号ID")
     derived_signal = relationship("StrategySignal", foreign_keys=[derived_signal_id])
+    
+    def signal_intents(self, strategy_id: int, instrument_map: Dict[str, List[str]]) -> List[Dict[str, Any]]:
+        """按资产类别到标的的映射，将建议配置拆分为逐标的信号意图（按类别权重从高到低）"""
+        allocation = self.recommended_allocation or {}
+        max_weight = max(allocation.values(), default=0.0) or 1.0
+        intents = []
+        for asset_class, weight in sorted(allocation.items(), key=lambda item: -item[1]):
+            symbols = instrument_map.get(asset_class) or []
+            for symbol in symbols:
+                intents.append({
+                    "strategy_id": strategy_id,
+                    "symbol": symbol,
+                    "signal_type": SignalType.BUY if weight > 0 else SignalType.SELL,
+                    "signal_strength": weight / max_weight,
+                    "target_weight": weight / len(symbols),
+                    "confidence_score": self.confidence_score,
+                    "reasoning": f"宏观择时建议{asset_class}配置{weight:.1%}",
+                    "factors": {"source": "macro_timing", "source_id": self.id, "asset_class": asset_class, "class_weight": weight},
+                    "signal_date": self.signal_date,
+                })
+        return intents
+
+
+class MacroIndicatorValue(Base):
+    """宏观指标数值（按指标代码、观测日期存储的时间序列，如利率、通胀、PMI）"""
+    __tablename__ = "macro_indicator_values"
+    __table_args__ = (
+        UniqueConstraint("indicator_code", "observation_date", name="uq_macro_indicator_date"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    indicator_code = Column(String(50), nullable=False, index=True, comment="指标代码，如pmi、inflation、interest_rate")
+    observation_date = Column(DateTime, nullable=False, index=True, comment="观测日期")
+    value = Column(Float, nullable=False, comment="指标数值")
+    source = Column(String(50), comment="数据来源")
+    
+    created_at = Column(DateTime, default=datetime.utcnow, comment="创建时间")
+    # 使用应用端时间戳（精确到微秒），便于据此判断指标库是否有更新
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, comment="更新时间")
 
 
 # === 行业轮动模型相关模型 ===
@@ -263,6 +420,7 @@ class SectorRotationSignal(Base):
     confidence_score = Column(Float, comment="置信度评分")
     model_version = Column(String(20), comment="模型版本")
     signal_date = Column(DateTime, nullable=False, comment="信号生成日期")
+    signal_source = Column(String(20), default="manual", server_default="manual", index=True, comment="信号来源：manual(手工输入评分)/price_history(行情聚合)")
     created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
     
     # 关联关系
@@ -271,24 +429,133 @@ class SectorRotationSignal(Base):
     # 可选：关联到由此信号生成的策略信号
     derived_signal_id = Column(Integer, ForeignKey("strategy_signals.id"), comment="派生的策略信号ID")
     derived_signal = relationship("StrategySignal", foreign_keys=[derived_signal_id])
+    
+    def signal_intents(self,
+                       strategy_id: int,
+                       constituents: Dict[str, List[Tuple[str, Optional[float]]]]) -> List[Dict[str, Any]]:
+        """
+        将行业建议权重按成分股市值拆分为逐标的信号意图（按行业权重从高到低）
+        
+        Args:
+            constituents: 行业 -> [(股票代码, 市值)]，市值缺失时行业内等权
+        """
+        allocation = self.recommended_industry_allocation or {}
+        max_weight = max(allocation.values(), default=0.0) or 1.0
+        intents = []
+        for industry, weight in sorted(allocation.items(), key=lambda item: -item[1]):
+            members = constituents.get(industry) or []
+            caps = [cap or 0.0 for _, cap in members]
+            total_cap = sum(caps)
+            for (symbol, _), cap in zip(members, caps):
+                share = cap / total_cap if total_cap > 0 else 1.0 / len(members)
+                intents.append({
+                    "strategy_id": strategy_id,
+                    "symbol": symbol,
+                    "signal_type": SignalType.BUY if weight > 0 else SignalType.SELL,
+                    "signal_strength": weight / max_weight,
+                    "target_weight": weight * share,
+                    "confidence_score": self.confidence_score,
+                    "reasoning": f"行业轮动建议{industry}配置{weight:.1%}",
+                    "factors": {
+                        "source": "sector_rotation", "source_id": self.id,
+                        "industry": industry, "industry_weight": weight, "constituent_share": share
+                    },
+                    "signal_date": self.signal_date,
+                })
+        return intents
 
 
 # === 多因子模型PLUS相关模型 ===
+def compress_json(data: Any) -> bytes:
+    """JSON序列化并zlib压缩"""
+    return zlib.compress(json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def decompress_json(blob: bytes) -> Any:
+    """解压并反序列化JSON"""
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+class MultiFactorInput(Base):
+    """多因子输入数据（按内容哈希去重，相同输入只保存一份）"""
+    __tablename__ = "multi_factor_inputs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String(64), unique=True, index=True, nullable=False, comment="输入内容SHA-256哈希")
+    stock_count = Column(Integer, comment="股票数量")
+    stocks_data = deferred(Column(LargeBinary, nullable=False, comment="压缩后的股票因子数据"))
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
+    
+    @staticmethod
+    def compute_hash(stocks_data: List[Dict[str, Any]]) -> str:
+        """计算输入数据的规范化内容哈希"""
+        canonical = json.dumps(stocks_data, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+    
+    @staticmethod
+    def get_or_create(db, stocks_data: List[Dict[str, Any]]) -> "MultiFactorInput":
+        """按内容哈希查找已有输入，不存在时新建（已写入，未提交）"""
+        return MultiFactorInput.get_or_create_many(db, [stocks_data])[0]
+    
+    @staticmethod
+    def get_or_create_many(db, stocks_data_list: List[List[Dict[str, Any]]]) -> List["MultiFactorInput"]:
+        """
+        批量按内容哈希查找或新建输入（一次IN查询，已写入，未提交）
+        
+        新建的输入在保存点中写入，并发请求已写入相同输入时只回滚保存点，重新查询后新建其余输入
+        """
+        hashes = [MultiFactorInput.compute_hash(stocks_data) for stocks_data in stocks_data_list]
+        data_by_hash = dict(zip(hashes, stocks_data_list))
+        while True:
+            existing = {
+                row.content_hash: row
+                for row in db.query(MultiFactorInput).filter(MultiFactorInput.content_hash.in_(data_by_hash)).all()
+            }
+            created = [
+                MultiFactorInput(content_hash=content_hash, stock_count=len(stocks_data), stocks_data=compress_json(stocks_data))
+                for content_hash, stocks_data in data_by_hash.items() if content_hash not in existing
+            ]
+            if not created:
+                break
+            try:
+                with db.begin_nested():
+                    db.add_all(created)
+            except IntegrityError:
+                continue
+            existing.update((db_input.content_hash, db_input) for db_input in created)
+            break
+        return [existing[content_hash] for content_hash in hashes]
+    
+    def load_stocks_data(self) -> List[Dict[str, Any]]:
+        """解压股票因子数据"""
+        return decompress_json(self.stocks_data)
+
+
 class MultiFactorScore(Base):
-    """多因子评分模型"""
+    """多因子评分模型
+    
+    storage_mode 为 compact 时，输入引用去重后的 MultiFactorInput，
+    评分以列式结构压缩保存在 scores_blob 中；full 为原有的逐股JSON存储。
+    """
     __tablename__ = "multi_factor_scores"
     
     id = Column(Integer, primary_key=True, index=True)
     strategy_id = Column(Integer, ForeignKey("strategies.id"), nullable=True, comment="关联策略ID")
+    storage_mode = Column(String(10), default="full", comment="存储模式(full/compact)")
     
     # 输入参数
-    stocks_data = Column(JSON, nullable=False, comment="股票因子数据")
+    input_id = Column(Integer, ForeignKey("multi_factor_inputs.id"), nullable=True, index=True, comment="去重后的输入数据ID")
+    stocks_data = deferred(Column(JSON, nullable=True, comment="股票因子数据(full模式)"))
     factor_weights = Column(JSON, comment="因子权重")
     market_regime = Column(String(20), comment="市场状态")
     auto_discover = Column(Boolean, default=False, comment="是否启用因子挖掘")
     
     # 输出结果
-    stock_scores = Column(JSON, nullable=False, comment="股票评分列表")
+    stock_scores = deferred(Column(JSON, nullable=True, comment="股票评分列表(full模式)"))
+    scores_blob = deferred(Column(LargeBinary, nullable=True, comment="压缩后的列式股票评分(compact模式)"))
+    stock_count = Column(Integer, comment="评分股票数量")
+    top_symbols = Column(JSON, comment="排名靠前的股票代码")
+    score_summary = Column(JSON, comment="评分分布摘要")
     adjusted_weights = Column(JSON, nullable=False, comment="调整后的因子权重")
     discovered_factors = Column(JSON, comment="新发现的因子及其权重")
     reasoning = Column(Text, comment="模型推理过程")
@@ -300,7 +567,174 @@ class MultiFactorScore(Base):
     
     # 关联关系
     strategy = relationship("Strategy", backref="multi_factor_scores")
+    input = relationship("MultiFactorInput")
     
     # 可选：关联到由此信号生成的策略信号
     derived_signal_id = Column(Integer, ForeignKey("strategy_signals.id"), comment="派生的策略信号ID")
-    derived_signal = relationship("StrategySignal", foreign_keys=[derived_signal_id]) 
\ No newline at end of file
+    derived_signal = relationship("StrategySignal", foreign_keys=[derived_signal_id])
+    
+    @staticmethod
+    def pack_scores(stock_scores: List[Dict[str, Any]]) -> bytes:
+        """将逐股评分列表压缩为列式结构，排名由顺序隐含"""
+        factors: List[str] = []
+        for score in stock_scores:
+            for factor in score["factor_contribution"]:
+                if factor not in factors:
+                    factors.append(factor)
+        return MultiFactorScore.pack_score_columns(
+            symbols=[score["symbol"] for score in stock_scores],
+            names=[score.get("name") for score in stock_scores],
+            total_scores=[score["total_score"] for score in stock_scores],
+            factors=factors,
+            contributions=[
+                [score["factor_contribution"].get(factor) for factor in factors]
+                for score in stock_scores
+            ]
+        )
+    
+    @staticmethod
+    def pack_score_columns(symbols: List[str],
+                           names: List[Optional[str]],
+                           total_scores: List[float],
+                           factors: List[str],
+                           contributions: List[List[Optional[float]]]) -> bytes:
+        """直接由按排名排列的列数据压缩评分（缺失的因子贡献为None）"""
+        columns = {
+            "symbols": symbols,
+            "names": names,
+            "total_scores": total_scores,
+            "factors": factors,
+            "contributions": contributions,
+        }
+        return compress_json(columns)
+    
+    @staticmethod
+    def unpack_scores(blob: bytes, offset: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """从列式压缩结构还原逐股评分（可只还原一个区间）"""
+        columns = decompress_json(blob)
+        end = len(columns["symbols"]) if limit is None else min(offset + limit, len(columns["symbols"]))
+        factors = columns["factors"]
+        result = []
+        for i in range(offset, end):
+            result.append({
+                "symbol": columns["symbols"][i],
+                "name": columns["names"][i],
+                "total_score": columns["total_scores"][i],
+                "factor_contribution": {
+                    factor: value for factor, value in zip(factors, columns["contributions"][i]) if value is not None
+                },
+                "rank": i + 1
+            })
+        return result
+    
+    def signal_intents(self,
+                       strategy_id: int,
+                       top_n: int,
+                       bottom_n: int = 0,
+                       weighting: str = "equal") -> List[Dict[str, Any]]:
+        """
+        将排名转换为逐标的信号意图：前 top_n 名买入，后 bottom_n 名卖出
+        
+        weighting 为 equal 时买入标的等权，为 score 时按正的总分加权（无正分时退回等权）
+        """
+        scores = self.load_stock_scores()
+        n = len(scores)
+        top = scores[:top_n]
+        if not top:
+            return []
+        bottom = scores[max(top_n, n - bottom_n):] if bottom_n else []
+        
+        raw = [max(score["total_score"], 0.0) if weighting == "score" else 1.0 for score in top]
+        total = sum(raw)
+        weights = [w / total for w in raw] if total > 0 else [1.0 / len(top)] * len(top)
+        
+        intents = []
+        for score, signal_type, weight in [(s, SignalType.BUY, w) for s, w in zip(top, weights)] + \
+                [(s, SignalType.SELL, 0.0) for s in bottom]:
+            percentile = (score["rank"] - 1) / max(n - 1, 1)
+            intents.append({
+                "strategy_id": strategy_id,
+                "symbol": score["symbol"],
+                "signal_type": signal_type,
+                "signal_strength": 1.0 - percentile if signal_type == SignalType.BUY else percentile,
+                "target_weight": weight,
+                "reasoning": f"多因子评分第{score['rank']}名（共{n}只）",
+                "factors": {
+                    "source": "multi_factor", "source_id": self.id, "rank": score["rank"],
+                    "total_score": score["total_score"], "factor_contribution": score.get("factor_contribution")
+                },
+                "signal_date": self.signal_date,
+            })
+        return intents
+    
+    def load_stock_scores(self, offset: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """按需加载逐股评分，兼容两种存储模式"""
+        if self.storage_mode == "compact":
+            return self.unpack_scores(self.scores_blob, offset, limit) if self.scores_blob else []
+        stock_scores = self.stock_scores or []
+        end = None if limit is None else offset + limit
+        return stock_scores[offset:end]
+
+
+
+# === 每日策略运行相关模型 ===
+class StrategyRunStep(Base):
+    """每日策略运行的步骤记录（按 运行日期+范围+步骤 唯一，用于幂等重跑与断点续跑）"""
+    __tablename__ = "strategy_run_steps"
+    __table_args__ = (
+        UniqueConstraint("run_date", "scope", "step", name="uq_strategy_run_step"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    run_date = Column(DateTime, nullable=False, index=True, comment="运行日期")
+    # market 为全市场公共步骤，strategy:<id> 为单个策略的步骤
+    scope = Column(String(50), nullable=False, comment="步骤范围")
+    strategy_id = Column(Integer, ForeignKey("strategies.id"), nullable=True, index=True, comment="策略ID")
+    step = Column(String(50), nullable=False, comment="步骤名称")
+    
+    status = Column(String(20), nullable=False, default="pending", comment="状态：pending/running/success/skipped/failed")
+    attempts = Column(Integer, default=0, comment="执行次数")
+    started_at = Column(DateTime, comment="开始时间")
+    finished_at = Column(DateTime, comment="结束时间")
+    duration_ms = Column(Float, comment="耗时(毫秒)")
+    output = Column(JSON, comment="步骤输出摘要")
+    error = Column(Text, comment="错误信息")
+
+
+# === 组合再平衡相关模型 ===
+class RebalanceOrder(Base):
+    """再平衡调仓指令（由组合配置的目标权重与当前持仓求差生成）"""
+    __tablename__ = "rebalance_orders"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    allocation_id = Column(Integer, ForeignKey("portfolio_allocations.id"), nullable=False, index=True, comment="组合配置ID")
+    strategy_id = Column(Integer, ForeignKey("strategies.id"), nullable=False, index=True, comment="策略ID")
+    portfolio_id = Column(Integer, ForeignKey("portfolios.id", ondelete="CASCADE"), nullable=False, index=True, comment="投资组合ID")
+    market_data_id = Column(Integer, ForeignKey("market_data.id"), nullable=False, comment="市场数据ID")
+    symbol = Column(String(20), nullable=False, comment="证券代码")
+    
+    # 指令内容
+    side = Column(String(10), nullable=False, comment="方向：BUY/SELL")
+    quantity = Column(Float, nullable=False, comment="数量（股/张/份）")
+    price = Column(Float, nullable=False, comment="参考价格")
+    amount = Column(Float, nullable=False, comment="参考金额")
+    current_weight = Column(Float, comment="调仓前权重")
+    target_weight = Column(Float, comment="目标权重")
+    post_trade_weight = Column(Float, comment="调仓后权重")
+    
+    status = Column(String(20), nullable=False, default="pending", comment="状态：pending/filled/cancelled")
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
+    
+    # 关联关系
+    allocation = relationship("PortfolioAllocation")
+    
+    @staticmethod
+    def replace_pending(db, allocation_ids: List[int], rows: List[Dict[str, Any]]) -> int:
+        """删除配置下尚未成交的指令并批量写入新指令（未提交），返回写入条数"""
+        if allocation_ids:
+            db.query(RebalanceOrder).filter(
+                RebalanceOrder.allocation_id.in_(allocation_ids), RebalanceOrder.status == "pending"
+            ).delete(synchronize_session=False)
+        if rows:
+            db.execute(insert(RebalanceOrder), rows)
+        return len(rows)
@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Float, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Text, Float, Boolean, ForeignKey, JSON, UniqueConstraint
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime
+from typing import Optional
 
 class UserProfile(Base):
     """用户画像模型"""
@@ -65,7 +66,7 @@ class RiskAssessment(Base):
     investment_horizon_score = Column(Integer, nullable=True)  # 投资期限得分
     
     # 测评详情
-    answers = Column(Text, nullable=True)  # 问卷答案 (JSON格式)
+    answers = Column(JSON(none_as_null=True), nullable=True)  # 问卷答案
     assessment_date = Column(DateTime, default=datetime.utcnow)
     
     def __repr__(self):
@@ -95,4 +96,195 @@ class InvestmentGoal(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     def __repr__(self):
-        return f"<InvestmentGoal(user_id={self.user_id}, goal_name={self.goal_name})>" 
\ No newline at end of file
+        return f"<InvestmentGoal(user_id={self.user_id}, goal_name={self.goal_name})>" 
+
+
+class GoalPortfolioLink(Base):
+    """投资目标关联组合模型"""
+    __tablename__ = 'goal_portfolio_links'
+    
+    id = Column(Integer, primary_key=True, index=True)
+    goal_id = Column(Integer, ForeignKey('investment_goals.id'), nullable=False, unique=True)
+    portfolio_id = Column(Integer, ForeignKey('portfolios.id', ondelete='CASCADE'), nullable=False, index=True)
+    
+    # 资金情况
+    current_amount = Column(Float, nullable=False, default=0.0)  # 当前投入该目标的金额
+    monthly_contribution = Column(Float, nullable=False, default=0.0)  # 每月定投金额
+    valued_at = Column(DateTime, nullable=True)  # 当前金额对应的组合净值日期，每日按净值变动重估
+    
+    # 时间戳
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<GoalPortfolioLink(goal_id={self.goal_id}, portfolio_id={self.portfolio_id})>"
+
+
+class GoalProjection(Base):
+    """投资目标蒙特卡洛预测结果模型"""
+    __tablename__ = 'goal_projections'
+    __table_args__ = (
+        UniqueConstraint('goal_id', 'run_date', name='uq_goal_projection_date'),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    goal_id = Column(Integer, ForeignKey('investment_goals.id'), nullable=False, index=True)
+    run_date = Column(DateTime, nullable=False)  # 预测日
+    portfolio_id = Column(Integer, ForeignKey('portfolios.id', ondelete='CASCADE'), nullable=False)
+    
+    # 输入
+    months = Column(Integer, nullable=False)  # 距目标日期的月数
+    current_amount = Column(Float, nullable=False)  # 当前金额
+    monthly_contribution = Column(Float, nullable=False)  # 每月定投金额
+    target_amount = Column(Float, nullable=False)  # 目标金额
+    expected_return = Column(Float, nullable=False)  # 组合年化收益估计
+    volatility = Column(Float, nullable=False)  # 组合年化波动率估计
+    
+    # 结果
+    probability = Column(Float, nullable=False)  # 到期达成目标的概率
+    expected_value = Column(Float, nullable=False)  # 到期价值均值
+    percentiles = Column(JSON, nullable=False)  # 到期价值分位数
+    bands = Column(JSON, nullable=False)  # 逐年价值分位数
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<GoalProjection(goal_id={self.goal_id}, probability={self.probability:.2f})>"
+
+
+class QuestionnaireTemplate(Base):
+    """风险测评问卷模板模型（已发布的版本不再修改，调整题目、分值或等级区间时发布新版本）"""
+    __tablename__ = 'questionnaire_templates'
+    __table_args__ = (
+        UniqueConstraint('code', 'version', name='uq_questionnaire_template_version'),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    code = Column(String(50), nullable=False, index=True)  # 模板代码，各版本共用
+    version = Column(Integer, nullable=False)  # 版本号
+    name = Column(String(100), nullable=False)  # 模板名称
+    description = Column(Text, nullable=True)
+    
+    # 模板定义
+    questions = Column(JSON, nullable=False)  # [{id, dimension, weight, options: {选项: 分值}}]
+    bands = Column(JSON, nullable=False)  # [{max_score, risk_level}]，按分数上限递增，最后一个区间可不设上限
+    tolerance_divisor = Column(Float, nullable=False, default=10.0)  # 风险承受能力 = 总分 / 换算系数（1-10）
+    is_active = Column(Boolean, default=True)  # 是否为该模板代码的当前版本
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    DEFAULT_CODE = "default"
+    # 默认模板与前端风险测评页的题目一致，分数区间与风险承受能力换算沿用原有规则
+    DEFAULT_QUESTIONS = [
+        {"id": "1", "dimension": "financial_situation",
+         "options": {"18-30": 20, "31-45": 14, "46-60": 8, "60以上": 2}},
+        {"id": "2", "dimension": "investment_experience",
+         "options": {"无经验": 2, "1-3年": 8, "3-5年": 14, "5年以上": 20}},
+        {"id": "3", "dimension": "risk_attitude",
+         "options": {"5%以内": 2, "5%-10%": 8, "10%-20%": 14, "20%以上": 20}},
+        {"id": "4", "dimension": "investment_horizon",
+         "options": {"保本": 2, "稳健增值": 8, "平衡": 14, "高风险高收益": 20}},
+        {"id": "5", "dimension": "risk_attitude",
+         "options": {"立即止损": 2, "部分减仓": 8, "保持不动": 14, "逢低加仓": 20}},
+    ]
+    DEFAULT_BANDS = [
+        {"max_score": 20, "risk_level": "保守"},
+        {"max_score": 40, "risk_level": "稳健"},
+        {"max_score": 60, "risk_level": "积极"},
+        {"max_score": None, "risk_level": "激进"},
+    ]
+    
+    def __repr__(self):
+        return f"<QuestionnaireTemplate(code={self.code}, version={self.version})>"
+    
+    @staticmethod
+    def ensure_default(db) -> None:
+        """首次使用时创建默认模板（未提交）"""
+        if not db.query(QuestionnaireTemplate.id).filter(QuestionnaireTemplate.code == QuestionnaireTemplate.DEFAULT_CODE).first():
+            db.add(QuestionnaireTemplate(
+                code=QuestionnaireTemplate.DEFAULT_CODE, version=1, name="默认风险测评问卷",
+                questions=QuestionnaireTemplate.DEFAULT_QUESTIONS, bands=QuestionnaireTemplate.DEFAULT_BANDS,
+                tolerance_divisor=10.0, is_active=True
+            ))
+            db.flush()
+    
+    @staticmethod
+    def resolve(db, code: str, version: Optional[int] = None) -> Optional["QuestionnaireTemplate"]:
+        """指定版本，或该模板代码的当前版本"""
+        if code == QuestionnaireTemplate.DEFAULT_CODE:
+            QuestionnaireTemplate.ensure_default(db)
+        query = db.query(QuestionnaireTemplate).filter(QuestionnaireTemplate.code == code)
+        if version is not None:
+            return query.filter(QuestionnaireTemplate.version == version).first()
+        return query.filter(QuestionnaireTemplate.is_active == True).order_by(QuestionnaireTemplate.version.desc()).first()
+
+
+class RiskAssessmentScoring(Base):
+    """风险测评评分记录模型（测评记录最近一次评分使用的问卷模板版本）"""
+    __tablename__ = 'risk_assessment_scorings'
+    
+    id = Column(Integer, primary_key=True, index=True)
+    assessment_id = Column(Integer, ForeignKey('risk_assessments.id'), nullable=False, unique=True)
+    template_id = Column(Integer, ForeignKey('questionnaire_templates.id'), nullable=False, index=True)
+    scored_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<RiskAssessmentScoring(assessment_id={self.assessment_id}, template_id={self.template_id})>"
+
+
+class ProfileSegmentation(Base):
+    """客户分群结果模型（每次全量分群一条记录，仅最新一次为当前分群）"""
+    __tablename__ = 'profile_segmentations'
+    
+    id = Column(Integer, primary_key=True, index=True)
+    n_clusters = Column(Integer, nullable=False)  # 客群数
+    features = Column(JSON, nullable=False)  # 参与分群的画像特征
+    means = Column(JSON, nullable=False)  # 标准化使用的各特征均值
+    scales = Column(JSON, nullable=False)  # 标准化使用的各特征标准差
+    centers = Column(JSON, nullable=False)  # 标准化空间中的客群中心
+    inertia = Column(Float, nullable=False)  # 样本到所属中心的距离平方和
+    users = Column(Integer, nullable=False)  # 分群覆盖的用户数
+    incremental_updates = Column(Integer, default=0)  # 全量分群后增量归类的画像数
+    is_active = Column(Boolean, default=True)  # 是否为当前分群
+    fitted_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<ProfileSegmentation(id={self.id}, n_clusters={self.n_clusters}, users={self.users})>"
+
+
+class ProfileSegment(Base):
+    """客群模型（同一客群共用一套模型组合约束）"""
+    __tablename__ = 'profile_segments'
+    __table_args__ = (
+        UniqueConstraint('segmentation_id', 'label', name='uq_profile_segment_label'),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    segmentation_id = Column(Integer, ForeignKey('profile_segmentations.id'), nullable=False, index=True)
+    label = Column(Integer, nullable=False)  # 客群编号（按风险承受评分从低到高）
+    name = Column(String(50), nullable=False)  # 客群名称
+    risk_level = Column(Integer, nullable=False)  # 中心风险承受评分对应的风险等级（1-5）
+    size = Column(Integer, nullable=False, default=0)  # 客群人数
+    center = Column(JSON, nullable=False)  # 原始量纲下的客群中心（年收入为对数，投资期限为年）
+    target_return = Column(Float, nullable=True)  # 客群目标收益率中位数
+    max_drawdown_tolerance = Column(Float, nullable=True)  # 客群最大回撤容忍度中位数
+    
+    def __repr__(self):
+        return f"<ProfileSegment(name={self.name}, size={self.size})>"
+
+
+class UserSegment(Base):
+    """用户所属客群模型"""
+    __tablename__ = 'user_segments'
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, unique=True)
+    segmentation_id = Column(Integer, ForeignKey('profile_segmentations.id'), nullable=False, index=True)
+    segment_id = Column(Integer, ForeignKey('profile_segments.id'), nullable=False, index=True)
+    distance = Column(Float, nullable=False)  # 到客群中心的标准化距离
+    profile_updated_at = Column(DateTime, nullable=True)  # 归类时画像的更新时间，晚于此时间的画像需要重新归类
+    assigned_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<UserSegment(user_id={self.user_id}, segment_id={self.segment_id})>"
@@ -20,7 +20,7 @@ if parent_dir not in sys.path:
     sys.path.insert(0, parent_dir)
 
 from database import get_db
-from models import Asset, PortfolioAsset, Tag
+from models import Asset, PortfolioAsset, ModelPortfolioAsset, Tag
 from schemas.portfolio import AssetCreate, AssetResponse, PortfolioAssetResponse, PortfolioResponse
 from utils.auth import get_current_active_user
 from models import User
@@ -141,6 +141,8 @@ def delete_asset(asset_id: int, db: Session = Depends(get_db)):
     ref_count = db.query(PortfolioAsset).filter(PortfolioAsset.asset_id == asset_id).count()
     if ref_count > 0:
         raise HTTPException(status_code=400, detail="该资产已被投资组合引用，无法删除")
+    if db.query(ModelPortfolioAsset.id).filter(ModelPortfolioAsset.asset_id == asset_id).first():
+        raise HTTPException(status_code=400, detail="该资产已被模型组合引用，无法删除")
     db.delete(asset)
     db.commit()
     return {"detail": "删除成功"}
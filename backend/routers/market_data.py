@@ -5,19 +5,22 @@
 import sys
 import os
 from typing import List, Optional
+from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
 from database import get_db
-from models.market_data import MarketData, PriceHistory, MarketIndex, IndexHistory, AssetType
+from models.market_data import MarketData, PriceHistory, MarketIndex, IndexHistory, AssetType, IndustryAggregate
 from schemas.market_data import (
     MarketDataCreate, MarketDataUpdate, MarketDataResponse,
     PriceHistoryCreate, PriceHistoryUpdate, PriceHistoryResponse,
+    PriceHistoryBulkCreate, PriceHistoryBulkResponse, IndustryAggregateResponse,
     MarketIndexCreate, MarketIndexUpdate, MarketIndexResponse,
     IndexHistoryCreate, IndexHistoryUpdate, IndexHistoryResponse,
     MarketDataWithPriceHistory, MarketIndexWithHistory,
     MarketDataQuery, PriceHistoryQuery
 )
 from utils.auth import get_current_user
+from services.industry_aggregates import refresh_aggregates, refresh_instrument
 from models.user import User
 
 # 创建路由器
@@ -74,6 +77,125 @@ def get_market_statistics(
     }
 
 
+# 价格批量导入与行业聚合路由 - 必须在参数化路由之前
+@router.post("/price-history/bulk", response_model=PriceHistoryBulkResponse)
+def bulk_import_price_history(
+    payload: PriceHistoryBulkCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    批量导入价格历史数据
+    
+    **功能说明:**
+    - 按证券代码批量写入日线，证券+日期已存在时覆盖
+    - 证券代码与已有记录各用一次查询完成匹配
+    - 导入后从最早的导入日期起增量更新行业/板块聚合指数
+    
+    **权限要求:**
+    - 需要用户登录认证
+    
+    **返回数据:**
+    - 新增、更新条数，未找到的证券代码以及重新计算的聚合行数
+    """
+    symbols = {bar.symbol for bar in payload.bars}
+    ids = dict(db.query(MarketData.symbol, MarketData.id).filter(MarketData.symbol.in_(symbols)).all())
+    
+    # 同一批次内重复的证券+日期以最后一条为准
+    bars = {}
+    for bar in payload.bars:
+        if bar.symbol in ids:
+            bars[(ids[bar.symbol], bar.date)] = bar.model_dump(exclude={"symbol"})
+    
+    inserted = updated = 0
+    if bars:
+        dates = [date for _, date in bars]
+        existing = {
+            (row.market_data_id, row.date): row
+            for row in db.query(PriceHistory).filter(
+                PriceHistory.market_data_id.in_({market_data_id for market_data_id, _ in bars}),
+                PriceHistory.date >= min(dates),
+                PriceHistory.date <= max(dates)
+            )
+        }
+        new_rows = []
+        for (market_data_id, date), data in bars.items():
+            row = existing.get((market_data_id, date))
+            if row is None:
+                new_rows.append(PriceHistory(market_data_id=market_data_id, **data))
+            else:
+                for field, value in data.items():
+                    setattr(row, field, value)
+                updated += 1
+        db.add_all(new_rows)
+        inserted = len(new_rows)
+        db.flush()
+    
+    aggregate_rows = 0
+    if bars and payload.refresh_aggregates:
+        aggregate_rows = refresh_aggregates(db, min(date for _, date in bars))
+    db.commit()
+    
+    return PriceHistoryBulkResponse(
+        inserted=inserted,
+        updated=updated,
+        unknown_symbols=sorted(symbols - set(ids)),
+        aggregate_rows=aggregate_rows
+    )
+
+
+@router.get("/industry-aggregates", response_model=List[IndustryAggregateResponse])
+def get_industry_aggregates(
+    group_type: str = Query("industry", pattern="^(industry|sector)$", description="分组类型：industry/sector"),
+    group_name: Optional[str] = Query(None, description="行业或板块名称"),
+    start_date: Optional[datetime] = Query(None, description="开始日期"),
+    end_date: Optional[datetime] = Query(None, description="结束日期"),
+    limit: int = Query(5000, ge=1, le=50000, description="限制数量"),
+    offset: int = Query(0, ge=0, description="偏移量"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    查询行业/板块日度聚合指数
+    
+    **功能说明:**
+    - 读取预计算的指数点位、收益、总市值、成交额与涨跌家数
+    - 支持按分组名称和日期范围筛选，按日期、名称排序
+    
+    **权限要求:**
+    - 需要用户登录认证
+    """
+    query = db.query(IndustryAggregate).filter(IndustryAggregate.group_type == group_type)
+    if group_name:
+        query = query.filter(IndustryAggregate.group_name == group_name)
+    if start_date:
+        query = query.filter(IndustryAggregate.date >= start_date)
+    if end_date:
+        query = query.filter(IndustryAggregate.date <= end_date)
+    
+    return query.order_by(IndustryAggregate.date, IndustryAggregate.group_name).offset(offset).limit(limit).all()
+
+
+@router.post("/industry-aggregates/rebuild")
+def rebuild_industry_aggregates(
+    since: Optional[datetime] = Query(None, description="从该日期起重新计算，缺省为全量重建"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    重建行业/板块聚合指数
+    
+    **功能说明:**
+    - 用于行业归属或市值调整后重新计算，或初始化已有历史数据
+    
+    **权限要求:**
+    - 需要用户登录认证
+    """
+    rows = refresh_aggregates(db, since)
+    db.commit()
+    return {"message": "聚合指数已重建", "rows": rows}
+
+
 # MarketIndex 路由 - 必须在参数化路由之前
 @router.post("/indices", response_model=MarketIndexResponse, status_code=status.HTTP_201_CREATED)
 def create_market_index(
@@ -491,6 +613,10 @@ def create_price_history(
     
     db_price_history = PriceHistory(**price_history_data)
     db.add(db_price_history)
+    db.flush()
+    
+    # 有行业或板块归属的证券，只从该日期起增量更新其所属行业与板块的聚合指数
+    refresh_instrument(db, market_data, db_price_history.date)
     db.commit()
     db.refresh(db_price_history)
     
@@ -0,0 +1,190 @@
+"""
+模型组合API路由
+管理多个客户组合共用的模型组合，关联客户组合并将模型权重（叠加客户偏离）批量下发为组合持仓
+"""
+from fastapi import APIRouter, Depends, HTTPException, status as http_status
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session, selectinload
+from typing import List
+from datetime import datetime
+
+from database import get_db
+from models import (
+    User, Portfolio, Asset, ModelPortfolio, ModelPortfolioAsset, PortfolioModelLink, PortfolioWeightOverride
+)
+from schemas.portfolio import (
+    ModelPortfolioCreate, ModelPortfolioResponse, ModelPortfolioLinkRequest, ModelPortfolioFanOutResponse,
+    PortfolioAssetCreate
+)
+from utils.auth import get_current_active_user, get_current_admin_user
+from services.model_portfolios import fan_out_holdings, link_to_model
+
+router = APIRouter(
+    prefix="/model-portfolios",
+    tags=["model-portfolios"],
+    responses={404: {"description": "未找到模型组合"}},
+)
+
+def _get_model(db: Session, model_id: int) -> ModelPortfolio:
+    """获取模型组合（含预加载的目标权重），不存在时返回404"""
+    model = db.query(ModelPortfolio).options(
+        selectinload(ModelPortfolio.model_assets).selectinload(ModelPortfolioAsset.asset)
+    ).filter(ModelPortfolio.id == model_id).first()
+    if not model:
+        raise HTTPException(status_code=404, detail="模型组合不存在")
+    return model
+
+def _require_editor(model: ModelPortfolio, current_user: User):
+    """仅管理员或模型组合创建者可修改模型及其关联，否则返回403"""
+    if not current_user.is_admin and model.created_by != current_user.id:
+        raise HTTPException(status_code=403, detail="无权修改该模型组合")
+
+def _validate_weights(db: Session, items: List[PortfolioAssetCreate]):
+    """一次 IN 查询校验资产，资产不可重复且权重合计不超过100%"""
+    asset_ids = [item.asset_id for item in items]
+    if len(set(asset_ids)) != len(asset_ids):
+        raise HTTPException(status_code=400, detail="模型组合中的资产不可重复")
+    if sum(item.weight for item in items) > 100 + 1e-6:
+        raise HTTPException(status_code=400, detail="模型组合权重合计不能超过100%")
+    found = {asset_id for (asset_id,) in db.query(Asset.id).filter(Asset.id.in_(asset_ids)).all()} if asset_ids else set()
+    for asset_id in asset_ids:
+        if asset_id not in found:
+            raise HTTPException(status_code=400, detail=f"资产ID {asset_id} 不存在")
+
+def _response(db: Session, model: ModelPortfolio) -> ModelPortfolioResponse:
+    count = db.query(func.count(PortfolioModelLink.id)).filter(PortfolioModelLink.model_id == model.id).scalar()
+    return ModelPortfolioResponse.model_validate(model, from_attributes=True).model_copy(update={"portfolios": count})
+
+@router.get("/", response_model=List[ModelPortfolioResponse])
+def list_model_portfolios(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    获取全部模型组合及各自关联的客户组合数。
+    """
+    models = db.query(ModelPortfolio).options(
+        selectinload(ModelPortfolio.model_assets).selectinload(ModelPortfolioAsset.asset)
+    ).order_by(ModelPortfolio.id).all()
+    counts = dict(db.query(PortfolioModelLink.model_id, func.count(PortfolioModelLink.id)).group_by(
+        PortfolioModelLink.model_id
+    ).all())
+    return [
+        ModelPortfolioResponse.model_validate(model, from_attributes=True).model_copy(update={"portfolios": counts.get(model.id, 0)})
+        for model in models
+    ]
+
+@router.post("/", response_model=ModelPortfolioResponse, status_code=http_status.HTTP_201_CREATED)
+def create_model_portfolio(
+    model_in: ModelPortfolioCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    创建模型组合（需管理员权限）。
+    - 参数: model_in (ModelPortfolioCreate): 名称、风险等级与目标权重
+    - 返回: ModelPortfolioResponse 新建的模型组合
+    """
+    if db.query(ModelPortfolio.id).filter(ModelPortfolio.name == model_in.name).first():
+        raise HTTPException(status_code=400, detail="模型组合名称已存在")
+    _validate_weights(db, model_in.assets)
+    model = ModelPortfolio(
+        name=model_in.name, description=model_in.description, risk_level=model_in.risk_level, created_by=current_user.id
+    )
+    db.add(model)
+    db.flush()
+    if model_in.assets:
+        db.execute(insert(ModelPortfolioAsset), [
+            {"model_id": model.id, "asset_id": item.asset_id, "weight": item.weight} for item in model_in.assets
+        ])
+    db.commit()
+    return _response(db, _get_model(db, model.id))
+
+@router.get("/{model_id}", response_model=ModelPortfolioResponse)
+def get_model_portfolio(
+    model_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    获取模型组合详情。
+    """
+    return _response(db, _get_model(db, model_id))
+
+@router.put("/{model_id}/assets", response_model=ModelPortfolioFanOutResponse)
+def update_model_assets(
+    model_id: int,
+    assets: List[PortfolioAssetCreate],
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    替换模型组合的目标权重，并按各关联组合的偏离重写其持仓。
+    - 返回: ModelPortfolioFanOutResponse 下发的组合数、去重后的权重方案数与持仓行数
+    """
+    model = _get_model(db, model_id)
+    _require_editor(model, current_user)
+    _validate_weights(db, assets)
+    db.query(ModelPortfolioAsset).filter(ModelPortfolioAsset.model_id == model.id).delete(synchronize_session=False)
+    if assets:
+        db.execute(insert(ModelPortfolioAsset), [
+            {"model_id": model.id, "asset_id": item.asset_id, "weight": item.weight} for item in assets
+        ])
+    model.updated_at = datetime.utcnow()
+    counts = fan_out_holdings(db, model_ids=[model.id])
+    db.commit()
+    return counts
+
+@router.post("/{model_id}/portfolios", response_model=ModelPortfolioFanOutResponse)
+def link_portfolios(
+    model_id: int,
+    req: ModelPortfolioLinkRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    将客户组合关联到模型组合，已关联其他模型的组合改为关联本模型。
+    keep_weights 为真时现有持仓保存为相对模型的偏离，否则持仓重写为模型权重。
+    非管理员只能关联自己的组合，他人的组合按不存在处理。
+    """
+    model = _get_model(db, model_id)
+    _require_editor(model, current_user)
+    portfolio_ids = sorted(set(req.portfolio_ids))
+    query = db.query(Portfolio.id).filter(Portfolio.id.in_(portfolio_ids))
+    if not current_user.is_admin:
+        query = query.filter(Portfolio.user_id == current_user.id)
+    found = {pid for (pid,) in query.all()}
+    missing = [pid for pid in portfolio_ids if pid not in found]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"投资组合不存在: {missing}")
+    counts = link_to_model(db, model, portfolio_ids, keep_weights=req.keep_weights)
+    db.commit()
+    return counts
+
+@router.delete("/{model_id}/portfolios/{portfolio_id}")
+def unlink_portfolio(
+    model_id: int,
+    portfolio_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    解除客户组合与模型组合的关联并删除其偏离，组合保留当前持仓。
+    """
+    _require_editor(_get_model(db, model_id), current_user)
+    query = db.query(PortfolioModelLink).filter(
+        PortfolioModelLink.model_id == model_id, PortfolioModelLink.portfolio_id == portfolio_id
+    )
+    if not current_user.is_admin:
+        query = query.join(Portfolio, Portfolio.id == PortfolioModelLink.portfolio_id).filter(
+            Portfolio.user_id == current_user.id
+        )
+    link = query.first()
+    if not link:
+        raise HTTPException(status_code=404, detail="组合未关联该模型组合")
+    db.query(PortfolioWeightOverride).filter(PortfolioWeightOverride.portfolio_id == portfolio_id).delete(
+        synchronize_session=False
+    )
+    db.delete(link)
+    db.commit()
+    return {"ok": True}
@@ -2,18 +2,33 @@
 投资组合相关API路由
 实现投资组合的创建和查询（仅限当前登录用户）
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Body
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status, Body, Query
+from sqlalchemy.orm import Session, selectinload
+from typing import Any, Dict, List, Optional
+from datetime import datetime
+import numpy as np
+import pandas as pd
 import sys
 import os
 import logging
 from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import String
+from sqlalchemy import String, func, insert
 from database import get_db
-from models import Portfolio, PortfolioAsset, Asset
-from schemas.portfolio import PortfolioCreate, PortfolioResponse, PortfolioUpdate, PortfolioAssetCreate
+from models import (
+    Portfolio, PortfolioAsset, Asset, PortfolioNavSnapshot, MarketIndex, IndexHistory,
+    PortfolioModelLink, PortfolioWeightOverride
+)
+from models.ai_models import PortfolioRiskAnalyzer
+from services.covariance import estimate_covariance, TRADING_DAYS
+from schemas.portfolio import (
+    PortfolioCreate, PortfolioResponse, PortfolioUpdate, PortfolioAssetCreate, PortfolioPerformance,
+    PortfolioNavSnapshotResponse, PortfolioValuationRequest, PortfolioValuationResponse,
+    PortfolioRiskResponse, AssetRiskContribution, PortfolioWhatIfRequest, PortfolioWhatIfResponse,
+    WhatIfMetrics, WhatIfAssetChange, PortfolioWeightOverrideItem, PortfolioWeightOverrideResponse
+)
 from utils.auth import get_current_active_user
+from services.portfolio_nav import refresh_nav_snapshots
+from services.model_portfolios import fan_out_holdings
 from models import User
 
 # 配置日志
@@ -31,6 +46,36 @@ router = APIRouter(
     responses={404: {"description": "未找到投资组合"}},
 )
 
+def _portfolio_query(db: Session):
+    """投资组合查询，资产关联及资产详情以 IN 查询预加载，序列化时不再逐个懒加载"""
+    return db.query(Portfolio).options(
+        selectinload(Portfolio.portfolio_assets).selectinload(PortfolioAsset.asset)
+    )
+
+def _get_user_portfolio(db: Session, portfolio_id: int, user_id: int) -> Portfolio:
+    """获取当前用户的投资组合（含预加载的资产），不存在时返回404"""
+    portfolio = _portfolio_query(db).filter(Portfolio.id == portfolio_id, Portfolio.user_id == user_id).first()
+    if not portfolio:
+        raise HTTPException(status_code=404, detail="投资组合不存在或无权限访问")
+    return portfolio
+
+def _validate_asset_ids(db: Session, asset_items: List[PortfolioAssetCreate]):
+    """一次 IN 查询校验全部资产ID，存在不存在的资产时按请求顺序报告第一个"""
+    requested = {item.asset_id for item in asset_items}
+    if not requested:
+        return
+    found = {asset_id for (asset_id,) in db.query(Asset.id).filter(Asset.id.in_(requested)).all()}
+    for item in asset_items:
+        if item.asset_id not in found:
+            raise HTTPException(status_code=400, detail=f"资产ID {item.asset_id} 不存在")
+
+def _insert_portfolio_assets(db: Session, portfolio_id: int, asset_items: List[PortfolioAssetCreate]):
+    """批量写入组合的资产及权重（一条多行插入）"""
+    if asset_items:
+        db.execute(insert(PortfolioAsset), [
+            {"portfolio_id": portfolio_id, "asset_id": item.asset_id, "weight": item.weight} for item in asset_items
+        ])
+
 @router.post("/", response_model=PortfolioResponse, status_code=status.HTTP_201_CREATED)
 def create_portfolio(
     portfolio_in: PortfolioCreate,
@@ -43,7 +88,8 @@ def create_portfolio(
     - 返回: PortfolioResponse 新建投资组合详情
     - 异常: 资产ID不存在时返回400
     """
-    # 创建投资组合对象
+    # 先校验资产，避免资产不存在时留下没有资产的组合
+    _validate_asset_ids(db, portfolio_in.assets)
     portfolio = Portfolio(
         name=portfolio_in.name,
         description=portfolio_in.description,
@@ -51,24 +97,11 @@ def create_portfolio(
         user_id=current_user.id
     )
     db.add(portfolio)
-    db.commit()
-    db.refresh(portfolio)
-
+    db.flush()
     # 添加资产及权重
-    for asset_item in portfolio_in.assets:
-        # 检查资产是否存在
-        asset = db.query(Asset).filter(Asset.id == asset_item.asset_id).first()
-        if not asset:
-            raise HTTPException(status_code=400, detail=f"资产ID {asset_item.asset_id} 不存在")
-        portfolio_asset = PortfolioAsset(
-            portfolio_id=portfolio.id,
-            asset_id=asset.id,
-            weight=asset_item.weight
-        )
-        db.add(portfolio_asset)
+    _insert_portfolio_assets(db, portfolio.id, portfolio_in.assets)
     db.commit()
-    db.refresh(portfolio)
-    return portfolio
+    return _get_user_portfolio(db, portfolio.id, current_user.id)
 
 @router.get("/me", response_model=List[PortfolioResponse])
 def get_my_portfolios(
@@ -76,11 +109,35 @@ def get_my_portfolios(
     current_user: User = Depends(get_current_active_user)
 ):
     """
-    获取当前用户的所有投资组合。
+    获取当前用户的所有投资组合，附带最近一次净值快照的业绩。
     - 返回: List[PortfolioResponse] 当前用户的投资组合列表
     """
-    portfolios = db.query(Portfolio).filter(Portfolio.user_id == current_user.id).all()
-    return portfolios
+    portfolios = _portfolio_query(db).filter(Portfolio.user_id == current_user.id).all()
+    # 各组合最新净值一次查询取出，不逐个组合或资产查询
+    snapshots = PortfolioNavSnapshot.latest(db, [portfolio.id for portfolio in portfolios])
+    responses = []
+    for portfolio in portfolios:
+        response = PortfolioResponse.model_validate(portfolio, from_attributes=True)
+        if portfolio.id in snapshots:
+            response.performance = PortfolioPerformance.model_validate(snapshots[portfolio.id], from_attributes=True)
+        responses.append(response)
+    return responses
+
+@router.post("/me/nav", response_model=PortfolioValuationResponse)
+def refresh_my_portfolio_nav(
+    req: PortfolioValuationRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    增量计算当前用户全部投资组合的净值快照（全市场组合由每日运行批量计算）。
+    - 参数: req (PortfolioValuationRequest): 估值截止日期与新组合起始日期
+    - 返回: PortfolioValuationResponse 写入的组合数与快照数
+    """
+    portfolio_ids = [row.id for row in db.query(Portfolio.id).filter(Portfolio.user_id == current_user.id).all()]
+    result = refresh_nav_snapshots(db, end_date=req.end_date, start_date=req.start_date, portfolio_ids=portfolio_ids)
+    db.commit()
+    return result
 
 @router.get("/{portfolio_id}", response_model=PortfolioResponse)
 def get_portfolio_detail(
@@ -91,10 +148,195 @@ def get_portfolio_detail(
     """
     获取指定投资组合详情（仅限当前用户）
     """
-    portfolio = db.query(Portfolio).filter(Portfolio.id == portfolio_id, Portfolio.user_id == current_user.id).first()
+    return _get_user_portfolio(db, portfolio_id, current_user.id)
+
+@router.get("/{portfolio_id}/nav", response_model=List[PortfolioNavSnapshotResponse])
+def get_portfolio_nav(
+    portfolio_id: int,
+    start_date: Optional[datetime] = Query(None, description="开始日期"),
+    end_date: Optional[datetime] = Query(None, description="结束日期"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    获取指定投资组合的净值快照序列（仅限当前用户）
+    """
+    portfolio = db.query(Portfolio.id).filter(Portfolio.id == portfolio_id, Portfolio.user_id == current_user.id).first()
     if not portfolio:
         raise HTTPException(status_code=404, detail="投资组合不存在或无权限访问")
-    return portfolio
+    query = db.query(PortfolioNavSnapshot).filter(PortfolioNavSnapshot.portfolio_id == portfolio_id)
+    if start_date:
+        query = query.filter(PortfolioNavSnapshot.date >= start_date)
+    if end_date:
+        query = query.filter(PortfolioNavSnapshot.date <= end_date)
+    return query.order_by(PortfolioNavSnapshot.date).all()
+
+def _portfolio_holdings(db: Session, portfolio_id: int, user_id: int) -> Dict[str, float]:
+    """当前用户组合的持仓 资产代码 -> 权重（小数），组合不存在时返回404"""
+    portfolio = db.query(Portfolio.id).filter(Portfolio.id == portfolio_id, Portfolio.user_id == user_id).first()
+    if not portfolio:
+        raise HTTPException(status_code=404, detail="投资组合不存在或无权限访问")
+    holdings = {}
+    for code, weight in db.query(Asset.code, PortfolioAsset.weight).join(
+        PortfolioAsset, PortfolioAsset.asset_id == Asset.id
+    ).filter(PortfolioAsset.portfolio_id == portfolio_id).all():
+        # 持仓权重以百分比存储
+        holdings[code] = holdings.get(code, 0.0) + weight / 100
+    return holdings
+
+def _risk_estimate(db: Session, codes: List[str], lookback_days: int, end_date: Optional[datetime]) -> Dict[str, Any]:
+    """组合优化模块缓存的协方差与收益估计；只有一个资产时改用样本方差与样本均值"""
+    estimate = estimate_covariance(db, codes, lookback_days, end_date)
+    if len(estimate["symbols"]) == 1:
+        returns = estimate["returns"][:, 0]
+        estimate = {
+            **estimate,
+            "covariance": np.array([[np.nanvar(returns, ddof=1) * TRADING_DAYS]]),
+            "mean_returns": np.array([np.nanmean(returns) * TRADING_DAYS]),
+        }
+    return estimate
+
+def _benchmark_returns(db: Session, index_code: str, dates: list) -> np.ndarray:
+    """基准指数在给定交易日上的日收益，缺失为NaN"""
+    market_index = db.query(MarketIndex.id).filter(MarketIndex.code == index_code).first()
+    if not market_index:
+        raise HTTPException(status_code=404, detail="基准指数不存在")
+    if not dates:
+        return np.zeros(0)
+    # 多取首日之前的一条记录以计算首日收益
+    previous = db.query(func.max(IndexHistory.date)).filter(
+        IndexHistory.market_index_id == market_index.id, IndexHistory.date < dates[0]
+    ).scalar()
+    rows = db.query(IndexHistory.date, IndexHistory.close_value).filter(
+        IndexHistory.market_index_id == market_index.id,
+        IndexHistory.date >= (previous or dates[0]),
+        IndexHistory.date <= dates[-1]
+    ).order_by(IndexHistory.date).all()
+    closes = pd.Series([row.close_value for row in rows], index=[row.date for row in rows], dtype=float)
+    return closes.pct_change(fill_method=None).reindex(dates).to_numpy(dtype=float)
+
+@router.get("/{portfolio_id}/risk", response_model=PortfolioRiskResponse)
+def get_portfolio_risk(
+    portfolio_id: int,
+    lookback_days: int = Query(252, ge=20, le=1260, description="回看交易日数"),
+    confidence: float = Query(0.95, gt=0.5, lt=1, description="VaR置信水平"),
+    horizon_days: int = Query(1, ge=1, le=250, description="持有期（交易日）"),
+    index_code: Optional[str] = Query(None, description="计算Beta的基准指数代码"),
+    end_date: Optional[datetime] = Query(None, description="行情截止日期，默认最新"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    计算指定投资组合的风险指标（仅限当前用户）：历史法/参数法VaR与CVaR、年化波动率、
+    相对基准指数的Beta、最大回撤及各资产风险贡献。协方差使用组合优化模块缓存的收缩估计。
+    """
+    holdings = _portfolio_holdings(db, portfolio_id, current_user.id)
+    if not holdings:
+        raise HTTPException(status_code=400, detail="投资组合没有持仓")
+    
+    estimate = _risk_estimate(db, list(holdings), lookback_days, end_date)
+    symbols, returns, covariance = estimate["symbols"], estimate["returns"], estimate["covariance"]
+    if not symbols:
+        raise HTTPException(status_code=400, detail="持仓资产缺少足够的行情数据")
+    weights = np.array([holdings[symbol] for symbol in symbols], dtype=float)
+    
+    benchmark = _benchmark_returns(db, index_code, estimate["dates"]) if index_code else None
+    analyzer = PortfolioRiskAnalyzer(confidence=confidence, horizon_days=horizon_days, trading_days=TRADING_DAYS)
+    result = analyzer.analyze(weights, covariance, returns, benchmark)
+    
+    total_weight = sum(holdings.values())
+    return PortfolioRiskResponse(
+        portfolio_id=portfolio_id,
+        as_of=estimate["dates"][-1] if estimate["dates"] else None,
+        observations=estimate["observations"],
+        confidence=confidence,
+        horizon_days=horizon_days,
+        volatility=result["volatility"],
+        historical_var=result["historical_var"],
+        historical_cvar=result["historical_cvar"],
+        parametric_var=result["parametric_var"],
+        parametric_cvar=result["parametric_cvar"],
+        max_drawdown=result["max_drawdown"],
+        beta=result["beta"],
+        benchmark=index_code,
+        coverage=float(weights.sum() / total_weight) if total_weight > 0 else 0.0,
+        risk_contributions=[
+            AssetRiskContribution(
+                code=symbol,
+                weight=float(weights[j]),
+                marginal_risk=float(result["marginal_risk"][j]),
+                risk_contribution=float(result["risk_contributions"][j])
+            )
+            for j, symbol in enumerate(symbols)
+        ],
+        excluded=sorted(set(holdings) - set(symbols))
+    )
+
+@router.post("/{portfolio_id}/what-if", response_model=PortfolioWhatIfResponse)
+def simulate_portfolio_weights(
+    portfolio_id: int,
+    req: PortfolioWhatIfRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    试算调整为建议权重后的风险收益与换手成本（仅限当前用户，不修改持仓）。
+    协方差与收益序列使用缓存的估计，拖动权重反复试算时只需少量查询与向量运算。
+    """
+    current = _portfolio_holdings(db, portfolio_id, current_user.id)
+    codes = dict(db.query(Asset.id, Asset.code).filter(Asset.id.in_({item.asset_id for item in req.assets})).all())
+    proposed = {}
+    for item in req.assets:
+        if item.asset_id not in codes:
+            raise HTTPException(status_code=400, detail=f"资产ID {item.asset_id} 不存在")
+        proposed[codes[item.asset_id]] = proposed.get(codes[item.asset_id], 0.0) + item.weight / 100
+    
+    universe = sorted(set(current) | set(proposed))
+    if not universe:
+        raise HTTPException(status_code=400, detail="当前持仓与建议权重均为空")
+    estimate = _risk_estimate(db, universe, req.lookback_days, req.end_date)
+    symbols = estimate["symbols"]
+    if not symbols:
+        raise HTTPException(status_code=400, detail="持仓资产缺少足够的行情数据")
+    
+    analyzer = PortfolioRiskAnalyzer(confidence=req.confidence, horizon_days=req.horizon_days, trading_days=TRADING_DAYS)
+    metrics = {}
+    for name, holdings in (("current", current), ("proposed", proposed)):
+        weights = np.array([holdings.get(symbol, 0.0) for symbol in symbols], dtype=float)
+        result = analyzer.analyze(weights, estimate["covariance"], estimate["returns"])
+        metrics[name] = WhatIfMetrics(
+            expected_return=float(weights @ estimate["mean_returns"]),
+            volatility=result["volatility"],
+            historical_var=result["historical_var"],
+            historical_cvar=result["historical_cvar"],
+            parametric_var=result["parametric_var"],
+            parametric_cvar=result["parametric_cvar"],
+            max_drawdown=result["max_drawdown"]
+        )
+    
+    # 换手与成本按全部资产计算（含缺少行情的资产）
+    current_weights = np.array([current.get(code, 0.0) for code in universe])
+    proposed_weights = np.array([proposed.get(code, 0.0) for code in universe])
+    traded = float(np.abs(proposed_weights - current_weights).sum())
+    cost = traded * req.cost_rate
+    return PortfolioWhatIfResponse(
+        portfolio_id=portfolio_id,
+        current=metrics["current"],
+        proposed=metrics["proposed"],
+        turnover=traded / 2,
+        estimated_cost=cost,
+        estimated_cost_amount=cost * req.portfolio_value if req.portfolio_value else None,
+        changes=[
+            WhatIfAssetChange(
+                code=code,
+                current_weight=float(current_weights[j]),
+                proposed_weight=float(proposed_weights[j]),
+                change=float(proposed_weights[j] - current_weights[j])
+            )
+            for j, code in enumerate(universe)
+        ],
+        excluded=sorted(set(universe) - set(symbols))
+    )
 
 @router.put("/{portfolio_id}", response_model=PortfolioResponse)
 def update_portfolio(
@@ -106,9 +348,7 @@ def update_portfolio(
     """
     更新指定投资组合基础信息（仅限当前用户）
     """
-    portfolio = db.query(Portfolio).filter(Portfolio.id == portfolio_id, Portfolio.user_id == current_user.id).first()
-    if not portfolio:
-        raise HTTPException(status_code=404, detail="投资组合不存在或无权限访问")
+    portfolio = _get_user_portfolio(db, portfolio_id, current_user.id)
     # 只更新基础字段
     if portfolio_in.name is not None:
         portfolio.name = portfolio_in.name
@@ -119,8 +359,7 @@ def update_portfolio(
     if portfolio_in.is_active is not None:
         portfolio.is_active = portfolio_in.is_active
     db.commit()
-    db.refresh(portfolio)
-    return portfolio
+    return _get_user_portfolio(db, portfolio_id, current_user.id)
 
 @router.put("/{portfolio_id}/assets", response_model=PortfolioResponse)
 def update_portfolio_assets(
@@ -132,25 +371,62 @@ def update_portfolio_assets(
     """
     更新指定投资组合的资产及权重（仅限当前用户）
     """
-    portfolio = db.query(Portfolio).filter(Portfolio.id == portfolio_id, Portfolio.user_id == current_user.id).first()
+    portfolio = db.query(Portfolio.id).filter(Portfolio.id == portfolio_id, Portfolio.user_id == current_user.id).first()
     if not portfolio:
         raise HTTPException(status_code=404, detail="投资组合不存在或无权限访问")
+    if db.query(PortfolioModelLink.id).filter(PortfolioModelLink.portfolio_id == portfolio_id).first():
+        raise HTTPException(status_code=400, detail="组合已关联模型组合，请通过权重偏离调整持仓")
+    _validate_asset_ids(db, assets)
     # 删除原有资产关联
     db.query(PortfolioAsset).filter(PortfolioAsset.portfolio_id == portfolio_id).delete()
     # 添加新资产关联
-    for asset_item in assets:
-        asset = db.query(Asset).filter(Asset.id == asset_item.asset_id).first()
-        if not asset:
-            raise HTTPException(status_code=400, detail=f"资产ID {asset_item.asset_id} 不存在")
-        portfolio_asset = PortfolioAsset(
-            portfolio_id=portfolio_id,
-            asset_id=asset.id,
-            weight=asset_item.weight
-        )
-        db.add(portfolio_asset)
+    _insert_portfolio_assets(db, portfolio_id, assets)
     db.commit()
-    db.refresh(portfolio)
-    return portfolio
+    return _get_user_portfolio(db, portfolio_id, current_user.id)
+
+@router.get("/{portfolio_id}/overrides", response_model=List[PortfolioWeightOverrideResponse])
+def get_weight_overrides(
+    portfolio_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    获取组合相对所关联模型组合的权重偏离（仅限当前用户）
+    """
+    _get_user_portfolio(db, portfolio_id, current_user.id)
+    return db.query(PortfolioWeightOverride).filter(PortfolioWeightOverride.portfolio_id == portfolio_id).order_by(
+        PortfolioWeightOverride.asset_id
+    ).all()
+
+@router.put("/{portfolio_id}/overrides", response_model=PortfolioResponse)
+def update_weight_overrides(
+    portfolio_id: int,
+    overrides: List[PortfolioWeightOverrideItem] = Body(..., description="各资产的权重偏离，替换原有偏离"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    替换组合相对模型组合的权重偏离，并按 模型权重 + 偏离 重写持仓（仅限当前用户）
+    - 异常: 组合未关联模型组合或资产不存在时返回400
+    """
+    _get_user_portfolio(db, portfolio_id, current_user.id)
+    if not db.query(PortfolioModelLink.id).filter(PortfolioModelLink.portfolio_id == portfolio_id).first():
+        raise HTTPException(status_code=400, detail="组合未关联模型组合")
+    asset_ids = [item.asset_id for item in overrides]
+    if len(set(asset_ids)) != len(asset_ids):
+        raise HTTPException(status_code=400, detail="同一资产只能设置一项偏离")
+    _validate_asset_ids(db, [PortfolioAssetCreate(asset_id=asset_id, weight=0) for asset_id in asset_ids])
+    db.query(PortfolioWeightOverride).filter(PortfolioWeightOverride.portfolio_id == portfolio_id).delete(
+        synchronize_session=False
+    )
+    rows = [{"portfolio_id": portfolio_id, "asset_id": item.asset_id, "weight_delta": item.weight_delta}
+            for item in overrides if item.weight_delta != 0]
+    if rows:
+        db.execute(insert(PortfolioWeightOverride), rows)
+    fan_out_holdings(db, portfolio_ids=[portfolio_id])
+    db.commit()
+    db.expire_all()
+    return _get_user_portfolio(db, portfolio_id, current_user.id)
 
 @router.delete("/{portfolio_id}", status_code=200)
 def delete_portfolio(
@@ -6,6 +6,7 @@ from fastapi import APIRouter
 
 from .base import router as base_router
 from .macro_timing import router as macro_timing_router
+from .macro_indicator import router as macro_indicator_router
 from .sector_rotation import router as sector_rotation_router
 from .multi_factor import router as multi_factor_router
 from .signal import router as signal_router
@@ -13,6 +14,9 @@ from .backtest import router as backtest_router
 from .allocation import router as allocation_router
 from .factor_model import router as factor_model_router
 from .market_regime import router as market_regime_router
+from .optimizer import router as optimizer_router
+from .rebalance import router as rebalance_router
+from .daily_run import router as daily_run_router, run_daily_strategies
 
 # 创建主路由器
 router = APIRouter(prefix="/strategy", tags=["AI投资策略引擎"])
@@ -20,6 +24,7 @@ router = APIRouter(prefix="/strategy", tags=["AI投资策略引擎"])
 # 注册所有子模块的路由器
 router.include_router(base_router, prefix="")
 router.include_router(macro_timing_router, prefix="")
+router.include_router(macro_indicator_router, prefix="")
 router.include_router(sector_rotation_router, prefix="")
 router.include_router(multi_factor_router, prefix="")
 router.include_router(signal_router, prefix="")
@@ -27,16 +32,24 @@ router.include_router(backtest_router, prefix="")
 router.include_router(allocation_router, prefix="")
 router.include_router(factor_model_router, prefix="")
 router.include_router(market_regime_router, prefix="")
+router.include_router(optimizer_router, prefix="")
+router.include_router(rebalance_router, prefix="")
+router.include_router(daily_run_router, prefix="")
 
 __all__ = [
     "router",
     "base_router",
     "macro_timing_router", 
+    "macro_indicator_router",
     "sector_rotation_router",
     "multi_factor_router",
     "signal_router",
     "backtest_router",
     "allocation_router",
     "factor_model_router",
-    "market_regime_router"
+    "market_regime_router",
+    "optimizer_router",
+    "rebalance_router",
+    "daily_run_router",
+    "run_daily_strategies"
 ] 
\ No newline at end of file
@@ -70,7 +70,7 @@ def get_strategies(
     return strategies
 
 
-@router.get("/{strategy_id}", response_model=StrategyResponse)
+@router.get("/{strategy_id:int}", response_model=StrategyResponse)
 def get_strategy(
     strategy_id: int,
     db: Session = Depends(get_db),
@@ -83,7 +83,7 @@ def get_strategy(
     return strategy
 
 
-@router.put("/{strategy_id}", response_model=StrategyResponse)
+@router.put("/{strategy_id:int}", response_model=StrategyResponse)
 def update_strategy(
     strategy_id: int,
     strategy_update: StrategyUpdate,
@@ -104,7 +104,7 @@ def update_strategy(
     return db_strategy
 
 
-@router.delete("/{strategy_id}", status_code=status.HTTP_204_NO_CONTENT)
+@router.delete("/{strategy_id:int}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_strategy(
     strategy_id: int,
     db: Session = Depends(get_db),
@@ -119,7 +119,7 @@ def delete_strategy(
     db.commit()
 
 
-@router.get("/{strategy_id}/with-signals", response_model=StrategyWithSignals)
+@router.get("/{strategy_id:int}/with-signals", response_model=StrategyWithSignals)
 def get_strategy_with_signals(
     strategy_id: int,
     db: Session = Depends(get_db),
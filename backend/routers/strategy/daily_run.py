@@ -0,0 +1,498 @@
+"""
+每日策略运行模块
+按 数据同步 → 组合估值 → 目标预测 → 客户分群 → 适当性检查 → 指标更新 → 因子评分 → 宏观/行业信号 → 组合配置 的顺序运行全部活跃策略，
+提供手动触发与运行记录查询
+"""
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, status as http_status
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session, sessionmaker
+from typing import Any, Callable, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time, timedelta
+import logging
+import time as timer
+
+from config import DAILY_RUN_CONFIG
+from database import get_db
+from utils.auth import get_current_user, get_current_admin_user
+from models.user import User
+from models.market_data import MarketIndex
+from models.strategy import (
+    Strategy, StrategyType, StrategySignal, StrategyRunStep, PortfolioAllocation, RegimeDetectionState,
+    MacroTimingSignal, SectorRotationSignal, MultiFactorScore, MultiFactorInput
+)
+from schemas.strategy import (
+    DailyRunRequest, DailyRunAcceptedResponse, StrategyRunStepResponse,
+    MultiFactorRequest, StockFactorData, MacroTimingHistoryRequest, SectorRotationBatchRequest,
+    BatchOptimizationRequest
+)
+from services.industry_aggregates import sync_aggregates
+from services.portfolio_nav import refresh_nav_snapshots
+from services.suitability import check_suitability
+from services.goal_projection import project_goals
+from services.segmentation import refresh_segmentation
+from .market_regime import advance_regime_state
+from .multi_factor import generate_multi_factor_score
+from .macro_timing import build_live_signal
+from .sector_rotation import run_rotation_batch
+from .signal import FANOUT_SOURCES, load_industry_constituents
+from .optimizer import run_batch_optimization
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="", tags=["每日策略运行"])
+
+# 全市场公共步骤，所有策略运行前执行一次
+MARKET_STEPS = ["ingest", "valuation", "goals", "segments", "suitability", "indicators"]
+# 各类策略依次执行的步骤，其他类型的策略暂无每日运行步骤
+STRATEGY_STEPS = {
+    StrategyType.MULTI_FACTOR: ["factor_scores", "allocations"],
+    StrategyType.MACRO_TIMING: ["signals", "allocations"],
+    StrategyType.SECTOR_ROTATION: ["signals", "allocations"],
+}
+# 参数中配置了 batch_optimization 的策略改为按客户约束批量优化配置
+BATCH_OPTIMIZATION_STEPS = ["optimized_allocations"]
+# 已完成的步骤在重跑时直接跳过
+DONE_STATUSES = ("success", "skipped")
+
+
+class StepSkipped(Exception):
+    """步骤缺少输入数据等原因无需执行"""
+
+
+class DailyStrategyRunner:
+    """
+    每日策略运行器
+
+    每个步骤在独立会话中执行，步骤的业务写入与步骤记录在同一事务中提交，
+    因此重跑同一运行日期时已成功的步骤直接跳过、失败的步骤从断点继续。
+    公共步骤完成后，各策略的步骤链在线程池中并行执行；单个策略失败不影响其他策略。
+    """
+
+    def __init__(self,
+                 session_factory: Callable[[], Session],
+                 run_date: Optional[datetime] = None,
+                 max_workers: Optional[int] = None,
+                 window_minutes: Optional[int] = None):
+        run_date = run_date or datetime.now()
+        self.session_factory = session_factory
+        self.run_date = datetime.combine(run_date.date(), time.min)
+        # 当日数据截止时间（含当天全部数据）
+        self.as_of = datetime.combine(run_date.date(), time.max)
+        self.max_workers = max_workers or DAILY_RUN_CONFIG["max_workers"]
+        self.window_minutes = window_minutes or DAILY_RUN_CONFIG["window_minutes"]
+        self.step_functions = {
+            "ingest": self.ingest,
+            "valuation": self.valuation,
+            "goals": self.goals,
+            "segments": self.segments,
+            "suitability": self.suitability,
+            "indicators": self.indicators,
+            "factor_scores": self.factor_scores,
+            "signals": self.signals,
+            "allocations": self.allocations,
+            "optimized_allocations": self.optimized_allocations,
+        }
+
+    def run(self, strategy_ids: Optional[List[int]] = None) -> Dict[str, Any]:
+        """执行全部步骤，返回运行摘要"""
+        started = timer.perf_counter()
+        db = self.session_factory()
+        try:
+            query = db.query(Strategy.id, Strategy.strategy_type, Strategy.parameters).filter(Strategy.is_active == True)
+            if strategy_ids is not None:
+                query = query.filter(Strategy.id.in_(strategy_ids))
+            chains = []
+            for strategy in query.order_by(Strategy.id).all():
+                if (strategy.parameters or {}).get("batch_optimization"):
+                    chains.append((strategy.id, BATCH_OPTIMIZATION_STEPS))
+                elif strategy.strategy_type in STRATEGY_STEPS:
+                    chains.append((strategy.id, STRATEGY_STEPS[strategy.strategy_type]))
+        finally:
+            db.close()
+
+        self.run_chain("market", None, MARKET_STEPS)
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="daily-run") as executor:
+            list(executor.map(lambda chain: self.run_chain(f"strategy:{chain[0]}", chain[0], chain[1]), chains))
+
+        elapsed = timer.perf_counter() - started
+        within_window = elapsed <= self.window_minutes * 60
+        if not within_window:
+            logger.warning("每日策略运行耗时%.1f秒，超出%d分钟的时间窗口", elapsed, self.window_minutes)
+        steps = self.load_steps()
+        status_counts: Dict[str, int] = {}
+        for step in steps:
+            status_counts[step.status] = status_counts.get(step.status, 0) + 1
+        return {
+            "run_date": self.run_date,
+            "strategies": len(chains),
+            "elapsed_seconds": elapsed,
+            "window_minutes": self.window_minutes,
+            "within_window": within_window,
+            "status_counts": status_counts,
+            "steps": steps,
+        }
+
+    def load_steps(self) -> List[StrategyRunStepResponse]:
+        db = self.session_factory()
+        try:
+            records = db.query(StrategyRunStep).filter(
+                StrategyRunStep.run_date == self.run_date
+            ).order_by(StrategyRunStep.id).all()
+            return [StrategyRunStepResponse.model_validate(record) for record in records]
+        finally:
+            db.close()
+
+    def run_chain(self, scope: str, strategy_id: Optional[int], steps: List[str]) -> bool:
+        """按顺序执行步骤链，遇到失败或正由其他运行执行的步骤即停止后续步骤"""
+        for step in steps:
+            if self.run_step(scope, strategy_id, step) not in DONE_STATUSES:
+                return False
+        return True
+
+    def find_step(self, db: Session, scope: str, step: str) -> Optional[StrategyRunStep]:
+        return db.query(StrategyRunStep).filter(
+            StrategyRunStep.run_date == self.run_date,
+            StrategyRunStep.scope == scope,
+            StrategyRunStep.step == step
+        ).first()
+
+    def in_progress(self, record: StrategyRunStep) -> bool:
+        """步骤正由其他运行执行；超过运行时间窗口仍未结束的视为中断，可重新执行"""
+        return (record.status == "running" and record.started_at is not None
+                and datetime.utcnow() - record.started_at < timedelta(minutes=self.window_minutes))
+
+    def run_step(self, scope: str, strategy_id: Optional[int], step: str) -> str:
+        """执行单个步骤并记录状态与耗时，返回步骤状态"""
+        db = self.session_factory()
+        try:
+            record = self.find_step(db, scope, step)
+            if record is not None and (record.status in DONE_STATUSES or self.in_progress(record)):
+                return record.status
+            claim = {"status": "running", "started_at": datetime.utcnow(), "error": None}
+            if record is None:
+                record = StrategyRunStep(run_date=self.run_date, scope=scope, strategy_id=strategy_id, step=step,
+                                         attempts=1, **claim)
+                db.add(record)
+                claimed = True
+            else:
+                # 以执行次数作乐观锁认领步骤，同一步骤的并发运行只有一个能认领成功
+                claimed = db.query(StrategyRunStep).filter(
+                    StrategyRunStep.id == record.id,
+                    StrategyRunStep.attempts == record.attempts
+                ).update({**claim, "attempts": record.attempts + 1}, synchronize_session=False) == 1
+            try:
+                db.commit()
+            except IntegrityError:
+                # 并发运行已插入同一步骤的记录
+                db.rollback()
+                claimed = False
+            if not claimed:
+                return self.find_step(db, scope, step).status
+
+            started = timer.perf_counter()
+            strategy = db.get(Strategy, strategy_id) if strategy_id is not None else None
+            try:
+                output = self.step_functions[step](db, strategy)
+                record.status = "success"
+                record.output = output
+            except (StepSkipped, HTTPException) as e:
+                db.rollback()
+                if isinstance(e, HTTPException) and e.status_code != 404:
+                    record.status = "failed"
+                    record.error = str(e.detail)
+                else:
+                    record.status = "skipped"
+                    record.output = {"reason": str(e.detail if isinstance(e, HTTPException) else e)}
+            except Exception as e:
+                db.rollback()
+                logger.exception("每日运行步骤失败: %s %s", scope, step)
+                record.status = "failed"
+                record.error = f"{type(e).__name__}: {e}"
+            record.finished_at = datetime.utcnow()
+            record.duration_ms = (timer.perf_counter() - started) * 1000
+            try:
+                db.commit()
+            except SQLAlchemyError as e:
+                # 步骤写入与其他运行冲突（如唯一约束）时整体回滚，步骤记为失败
+                db.rollback()
+                logger.exception("每日运行步骤提交失败: %s %s", scope, step)
+                record.status = "failed"
+                record.output = None
+                record.error = f"{type(e).__name__}: {getattr(e, 'orig', None) or e}"
+                record.finished_at = datetime.utcnow()
+                record.duration_ms = (timer.perf_counter() - started) * 1000
+                db.commit()
+            return record.status
+        finally:
+            db.close()
+
+    # === 步骤实现：只写入会话不提交，由 run_step 与步骤记录一起提交 ===
+
+    def ingest(self, db: Session, strategy: Optional[Strategy]) -> Dict[str, Any]:
+        """补齐行业/板块聚合指数中尚未覆盖的交易日"""
+        return {"aggregate_rows": sync_aggregates(db)}
+
+    def valuation(self, db: Session, strategy: Optional[Strategy]) -> Dict[str, Any]:
+        """增量计算全部活跃组合截至运行日的净值快照"""
+        return refresh_nav_snapshots(db, end_date=self.as_of)
+
+    def goals(self, db: Session, strategy: Optional[Strategy]) -> Dict[str, Any]:
+        """按最新净值重估目标金额、刷新完成进度，并保存全部活跃目标当日的达成概率预测"""
+        results = project_goals(
+            db, self.run_date, seed=int(self.run_date.strftime("%Y%m%d")), persist=True
+        )
+        counts = {"goals": len(results), "projected": 0, "unlinked": 0, "incomplete": 0}
+        for result in results:
+            counts[result["status"]] += 1
+        return counts
+
+    def segments(self, db: Session, strategy: Optional[Strategy]) -> Dict[str, Any]:
+        """将新增或更新过的用户画像归入当前客群，变更较多时全量重新分群，供按客群批量优化使用"""
+        return refresh_segmentation(db, seed=int(self.run_date.strftime("%Y%m%d")))
+
+    def suitability(self, db: Session, strategy: Optional[Strategy]) -> Dict[str, Any]:
+        """按持有人画像检查全部活跃组合的实际风险，供次日合规报告使用"""
+        return check_suitability(db, self.run_date, end_date=self.as_of)
+
+    def indicators(self, db: Session, strategy: Optional[Strategy]) -> Dict[str, Any]:
+        """对已拟合市场状态模型的指数做增量滤波"""
+        current = {}
+        new_days = 0
+        for state in db.query(RegimeDetectionState).all():
+            regimes, dates, _ = advance_regime_state(db, state)
+            new_days += len(dates)
+            current[str(state.market_index_id)] = regimes[state.current_state].regime_name
+        db.flush()
+        return {"indices": len(current), "new_days": new_days, "current_regimes": current}
+
+    def factor_scores(self, db: Session, strategy: Strategy) -> Dict[str, Any]:
+        """以策略的多因子输入数据评分，并使用当前识别的市场状态"""
+        existing = db.query(MultiFactorScore.id).filter(
+            MultiFactorScore.strategy_id == strategy.id,
+            MultiFactorScore.signal_date == self.run_date
+        ).first()
+        if existing:
+            return {"source_type": "multi_factor", "source_id": existing.id, "reused": True}
+
+        parameters = strategy.parameters or {}
+        db_input = None
+        if parameters.get("multi_factor_input_id"):
+            db_input = db.get(MultiFactorInput, parameters["multi_factor_input_id"])
+        else:
+            latest = db.query(MultiFactorScore.input_id).filter(
+                MultiFactorScore.strategy_id == strategy.id,
+                MultiFactorScore.input_id.isnot(None)
+            ).order_by(MultiFactorScore.signal_date.desc()).first()
+            if latest:
+                db_input = db.get(MultiFactorInput, latest.input_id)
+        if db_input is None:
+            raise StepSkipped("策略没有可用的多因子输入数据")
+
+        req = MultiFactorRequest(
+            stocks=[StockFactorData(**stock) for stock in db_input.load_stocks_data()],
+            factor_weights=parameters.get("factor_weights"),
+            market_regime=parameters.get("market_regime"),
+            market_regime_id=self._current_regime_id(db, parameters.get("regime_index_code")),
+            storage_mode="compact",
+            strategy_id=strategy.id
+        )
+        db_score, _, _ = generate_multi_factor_score(db, req, signal_date=self.run_date)
+        db.flush()
+        return {
+            "source_type": "multi_factor",
+            "source_id": db_score.id,
+            "stock_count": db_score.stock_count,
+            "market_regime": db_score.market_regime,
+        }
+
+    def signals(self, db: Session, strategy: Strategy) -> Dict[str, Any]:
+        """生成宏观择时或行业轮动信号"""
+        parameters = strategy.parameters or {}
+        if strategy.strategy_type == StrategyType.MACRO_TIMING:
+            existing = db.query(MacroTimingSignal.id).filter(
+                MacroTimingSignal.strategy_id == strategy.id,
+                MacroTimingSignal.signal_date == self.run_date
+            ).first()
+            if existing:
+                return {"source_type": "macro_timing", "source_id": existing.id, "reused": True}
+            req = MacroTimingHistoryRequest(
+                **{**(parameters.get("macro_timing") or {}), "end_date": self.as_of, "strategy_id": strategy.id}
+            )
+            db_signal = build_live_signal(db, req, signal_date=self.run_date)
+            db.flush()
+            return {"source_type": "macro_timing", "source_id": db_signal.id}
+
+        req = SectorRotationBatchRequest(
+            **{**(parameters.get("sector_rotation") or {}), "end_date": self.as_of, "strategy_id": strategy.id,
+               "incremental": True, "persist": True}
+        )
+        response = run_rotation_batch(db, req, strategy.id)
+        latest = db.query(SectorRotationSignal.id, SectorRotationSignal.signal_date).filter(
+            SectorRotationSignal.strategy_id == strategy.id,
+            SectorRotationSignal.signal_source == "price_history",
+            SectorRotationSignal.signal_date <= self.as_of
+        ).order_by(SectorRotationSignal.signal_date.desc()).first()
+        if latest is None:
+            raise StepSkipped("行业聚合数据不足，未生成行业轮动信号")
+        return {
+            "source_type": "sector_rotation",
+            "source_id": latest.id,
+            "signal_date": latest.signal_date.isoformat(),
+            "new_signals": len(response.dates),
+        }
+
+    def allocations(self, db: Session, strategy: Strategy) -> Dict[str, Any]:
+        """将当日模型输出展开为策略信号，并为跟随该策略的组合写入目标配置"""
+        upstream = db.query(StrategyRunStep.output).filter(
+            StrategyRunStep.run_date == self.run_date,
+            StrategyRunStep.scope == f"strategy:{strategy.id}",
+            StrategyRunStep.step.in_(["factor_scores", "signals"]),
+            StrategyRunStep.status == "success"
+        ).first()
+        if upstream is None:
+            raise StepSkipped("当日没有可用的模型输出")
+        source_type = upstream.output["source_type"]
+        source = db.get(FANOUT_SOURCES[source_type], upstream.output["source_id"])
+        parameters = strategy.parameters or {}
+
+        market_data_ids = None
+        if source_type == "multi_factor":
+            intents = source.signal_intents(strategy.id, parameters.get("top_n", 50),
+                                            parameters.get("bottom_n", 0), parameters.get("weighting", "equal"))
+        elif source_type == "sector_rotation":
+            constituents, market_data_ids = load_industry_constituents(db, [source], parameters.get("per_industry"))
+            intents = source.signal_intents(strategy.id, constituents)
+        elif parameters.get("instrument_map"):
+            intents = source.signal_intents(strategy.id, parameters["instrument_map"])
+        else:
+            intents = []
+
+        created = 0
+        unknown_symbols: List[str] = []
+        if intents and source.derived_signal_id is None:
+            inserted, unknown_symbols = StrategySignal.fan_out(db, intents, market_data_ids)
+            created = len(inserted)
+            if inserted:
+                source.derived_signal_id = min(signal_id for signal_id, _ in inserted)
+
+        # 有标的映射时按标的配置，否则（宏观择时）按资产类别配置
+        if intents:
+            target_weights: Dict[str, float] = {}
+            for intent in intents:
+                if intent["symbol"] not in unknown_symbols and intent["target_weight"]:
+                    target_weights[intent["symbol"]] = target_weights.get(intent["symbol"], 0.0) + intent["target_weight"]
+        else:
+            target_weights = dict(source.recommended_allocation)
+
+        portfolio_ids = parameters.get("portfolio_ids") or [
+            row.portfolio_id for row in db.query(PortfolioAllocation.portfolio_id).filter(
+                PortfolioAllocation.strategy_id == strategy.id
+            ).distinct().all()
+        ]
+        existing = {
+            allocation.portfolio_id: allocation for allocation in db.query(PortfolioAllocation).filter(
+                PortfolioAllocation.strategy_id == strategy.id,
+                PortfolioAllocation.allocation_date == self.run_date,
+                PortfolioAllocation.is_executed == False
+            ).all()
+        }
+        for portfolio_id in portfolio_ids:
+            allocation = existing.get(portfolio_id)
+            if allocation is None:
+                allocation = PortfolioAllocation(strategy_id=strategy.id, portfolio_id=portfolio_id, allocation_date=self.run_date)
+                db.add(allocation)
+            allocation.target_weights = target_weights
+            allocation.rebalance_reason = f"每日策略运行（{source_type}#{source.id}）"
+        db.flush()
+        return {
+            "source_type": source_type,
+            "source_id": source.id,
+            "signals": created,
+            "unknown_symbols": unknown_symbols,
+            "portfolios": len(portfolio_ids),
+        }
+
+    def optimized_allocations(self, db: Session, strategy: Strategy) -> Dict[str, Any]:
+        """按各组合的风险等级与用户画像约束批量优化，写入当日个性化配置"""
+        req = BatchOptimizationRequest(
+            **{**strategy.parameters["batch_optimization"], "strategy_id": strategy.id, "end_date": self.as_of}
+        )
+        response = run_batch_optimization(db, req, allocation_date=self.run_date)
+        db.flush()
+        return {
+            "portfolios": response.portfolios,
+            "signatures": response.signatures,
+            "allocations": response.allocations_written,
+            "excluded_symbols": response.excluded_symbols,
+        }
+
+    def _current_regime_id(self, db: Session, index_code: Optional[str]) -> Optional[int]:
+        """指数当前识别出的市场状态ID（未配置或未拟合时为None）"""
+        if not index_code:
+            return None
+        state = db.query(RegimeDetectionState).join(
+            MarketIndex, MarketIndex.id == RegimeDetectionState.market_index_id
+        ).filter(MarketIndex.code == index_code).first()
+        return state.regime_ids[state.current_state] if state else None
+
+
+def run_daily_strategies(run_date: Optional[datetime] = None) -> Dict[str, Any]:
+    """定时任务入口：使用默认数据库会话运行全部活跃策略"""
+    from database import SessionLocal
+    return DailyStrategyRunner(SessionLocal, run_date).run()
+
+
+def _run_in_background(runner: DailyStrategyRunner, strategy_ids: Optional[List[int]]) -> None:
+    """后台执行每日运行，异常只记录日志（步骤状态已逐步写入步骤记录）"""
+    try:
+        summary = runner.run(strategy_ids)
+        logger.info("手动触发的每日运行完成: %s %s", summary["run_date"].date(), summary["status_counts"])
+    except Exception:
+        logger.exception("手动触发的每日运行失败: %s", runner.run_date.date())
+
+
+@router.post("/daily_runs", response_model=DailyRunAcceptedResponse, status_code=http_status.HTTP_202_ACCEPTED)
+def trigger_daily_run(
+    req: DailyRunRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    手动触发每日策略运行（需管理员权限，后台执行）
+
+    立即返回运行日期，进度与结果通过 GET /daily_runs 查询步骤记录；
+    同一运行日期可重复触发：已完成的步骤跳过，失败或未执行的步骤继续执行
+    """
+    runner = DailyStrategyRunner(
+        sessionmaker(autocommit=False, autoflush=False, bind=db.get_bind()),
+        req.run_date,
+        req.max_workers
+    )
+    background_tasks.add_task(_run_in_background, runner, req.strategy_ids)
+    return DailyRunAcceptedResponse(run_date=runner.run_date, strategy_ids=req.strategy_ids)
+
+
+@router.get("/daily_runs", response_model=List[StrategyRunStepResponse])
+def get_daily_run_steps(
+    run_date: Optional[datetime] = Query(None, description="运行日期，缺省为最近一次运行"),
+    strategy_id: Optional[int] = Query(None, description="策略ID"),
+    status: Optional[str] = Query(None, description="步骤状态"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """查询每日运行的步骤记录及耗时"""
+    if run_date is None:
+        run_date = db.query(func.max(StrategyRunStep.run_date)).scalar()
+        if run_date is None:
+            return []
+    run_date = datetime.combine(run_date.date(), time.min)
+
+    query = db.query(StrategyRunStep).filter(StrategyRunStep.run_date == run_date)
+    if strategy_id:
+        query = query.filter(StrategyRunStep.strategy_id == strategy_id)
+    if status:
+        query = query.filter(StrategyRunStep.status == status)
+    return query.order_by(StrategyRunStep.id).all()
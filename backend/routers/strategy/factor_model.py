@@ -4,20 +4,29 @@
 """
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 from typing import List, Optional
+from datetime import datetime
+import numpy as np
 
 from database import get_db
 from utils.auth import get_current_user
 from models.user import User
 from models.strategy import (
-    FactorModel
+    FactorModel, RiskModelVersion
 )
+from models.ai_models import FactorRiskModel
 from schemas.strategy import (
-    FactorModelCreate, FactorModelUpdate, FactorModelResponse
+    FactorModelCreate, FactorModelUpdate, FactorModelResponse,
+    RiskModelBuildRequest, RiskModelSummary, RiskModelResponse
 )
 
 router = APIRouter(prefix="", tags=["因子模型管理"])
 
+# 并发估计同一因子模型时，版本号冲突的重试次数
+VERSION_RETRIES = 3
+
 
 @router.post("/factors", response_model=FactorModelResponse, status_code=status.HTTP_201_CREATED)
 def create_factor_model(
@@ -97,4 +106,135 @@ def delete_factor_model(
         raise HTTPException(status_code=404, detail="因子模型不存在")
     
     db.delete(db_factor_model)
-    db.commit() 
\ No newline at end of file
+    db.commit() 
+
+def _get_factor_model_or_404(db: Session, factor_model_id: int) -> FactorModel:
+    """获取因子模型，不存在时返回404"""
+    factor_model = db.query(FactorModel).filter(FactorModel.id == factor_model_id).first()
+    if not factor_model:
+        raise HTTPException(status_code=404, detail="因子模型不存在")
+    return factor_model
+
+
+def _next_version(db: Session, factor_model_id: int) -> int:
+    """因子模型的下一个风险模型版本号"""
+    latest_version = db.query(func.max(RiskModelVersion.version)).filter(
+        RiskModelVersion.factor_model_id == factor_model_id
+    ).scalar()
+    return (latest_version or 0) + 1
+
+
+@router.post("/factors/{factor_model_id}/risk_models", response_model=RiskModelResponse, status_code=status.HTTP_201_CREATED)
+def build_risk_model(
+    factor_model_id: int,
+    req: RiskModelBuildRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """估计因子风险模型并保存为新版本（日期无序时按日期排序，EWMA权重以最近日期为最大）"""
+    factor_model = _get_factor_model_or_404(db, factor_model_id)
+    factors = list(factor_model.factors or [])
+    
+    n_dates, n_symbols, n_factors = len(req.dates), len(req.symbols), len(factors)
+    # 逐层校验长度，参差不齐的嵌套列表无法构成矩阵
+    if len(req.exposures) != n_dates or any(
+        len(day) != n_symbols or any(len(row) != n_factors for row in day) for day in req.exposures
+    ):
+        raise HTTPException(status_code=400, detail=f"因子暴露维度应为{(n_dates, n_symbols, n_factors)}")
+    if len(req.returns) != n_dates or any(len(row) != n_symbols for row in req.returns):
+        raise HTTPException(status_code=400, detail=f"收益矩阵维度应为{(n_dates, n_symbols)}")
+    if req.regression_weights is not None and len(req.regression_weights) != n_symbols:
+        raise HTTPException(status_code=400, detail="回归权重数量与证券数量不一致")
+    if len(set(req.dates)) != n_dates:
+        raise HTTPException(status_code=400, detail="估计窗口内的日期不可重复")
+    
+    order = sorted(range(n_dates), key=req.dates.__getitem__)
+    exposures = np.asarray(req.exposures, dtype=float).reshape(n_dates, n_symbols, n_factors)[order]
+    returns = np.asarray(
+        [[np.nan if r is None else r for r in row] for row in req.returns], dtype=float
+    ).reshape(n_dates, n_symbols)[order]
+    
+    # 请求参数优先，其次取因子模型参数，最后使用默认值
+    model_parameters = factor_model.model_parameters or {}
+    parameters = {
+        "half_life": req.half_life or model_parameters.get("half_life", 90),
+        "newey_west_lags": req.newey_west_lags if req.newey_west_lags is not None else model_parameters.get("newey_west_lags", 2),
+        "specific_half_life": req.specific_half_life or model_parameters.get("specific_half_life"),
+    }
+    risk_model = FactorRiskModel(**parameters)
+    parameters["specific_half_life"] = risk_model.specific_half_life
+    
+    result = risk_model.build(exposures, returns, req.regression_weights)
+    specific_variance = [None if np.isnan(v) else float(v) for v in result["specific_variance"]]
+    
+    # 并发估计可能取到相同的最大版本号，唯一约束冲突时回滚并按新的最大版本号重试
+    for _ in range(VERSION_RETRIES):
+        db_risk_model = RiskModelVersion(
+            factor_model_id=factor_model_id,
+            version=_next_version(db, factor_model_id),
+            factors=factors,
+            symbols=req.symbols,
+            start_date=min(req.dates),
+            end_date=max(req.dates),
+            factor_returns=result["factor_returns"].tolist(),
+            factor_covariance=result["factor_covariance"].tolist(),
+            specific_variance=specific_variance,
+            parameters=parameters,
+            model_version=risk_model.model_name
+        )
+        factor_model.last_updated = datetime.utcnow()
+        db.add(db_risk_model)
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            continue
+        db.refresh(db_risk_model)
+        return db_risk_model
+    raise HTTPException(status_code=409, detail="风险模型版本号冲突，请稍后重试")
+
+
+@router.get("/factors/{factor_model_id}/risk_models", response_model=List[RiskModelSummary])
+def get_risk_models(
+    factor_model_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """获取因子模型的风险模型版本列表（不含矩阵数据）"""
+    _get_factor_model_or_404(db, factor_model_id)
+    versions = db.query(RiskModelVersion).filter(
+        RiskModelVersion.factor_model_id == factor_model_id
+    ).order_by(RiskModelVersion.version.desc()).all()
+    return versions
+
+
+@router.get("/factors/{factor_model_id}/risk_models/latest", response_model=RiskModelResponse)
+def get_latest_risk_model(
+    factor_model_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """获取最新版本的风险模型"""
+    risk_model = db.query(RiskModelVersion).filter(
+        RiskModelVersion.factor_model_id == factor_model_id
+    ).order_by(RiskModelVersion.version.desc()).first()
+    if not risk_model:
+        raise HTTPException(status_code=404, detail="风险模型不存在")
+    return risk_model
+
+
+@router.get("/factors/{factor_model_id}/risk_models/{version}", response_model=RiskModelResponse)
+def get_risk_model(
+    factor_model_id: int,
+    version: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """获取指定版本的风险模型"""
+    risk_model = db.query(RiskModelVersion).filter(
+        RiskModelVersion.factor_model_id == factor_model_id,
+        RiskModelVersion.version == version
+    ).first()
+    if not risk_model:
+        raise HTTPException(status_code=404, detail="风险模型不存在")
+    return risk_model
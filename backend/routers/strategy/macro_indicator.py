@@ -0,0 +1,83 @@
+"""
+宏观指标数据模块
+提供宏观指标时间序列（利率、通胀、PMI等）的批量写入和查询功能
+"""
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from datetime import datetime
+
+from database import get_db
+from utils.auth import get_current_user
+from models.user import User
+from models.strategy import MacroIndicatorValue
+from schemas.strategy import (
+    MacroIndicatorBulkRequest, MacroIndicatorBulkResponse, MacroIndicatorValueResponse
+)
+
+router = APIRouter(prefix="", tags=["宏观指标数据"])
+
+
+@router.post("/macro_indicators", response_model=MacroIndicatorBulkResponse)
+def upsert_macro_indicators(
+    req: MacroIndicatorBulkRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """批量写入宏观指标，指标代码+日期已存在时覆盖数值"""
+    # 同一批次内重复的观测以最后一条为准
+    points = {(p.indicator_code, p.observation_date): p.value for p in req.points}
+    codes = {code for code, _ in points}
+    dates = [date for _, date in points]
+    
+    # 一次查询取出本批次日期范围内的已有记录
+    existing = {
+        (row.indicator_code, row.observation_date): row
+        for row in db.query(MacroIndicatorValue).filter(
+            MacroIndicatorValue.indicator_code.in_(codes),
+            MacroIndicatorValue.observation_date >= min(dates),
+            MacroIndicatorValue.observation_date <= max(dates)
+        )
+    }
+    
+    new_rows = []
+    updated = 0
+    for (code, date), value in points.items():
+        row = existing.get((code, date))
+        if row is None:
+            new_rows.append(MacroIndicatorValue(
+                indicator_code=code, observation_date=date, value=value, source=req.source
+            ))
+        elif row.value != value or (req.source and row.source != req.source):
+            row.value = value
+            row.source = req.source or row.source
+            updated += 1
+    
+    db.add_all(new_rows)
+    db.commit()
+    return MacroIndicatorBulkResponse(inserted=len(new_rows), updated=updated)
+
+
+@router.get("/macro_indicators", response_model=List[MacroIndicatorValueResponse])
+def get_macro_indicators(
+    indicator_code: Optional[str] = Query(None, description="指标代码"),
+    start_date: Optional[datetime] = Query(None, description="开始日期"),
+    end_date: Optional[datetime] = Query(None, description="结束日期"),
+    limit: int = Query(1000, ge=1, le=10000, description="限制数量"),
+    offset: int = Query(0, ge=0, description="偏移量"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """查询宏观指标时间序列"""
+    query = db.query(MacroIndicatorValue)
+    
+    if indicator_code:
+        query = query.filter(MacroIndicatorValue.indicator_code == indicator_code)
+    if start_date:
+        query = query.filter(MacroIndicatorValue.observation_date >= start_date)
+    if end_date:
+        query = query.filter(MacroIndicatorValue.observation_date <= end_date)
+    
+    return query.order_by(
+        MacroIndicatorValue.indicator_code, MacroIndicatorValue.observation_date
+    ).offset(offset).limit(limit).all()
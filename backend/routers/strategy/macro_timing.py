@@ -3,19 +3,28 @@
 提供宏观择时信号生成和历史查询功能
 """
 from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from typing import List, Optional
+from collections import OrderedDict
 from datetime import datetime
+import threading
+import numpy as np
+import pandas as pd
 
 from database import get_db
 from utils.auth import get_current_user
+from utils.cache import TTLCache, canonical_hash
 from models.user import User
+from models.model_config import ModelConfig
 from models.strategy import (
-    Strategy, MacroTimingSignal
+    Strategy, MacroTimingSignal, MacroIndicatorValue
 )
 from models.ai_models import MacroTimingModel
 from schemas.strategy import (
-    MacroTimingRequest, MacroTimingResponse
+    MacroTimingRequest, MacroTimingResponse,
+    MacroTimingHistoryRequest, MacroTimingHistoryResponse
 )
 
 router = APIRouter(prefix="", tags=["宏观择时模型"])
@@ -23,6 +32,69 @@ router = APIRouter(prefix="", tags=["宏观择时模型"])
 # 初始化AI模型
 macro_timing_model = MacroTimingModel()
 
+# 宏观择时信号缓存：输入空间很小（周期×情绪×少量因子），前端请求高度重复
+SIGNAL_CACHE_TTL = 300
+_signal_cache = TTLCache(max_entries=256, ttl=SIGNAL_CACHE_TTL)
+# 已持久化信号的去重键 -> 信号日期，避免每次请求都查询数据库
+_persisted_signals = TTLCache(max_entries=1024, ttl=SIGNAL_CACHE_TTL)
+
+# 模型使用的数值指标
+MODEL_INDICATORS = ["pmi", "inflation", "interest_rate", "sentiment", "exchange_rate", "geopolitical_risk"]
+
+# 由指标库计算的历史配置表缓存，键包含指标库版本，指标更新后自动失效
+ALLOCATION_TABLE_CACHE_SIZE = 8
+_allocation_tables: "OrderedDict[tuple, dict]" = OrderedDict()
+_allocation_tables_lock = threading.Lock()
+
+
+def _load_allocation_table(db: Session, req: MacroTimingHistoryRequest) -> dict:
+    """读取指标库并计算（或从缓存取得）全部日期的资产配置表"""
+    indicator_map = {name: name for name in MODEL_INDICATORS}
+    indicator_map.update({k: v for k, v in (req.indicator_map or {}).items() if k in indicator_map})
+    codes = set(indicator_map.values())
+    
+    # 指标库版本：记录数、最近更新时间与最新观测日期
+    version = tuple(db.query(
+        func.count(MacroIndicatorValue.id),
+        func.max(MacroIndicatorValue.updated_at),
+        func.max(MacroIndicatorValue.observation_date)
+    ).filter(MacroIndicatorValue.indicator_code.in_(codes)).one())
+    key = (version, tuple(sorted(indicator_map.items())), req.lookback, req.inflation_threshold, macro_timing_model.model_name)
+    with _allocation_tables_lock:
+        if key in _allocation_tables:
+            _allocation_tables.move_to_end(key)
+            return _allocation_tables[key]
+    
+    rows = db.query(
+        MacroIndicatorValue.indicator_code, MacroIndicatorValue.observation_date, MacroIndicatorValue.value
+    ).filter(MacroIndicatorValue.indicator_code.in_(codes)).all()
+    if not rows:
+        raise HTTPException(status_code=404, detail="指标库中没有可用的宏观指标数据")
+    
+    series = pd.DataFrame(rows, columns=["indicator_code", "observation_date", "value"]).pivot(
+        index="observation_date", columns="indicator_code", values="value"
+    )
+    frame = pd.DataFrame(
+        {name: series[code] for name, code in indicator_map.items() if code in series.columns},
+        index=series.index
+    )
+    table = macro_timing_model.compute_allocation_table(frame, req.lookback, req.inflation_threshold)
+    
+    with _allocation_tables_lock:
+        _allocation_tables[key] = table
+        if len(_allocation_tables) > ALLOCATION_TABLE_CACHE_SIZE:
+            _allocation_tables.popitem(last=False)
+    return table
+
+
+def _sentiment_label(score: float) -> str:
+    """数值情绪映射为情绪标签"""
+    if score >= 0.65:
+        return "乐观"
+    if score <= 0.35:
+        return "悲观"
+    return "中性"
+
 
 @router.post("/macro_timing_signal", response_model=MacroTimingResponse)
 def macro_timing_signal(
@@ -30,23 +102,86 @@ def macro_timing_signal(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """生成宏观择时信号"""
+    """生成宏观择时信号（相同输入命中缓存，且每天只保存一条）"""
     print("[DEBUG] 宏观择时API收到请求:", req)
     
-    # 使用真实AI模型生成配置建议
-    allocation, reasoning, confidence = macro_timing_model.generate_asset_allocation(
-        economic_cycle=req.economic_cycle,
-        market_sentiment=req.market_sentiment,
-        additional_factors=req.additional_factors
-    )
+    # 缓存键包含请求参数、模型版本以及当前激活的模型配置
+    input_hash = canonical_hash({
+        "economic_cycle": req.economic_cycle,
+        "market_sentiment": req.market_sentiment,
+        "additional_factors": req.additional_factors or {},
+        "model_version": macro_timing_model.model_name,
+        "model_config": _active_config_fingerprint(db)
+    })
+    
+    cached = _signal_cache.get(input_hash)
+    if cached is None:
+        # 使用真实AI模型生成配置建议
+        cached = macro_timing_model.generate_asset_allocation(
+            economic_cycle=req.economic_cycle,
+            market_sentiment=req.market_sentiment,
+            additional_factors=req.additional_factors
+        )
+        _signal_cache.set(input_hash, cached)
+    allocation, reasoning, confidence = dict(cached[0]), cached[1], cached[2]
     
     print("[DEBUG] 宏观择时API响应:", allocation, reasoning, confidence)
     
+    # 如果请求中包含策略ID，则关联到该策略
+    strategy_id = None
+    if hasattr(req, 'strategy_id') and req.strategy_id:
+        strategy = db.query(Strategy).filter(Strategy.id == req.strategy_id).first()
+        if strategy:
+            strategy_id = strategy.id
+    
     # 创建信号日期
     signal_date = datetime.utcnow()
+    dedup_key = canonical_hash([input_hash, strategy_id, signal_date.date().isoformat()])
+    
+    # 同一输入、同一策略每天只保存一条，重复请求返回已保存信号的日期
+    persisted_date = _persisted_signals.get(dedup_key)
+    if persisted_date is None:
+        persisted_date = _save_signal(db, req, strategy_id, input_hash, dedup_key,
+                                      allocation, reasoning, confidence, signal_date)
+        _persisted_signals.set(dedup_key, persisted_date)
+    
+    return MacroTimingResponse(
+        recommended_allocation=allocation,
+        reasoning=reasoning,
+        signal_date=persisted_date
+    )
+
+
+def _active_config_fingerprint(db: Session) -> Optional[str]:
+    """当前激活的宏观择时模型配置指纹，无激活配置时为None"""
+    config = db.query(
+        ModelConfig.id, ModelConfig.model_version, ModelConfig.parameters, ModelConfig.updated_at
+    ).filter(
+        ModelConfig.model_name == "macro_timing",
+        ModelConfig.is_active == True
+    ).order_by(ModelConfig.updated_at.desc()).first()
+    if config is None:
+        return None
+    return canonical_hash([config.id, config.model_version, config.parameters, config.updated_at])
+
+
+def _save_signal(db: Session,
+                 req: MacroTimingRequest,
+                 strategy_id: Optional[int],
+                 input_hash: str,
+                 dedup_key: str,
+                 allocation: dict,
+                 reasoning: str,
+                 confidence: float,
+                 signal_date: datetime) -> datetime:
+    """保存信号，当天已有相同输入的记录时不重复写入，返回已保存信号的日期"""
+    existing = db.query(MacroTimingSignal.signal_date).filter(MacroTimingSignal.dedup_key == dedup_key).first()
+    if existing:
+        return existing.signal_date
     
     # 持久化存储到数据库
     db_signal = MacroTimingSignal(
+        strategy_id=strategy_id,
         economic_cycle=req.economic_cycle,
         market_sentiment=req.market_sentiment,
         additional_factors=req.additional_factors,
@@ -54,23 +189,94 @@ def macro_timing_signal(
         reasoning=reasoning,
         confidence_score=confidence,
         model_version=macro_timing_model.model_name,
-        signal_date=signal_date
+        signal_date=signal_date,
+        input_hash=input_hash,
+        dedup_key=dedup_key
     )
+    db.add(db_signal)
+    try:
+        db.commit()
+    except IntegrityError:
+        # 并发请求已写入同一条记录
+        db.rollback()
+        existing = db.query(MacroTimingSignal.signal_date).filter(MacroTimingSignal.dedup_key == dedup_key).one()
+        return existing.signal_date
+    return signal_date
+
+
+@router.post("/macro_timing_signal/history", response_model=MacroTimingHistoryResponse)
+def macro_timing_history(
+    req: MacroTimingHistoryRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """基于指标库一次性计算全部历史日期的资产配置，用于宏观择时回测"""
+    table = _load_allocation_table(db, req)
+    dates = pd.DatetimeIndex(table["dates"])
+    mask = np.ones(len(dates), dtype=bool)
+    if req.start_date:
+        mask &= dates >= pd.Timestamp(req.start_date)
+    if req.end_date:
+        mask &= dates <= pd.Timestamp(req.end_date)
     
-    # 如果请求中包含策略ID，则关联到该策略
-    if hasattr(req, 'strategy_id') and req.strategy_id:
+    return MacroTimingHistoryResponse(
+        dates=list(dates[mask].to_pydatetime()),
+        asset_classes=table["asset_classes"],
+        economic_cycles=list(table["economic_cycles"][mask]),
+        composite_scores=table["composite_scores"][mask].tolist(),
+        allocations=table["allocations"][mask].tolist(),
+        confidence=table["confidence"][mask].tolist()
+    )
+
+
+def build_live_signal(db: Session, req: MacroTimingHistoryRequest, signal_date: Optional[datetime] = None) -> MacroTimingSignal:
+    """取历史配置表的最新一行构建宏观择时信号（已加入会话，未提交）"""
+    table = _load_allocation_table(db, req)
+    row = len(table["dates"]) - 1
+    if req.end_date:
+        row = int(np.searchsorted(pd.DatetimeIndex(table["dates"]), pd.Timestamp(req.end_date), side="right")) - 1
+        if row < 0:
+            raise HTTPException(status_code=404, detail="指定日期之前没有宏观指标数据")
+    
+    allocation = dict(zip(table["asset_classes"], table["allocations"][row].tolist()))
+    indicators = table["indicators"].iloc[row]
+    
+    db_signal = MacroTimingSignal(
+        economic_cycle=table["economic_cycles"][row] or "未知",
+        market_sentiment=_sentiment_label(table["sentiment_scores"][row]),
+        additional_factors={
+            **{name: float(value) for name, value in indicators.items() if pd.notna(value)},
+            "indicator_date": pd.Timestamp(table["dates"][row]).isoformat()
+        },
+        recommended_allocation=allocation,
+        reasoning=macro_timing_model.describe_allocation(table, row),
+        confidence_score=float(table["confidence"][row]),
+        model_version=macro_timing_model.model_name,
+        signal_date=signal_date or datetime.utcnow()
+    )
+    if req.strategy_id:
         strategy = db.query(Strategy).filter(Strategy.id == req.strategy_id).first()
         if strategy:
             db_signal.strategy_id = strategy.id
     
     db.add(db_signal)
+    return db_signal
+
+
+@router.post("/macro_timing_signal/live", response_model=MacroTimingResponse)
+def macro_timing_live_signal(
+    req: MacroTimingHistoryRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """取历史配置表的最新一行作为实时宏观择时信号并保存"""
+    db_signal = build_live_signal(db, req)
     db.commit()
-    db.refresh(db_signal)
     
     return MacroTimingResponse(
-        recommended_allocation=allocation,
-        reasoning=reasoning,
-        signal_date=signal_date
+        recommended_allocation=db_signal.recommended_allocation,
+        reasoning=db_signal.reasoning,
+        signal_date=db_signal.signal_date
     )
 
 
@@ -5,20 +5,260 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
 from typing import List, Optional
+from datetime import datetime
+import numpy as np
 
 from database import get_db
 from utils.auth import get_current_user
 from models.user import User
 from models.strategy import (
-    MarketRegime
+    MarketRegime, RegimeDetectionState
 )
+from models.market_data import MarketIndex, IndexHistory
+from models.ai_models import MarketRegimeHMM
 from schemas.strategy import (
-    MarketRegimeCreate, MarketRegimeUpdate, MarketRegimeResponse
+    MarketRegimeCreate, MarketRegimeUpdate, MarketRegimeResponse,
+    RegimeDetectionRequest, RegimeDetectionResponse, RegimePathPoint
 )
 
 router = APIRouter(prefix="", tags=["市场状态管理"])
 
 
+def _get_index(db: Session, index_code: str) -> MarketIndex:
+    market_index = db.query(MarketIndex).filter(MarketIndex.code == index_code).first()
+    if not market_index:
+        raise HTTPException(status_code=404, detail="指数不存在")
+    return market_index
+
+
+def _load_index_closes(db: Session, market_index_id: int,
+                       start_date: Optional[datetime] = None,
+                       end_date: Optional[datetime] = None,
+                       after: Optional[datetime] = None):
+    """按日期升序读取指数收盘点位，返回 (日期列表, 收盘数组)"""
+    query = db.query(IndexHistory.date, IndexHistory.close_value).filter(
+        IndexHistory.market_index_id == market_index_id,
+        IndexHistory.close_value.isnot(None)
+    )
+    if start_date:
+        query = query.filter(IndexHistory.date >= start_date)
+    if end_date:
+        query = query.filter(IndexHistory.date <= end_date)
+    if after:
+        query = query.filter(IndexHistory.date > after)
+    rows = query.order_by(IndexHistory.date).all()
+    return [row.date for row in rows], np.array([row.close_value for row in rows], dtype=float)
+
+
+def _apply_path(regimes: List[MarketRegime], dates: List[datetime], path: List[int],
+                previous_state: Optional[int] = None, previous_date: Optional[datetime] = None):
+    """按状态路径更新各状态最近一段的起止日期，当前状态的结束日期为空"""
+    for date, state in zip(dates, path):
+        if state != previous_state:
+            if previous_state is not None:
+                regimes[previous_state].end_date = previous_date
+            regimes[state].start_date = date
+            regimes[state].end_date = None
+        previous_state, previous_date = state, date
+
+
+def _update_probabilities(regimes: List[MarketRegime], alpha: np.ndarray, as_of: datetime):
+    for k, regime in enumerate(regimes):
+        # JSON列需整体赋值才能被识别为已修改
+        regime.regime_indicators = {
+            **(regime.regime_indicators or {}),
+            "probability": float(alpha[k]),
+            "as_of": as_of.isoformat(),
+        }
+
+
+def _detection_response(index_code: str, state: RegimeDetectionState, regimes: List[MarketRegime],
+                        dates: List[datetime], filtered: np.ndarray, include_path: bool,
+                        iterations: Optional[int] = None, converged: Optional[bool] = None) -> RegimeDetectionResponse:
+    names = [regime.regime_name for regime in regimes]
+    transmat = state.parameters["transmat"]
+    path = []
+    if include_path:
+        path = [RegimePathPoint(
+            date=date,
+            regime_name=names[int(np.argmax(probs))],
+            probabilities=dict(zip(names, probs.tolist()))
+        ) for date, probs in zip(dates, filtered)]
+    return RegimeDetectionResponse(
+        index_code=index_code,
+        n_states=state.n_states,
+        log_likelihood=state.log_likelihood,
+        iterations=iterations,
+        converged=converged,
+        new_days=len(dates),
+        last_date=state.last_date,
+        current_regime=names[state.current_state],
+        current_probabilities=dict(zip(names, state.filtered_probabilities)),
+        transition_matrix={names[i]: dict(zip(names, row)) for i, row in enumerate(transmat)},
+        regimes=regimes,
+        path=path
+    )
+
+
+@router.post("/regimes/detect", response_model=RegimeDetectionResponse)
+def detect_market_regimes(
+    req: RegimeDetectionRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    基于指数历史拟合高斯隐马尔可夫模型识别市场状态
+    
+    每个隐状态写入（或更新）一条市场状态，regime_indicators 记录识别方法与状态统计，
+    transition_probabilities 为拟合的转移矩阵行（按目标状态ID）；同时保存模型参数供逐日增量滤波
+    """
+    market_index = _get_index(db, req.index_code)
+    dates, closes = _load_index_closes(db, market_index.id, req.start_date, req.end_date)
+    model = MarketRegimeHMM(n_states=req.n_states, vol_window=req.vol_window, n_iter=req.max_iter)
+    X = model.features(closes)
+    try:
+        result = model.fit(X)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    obs_dates = dates[req.vol_window:]
+    
+    labels = model.state_labels(result["means"])
+    transmat = result["transmat"]
+    path = result["filtered"].argmax(axis=1)
+    occupancy = np.bincount(path, minlength=req.n_states) / len(path)
+    
+    # 重新拟合时复用该指数上次写入的市场状态
+    state = db.query(RegimeDetectionState).filter(RegimeDetectionState.market_index_id == market_index.id).first()
+    existing = {}
+    if state is not None:
+        existing = {
+            regime.regime_name: regime
+            for regime in db.query(MarketRegime).filter(MarketRegime.id.in_(state.regime_ids)).all()
+        }
+    regimes = []
+    for k, label in enumerate(labels):
+        regime = existing.pop(label["regime_name"], None)
+        if regime is None:
+            regime = MarketRegime(regime_name=label["regime_name"])
+            db.add(regime)
+        regime.description = f"{market_index.name}隐马尔可夫模型识别的第{k + 1}个状态"
+        regime.market_sentiment = label["market_sentiment"]
+        regime.volatility_regime = label["volatility_regime"]
+        regime.regime_indicators = {
+            "method": "gaussian_hmm",
+            "index_code": req.index_code,
+            "state_index": k,
+            "mean_return": float(result["means"][k, 0] * MarketRegimeHMM.TRADING_DAYS),
+            "volatility": float(result["means"][k, 1] * np.sqrt(MarketRegimeHMM.TRADING_DAYS)),
+            "expected_duration": float(1.0 / max(1.0 - transmat[k, k], 1e-12)),
+            "occupancy": float(occupancy[k]),
+        }
+        regime.start_date = None
+        regime.end_date = None
+        regimes.append(regime)
+    # 状态数减少时移除多余的旧状态
+    for regime in existing.values():
+        db.delete(regime)
+    # 状态名称在不同指数间会重复，转移概率按状态ID记录
+    db.flush()
+    for k, regime in enumerate(regimes):
+        regime.transition_probabilities = {
+            str(regimes[j].id): float(transmat[k, j]) for j in range(req.n_states)
+        }
+    
+    _apply_path(regimes, obs_dates, path.tolist())
+    alpha = result["filtered"][-1]
+    _update_probabilities(regimes, alpha, obs_dates[-1])
+    db.flush()
+    
+    if state is None:
+        state = RegimeDetectionState(market_index_id=market_index.id)
+        db.add(state)
+    returns = np.diff(np.log(closes))
+    state.n_states = req.n_states
+    state.vol_window = req.vol_window
+    state.parameters = {key: result[key].tolist() for key in ("startprob", "transmat", "means", "variances")}
+    state.regime_ids = [regime.id for regime in regimes]
+    state.log_likelihood = result["log_likelihood"]
+    state.filtered_probabilities = alpha.tolist()
+    state.recent_returns = returns[-req.vol_window:].tolist()
+    state.last_close = float(closes[-1])
+    state.last_date = dates[-1]
+    state.current_state = int(path[-1])
+    state.fitted_at = datetime.utcnow()
+    db.commit()
+    for regime in regimes:
+        db.refresh(regime)
+    
+    return _detection_response(req.index_code, state, regimes, obs_dates, result["filtered"],
+                               req.include_path, result["iterations"], result["converged"])
+
+
+@router.post("/regimes/detect/{index_code}/update", response_model=RegimeDetectionResponse)
+def update_market_regimes(
+    index_code: str,
+    include_path: bool = Query(False, description="是否返回新增交易日的状态路径"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    对上次处理之后的新交易日做前向滤波（不重新拟合参数）
+    
+    每新增一个交易日只需一次 K×K 运算，更新当前状态概率及状态起止日期
+    """
+    market_index = _get_index(db, index_code)
+    state = db.query(RegimeDetectionState).filter(RegimeDetectionState.market_index_id == market_index.id).first()
+    if not state:
+        raise HTTPException(status_code=404, detail="该指数尚未拟合市场状态模型")
+    regimes, dates, filtered = advance_regime_state(db, state)
+    db.commit()
+    for regime in regimes:
+        db.refresh(regime)
+    
+    return _detection_response(index_code, state, regimes, dates, filtered, include_path)
+
+
+def advance_regime_state(db: Session, state: RegimeDetectionState):
+    """
+    对上次处理之后的新交易日逐日前向滤波并更新状态（不提交）
+    
+    Returns:
+        (按隐状态排列的市场状态, 新交易日列表, 各日滤波概率)
+    """
+    regimes_by_id = {
+        regime.id: regime for regime in db.query(MarketRegime).filter(MarketRegime.id.in_(state.regime_ids)).all()
+    }
+    if len(regimes_by_id) != len(state.regime_ids):
+        raise HTTPException(status_code=409, detail="模型对应的市场状态已被删除，请重新拟合")
+    regimes = [regimes_by_id[regime_id] for regime_id in state.regime_ids]
+    
+    dates, closes = _load_index_closes(db, state.market_index_id, after=state.last_date)
+    if not dates:
+        return regimes, [], np.empty((0, state.n_states))
+    
+    model = MarketRegimeHMM(n_states=state.n_states, vol_window=state.vol_window)
+    params = {key: np.array(value) for key, value in state.parameters.items()}
+    alpha = np.array(state.filtered_probabilities)
+    recent = list(state.recent_returns)
+    last_close = state.last_close
+    filtered = np.empty((len(dates), state.n_states))
+    for i, close in enumerate(closes):
+        recent = (recent + [float(np.log(close / last_close))])[-state.vol_window:]
+        last_close = close
+        alpha = model.filter_step(alpha, model.observation(recent), params["transmat"], params["means"], params["variances"])
+        filtered[i] = alpha
+    
+    path = filtered.argmax(axis=1)
+    _apply_path(regimes, dates, path.tolist(), state.current_state, state.last_date)
+    _update_probabilities(regimes, alpha, dates[-1])
+    state.filtered_probabilities = alpha.tolist()
+    state.recent_returns = recent
+    state.last_close = float(last_close)
+    state.last_date = dates[-1]
+    state.current_state = int(path[-1])
+    return regimes, dates, filtered
+
+
 @router.post("/regimes", response_model=MarketRegimeResponse, status_code=status.HTTP_201_CREATED)
 def create_market_regime(
     regime: MarketRegimeCreate,
@@ -3,36 +3,98 @@
 提供多因子信号生成和历史查询功能
 """
 from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
+import json
+import numpy as np
 
 from database import get_db
 from utils.auth import get_current_user
 from models.user import User
 from models.strategy import (
-    Strategy, MultiFactorScore
+    Strategy, MultiFactorScore, MultiFactorInput, MarketRegime
 )
-from models.ai_models import MultiFactorModel
+from models.ai_models import MultiFactorModel, RegimeWeightTable
 from schemas.strategy import (
-    MultiFactorRequest, MultiFactorResponse, StockScore
+    MultiFactorRequest, MultiFactorResponse, StockScore, RankingSummary,
+    MultiFactorScoreSummary, MultiFactorBatchRequest, MultiFactorBatchResponse,
+    RegimeWeightTableResponse, RegimeWeightEntry
 )
 
 router = APIRouter(prefix="", tags=["多因子模型"])
 
 # 初始化AI模型
 multi_factor_model = MultiFactorModel()
+regime_weight_table = RegimeWeightTable(multi_factor_model)
 
+# 评分记录摘要中保留的前几名股票数量
+TOP_SYMBOLS_COUNT = 10
 
-@router.post("/multi_factor_signal", response_model=MultiFactorResponse)
-def multi_factor_signal(
-    req: MultiFactorRequest,
+
+def _load_regimes(db: Session) -> List[dict]:
+    """读取权重表所需的市场状态字段"""
+    rows = db.query(
+        MarketRegime.id, MarketRegime.regime_name,
+        MarketRegime.regime_indicators, MarketRegime.transition_probabilities
+    ).order_by(MarketRegime.id).all()
+    return [{
+        "id": row.id,
+        "regime_name": row.regime_name,
+        "regime_indicators": row.regime_indicators,
+        "transition_probabilities": row.transition_probabilities
+    } for row in rows]
+
+
+def _default_weights(factor_weights: Optional[dict]) -> dict:
+    """请求未提供权重时使用默认等权"""
+    return factor_weights or {
+        factor: 1.0/len(multi_factor_model.default_factors) for factor in multi_factor_model.default_factors
+    }
+
+
+def _resolve_regime_vector(db: Session, req: MultiFactorRequest):
+    """请求指定market_regime_id时，返回 (状态名称, (因子顺序, 缓存的权重向量))"""
+    if req.market_regime_id is None:
+        return req.market_regime, None
+    regimes = _load_regimes(db)
+    regime = next((r for r in regimes if r["id"] == req.market_regime_id), None)
+    if regime is None:
+        raise HTTPException(status_code=404, detail="市场状态不存在")
+    vector = regime_weight_table.get_weight_vector(regimes, regime["id"], _default_weights(req.factor_weights))
+    return regime["regime_name"], vector
+
+
+@router.get("/multi_factor_regime_weights", response_model=RegimeWeightTableResponse)
+def get_regime_weight_table(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """生成多因子信号"""
-    print("[DEBUG] 多因子模型API收到请求:", req)
+    """查看各已存储市场状态的条件因子权重表（默认等权为基础权重）"""
+    table = regime_weight_table.get_table(_load_regimes(db), _default_weights(None))
+    factors = table["factors"]
+    entries = []
+    for i, regime_id in enumerate(table["regime_ids"]):
+        entries.append(RegimeWeightEntry(
+            regime_id=regime_id,
+            regime_name=table["regime_names"][i],
+            own_weights=dict(zip(factors, table["own_weights"][i].tolist())),
+            blended_weights=dict(zip(factors, table["blended_weights"][i].tolist())),
+            transition={
+                state: float(p) for state, p in zip(table["states"], table["transition_matrix"][i]) if p > 0
+            }
+        ))
+    return RegimeWeightTableResponse(factors=factors, regimes=entries)
+
+
+def generate_multi_factor_score(db: Session, req: MultiFactorRequest, signal_date: Optional[datetime] = None):
+    """
+    评分并构建待保存的多因子评分记录（已加入会话，未提交）
     
+    Returns:
+        (评分记录, 逐股评分, 评分摘要)
+    """
     # 准备股票数据
     stocks_data = [{
         "symbol": stock.symbol,
@@ -40,43 +102,41 @@ def multi_factor_signal(
         "factor_values": stock.factor_values
     } for stock in req.stocks]
     
-    # 使用真实AI模型生成股票排名
-    stock_scores, adjusted_weights, discovered_factors, reasoning, confidence = multi_factor_model.generate_stock_ranking(
+    # 指定已存储的市场状态时使用缓存的条件权重向量
+    market_regime, regime_vector = _resolve_regime_vector(db, req)
+    
+    # 使用真实AI模型生成股票排名（指定top_k时只构建前K名）
+    stock_scores, summary, adjusted_weights, discovered_factors, reasoning, confidence = multi_factor_model.generate_top_k_ranking(
         stocks_data=stocks_data,
+        top_k=req.top_k,
         factor_weights=req.factor_weights,
-        market_regime=req.market_regime,
-        auto_discover=req.auto_discover
+        market_regime=market_regime,
+        auto_discover=req.auto_discover,
+        regime_vector=regime_vector
     )
     
-    # 转换为StockScore对象
-    stock_score_objects = []
-    for score_data in stock_scores:
-        stock_score_objects.append(StockScore(
-            symbol=score_data["symbol"],
-            name=score_data["name"],
-            total_score=score_data["total_score"],
-            factor_contribution=score_data["factor_contribution"],
-            rank=score_data["rank"]
-        ))
-    
-    print("[DEBUG] 多因子模型API响应:", stock_score_objects, adjusted_weights)
-    
-    # 创建信号日期
-    signal_date = datetime.utcnow()
-    
     # 持久化存储到数据库
     db_score = MultiFactorScore(
-        stocks_data=stocks_data,
+        storage_mode=req.storage_mode,
         factor_weights=req.factor_weights,
-        market_regime=req.market_regime,
+        market_regime=market_regime,
         auto_discover=req.auto_discover,
-        stock_scores=stock_scores,
+        stock_count=len(stocks_data),
+        top_symbols=[score_data["symbol"] for score_data in stock_scores[:TOP_SYMBOLS_COUNT]],
+        score_summary=summary,
         adjusted_weights=adjusted_weights,
         discovered_factors=discovered_factors,
         reasoning=reasoning,
         model_version=multi_factor_model.model_name,
-        signal_date=signal_date
+        signal_date=signal_date or datetime.utcnow()
     )
+    if req.storage_mode == "compact":
+        # 相同输入只保存一份，评分以列式结构压缩保存
+        db_score.input = MultiFactorInput.get_or_create(db, stocks_data)
+        db_score.scores_blob = MultiFactorScore.pack_scores(stock_scores)
+    else:
+        db_score.stocks_data = stocks_data
+        db_score.stock_scores = stock_scores
     
     # 如果请求中包含策略ID，则关联到该策略
     if hasattr(req, 'strategy_id') and req.strategy_id:
@@ -85,19 +145,185 @@ def multi_factor_signal(
             db_score.strategy_id = strategy.id
     
     db.add(db_score)
+    return db_score, stock_scores, summary
+
+
+@router.post("/multi_factor_signal", response_model=MultiFactorResponse)
+def multi_factor_signal(
+    req: MultiFactorRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """生成多因子信号"""
+    print("[DEBUG] 多因子模型API收到请求:", req)
+    
+    db_score, stock_scores, summary = generate_multi_factor_score(db, req)
     db.commit()
     db.refresh(db_score)
     
+    # 转换为StockScore对象
+    stock_score_objects = []
+    for score_data in stock_scores:
+        stock_score_objects.append(StockScore(
+            symbol=score_data["symbol"],
+            name=score_data["name"],
+            total_score=score_data["total_score"],
+            factor_contribution=score_data["factor_contribution"],
+            rank=score_data["rank"]
+        ))
+    
+    print("[DEBUG] 多因子模型API响应:", stock_score_objects, db_score.adjusted_weights)
+    
     return MultiFactorResponse(
         stock_scores=stock_score_objects,
-        adjusted_weights=adjusted_weights,
-        discovered_factors=discovered_factors,
-        reasoning=reasoning,
-        signal_date=signal_date
+        summary=RankingSummary(**summary),
+        adjusted_weights=db_score.adjusted_weights,
+        discovered_factors=db_score.discovered_factors,
+        reasoning=db_score.reasoning,
+        signal_date=db_score.signal_date
     )
 
 
-@router.get("/multi_factor_scores", response_model=List[MultiFactorResponse])
+@router.post("/multi_factor_signal/stream")
+def multi_factor_signal_stream(
+    req: MultiFactorRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """按排名顺序流式输出完整股票排名（NDJSON，每行一只股票，不持久化）"""
+    stocks_data = [{
+        "symbol": stock.symbol,
+        "name": stock.name,
+        "factor_values": stock.factor_values
+    } for stock in req.stocks]
+    
+    _, regime_vector = _resolve_regime_vector(db, req)
+    if regime_vector is not None:
+        total_scores, contributions, factors = multi_factor_model.score_with_vector(stocks_data, *regime_vector)
+    else:
+        total_scores, contributions, factors = multi_factor_model.score_stocks(
+            stocks_data, _default_weights(req.factor_weights), req.market_regime
+        )
+    order = multi_factor_model.select_top_k(total_scores, req.top_k)
+    
+    def generate_lines():
+        for score_data in multi_factor_model.iter_stock_ranking(stocks_data, total_scores, contributions, factors, order):
+            yield json.dumps(score_data, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(generate_lines(), media_type="application/x-ndjson")
+
+
+@router.post("/multi_factor_signal/batch", response_model=MultiFactorBatchResponse)
+def multi_factor_signal_batch(
+    req: MultiFactorBatchRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """多日期批量多因子评分：对 日期×股票×因子 张量一次性向量化评分，可选按日期持久化"""
+    n_dates, n_stocks, n_factors = len(req.dates), len(req.symbols), len(req.factors)
+    # 逐层校验长度，参差不齐的嵌套列表无法构成张量
+    if len(req.factor_values) != n_dates or any(
+        len(day) != n_stocks or any(len(row) != n_factors for row in day) for day in req.factor_values
+    ):
+        raise HTTPException(status_code=400, detail=f"因子值维度应为{(n_dates, n_stocks, n_factors)}")
+    values = np.array(
+        [[[np.nan if v is None else v for v in row] for row in day] for day in req.factor_values],
+        dtype=float
+    ).reshape(n_dates, n_stocks, n_factors)
+    if req.names is not None and len(req.names) != n_stocks:
+        raise HTTPException(status_code=400, detail="股票名称数量与股票代码数量不一致")
+    if req.market_regimes is not None and len(req.market_regimes) != n_dates:
+        raise HTTPException(status_code=400, detail="市场状态数量与日期数量不一致")
+    
+    market_regimes = req.market_regimes or [req.market_regime] * n_dates
+    scores, contributions, regime_weights = multi_factor_model.score_tensor(
+        values, req.factors, req.factor_weights, market_regimes
+    )
+    ranks = multi_factor_model.rank_matrix(scores)
+    
+    score_ids = None
+    if req.persist:
+        score_ids = _persist_batch_scores(db, req, values, scores, contributions, ranks, market_regimes, regime_weights)
+    
+    return MultiFactorBatchResponse(
+        dates=req.dates,
+        symbols=req.symbols,
+        scores=np.where(np.isnan(scores), None, scores).tolist(),
+        ranks=np.where(ranks == 0, None, ranks).tolist() if req.include_ranks else None,
+        score_ids=score_ids,
+        signal_date=datetime.utcnow()
+    )
+
+
+def _persist_batch_scores(db: Session,
+                          req: MultiFactorBatchRequest,
+                          values: np.ndarray,
+                          scores: np.ndarray,
+                          contributions: np.ndarray,
+                          ranks: np.ndarray,
+                          market_regimes: List[Optional[str]],
+                          regime_weights: dict) -> List[int]:
+    """按日期以紧凑模式批量写入评分记录，单次提交"""
+    strategy_id = None
+    if req.strategy_id:
+        strategy = db.query(Strategy).filter(Strategy.id == req.strategy_id).first()
+        if strategy:
+            strategy_id = strategy.id
+    
+    names = req.names or [None] * len(req.symbols)
+    
+    # 每个日期的输入按内容哈希去重，一次查询完成
+    stocks_data_list = []
+    for d in range(len(req.dates)):
+        stocks_data_list.append([{
+            "symbol": req.symbols[i],
+            "name": names[i],
+            "factor_values": {
+                factor: float(values[d, i, j]) for j, factor in enumerate(req.factors) if np.isfinite(values[d, i, j])
+            }
+        } for i in range(len(req.symbols)) if np.isfinite(values[d, i]).any()])
+    inputs = MultiFactorInput.get_or_create_many(db, stocks_data_list)
+    
+    rows = []
+    for d, signal_date in enumerate(req.dates):
+        regime = market_regimes[d]
+        valid = np.flatnonzero(ranks[d] > 0)
+        order = valid[np.argsort(ranks[d, valid])]
+        factor_mask = np.isfinite(contributions[d, order]).any(axis=0)
+        factors = [f for f, used in zip(req.factors, factor_mask) if used]
+        day_contributions = contributions[d][np.ix_(order, factor_mask)]
+        
+        rows.append(MultiFactorScore(
+            strategy_id=strategy_id,
+            storage_mode="compact",
+            input=inputs[d],
+            factor_weights=req.factor_weights,
+            market_regime=regime,
+            auto_discover=False,
+            scores_blob=MultiFactorScore.pack_score_columns(
+                symbols=[req.symbols[i] for i in order],
+                names=[names[i] for i in order],
+                total_scores=scores[d, order].tolist(),
+                factors=factors,
+                contributions=np.where(np.isnan(day_contributions), None, day_contributions).tolist()
+            ),
+            stock_count=len(order),
+            top_symbols=[req.symbols[i] for i in order[:TOP_SYMBOLS_COUNT]],
+            score_summary=multi_factor_model.summarize_scores(scores[d, order]),
+            adjusted_weights=regime_weights[regime],
+            reasoning="批量历史评分",
+            model_version=multi_factor_model.model_name,
+            signal_date=signal_date
+        ))
+    
+    db.add_all(rows)
+    db.flush()
+    score_ids = [row.id for row in rows]
+    db.commit()
+    return score_ids
+
+
+@router.get("/multi_factor_scores", response_model=List[MultiFactorScoreSummary])
 def get_multi_factor_scores(
     strategy_id: Optional[int] = Query(None, description="策略ID"),
     market_regime: Optional[str] = Query(None, description="市场状态"),
@@ -108,7 +334,7 @@ def get_multi_factor_scores(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """获取多因子评分历史记录"""
+    """获取多因子评分历史记录（仅摘要，逐股评分通过详情接口按需加载）"""
     query = db.query(MultiFactorScore)
     
     # 应用筛选条件
@@ -121,32 +347,17 @@ def get_multi_factor_scores(
     if end_date:
         query = query.filter(MultiFactorScore.signal_date <= end_date)
     
-    # 排序并分页
+    # 排序并分页（评分大字段为延迟加载，此处不会读取）
     scores = query.order_by(MultiFactorScore.signal_date.desc()).offset(offset).limit(limit).all()
-    
-    # 转换为响应格式
-    result = []
-    for score in scores:
-        # 转换股票评分列表
-        stock_scores_list = []
-        for stock_data in score.stock_scores:
-            stock_scores_list.append(StockScore(
-                symbol=stock_data["symbol"],
-                name=stock_data["name"],
-                total_score=stock_data["total_score"],
-                factor_contribution=stock_data["factor_contribution"],
-                rank=stock_data["rank"]
-            ))
-        
-        result.append(MultiFactorResponse(
-            stock_scores=stock_scores_list,
-            adjusted_weights=score.adjusted_weights,
-            discovered_factors=score.discovered_factors,
-            reasoning=score.reasoning,
-            signal_date=score.signal_date
-        ))
-    
-    return result
+    return scores
+
+
+def _get_score_or_404(db: Session, score_id: int) -> MultiFactorScore:
+    """获取多因子评分记录，不存在时返回404"""
+    score = db.query(MultiFactorScore).filter(MultiFactorScore.id == score_id).first()
+    if not score:
+        raise HTTPException(status_code=404, detail="评分不存在")
+    return score
 
 
 @router.get("/multi_factor_scores/{score_id}", response_model=MultiFactorResponse)
@@ -156,25 +367,26 @@ def get_multi_factor_score(
     current_user: User = Depends(get_current_user)
 ):
     """获取单个多因子评分"""
-    score = db.query(MultiFactorScore).filter(MultiFactorScore.id == score_id).first()
-    if not score:
-        raise HTTPException(status_code=404, detail="评分不存在")
-    
-    # 转换股票评分列表
-    stock_scores_list = []
-    for stock_data in score.stock_scores:
-        stock_scores_list.append(StockScore(
-            symbol=stock_data["symbol"],
-            name=stock_data["name"],
-            total_score=stock_data["total_score"],
-            factor_contribution=stock_data["factor_contribution"],
-            rank=stock_data["rank"]
-        ))
+    score = _get_score_or_404(db, score_id)
     
     return MultiFactorResponse(
-        stock_scores=stock_scores_list,
+        stock_scores=[StockScore(**stock_data) for stock_data in score.load_stock_scores()],
+        summary=RankingSummary(**score.score_summary) if score.score_summary else None,
         adjusted_weights=score.adjusted_weights,
         discovered_factors=score.discovered_factors,
         reasoning=score.reasoning,
         signal_date=score.signal_date
-    ) 
\ No newline at end of file
+    )
+
+
+@router.get("/multi_factor_scores/{score_id}/stocks", response_model=List[StockScore])
+def get_multi_factor_score_stocks(
+    score_id: int,
+    limit: int = Query(100, ge=1, le=10000, description="限制数量"),
+    offset: int = Query(0, ge=0, description="排名偏移量"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """按排名区间加载单个多因子评分的逐股评分"""
+    score = _get_score_or_404(db, score_id)
+    return [StockScore(**stock_data) for stock_data in score.load_stock_scores(offset, limit)]
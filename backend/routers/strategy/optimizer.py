@@ -0,0 +1,264 @@
+"""
+组合优化模块
+基于收缩协方差估计，提供均值-方差、最小方差、风险平价与最大分散化优化
+"""
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import and_, insert
+from sqlalchemy.orm import Session
+from typing import Any, Dict, List, Optional
+from datetime import datetime
+import time
+import numpy as np
+
+from database import get_db
+from utils.auth import get_current_user
+from models.user import User
+from models.strategy import Strategy, PortfolioAllocation
+from models.portfolio import Portfolio
+from models.user_profile import UserProfile, UserSegment, ProfileSegment, ProfileSegmentation
+from models.ai_models import PortfolioOptimizer, BatchPortfolioOptimizer
+from services.covariance import estimate_covariance
+from schemas.strategy import (
+    OptimizationRequest, OptimizationResponse,
+    BatchOptimizationRequest, BatchOptimizationResponse, BatchOptimizationGroup
+)
+
+router = APIRouter(prefix="", tags=["组合优化"])
+
+portfolio_optimizer = PortfolioOptimizer()
+
+
+def _group_matrix(estimate: Dict[str, Any], limits: Optional[Dict[str, float]]):
+    """行业权重上限转换为 分组归属矩阵 与 上限向量"""
+    if not limits:
+        return None, None
+    names = list(limits)
+    groups = np.array([[float(industry == name) for industry in estimate["industries"]] for name in names])
+    return groups, np.array([limits[name] for name in names])
+
+
+def _save_allocations(db: Session, req: OptimizationRequest, weights: Dict[str, float],
+                      metrics: Dict[str, Any], allocation_date: datetime) -> List[int]:
+    """将优化结果保存为策略在各投资组合上的配置"""
+    strategy = db.query(Strategy).filter(Strategy.id == req.strategy_id).first()
+    if not strategy:
+        raise HTTPException(status_code=404, detail="策略不存在")
+    found = {pid for (pid,) in db.query(Portfolio.id).filter(Portfolio.id.in_(req.portfolio_ids)).all()}
+    missing = sorted(set(req.portfolio_ids) - found)
+    if missing:
+        raise HTTPException(status_code=404, detail=f"投资组合不存在: {missing}")
+    
+    allocations = [
+        PortfolioAllocation(
+            strategy_id=req.strategy_id,
+            portfolio_id=portfolio_id,
+            allocation_date=allocation_date,
+            target_weights=weights,
+            rebalance_reason=f"组合优化（{req.method}）",
+            risk_metrics={
+                "volatility": metrics["volatility"],
+                "diversification_ratio": metrics["diversification_ratio"],
+            },
+            expected_return=metrics["expected_return"],
+        )
+        for portfolio_id in req.portfolio_ids
+    ]
+    db.add_all(allocations)
+    db.flush()
+    return [allocation.id for allocation in allocations]
+
+
+@router.post("/optimize", response_model=OptimizationResponse)
+def optimize_portfolio(
+    req: OptimizationRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """基于收缩协方差求解最优组合权重，可选保存为策略的组合配置（未收敛的解不保存）"""
+    estimate = estimate_covariance(db, req.symbols, req.lookback_days, req.end_date)
+    symbols = estimate["symbols"]
+    if len(symbols) < 2:
+        raise HTTPException(status_code=400, detail="可用于优化的资产不足（需要至少2只有足够行情的资产）")
+    
+    expected = estimate["mean_returns"]
+    if req.expected_returns:
+        expected = np.array([req.expected_returns.get(symbol, mu) for symbol, mu in zip(symbols, expected)])
+    
+    groups, group_limits = _group_matrix(estimate, req.group_limits)
+    budgets = np.array([req.risk_budgets.get(symbol, 0.0) for symbol in symbols]) if req.risk_budgets else None
+    if budgets is not None and np.any(budgets <= 0):
+        raise HTTPException(status_code=400, detail="风险预算须覆盖全部资产且为正数")
+    
+    started = time.perf_counter()
+    try:
+        result = portfolio_optimizer.optimize(
+            req.method, estimate["covariance"], expected, risk_aversion=req.risk_aversion,
+            min_weight=req.min_weight, max_weight=req.max_weight, target_return=req.target_return,
+            groups=groups, group_limits=group_limits, risk_budgets=budgets
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    solve_ms = (time.perf_counter() - started) * 1000
+    
+    metrics = PortfolioOptimizer.portfolio_metrics(result["weights"], estimate["covariance"], expected)
+    weights = {symbol: float(w) for symbol, w in zip(symbols, result["weights"])}
+    
+    allocation_ids = []
+    if req.strategy_id is not None and req.portfolio_ids:
+        if not result["converged"]:
+            raise HTTPException(status_code=400, detail="优化未收敛，未保存组合配置")
+        allocation_date = req.end_date or (estimate["dates"][-1] if estimate["dates"] else datetime.now())
+        allocation_ids = _save_allocations(db, req, weights, metrics, allocation_date)
+        db.commit()
+    
+    return OptimizationResponse(
+        method=req.method,
+        weights=weights,
+        expected_return=metrics["expected_return"],
+        volatility=metrics["volatility"],
+        risk_contributions={symbol: float(c) for symbol, c in zip(symbols, metrics["risk_contributions"])},
+        diversification_ratio=metrics["diversification_ratio"],
+        shrinkage=estimate["shrinkage"],
+        observations=estimate["observations"],
+        excluded_symbols=estimate["excluded"],
+        iterations=result["iterations"],
+        converged=result["converged"],
+        solve_ms=solve_ms,
+        allocation_ids=allocation_ids,
+    )
+
+
+def run_batch_optimization(db: Session, req: BatchOptimizationRequest,
+                           allocation_date: Optional[datetime] = None) -> BatchOptimizationResponse:
+    """
+    为大量客户组合生成个性化配置（未提交）
+    
+    组合按 风险等级 + 用户画像中的目标收益与最大回撤容忍度 离散为约束签名，每个签名只求解一次；
+    by_segment 为真时持有人已归入当前客群的组合改用客群的风险等级与约束中位数，签名数不超过客群数。
+    同一策略同一配置日期下未执行的旧配置先删除再批量写入，重复运行不产生重复数据。
+    """
+    started = time.perf_counter()
+    strategy = db.query(Strategy).filter(Strategy.id == req.strategy_id).first()
+    if not strategy:
+        raise HTTPException(status_code=404, detail="策略不存在")
+    
+    estimate = estimate_covariance(db, req.symbols, req.lookback_days, req.end_date)
+    symbols = estimate["symbols"]
+    if len(symbols) < 2:
+        raise HTTPException(status_code=400, detail="可用于优化的资产不足（需要至少2只有足够行情的资产）")
+    expected = estimate["mean_returns"]
+    if req.expected_returns:
+        expected = np.array([req.expected_returns.get(symbol, mu) for symbol, mu in zip(symbols, expected)])
+    groups, group_limits = _group_matrix(estimate, req.group_limits)
+    
+    # 一次查询全部组合及其用户画像中的约束
+    columns = [Portfolio.id, Portfolio.risk_level, UserProfile.target_return, UserProfile.max_drawdown_tolerance]
+    if req.by_segment:
+        columns += [ProfileSegment.name.label("segment_name"), ProfileSegment.risk_level.label("segment_risk_level"),
+                    ProfileSegment.target_return.label("segment_target_return"),
+                    ProfileSegment.max_drawdown_tolerance.label("segment_max_drawdown")]
+    query = db.query(*columns).outerjoin(UserProfile, UserProfile.user_id == Portfolio.user_id)
+    if req.by_segment:
+        # 只使用当前分群的归属，旧分群遗留的归属视为未分群
+        query = query.outerjoin(UserSegment, and_(
+            UserSegment.user_id == Portfolio.user_id,
+            UserSegment.segmentation_id.in_(db.query(ProfileSegmentation.id).filter(ProfileSegmentation.is_active == True))
+        )).outerjoin(ProfileSegment, ProfileSegment.id == UserSegment.segment_id)
+    query = query.filter(Portfolio.is_active == True)
+    if req.portfolio_ids is not None:
+        query = query.filter(Portfolio.id.in_(req.portfolio_ids))
+    portfolios = query.order_by(Portfolio.id).all()
+    if not portfolios:
+        raise HTTPException(status_code=404, detail="没有需要优化的投资组合")
+    
+    batch = BatchPortfolioOptimizer(portfolio_optimizer, max_workers=req.max_workers)
+    signature_of, segment_of = {}, {}
+    for row in portfolios:
+        if req.by_segment and row.segment_name is not None:
+            signature_of[row.id] = batch.signature(row.segment_risk_level, row.segment_target_return,
+                                                   row.segment_max_drawdown)
+            segment_of[row.id] = row.segment_name
+        else:
+            signature_of[row.id] = batch.signature(row.risk_level, row.target_return, row.max_drawdown_tolerance)
+    if req.min_weight * len(symbols) > 1 + 1e-9 or req.max_weight * len(symbols) < 1 - 1e-9:
+        raise HTTPException(status_code=400, detail="权重上下限与资产数量矛盾，无可行解")
+    results = batch.solve(
+        estimate["covariance"], expected, list(signature_of.values()),
+        min_weight=req.min_weight, max_weight=req.max_weight, groups=groups, group_limits=group_limits
+    )
+    
+    # 去掉数值噪声级别的权重，每个签名只构造一次权重字典与调仓原因
+    weights_of, reason_of = {}, {}
+    for signature, result in results.items():
+        weights = np.where(result["weights"] >= 1e-4, result["weights"], 0.0)
+        weights = weights / weights.sum()
+        weights_of[signature] = {symbol: round(float(w), 6) for symbol, w in zip(symbols, weights) if w > 0}
+        risk_level, target_return, max_drawdown = signature
+        reason_of[signature] = "批量个性化优化（风险等级{}{}{}）".format(
+            risk_level,
+            f"，目标收益{target_return:.1%}" if target_return is not None else "",
+            f"，最大回撤{max_drawdown:.0%}" if max_drawdown is not None else "",
+        )
+    
+    written = 0
+    if req.persist:
+        allocation_date = allocation_date or req.allocation_date or req.end_date or \
+            (estimate["dates"][-1] if estimate["dates"] else datetime.now())
+        db.query(PortfolioAllocation).filter(
+            PortfolioAllocation.strategy_id == req.strategy_id,
+            PortfolioAllocation.allocation_date == allocation_date,
+            PortfolioAllocation.is_executed == False,
+            PortfolioAllocation.portfolio_id.in_(list(signature_of))
+        ).delete(synchronize_session=False)
+        rows = []
+        for portfolio_id, signature in signature_of.items():
+            result = results[signature]
+            rows.append({
+                "strategy_id": req.strategy_id,
+                "portfolio_id": portfolio_id,
+                "allocation_date": allocation_date,
+                "target_weights": weights_of[signature],
+                "rebalance_reason": f"{segment_of[portfolio_id]}：{reason_of[signature]}"
+                if portfolio_id in segment_of else reason_of[signature],
+                "risk_metrics": {"volatility": result["volatility"], "risk_aversion": result["risk_aversion"],
+                                 "target_met": result["target_met"], "risk_met": result["risk_met"]},
+                "expected_return": result["expected_return"],
+                "is_executed": False,
+            })
+        db.execute(insert(PortfolioAllocation), rows)
+        written = len(rows)
+    
+    counts: Dict[tuple, int] = {}
+    for signature in signature_of.values():
+        counts[signature] = counts.get(signature, 0) + 1
+    return BatchOptimizationResponse(
+        strategy_id=req.strategy_id,
+        portfolios=len(portfolios),
+        signatures=len(results),
+        segmented_portfolios=len(segment_of),
+        allocations_written=written,
+        excluded_symbols=estimate["excluded"],
+        elapsed_seconds=time.perf_counter() - started,
+        groups=[
+            BatchOptimizationGroup(
+                risk_level=signature[0], target_return=signature[1], max_drawdown=signature[2],
+                portfolios=counts[signature], risk_aversion=result["risk_aversion"],
+                expected_return=result["expected_return"], volatility=result["volatility"],
+                target_met=result["target_met"], risk_met=result["risk_met"]
+            )
+            for signature, result in sorted(results.items(), key=lambda item: str(item[0]))
+        ],
+    )
+
+
+@router.post("/optimize/batch", response_model=BatchOptimizationResponse)
+def optimize_portfolios_batch(
+    req: BatchOptimizationRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """按客户约束批量生成个性化组合配置（相同约束签名只求解一次，可多进程并行）"""
+    response = run_batch_optimization(db, req)
+    if req.persist:
+        db.commit()
+    return response
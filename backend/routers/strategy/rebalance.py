@@ -0,0 +1,206 @@
+"""
+组合再平衡模块
+将策略组合配置的目标权重与各组合当前持仓求差，生成可执行的调仓指令
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import List, Optional
+import json
+import numpy as np
+
+from database import get_db
+from utils.auth import get_current_user
+from models.user import User
+from models.strategy import Strategy, PortfolioAllocation, RebalanceOrder
+from models.market_data import MarketData, PriceHistory
+from models.portfolio import Asset, PortfolioAsset
+from models.ai_models import RebalanceEngine
+from schemas.strategy import (
+    RebalanceRequest, RebalanceResponse, RebalanceOrderResponse, RebalancePortfolioSummary
+)
+
+router = APIRouter(prefix="", tags=["组合再平衡"])
+
+
+def _pending_allocations(db: Session, req: RebalanceRequest) -> List[PortfolioAllocation]:
+    """各组合最近一条未执行的配置"""
+    query = db.query(PortfolioAllocation).filter(
+        PortfolioAllocation.strategy_id == req.strategy_id,
+        PortfolioAllocation.is_executed == False
+    )
+    if req.portfolio_ids:
+        query = query.filter(PortfolioAllocation.portfolio_id.in_(req.portfolio_ids))
+    latest = {}
+    for allocation in query.order_by(PortfolioAllocation.allocation_date, PortfolioAllocation.id).all():
+        latest[allocation.portfolio_id] = allocation
+    return list(latest.values())
+
+
+def _load_holdings(db: Session, portfolio_ids: List[int]):
+    """一次查询全部组合持仓（资产代码对应市场数据代码），返回 (可交易持仓, 各组合不可交易持仓权重)"""
+    rows = db.query(
+        PortfolioAsset.portfolio_id, PortfolioAsset.weight, MarketData.id, MarketData.symbol
+    ).join(Asset, Asset.id == PortfolioAsset.asset_id).outerjoin(
+        MarketData, MarketData.symbol == Asset.code
+    ).filter(PortfolioAsset.portfolio_id.in_(portfolio_ids)).all()
+    
+    tradable, untradable = [], {}
+    for portfolio_id, weight, market_data_id, symbol in rows:
+        # 持仓权重以百分比存储
+        if market_data_id is None:
+            untradable[portfolio_id] = untradable.get(portfolio_id, 0.0) + weight / 100
+        else:
+            tradable.append((portfolio_id, symbol, weight / 100))
+    return tradable, untradable
+
+
+def run_rebalance(db: Session, req: RebalanceRequest) -> RebalanceResponse:
+    """计算策略下全部组合的调仓指令；非试算时替换各配置下尚未成交的指令（未提交）"""
+    allocations = _pending_allocations(db, req)
+    if not allocations:
+        raise HTTPException(status_code=404, detail="策略没有待执行的组合配置")
+    portfolio_ids = [allocation.portfolio_id for allocation in allocations]
+    holdings, untradable = _load_holdings(db, portfolio_ids)
+    
+    # 标的全集：目标权重与当前持仓的并集，统一查询市场数据与最新价格
+    symbols = set(symbol for _, symbol, _ in holdings)
+    for allocation in allocations:
+        symbols.update((allocation.target_weights or {}).keys())
+    instruments = {
+        row.symbol: row for row in db.query(MarketData.id, MarketData.symbol, MarketData.asset_type).filter(
+            MarketData.symbol.in_(symbols)
+        ).all()
+    } if symbols else {}
+    closes = PriceHistory.latest_closes(db, [row.id for row in instruments.values()]) if instruments else {}
+    priced = sorted(symbol for symbol, row in instruments.items() if (closes.get(row.id) or 0) > 0)
+    unpriced = sorted(symbols - set(priced))
+    column = {symbol: j for j, symbol in enumerate(priced)}
+    
+    # 同一模型配置通常下发给全部客户组合，目标权重按内容去重后再展开为矩阵
+    unique_targets, target_index = {}, []
+    for allocation in allocations:
+        key = json.dumps(allocation.target_weights or {}, sort_keys=True)
+        target_index.append(unique_targets.setdefault(key, len(unique_targets)))
+    target_rows = np.zeros((len(unique_targets), len(priced)))
+    for key, i in unique_targets.items():
+        for symbol, weight in json.loads(key).items():
+            if symbol in column:
+                target_rows[i, column[symbol]] = weight
+    target = target_rows[np.array(target_index, dtype=int)]
+    
+    row_of = {portfolio_id: i for i, portfolio_id in enumerate(portfolio_ids)}
+    current = np.zeros_like(target)
+    for portfolio_id, symbol, weight in holdings:
+        if symbol in column:
+            current[row_of[portfolio_id], column[symbol]] += weight
+    
+    values = np.array([req.portfolio_values.get(pid, req.default_portfolio_value) for pid in portfolio_ids], dtype=float)
+    prices = np.array([closes[instruments[symbol].id] for symbol in priced], dtype=float)
+    lot_sizes = np.array([
+        req.lot_sizes.get(symbol, RebalanceEngine.lot_size(instruments[symbol].asset_type.value)) for symbol in priced
+    ], dtype=float)
+    
+    engine = RebalanceEngine(
+        tolerance=req.tolerance, relative_tolerance=req.relative_tolerance, max_turnover=req.max_turnover,
+        min_trade_value=req.min_trade_value, trade_to=req.trade_to
+    )
+    result = engine.rebalance(current, target, values, prices, lot_sizes) if priced else None
+    
+    rows = []
+    if result is not None:
+        quantity, amount, post = result["quantity"], result["amount"], result["post_weights"]
+        for i, j in zip(*np.nonzero(quantity)):
+            rows.append({
+                "allocation_id": allocations[i].id,
+                "strategy_id": req.strategy_id,
+                "portfolio_id": portfolio_ids[i],
+                "market_data_id": instruments[priced[j]].id,
+                "symbol": priced[j],
+                "side": "BUY" if quantity[i, j] > 0 else "SELL",
+                "quantity": float(abs(quantity[i, j])),
+                "price": float(prices[j]),
+                "amount": float(abs(amount[i, j])),
+                "current_weight": float(current[i, j]),
+                "target_weight": float(target[i, j]),
+                "post_trade_weight": float(post[i, j]),
+                "status": "pending",
+            })
+    
+    order_counts = np.bincount([row_of[row["portfolio_id"]] for row in rows], minlength=len(portfolio_ids))
+    summaries = [
+        RebalancePortfolioSummary(
+            portfolio_id=portfolio_id,
+            allocation_id=allocations[i].id,
+            portfolio_value=float(values[i]),
+            orders=int(order_counts[i]),
+            breaches=int(result["breaches"][i]) if result is not None else 0,
+            turnover=float(result["turnover"][i]) if result is not None else 0.0,
+            cash_weight=float(1.0 - untradable.get(portfolio_id, 0.0) - (
+                result["post_weights"][i].sum() if result is not None else current[i].sum()
+            )),
+        )
+        for i, portfolio_id in enumerate(portfolio_ids)
+    ]
+    
+    if req.dry_run:
+        orders = [RebalanceOrderResponse(**row) for row in rows]
+    else:
+        allocation_ids = [allocation.id for allocation in allocations]
+        RebalanceOrder.replace_pending(db, allocation_ids, rows)
+        orders = [RebalanceOrderResponse.model_validate(order) for order in db.query(RebalanceOrder).filter(
+            RebalanceOrder.allocation_id.in_(allocation_ids), RebalanceOrder.status == "pending"
+        ).order_by(RebalanceOrder.id).all()]
+    
+    return RebalanceResponse(
+        strategy_id=req.strategy_id, portfolios=summaries, orders=orders,
+        unpriced_symbols=unpriced, dry_run=req.dry_run
+    )
+
+
+@router.post("/rebalance", response_model=RebalanceResponse)
+def rebalance_portfolios(
+    req: RebalanceRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    按策略最新的组合配置，为全部关联组合生成调仓指令（按手数取整，支持容忍带与换手率上限）
+    
+    保存指令会替换全部关联组合未成交的指令，需管理员权限；非管理员仅可试算
+    """
+    if not req.dry_run and not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="保存调仓指令需要管理员权限")
+    strategy = db.query(Strategy).filter(Strategy.id == req.strategy_id).first()
+    if not strategy:
+        raise HTTPException(status_code=404, detail="策略不存在")
+    
+    response = run_rebalance(db, req)
+    if not req.dry_run:
+        db.commit()
+    return response
+
+
+@router.get("/rebalance/orders", response_model=List[RebalanceOrderResponse])
+def get_rebalance_orders(
+    strategy_id: Optional[int] = Query(None, description="策略ID"),
+    portfolio_id: Optional[int] = Query(None, description="投资组合ID"),
+    allocation_id: Optional[int] = Query(None, description="组合配置ID"),
+    status: Optional[str] = Query(None, description="状态"),
+    limit: int = Query(100, ge=1, le=1000, description="限制数量"),
+    offset: int = Query(0, ge=0, description="偏移量"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """获取调仓指令列表"""
+    query = db.query(RebalanceOrder)
+    
+    if strategy_id:
+        query = query.filter(RebalanceOrder.strategy_id == strategy_id)
+    if portfolio_id:
+        query = query.filter(RebalanceOrder.portfolio_id == portfolio_id)
+    if allocation_id:
+        query = query.filter(RebalanceOrder.allocation_id == allocation_id)
+    if status:
+        query = query.filter(RebalanceOrder.status == status)
+    
+    return query.order_by(RebalanceOrder.id).offset(offset).limit(limit).all()
@@ -3,19 +3,25 @@
 提供行业轮动信号生成和历史查询功能
 """
 from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
+import numpy as np
+import pandas as pd
 
 from database import get_db
 from utils.auth import get_current_user
 from models.user import User
+from models.market_data import IndustryAggregate
 from models.strategy import (
     Strategy, SectorRotationSignal
 )
 from models.ai_models import SectorRotationModel
+from services.industry_aggregates import sync_aggregates
 from schemas.strategy import (
-    SectorRotationRequest, SectorRotationResponse
+    SectorRotationRequest, SectorRotationResponse,
+    SectorRotationBatchRequest, SectorRotationBatchResponse
 )
 
 router = APIRouter(prefix="", tags=["行业轮动模型"])
@@ -74,6 +80,149 @@ def sector_rotation_signal(
     )
 
 
+@router.post("/sector_rotation_signal/batch", response_model=SectorRotationBatchResponse)
+def sector_rotation_signal_batch(
+    req: SectorRotationBatchRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """基于行业聚合表批量生成全部日期的行业轮动信号
+    
+    增量模式下只为上次生成信号之后的新交易日计算，并仅加载所需的回看窗口。
+    """
+    strategy_id = None
+    if req.strategy_id:
+        strategy = db.query(Strategy).filter(Strategy.id == req.strategy_id).first()
+        if strategy:
+            strategy_id = strategy.id
+    
+    response = run_rotation_batch(db, req, strategy_id)
+    db.commit()
+    return response
+
+
+def run_rotation_batch(db: Session, req: SectorRotationBatchRequest, strategy_id: Optional[int]) -> SectorRotationBatchResponse:
+    """批量计算（并按需写入）行业轮动信号，只flush不提交"""
+    # 先补齐聚合表中尚未覆盖的最新交易日
+    sync_aggregates(db, ("industry",))
+    
+    # 确定需要生成信号的起始日期（不含）以及加载数据的起始日期（含回看窗口）
+    emit_after = None
+    if req.incremental:
+        emit_after = db.query(func.max(SectorRotationSignal.signal_date)).filter(
+            SectorRotationSignal.signal_source == "price_history",
+            SectorRotationSignal.strategy_id == strategy_id if strategy_id else SectorRotationSignal.strategy_id.is_(None)
+        ).scalar()
+    load_from = None
+    anchor = emit_after or req.start_date
+    if anchor is not None:
+        load_from = db.query(IndustryAggregate.date).filter(
+            IndustryAggregate.group_type == "industry", IndustryAggregate.date <= anchor
+        ).distinct().order_by(IndustryAggregate.date.desc()).offset(max(req.lookback, req.flow_window)).limit(1).scalar()
+    
+    panel_dates, panel = _load_industry_panel(db, load_from, req.end_date)
+    if panel is None:
+        return SectorRotationBatchResponse(industries=[], dates=[], scores=[], allocations=[], signal_ids=[] if req.persist else None)
+    
+    signals = sector_rotation_model.compute_rotation_scores(panel, req.lookback, req.flow_window)
+    allocations, confidence = sector_rotation_model.allocate_batch(signals["scores"], signals["fund_flow"])
+    
+    # 只输出有有效评分且位于本次区间内的日期
+    mask = np.isfinite(signals["scores"]).any(axis=1)
+    if emit_after is not None:
+        mask &= panel_dates > pd.Timestamp(emit_after)
+    if req.start_date:
+        mask &= panel_dates >= pd.Timestamp(req.start_date)
+    rows = np.flatnonzero(mask)
+    dates = list(panel_dates[rows].to_pydatetime())
+    
+    signal_ids = None
+    if req.persist:
+        signal_ids = _persist_rotation_signals(db, panel["industries"], dates, rows, signals,
+                                               allocations, confidence, strategy_id, req)
+    
+    scores = signals["scores"][rows]
+    return SectorRotationBatchResponse(
+        industries=panel["industries"],
+        dates=dates,
+        scores=np.where(np.isnan(scores), None, scores).tolist(),
+        allocations=allocations[rows].tolist(),
+        signal_ids=signal_ids
+    )
+
+
+def _load_industry_panel(db: Session, start_date: Optional[datetime], end_date: Optional[datetime]):
+    """从行业聚合表读取区间内的行业日度数据"""
+    query = db.query(
+        IndustryAggregate.date, IndustryAggregate.group_name, IndustryAggregate.daily_return,
+        IndustryAggregate.market_cap, IndustryAggregate.turnover, IndustryAggregate.signed_turnover,
+        IndustryAggregate.advancers, IndustryAggregate.constituents
+    ).filter(IndustryAggregate.group_type == "industry")
+    if start_date:
+        query = query.filter(IndustryAggregate.date >= start_date)
+    if end_date:
+        query = query.filter(IndustryAggregate.date <= end_date)
+    
+    rows = pd.DataFrame(query.all(), columns=[
+        "date", "group_name", "daily_return", "market_cap", "turnover", "signed_turnover", "advancers", "constituents"
+    ])
+    if rows.empty:
+        return pd.DatetimeIndex([]), None
+    
+    def pivot(column: str, fill: Optional[float] = 0.0) -> np.ndarray:
+        table = rows.pivot(index="date", columns="group_name", values=column).sort_index().sort_index(axis=1)
+        return (table if fill is None else table.fillna(fill)).to_numpy(dtype=float)
+    
+    dates = pd.DatetimeIndex(sorted(rows["date"].unique()))
+    panel = {
+        "industries": sorted(rows["group_name"].unique()),
+        "index_returns": pivot("daily_return", fill=None),
+        "market_caps": pivot("market_cap"),
+        "turnover": pivot("turnover"),
+        "signed_turnover": pivot("signed_turnover"),
+        "advancers": pivot("advancers"),
+        "constituents": pivot("constituents"),
+    }
+    return dates, panel
+
+
+def _persist_rotation_signals(db: Session,
+                              industries: List[str],
+                              dates: List[datetime],
+                              rows: np.ndarray,
+                              signals: dict,
+                              allocations: np.ndarray,
+                              confidence: np.ndarray,
+                              strategy_id: Optional[int],
+                              req: SectorRotationBatchRequest) -> List[int]:
+    """按日期批量写入行业轮动信号（只flush，由调用方统一提交）"""
+    db_signals = []
+    for signal_date, row in zip(dates, rows):
+        valid = np.flatnonzero(np.isfinite(signals["scores"][row]))
+        top = valid[np.argsort(-signals["scores"][row, valid], kind="stable")][:3]
+        db_signals.append(SectorRotationSignal(
+            strategy_id=strategy_id,
+            industry_scores={industries[k]: float(signals["scores"][row, k]) for k in valid},
+            fund_flows={industries[k]: float(signals["fund_flow"][row, k]) for k in valid},
+            additional_factors={
+                "momentum": {industries[k]: float(signals["momentum"][row, k]) for k in valid},
+                "breadth": {industries[k]: float(signals["breadth"][row, k]) for k in valid},
+                "lookback": req.lookback,
+                "flow_window": req.flow_window
+            },
+            recommended_industry_allocation={industries[k]: float(allocations[row, k]) for k in valid},
+            reasoning=f"基于行情聚合的行业相对动量、上涨广度与资金流向评分，推荐配置前三大行业：{', '.join(industries[k] for k in top)}。",
+            confidence_score=float(confidence[row]),
+            model_version=sector_rotation_model.model_name,
+            signal_date=signal_date,
+            signal_source="price_history"
+        ))
+    
+    db.add_all(db_signals)
+    db.flush()
+    return [signal.id for signal in db_signals]
+
+
 @router.get("/sector_rotation_signals", response_model=List[SectorRotationResponse])
 def get_sector_rotation_signals(
     strategy_id: Optional[int] = Query(None, description="策略ID"),
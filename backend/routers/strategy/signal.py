@@ -11,15 +11,60 @@ from database import get_db
 from utils.auth import get_current_user
 from models.user import User
 from models.strategy import (
-    Strategy, StrategySignal, SignalType
+    Strategy, StrategySignal, SignalType,
+    MacroTimingSignal, SectorRotationSignal, MultiFactorScore
 )
 from models.market_data import MarketData
 from schemas.strategy import (
-    StrategySignalCreate, StrategySignalUpdate, StrategySignalResponse
+    StrategySignalCreate, StrategySignalUpdate, StrategySignalResponse,
+    SignalFanoutRequest, SignalFanoutResponse, SignalFanoutSourceResult
 )
 
 router = APIRouter(prefix="", tags=["策略信号管理"])
 
+# 可展开为策略信号的模型输出
+FANOUT_SOURCES = {
+    "macro_timing": MacroTimingSignal,
+    "sector_rotation": SectorRotationSignal,
+    "multi_factor": MultiFactorScore,
+}
+
+
+def load_industry_constituents(db: Session, sources: List[SectorRotationSignal], per_industry: Optional[int]):
+    """一次查询所有涉及行业的成分股，返回 (行业 -> [(代码, 市值)], 代码 -> 市场数据ID)"""
+    industries = set()
+    for source in sources:
+        industries.update((source.recommended_industry_allocation or {}).keys())
+    rows = db.query(MarketData.id, MarketData.symbol, MarketData.industry, MarketData.market_cap).filter(
+        MarketData.industry.in_(industries),
+        MarketData.is_active == True
+    ).order_by(MarketData.market_cap.desc(), MarketData.symbol).all() if industries else []
+    
+    constituents = {}
+    for row in rows:
+        members = constituents.setdefault(row.industry, [])
+        if per_industry is None or len(members) < per_industry:
+            members.append((row.symbol, row.market_cap))
+    return constituents, {row.symbol: row.id for row in rows}
+
+
+def _delete_derived_signals(db: Session, source_type: str, sources) -> int:
+    """删除此前由这些模型输出展开的策略信号（按信号因子中记录的来源识别）"""
+    source_ids = {source.id for source in sources}
+    for source in sources:
+        source.derived_signal_id = None
+    candidates = db.query(StrategySignal.id, StrategySignal.factors).filter(
+        StrategySignal.signal_date.in_({source.signal_date for source in sources})
+    ).all()
+    stale_ids = [
+        row.id for row in candidates
+        if row.factors and row.factors.get("source") == source_type and row.factors.get("source_id") in source_ids
+    ]
+    if stale_ids:
+        db.flush()
+        db.query(StrategySignal).filter(StrategySignal.id.in_(stale_ids)).delete(synchronize_session=False)
+    return len(stale_ids)
+
 
 @router.post("/signals", response_model=StrategySignalResponse, status_code=status.HTTP_201_CREATED)
 def create_strategy_signal(
@@ -45,6 +90,85 @@ def create_strategy_signal(
     return db_signal
 
 
+@router.post("/signals/fanout", response_model=SignalFanoutResponse, status_code=status.HTTP_201_CREATED)
+def fan_out_strategy_signals(
+    req: SignalFanoutRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    将模型输出批量展开为逐标的策略信号
+    
+    **功能说明:**
+    - 宏观择时：按 instrument_map 将各资产类别权重平分到对应标的
+    - 行业轮动：按成分股市值将行业权重拆分到个股
+    - 多因子：排名前 top_n 买入、后 bottom_n 卖出
+    - 市场数据按代码集合一次查询，所有信号一次批量写入，并回写模型输出的 derived_signal_id
+    
+    **权限要求:**
+    - 需要用户登录认证
+    """
+    model = FANOUT_SOURCES[req.source_type]
+    source_ids = list(dict.fromkeys(req.source_ids))
+    sources = db.query(model).filter(model.id.in_(source_ids)).order_by(model.id).all()
+    missing = sorted(set(source_ids) - {source.id for source in sources})
+    if missing:
+        raise HTTPException(status_code=404, detail=f"模型输出不存在: {missing}")
+    
+    strategy_ids = {source.id: req.strategy_id or source.strategy_id for source in sources}
+    if None in strategy_ids.values():
+        raise HTTPException(status_code=400, detail="模型输出未关联策略，请指定strategy_id")
+    found = {row.id for row in db.query(Strategy.id).filter(Strategy.id.in_(set(strategy_ids.values()))).all()}
+    if found != set(strategy_ids.values()):
+        raise HTTPException(status_code=404, detail="策略不存在")
+    
+    already = [source.id for source in sources if source.derived_signal_id is not None]
+    if already and not req.replace:
+        raise HTTPException(status_code=409, detail=f"模型输出已展开为策略信号: {already}")
+    replaced = _delete_derived_signals(db, req.source_type, sources) if already else 0
+    
+    market_data_ids = None
+    intents = []
+    if req.source_type == "macro_timing":
+        if not req.instrument_map:
+            raise HTTPException(status_code=400, detail="宏观择时信号需提供instrument_map")
+        for source in sources:
+            intents.extend(source.signal_intents(strategy_ids[source.id], req.instrument_map))
+    elif req.source_type == "sector_rotation":
+        constituents, market_data_ids = load_industry_constituents(db, sources, req.per_industry)
+        for source in sources:
+            intents.extend(source.signal_intents(strategy_ids[source.id], constituents))
+    else:
+        for source in sources:
+            intents.extend(source.signal_intents(strategy_ids[source.id], req.top_n, req.bottom_n, req.weighting))
+    
+    inserted, unknown_symbols = StrategySignal.fan_out(db, intents, market_data_ids)
+    
+    # 每个模型输出回写其首个（权重最高、排名最前）信号，即插入ID最小者
+    counts = {source.id: 0 for source in sources}
+    first_signal = {}
+    for signal_id, factors in inserted:
+        source_id = factors["source_id"]
+        counts[source_id] += 1
+        first_signal[source_id] = min(signal_id, first_signal.get(source_id, signal_id))
+    for source in sources:
+        source.derived_signal_id = first_signal.get(source.id)
+    db.commit()
+    
+    return SignalFanoutResponse(
+        created=len(inserted),
+        replaced=replaced,
+        sources=[
+            SignalFanoutSourceResult(
+                source_id=source.id,
+                signal_count=counts[source.id],
+                derived_signal_id=first_signal.get(source.id)
+            ) for source in sources
+        ],
+        unknown_symbols=unknown_symbols
+    )
+
+
 @router.get("/signals", response_model=List[StrategySignalResponse])
 def get_strategy_signals(
     strategy_id: Optional[int] = Query(None, description="策略ID"),
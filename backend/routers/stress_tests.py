@@ -0,0 +1,148 @@
+"""
+压力测试API路由
+管理内置历史情景与自定义因子冲击情景，对全部组合执行压力测试并查询结果
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query, status as http_status
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from datetime import datetime, time
+
+from database import get_db
+from models import User, Portfolio, StressScenario, StressTestResult
+from models.market_data import MarketIndex
+from schemas.portfolio import (
+    StressScenarioCreate, StressScenarioResponse, StressTestRunRequest, StressTestRunResponse,
+    StressTestResultResponse
+)
+from utils.auth import get_current_active_user, get_current_admin_user
+from services.stress_tests import stress_test_portfolios
+
+router = APIRouter(
+    prefix="/stress-tests",
+    tags=["stress-tests"],
+    responses={404: {"description": "未找到情景或测试结果"}},
+)
+
+@router.get("/scenarios", response_model=List[StressScenarioResponse])
+def list_scenarios(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    获取全部压力测试情景（首次访问时补齐内置历史情景）。
+    """
+    StressScenario.ensure_builtin(db)
+    db.commit()
+    return db.query(StressScenario).order_by(StressScenario.id).all()
+
+@router.post("/scenarios", response_model=StressScenarioResponse, status_code=http_status.HTTP_201_CREATED)
+def create_scenario(
+    scenario: StressScenarioCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    创建自定义情景：历史情景重放指定指数在起止日期间的走势，因子情景按指数冲击经Beta传导至各标的。
+    - 参数: scenario (StressScenarioCreate): 情景定义
+    - 返回: StressScenarioResponse 新建的情景
+    """
+    if db.query(StressScenario.id).filter(StressScenario.name == scenario.name).first():
+        raise HTTPException(status_code=400, detail="情景名称已存在")
+    if scenario.scenario_type == "historical":
+        if not scenario.index_code or not scenario.start_date or not scenario.end_date \
+                or scenario.start_date >= scenario.end_date:
+            raise HTTPException(status_code=400, detail="历史情景需要基准指数和有效的起止日期")
+    elif not scenario.factor_shocks and not scenario.symbol_shocks:
+        raise HTTPException(status_code=400, detail="因子情景至少需要一项冲击")
+
+    codes = set(scenario.factor_shocks)
+    if scenario.scenario_type == "historical":
+        codes.add(scenario.index_code)
+    found = {code for (code,) in db.query(MarketIndex.code).filter(MarketIndex.code.in_(codes)).all()}
+    if codes - found:
+        raise HTTPException(status_code=404, detail=f"指数不存在: {', '.join(sorted(codes - found))}")
+
+    db_scenario = StressScenario(**scenario.model_dump(), is_builtin=False, created_by=current_user.id)
+    db.add(db_scenario)
+    db.commit()
+    db.refresh(db_scenario)
+    return db_scenario
+
+@router.delete("/scenarios/{scenario_id}")
+def delete_scenario(
+    scenario_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    删除自定义情景及其测试结果，内置情景不可删除，仅创建者或管理员可删除。
+    """
+    scenario = db.query(StressScenario).filter(StressScenario.id == scenario_id).first()
+    if not scenario:
+        raise HTTPException(status_code=404, detail="情景不存在")
+    if scenario.is_builtin:
+        raise HTTPException(status_code=400, detail="内置情景不可删除")
+    if not current_user.is_admin and scenario.created_by != current_user.id:
+        raise HTTPException(status_code=403, detail="无权删除该情景")
+    db.query(StressTestResult).filter(StressTestResult.scenario_id == scenario_id).delete(synchronize_session=False)
+    db.delete(scenario)
+    db.commit()
+    return {"ok": True}
+
+@router.post("/runs", response_model=StressTestRunResponse)
+def run_stress_tests(
+    req: StressTestRunRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    对全部活跃组合执行压力测试（需管理员权限），覆盖测试日相同情景的已有结果。
+    - 参数: req (StressTestRunRequest): 测试日、情景与估计Beta的回看期
+    - 返回: StressTestRunResponse 各情景汇总
+    """
+    StressScenario.ensure_builtin(db)
+    if req.scenario_ids:
+        found = {scenario_id for (scenario_id,) in db.query(StressScenario.id).filter(
+            StressScenario.id.in_(req.scenario_ids)
+        ).all()}
+        if set(req.scenario_ids) - found:
+            raise HTTPException(status_code=404, detail="情景不存在")
+
+    run_date = datetime.combine((req.run_date or datetime.now()).date(), time.min)
+    summaries = stress_test_portfolios(
+        db, run_date, scenario_ids=req.scenario_ids, lookback_days=req.lookback_days, end_date=req.end_date
+    )
+    db.commit()
+    return StressTestRunResponse(run_date=run_date, scenarios=summaries)
+
+@router.get("/results", response_model=List[StressTestResultResponse])
+def get_stress_test_results(
+    run_date: Optional[datetime] = Query(None, description="测试日，默认最近一次测试"),
+    scenario_id: Optional[int] = Query(None, description="情景ID"),
+    portfolio_id: Optional[int] = Query(None, description="投资组合ID"),
+    limit: int = Query(1000, ge=1, le=100000, description="数量上限"),
+    offset: int = Query(0, ge=0, description="偏移量"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    查询压力测试结果，按情景收益从低到高排列。管理员可查询全部组合，其他用户只返回自己的组合。
+    """
+    if run_date is None:
+        run_date = db.query(func.max(StressTestResult.run_date)).scalar()
+        if run_date is None:
+            raise HTTPException(status_code=404, detail="尚未执行压力测试")
+    else:
+        run_date = datetime.combine(run_date.date(), time.min)
+
+    query = db.query(StressTestResult).filter(StressTestResult.run_date == run_date)
+    if not current_user.is_admin:
+        query = query.join(Portfolio, Portfolio.id == StressTestResult.portfolio_id).filter(
+            Portfolio.user_id == current_user.id
+        )
+    if scenario_id:
+        query = query.filter(StressTestResult.scenario_id == scenario_id)
+    if portfolio_id:
+        query = query.filter(StressTestResult.portfolio_id == portfolio_id)
+    return query.order_by(StressTestResult.portfolio_return, StressTestResult.id).offset(offset).limit(limit).all()
@@ -0,0 +1,103 @@
+"""
+组合适当性检查API路由
+按持有人画像检查全部组合的实际风险，生成合规报告
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from typing import Optional
+from collections import Counter
+from datetime import datetime, time
+
+from database import get_db
+from models import User, Portfolio, SuitabilityCheck
+from schemas.portfolio import (
+    SuitabilityRunRequest, SuitabilityRunResponse, SuitabilityCheckResponse, SuitabilityReport
+)
+from utils.auth import get_current_active_user, get_current_admin_user
+from services.suitability import check_suitability
+
+router = APIRouter(
+    prefix="/suitability",
+    tags=["suitability"],
+    responses={404: {"description": "未找到检查结果"}},
+)
+
+@router.post("/checks", response_model=SuitabilityRunResponse)
+def run_suitability_checks(
+    req: SuitabilityRunRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    对全部活跃组合执行适当性检查（需管理员权限，每日运行在收盘后自动执行），覆盖检查日的已有结果。
+    - 参数: req (SuitabilityRunRequest): 检查日、行情截止日期与回看期
+    - 返回: SuitabilityRunResponse 各状态组合数
+    """
+    run_date = datetime.combine((req.run_date or datetime.now()).date(), time.min)
+    counts = check_suitability(db, run_date, lookback_days=req.lookback_days, end_date=req.end_date)
+    db.commit()
+    return SuitabilityRunResponse(
+        run_date=run_date,
+        portfolios=counts["portfolios"],
+        passed=counts["pass"],
+        breached=counts["breach"],
+        unassessed=counts["unassessed"]
+    )
+
+@router.get("/report", response_model=SuitabilityReport)
+def get_suitability_report(
+    run_date: Optional[datetime] = Query(None, description="检查日，默认最近一次检查"),
+    status: Optional[str] = Query(None, description="只返回指定状态的明细：pass/breach/unassessed"),
+    breach: Optional[str] = Query(None, description="只返回包含指定越限项的明细"),
+    limit: int = Query(1000, ge=1, le=100000, description="明细数量上限"),
+    offset: int = Query(0, ge=0, description="明细偏移量"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    获取适当性检查报告：各状态与各越限项的组合数，以及检查明细。
+    管理员查看全量组合，其他用户只统计自己的组合。
+    """
+    def scoped(query):
+        if current_user.is_admin:
+            return query
+        return query.join(Portfolio, Portfolio.id == SuitabilityCheck.portfolio_id).filter(
+            Portfolio.user_id == current_user.id
+        )
+
+    if run_date is None:
+        run_date = db.query(func.max(SuitabilityCheck.run_date)).scalar()
+        if run_date is None:
+            raise HTTPException(status_code=404, detail="尚未执行适当性检查")
+    else:
+        run_date = datetime.combine(run_date.date(), time.min)
+    
+    status_counts = dict(scoped(db.query(SuitabilityCheck.status, func.count(SuitabilityCheck.id))).filter(
+        SuitabilityCheck.run_date == run_date
+    ).group_by(SuitabilityCheck.status).all())
+    if not status_counts:
+        raise HTTPException(status_code=404, detail="该检查日没有检查结果")
+    breach_counts = Counter(
+        name for (breaches,) in scoped(db.query(SuitabilityCheck.breaches)).filter(
+            SuitabilityCheck.run_date == run_date, SuitabilityCheck.status == "breach"
+        ).all() for name in breaches
+    )
+    
+    query = scoped(db.query(SuitabilityCheck)).filter(SuitabilityCheck.run_date == run_date)
+    if status:
+        query = query.filter(SuitabilityCheck.status == status)
+    query = query.order_by(SuitabilityCheck.portfolio_id)
+    if breach:
+        # 越限项存于JSON列，按项过滤后再分页
+        checks = [check for check in query.all() if breach in check.breaches][offset:offset + limit]
+    else:
+        checks = query.offset(offset).limit(limit).all()
+    
+    return SuitabilityReport(
+        run_date=run_date,
+        portfolios=sum(status_counts.values()),
+        status_counts=status_counts,
+        breach_counts=dict(breach_counts),
+        checks=[SuitabilityCheckResponse.model_validate(check, from_attributes=True) for check in checks]
+    )
@@ -1,9 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
 from typing import List, Optional
+from datetime import datetime
 from database import get_db
-from models.user_profile import UserProfile, RiskAssessment, InvestmentGoal
+from models.user_profile import (
+    UserProfile, RiskAssessment, InvestmentGoal, GoalPortfolioLink, QuestionnaireTemplate,
+    RiskAssessmentScoring, ProfileSegmentation, ProfileSegment
+)
 from models.user import User
+from models.portfolio import Portfolio, PortfolioNavSnapshot
+from models.ai_models import GoalProjectionEngine
+from utils.auth import get_current_active_user, get_current_admin_user
+from services.goal_projection import project_goals
+from services.questionnaire import template_scorer, publish_template, score_rows, rescore_assessments
+from services.segmentation import refresh_segmentation
 from schemas.user_profile import (
     UserProfileCreate,
     UserProfileUpdate,
@@ -12,9 +22,19 @@ from schemas.user_profile import (
     RiskAssessmentResponse,
     InvestmentGoalCreate,
     InvestmentGoalUpdate,
-    InvestmentGoalResponse
+    InvestmentGoalResponse,
+    GoalPortfolioLinkRequest,
+    GoalPortfolioLinkResponse,
+    GoalProjectionResponse,
+    QuestionnaireTemplateCreate,
+    QuestionnaireTemplateResponse,
+    QuestionnaireRescoreRequest,
+    QuestionnaireRescoreResponse,
+    SegmentRefreshRequest,
+    SegmentRefreshResponse,
+    SegmentationResponse,
+    ProfileSegmentResponse
 )
-import json
 
 router = APIRouter(prefix="/user-profile", tags=["user-profile"])
 
@@ -60,6 +80,90 @@ def create_user_profile(profile: UserProfileCreate, db: Session = Depends(get_db
         updated_at=getattr(db_profile, 'updated_at')
     )
 
+# 问卷模板相关接口（需在 /{user_id} 之前注册）
+@router.get("/questionnaire-templates", response_model=List[QuestionnaireTemplateResponse])
+def list_questionnaire_templates(code: Optional[str] = Query(None, description="模板代码"), db: Session = Depends(get_db)):
+    """获取问卷模板的全部版本（默认模板由 init_db 写入，或在首次测评时创建）"""
+    query = db.query(QuestionnaireTemplate)
+    if code:
+        query = query.filter(QuestionnaireTemplate.code == code)
+    return query.order_by(QuestionnaireTemplate.code, QuestionnaireTemplate.version).all()
+
+@router.post("/questionnaire-templates", response_model=QuestionnaireTemplateResponse, status_code=status.HTTP_201_CREATED)
+def publish_questionnaire_template(
+    template: QuestionnaireTemplateCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """发布问卷模板新版本（需管理员权限，版本号自动递增），已有测评需调用重新评分接口才会按新版本计分"""
+    try:
+        db_template = publish_template(
+            db, template.code, template.name,
+            questions=[question.model_dump() for question in template.questions],
+            bands=[band.model_dump() for band in template.bands],
+            tolerance_divisor=template.tolerance_divisor,
+            description=template.description,
+            activate=template.activate
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    db.commit()
+    db.refresh(db_template)
+    return db_template
+
+@router.post("/questionnaire-templates/{template_id}/rescore", response_model=QuestionnaireRescoreResponse)
+def rescore_risk_assessments(
+    template_id: int,
+    req: QuestionnaireRescoreRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """按指定模板版本批量重新评分同一模板代码下的全部历史测评（需管理员权限）"""
+    template = db.query(QuestionnaireTemplate).filter(QuestionnaireTemplate.id == template_id).first()
+    if not template:
+        raise HTTPException(status_code=404, detail="问卷模板不存在")
+    
+    counts = rescore_assessments(db, template, versions=req.versions, include_legacy=req.include_legacy)
+    db.commit()
+    return QuestionnaireRescoreResponse(template_id=template.id, code=template.code, version=template.version, **counts)
+
+# 客户分群相关接口（需在 /{user_id} 之前注册）
+@router.post("/segments/refresh", response_model=SegmentRefreshResponse)
+def refresh_segments(
+    req: SegmentRefreshRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """刷新客户分群（需管理员权限）：默认只归类新增或更新过的画像，变更较多或指定时全量重新分群"""
+    result = refresh_segmentation(db, n_clusters=req.n_clusters, refit=req.refit, seed=req.seed)
+    db.commit()
+    return result
+
+@router.get("/segments", response_model=SegmentationResponse)
+def get_segments(db: Session = Depends(get_db)):
+    """获取当前客户分群及各客群"""
+    segmentation = db.query(ProfileSegmentation).filter(ProfileSegmentation.is_active == True).order_by(
+        ProfileSegmentation.id.desc()
+    ).first()
+    if not segmentation:
+        raise HTTPException(status_code=404, detail="尚未进行客户分群")
+    segments = db.query(ProfileSegment).filter(ProfileSegment.segmentation_id == segmentation.id).order_by(
+        ProfileSegment.label
+    ).all()
+    return SegmentationResponse(
+        id=segmentation.id, n_clusters=segmentation.n_clusters, users=segmentation.users,
+        inertia=segmentation.inertia, incremental_updates=segmentation.incremental_updates or 0,
+        fitted_at=segmentation.fitted_at, updated_at=segmentation.updated_at,
+        segments=[
+            ProfileSegmentResponse(
+                id=segment.id, label=segment.label, name=segment.name, risk_level=segment.risk_level, size=segment.size,
+                center=dict(zip(segmentation.features, segment.center)), target_return=segment.target_return,
+                max_drawdown_tolerance=segment.max_drawdown_tolerance
+            )
+            for segment in segments
+        ]
+    )
+
 @router.get("/{user_id}", response_model=UserProfileResponse)
 def get_user_profile(user_id: int, db: Session = Depends(get_db)):
     """获取用户画像"""
@@ -129,74 +233,64 @@ def update_user_profile(user_id: int, profile_update: UserProfileUpdate, db: Ses
     )
 
 # 风险测评相关接口
+def _assessment_response(assessment: RiskAssessment, template: Optional[QuestionnaireTemplate]) -> RiskAssessmentResponse:
+    """测评记录与评分所用模板版本转换为响应模型"""
+    return RiskAssessmentResponse(
+        id=getattr(assessment, 'id'),
+        user_id=getattr(assessment, 'user_id'),
+        total_score=getattr(assessment, 'total_score'),
+        risk_level=getattr(assessment, 'risk_level'),
+        risk_tolerance=getattr(assessment, 'risk_tolerance'),
+        investment_knowledge_score=getattr(assessment, 'investment_knowledge_score'),
+        investment_experience_score=getattr(assessment, 'investment_experience_score'),
+        financial_situation_score=getattr(assessment, 'financial_situation_score'),
+        risk_attitude_score=getattr(assessment, 'risk_attitude_score'),
+        investment_horizon_score=getattr(assessment, 'investment_horizon_score'),
+        answers=getattr(assessment, 'answers'),
+        assessment_date=getattr(assessment, 'assessment_date'),
+        template_code=template.code if template is not None else None,
+        template_version=template.version if template is not None else None
+    )
+
 @router.post("/risk-assessment", response_model=RiskAssessmentResponse, status_code=status.HTTP_201_CREATED)
 def create_risk_assessment(assessment: RiskAssessmentCreate, db: Session = Depends(get_db)):
-    """创建风险测评记录"""
+    """创建风险测评记录，按问卷模板在服务端计算总分、各维度得分、风险等级与风险承受能力"""
     # 验证用户是否存在
     user = db.query(User).filter(User.id == assessment.user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="用户不存在")
     
-    # 计算风险等级
-    risk_level = calculate_risk_level(assessment.total_score)
-    risk_tolerance = calculate_risk_tolerance(assessment.total_score)
+    template = QuestionnaireTemplate.resolve(db, assessment.template_code, assessment.template_version)
+    if not template:
+        raise HTTPException(status_code=404, detail="问卷模板不存在")
+    result = template_scorer(template).score([assessment.answers])
+    if result["invalid"][0]:
+        raise HTTPException(status_code=400, detail=f"问卷答案无效，未作答或选项无效的题目: {', '.join(result['invalid'][0])}")
     
     # 创建风险测评记录
     db_assessment = RiskAssessment(
         user_id=assessment.user_id,
-        total_score=assessment.total_score,
-        risk_level=risk_level,
-        risk_tolerance=risk_tolerance,
-        investment_knowledge_score=assessment.investment_knowledge_score,
-        investment_experience_score=assessment.investment_experience_score,
-        financial_situation_score=assessment.financial_situation_score,
-        risk_attitude_score=assessment.risk_attitude_score,
-        investment_horizon_score=assessment.investment_horizon_score,
-        answers=json.dumps(assessment.answers) if assessment.answers else None
+        answers=assessment.answers,
+        **score_rows(result)[0]
     )
-    
     db.add(db_assessment)
+    db.flush()
+    db.add(RiskAssessmentScoring(assessment_id=db_assessment.id, template_id=template.id))
     db.commit()
     db.refresh(db_assessment)
     
-    return RiskAssessmentResponse(
-        id=getattr(db_assessment, 'id'),
-        user_id=getattr(db_assessment, 'user_id'),
-        total_score=getattr(db_assessment, 'total_score'),
-        risk_level=getattr(db_assessment, 'risk_level'),
-        risk_tolerance=getattr(db_assessment, 'risk_tolerance'),
-        investment_knowledge_score=getattr(db_assessment, 'investment_knowledge_score'),
-        investment_experience_score=getattr(db_assessment, 'investment_experience_score'),
-        financial_situation_score=getattr(db_assessment, 'financial_situation_score'),
-        risk_attitude_score=getattr(db_assessment, 'risk_attitude_score'),
-        investment_horizon_score=getattr(db_assessment, 'investment_horizon_score'),
-        answers=json.loads(getattr(db_assessment, 'answers')) if getattr(db_assessment, 'answers') else None,
-        assessment_date=getattr(db_assessment, 'assessment_date')
-    )
+    return _assessment_response(db_assessment, template)
 
 @router.get("/risk-assessment/{user_id}", response_model=List[RiskAssessmentResponse])
 def get_user_risk_assessments(user_id: int, db: Session = Depends(get_db)):
     """获取用户的风险测评记录"""
-    assessments = db.query(RiskAssessment).filter(RiskAssessment.user_id == user_id).order_by(RiskAssessment.assessment_date.desc()).all()
+    rows = db.query(RiskAssessment, QuestionnaireTemplate).outerjoin(
+        RiskAssessmentScoring, RiskAssessmentScoring.assessment_id == RiskAssessment.id
+    ).outerjoin(
+        QuestionnaireTemplate, QuestionnaireTemplate.id == RiskAssessmentScoring.template_id
+    ).filter(RiskAssessment.user_id == user_id).order_by(RiskAssessment.assessment_date.desc()).all()
     
-    result = []
-    for assessment in assessments:
-        result.append(RiskAssessmentResponse(
-            id=getattr(assessment, 'id'),
-            user_id=getattr(assessment, 'user_id'),
-            total_score=getattr(assessment, 'total_score'),
-            risk_level=getattr(assessment, 'risk_level'),
-            risk_tolerance=getattr(assessment, 'risk_tolerance'),
-            investment_knowledge_score=getattr(assessment, 'investment_knowledge_score'),
-            investment_experience_score=getattr(assessment, 'investment_experience_score'),
-            financial_situation_score=getattr(assessment, 'financial_situation_score'),
-            risk_attitude_score=getattr(assessment, 'risk_attitude_score'),
-            investment_horizon_score=getattr(assessment, 'investment_horizon_score'),
-            answers=json.loads(getattr(assessment, 'answers')) if getattr(assessment, 'answers') else None,
-            assessment_date=getattr(assessment, 'assessment_date')
-        ))
-    
-    return result
+    return [_assessment_response(assessment, template) for assessment, template in rows]
 
 # 投资目标相关接口
 @router.post("/investment-goals", response_model=InvestmentGoalResponse, status_code=status.HTTP_201_CREATED)
@@ -279,19 +373,54 @@ def update_investment_goal(goal_id: int, goal_update: InvestmentGoalUpdate, db:
         updated_at=getattr(db_goal, 'updated_at')
     )
 
-# 辅助函数
-def calculate_risk_level(total_score: int) -> str:
-    """根据总分计算风险等级"""
-    if total_score <= 20:
-        return "保守"
-    elif total_score <= 40:
-        return "稳健"
-    elif total_score <= 60:
-        return "积极"
-    else:
-        return "激进"
+@router.put("/investment-goals/{goal_id}/portfolio", response_model=GoalPortfolioLinkResponse)
+def link_goal_portfolio(goal_id: int, link: GoalPortfolioLinkRequest, db: Session = Depends(get_db)):
+    """关联投资目标与投资组合（已关联则覆盖），当前金额以组合最新净值日为估值日"""
+    goal = db.query(InvestmentGoal).filter(InvestmentGoal.id == goal_id).first()
+    if not goal:
+        raise HTTPException(status_code=404, detail="投资目标不存在")
+    portfolio = db.query(Portfolio).filter(Portfolio.id == link.portfolio_id).first()
+    if not portfolio:
+        raise HTTPException(status_code=404, detail="投资组合不存在")
+    if portfolio.user_id != goal.user_id:
+        raise HTTPException(status_code=400, detail="投资组合不属于该目标的用户")
+    
+    db_link = db.query(GoalPortfolioLink).filter(GoalPortfolioLink.goal_id == goal_id).first()
+    if not db_link:
+        db_link = GoalPortfolioLink(goal_id=goal_id)
+        db.add(db_link)
+    for field, value in link.model_dump().items():
+        setattr(db_link, field, value)
+    snapshot = PortfolioNavSnapshot.latest(db, [link.portfolio_id]).get(link.portfolio_id)
+    db_link.valued_at = snapshot.date if snapshot is not None else None
+    if goal.target_amount:
+        goal.progress = min(100.0, link.current_amount / goal.target_amount * 100)
+    
+    db.commit()
+    db.refresh(db_link)
+    return db_link
 
-def calculate_risk_tolerance(total_score: int) -> float:
-    """根据总分计算风险承受能力 (1-10)"""
-    # 将总分映射到1-10的风险承受能力
-    return min(10.0, max(1.0, total_score / 10.0)) 
\ No newline at end of file
+@router.get("/investment-goals/{user_id}/projections", response_model=GoalProjectionResponse)
+def get_goal_projections(
+    user_id: int,
+    paths: int = Query(GoalProjectionEngine.DEFAULT_PATHS, ge=100, le=20000, description="模拟路径数"),
+    seed: Optional[int] = Query(None, description="随机种子"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    蒙特卡洛预测用户全部活跃目标的达成概率与价值分位数（同一次模拟覆盖全部目标）。
+    只能预测自己的目标（管理员除外）；路径数×最长预测月数超过引擎上限时返回400。
+    """
+    if user_id != current_user.id and not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="无权查看该用户的目标预测")
+    user = db.query(User).filter(User.id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="用户不存在")
+    
+    run_date = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    try:
+        goals = project_goals(db, run_date, user_id=user_id, paths=paths, seed=seed)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return GoalProjectionResponse(user_id=user_id, run_date=run_date, paths=paths, goals=goals)
@@ -114,6 +114,42 @@ class PriceHistoryResponse(PriceHistoryBase):
         from_attributes = True
 
 
+class PriceHistoryBulkItem(PriceHistoryBase):
+    """批量导入的单条价格数据Schema（按证券代码关联）"""
+    symbol: str = Field(..., min_length=1, max_length=20, description="证券代码")
+
+
+class PriceHistoryBulkCreate(BaseModel):
+    """批量导入价格历史Schema"""
+    bars: List[PriceHistoryBulkItem] = Field(..., min_length=1, description="价格数据列表")
+    refresh_aggregates: bool = Field(default=True, description="是否增量更新行业/板块聚合指数")
+
+
+class PriceHistoryBulkResponse(BaseModel):
+    """批量导入价格历史响应Schema"""
+    inserted: int = Field(..., description="新增条数")
+    updated: int = Field(..., description="更新条数")
+    unknown_symbols: List[str] = Field(default_factory=list, description="未找到的证券代码")
+    aggregate_rows: int = Field(0, description="重新计算的聚合指数行数")
+
+
+class IndustryAggregateResponse(BaseModel):
+    """行业/板块聚合指数响应Schema"""
+    group_type: str = Field(..., description="分组类型：industry(行业)/sector(板块)")
+    group_name: str = Field(..., description="行业或板块名称")
+    date: datetime = Field(..., description="交易日期")
+    index_level: Optional[float] = Field(None, description="市值加权指数点位（基点1000）")
+    daily_return: Optional[float] = Field(None, description="当日市值加权收益")
+    market_cap: Optional[float] = Field(None, description="成分股总市值")
+    turnover: Optional[float] = Field(None, description="成交额")
+    signed_turnover: Optional[float] = Field(None, description="按涨跌方向计的成交额")
+    advancers: Optional[int] = Field(None, description="上涨家数")
+    constituents: Optional[int] = Field(None, description="当日有行情的成分股数量")
+
+    class Config:
+        from_attributes = True
+
+
 # MarketIndex Schemas
 class MarketIndexBase(BaseModel):
     """市场指数基础Schema"""
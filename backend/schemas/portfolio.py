@@ -2,7 +2,7 @@
 投资组合相关的Pydantic模型
 用于API请求和响应的数据验证
 """
-from typing import List, Optional, TYPE_CHECKING
+from typing import Dict, List, Optional, TYPE_CHECKING
 from datetime import datetime
 from pydantic import BaseModel, Field, validator
 
@@ -121,6 +121,84 @@ class PortfolioUpdate(BaseModel):
         return v
 
 
+class PortfolioPerformance(BaseModel):
+    """
+    投资组合业绩模型。
+    取自最近一条净值快照。
+    """
+    date: datetime = Field(..., description="净值日期")
+    nav: float = Field(..., description="单位净值")
+    daily_return: float = Field(..., description="当日收益")
+    cumulative_return: float = Field(..., description="累计收益")
+    coverage: float = Field(..., description="有可用行情的权重占比")
+
+    class Config:
+        orm_mode = True
+
+
+class PortfolioNavSnapshotResponse(PortfolioPerformance):
+    """
+    组合净值快照响应模型。
+    在业绩字段基础上包含各资产收益贡献。
+    """
+    id: int
+    portfolio_id: int
+    contributions: Dict[str, float] = Field({}, description="各资产收益贡献")
+
+    class Config:
+        orm_mode = True
+
+
+class PortfolioValuationRequest(BaseModel):
+    """
+    组合估值请求模型。
+    增量计算当前用户全部组合的净值快照。
+    """
+    end_date: Optional[datetime] = Field(None, description="估值截止日期，默认最新交易日")
+    start_date: Optional[datetime] = Field(None, description="尚无快照的组合的起始日期，默认截止日期当天")
+
+
+class PortfolioValuationResponse(BaseModel):
+    """
+    组合估值响应模型。
+    """
+    portfolios: int = Field(..., description="写入快照的组合数")
+    snapshots: int = Field(..., description="写入的快照条数")
+
+
+class AssetRiskContribution(BaseModel):
+    """
+    资产风险贡献模型。
+    """
+    code: str = Field(..., description="资产代码")
+    weight: float = Field(..., description="权重（小数）")
+    marginal_risk: float = Field(..., description="边际风险（组合波动率对权重的偏导）")
+    risk_contribution: float = Field(..., description="风险贡献占组合方差的比例")
+
+
+class PortfolioRiskResponse(BaseModel):
+    """
+    投资组合风险分析响应模型。
+    VaR/CVaR以组合市值的损失比例表示（正数）。
+    """
+    portfolio_id: int
+    as_of: Optional[datetime] = Field(None, description="行情截止日期")
+    observations: int = Field(..., description="日收益观测数")
+    confidence: float = Field(..., description="置信水平")
+    horizon_days: int = Field(..., description="持有期（交易日）")
+    volatility: float = Field(..., description="年化波动率")
+    historical_var: float = Field(..., description="历史法VaR")
+    historical_cvar: float = Field(..., description="历史法CVaR")
+    parametric_var: float = Field(..., description="参数法VaR")
+    parametric_cvar: float = Field(..., description="参数法CVaR")
+    max_drawdown: float = Field(..., description="回看期内最大回撤")
+    beta: Optional[float] = Field(None, description="相对基准指数的Beta")
+    benchmark: Optional[str] = Field(None, description="基准指数代码")
+    coverage: float = Field(..., description="参与计算的持仓权重占比")
+    risk_contributions: List[AssetRiskContribution] = Field([], description="各资产风险贡献")
+    excluded: List[str] = Field([], description="缺少行情未参与计算的资产代码")
+
+
 class PortfolioResponse(PortfolioBase):
     """
     投资组合响应模型。
@@ -132,6 +210,273 @@ class PortfolioResponse(PortfolioBase):
     updated_at: datetime
     is_active: bool
     portfolio_assets: List[PortfolioAssetResponse] = []
+    performance: Optional[PortfolioPerformance] = Field(None, description="最近一次净值快照的业绩")
+
+    class Config:
+        orm_mode = True 
+
+class PortfolioWhatIfRequest(BaseModel):
+    """
+    组合调整试算请求模型。
+    只计算不保存，建议权重与 PUT /portfolios/{id}/assets 的格式一致。
+    """
+    assets: List[PortfolioAssetCreate] = Field(..., description="建议的资产及权重")
+    lookback_days: int = Field(252, ge=20, le=1260, description="回看交易日数")
+    confidence: float = Field(0.95, gt=0.5, lt=1, description="VaR置信水平")
+    horizon_days: int = Field(1, ge=1, le=250, description="持有期（交易日）")
+    end_date: Optional[datetime] = Field(None, description="行情截止日期，默认最新")
+    cost_rate: float = Field(0.001, ge=0, le=0.05, description="单边交易成本率（佣金、印花税与冲击成本合计）")
+    portfolio_value: Optional[float] = Field(None, gt=0, description="组合市值，提供时返回成本金额")
+
+
+class WhatIfMetrics(BaseModel):
+    """
+    试算风险收益指标模型。
+    VaR/CVaR以组合市值的损失比例表示（正数）。
+    """
+    expected_return: float = Field(..., description="按历史平均收益估计的年化收益")
+    volatility: float = Field(..., description="年化波动率")
+    historical_var: float = Field(..., description="历史法VaR")
+    historical_cvar: float = Field(..., description="历史法CVaR")
+    parametric_var: float = Field(..., description="参数法VaR")
+    parametric_cvar: float = Field(..., description="参数法CVaR")
+    max_drawdown: float = Field(..., description="回看期内按该权重回测的最大回撤")
+
+
+class WhatIfAssetChange(BaseModel):
+    """
+    单个资产的权重变化模型（小数）。
+    """
+    code: str = Field(..., description="资产代码")
+    current_weight: float = Field(..., description="当前权重")
+    proposed_weight: float = Field(..., description="建议权重")
+    change: float = Field(..., description="权重变化")
+
+
+class PortfolioWhatIfResponse(BaseModel):
+    """
+    组合调整试算响应模型。
+    """
+    portfolio_id: int
+    current: WhatIfMetrics = Field(..., description="当前持仓指标")
+    proposed: WhatIfMetrics = Field(..., description="建议权重指标")
+    turnover: float = Field(..., description="单边换手率")
+    estimated_cost: float = Field(..., description="交易成本占组合市值的比例")
+    estimated_cost_amount: Optional[float] = Field(None, description="交易成本金额")
+    changes: List[WhatIfAssetChange] = Field([], description="各资产权重变化")
+    excluded: List[str] = Field([], description="缺少行情未计入风险收益指标的资产代码")
+
+
+class SuitabilityRunRequest(BaseModel):
+    """
+    适当性检查请求模型。
+    """
+    run_date: Optional[datetime] = Field(None, description="检查日，默认当天")
+    end_date: Optional[datetime] = Field(None, description="行情截止日期，默认最新")
+    lookback_days: int = Field(252, ge=20, le=1260, description="计算实际风险的回看交易日数")
+
+
+class SuitabilityRunResponse(BaseModel):
+    """
+    适当性检查执行结果模型。
+    """
+    run_date: datetime
+    portfolios: int = Field(..., description="检查的组合数")
+    passed: int = Field(..., description="通过的组合数")
+    breached: int = Field(..., description="存在越限项的组合数")
+    unassessed: int = Field(..., description="持有人没有画像、无法完整评估的组合数")
+
+
+class SuitabilityCheckResponse(BaseModel):
+    """
+    单个组合的适当性检查结果模型。
+    """
+    id: int
+    run_date: datetime
+    portfolio_id: int
+    user_id: int
+    risk_level: int = Field(..., description="组合风险等级")
+    allowed_risk_level: Optional[int] = Field(None, description="风险承受评分允许的最高风险等级")
+    volatility: float = Field(..., description="年化波动率")
+    max_drawdown: float = Field(..., description="回看期最大回撤")
+    expected_drawdown: float = Field(..., description="由波动率推算的预期回撤")
+    drawdown_tolerance: Optional[float] = Field(None, description="最大回撤容忍度")
+    illiquid_weight: float = Field(..., description="非上市资产权重")
+    liquidity_needs: Optional[str] = Field(None, description="流动性需求")
+    status: str = Field(..., description="检查状态：pass/breach/unassessed")
+    breaches: List[str] = Field([], description="越限项：risk_level/volatility/drawdown/liquidity")
+
+    class Config:
+        orm_mode = True
+
+
+class SuitabilityReport(BaseModel):
+    """
+    全量适当性检查报告模型。
+    """
+    run_date: datetime
+    portfolios: int = Field(..., description="检查的组合数")
+    status_counts: Dict[str, int] = Field({}, description="各状态组合数")
+    breach_counts: Dict[str, int] = Field({}, description="各越限项组合数")
+    checks: List[SuitabilityCheckResponse] = Field([], description="检查明细")
+
+
+class StressScenarioCreate(BaseModel):
+    """
+    自定义压力测试情景请求模型。
+    """
+    name: str = Field(..., min_length=1, max_length=100, description="情景名称")
+    description: Optional[str] = Field(None, max_length=500, description="情景描述")
+    scenario_type: str = Field("factor", description="情景类型：historical（历史重放）/factor（因子冲击）")
+    index_code: Optional[str] = Field(None, description="历史情景的基准指数代码")
+    start_date: Optional[datetime] = Field(None, description="历史区间起点")
+    end_date: Optional[datetime] = Field(None, description="历史区间终点")
+    factor_shocks: Dict[str, float] = Field({}, description="指数代码 -> 区间收益冲击（小数）")
+    symbol_shocks: Dict[str, float] = Field({}, description="标的代码 -> 区间收益冲击（小数），优先于其他来源")
+
+    @validator('scenario_type')
+    def check_scenario_type(cls, v):
+        """验证情景类型"""
+        if v not in ("historical", "factor"):
+            raise ValueError('情景类型必须为 historical 或 factor')
+        return v
+
+    @validator('factor_shocks', 'symbol_shocks')
+    def check_shocks(cls, v):
+        """验证冲击不低于-100%"""
+        if any(shock < -1 for shock in v.values()):
+            raise ValueError('冲击不能低于-100%')
+        return v
+
+
+class StressScenarioResponse(StressScenarioCreate):
+    """
+    压力测试情景响应模型。
+    """
+    id: int
+    is_builtin: bool = Field(..., description="是否内置历史情景")
+    created_by: Optional[int] = None
+    created_at: datetime
+
+    class Config:
+        orm_mode = True
+
+
+class StressTestRunRequest(BaseModel):
+    """
+    压力测试请求模型。
+    """
+    run_date: Optional[datetime] = Field(None, description="测试日，默认当天")
+    end_date: Optional[datetime] = Field(None, description="估计Beta的行情截止日期，默认最新")
+    lookback_days: int = Field(252, ge=20, le=1260, description="估计Beta的回看交易日数")
+    scenario_ids: Optional[List[int]] = Field(None, description="参与测试的情景，默认全部")
+
+
+class StressScenarioSummary(BaseModel):
+    """
+    单个情景的压力测试汇总模型。
+    """
+    scenario_id: int
+    name: str
+    status: str = Field(..., description="completed/skipped")
+    reason: Optional[str] = Field(None, description="跳过原因")
+    index_return: Optional[float] = Field(None, description="历史情景基准指数的区间收益")
+    portfolios: int = Field(0, description="测试的组合数")
+    mean_return: Optional[float] = Field(None, description="组合平均情景收益")
+    worst_return: Optional[float] = Field(None, description="组合最差情景收益")
+    mean_coverage: Optional[float] = Field(None, description="有冲击的持仓权重均值")
+
+
+class StressTestRunResponse(BaseModel):
+    """
+    压力测试执行结果模型。
+    """
+    run_date: datetime
+    scenarios: List[StressScenarioSummary] = Field([], description="各情景汇总")
+
+
+class StressTestResultResponse(BaseModel):
+    """
+    单个组合在单个情景下的压力测试结果模型。
+    """
+    id: int
+    run_date: datetime
+    scenario_id: int
+    portfolio_id: int
+    user_id: int
+    portfolio_return: float = Field(..., description="情景收益")
+    coverage: float = Field(..., description="有冲击的持仓权重")
+    worst_symbol: Optional[str] = Field(None, description="亏损贡献最大的标的")
+    worst_contribution: float = Field(..., description="该标的的亏损贡献")
+
+    class Config:
+        orm_mode = True
+
+
+class ModelPortfolioCreate(PortfolioBase):
+    """
+    创建模型组合的请求模型。
+    目标权重合计不超过100%，不足部分视为现金。
+    """
+    assets: List[PortfolioAssetCreate] = Field([], description="目标资产及权重")
+
+
+class ModelPortfolioAssetResponse(PortfolioAssetBase):
+    """
+    模型组合目标权重响应模型。
+    """
+    asset: AssetResponse
+
+    class Config:
+        orm_mode = True
+
+
+class ModelPortfolioResponse(PortfolioBase):
+    """
+    模型组合响应模型。
+    包含目标权重与关联的客户组合数。
+    """
+    id: int
+    is_active: bool
+    created_at: datetime
+    updated_at: datetime
+    model_assets: List[ModelPortfolioAssetResponse] = []
+    portfolios: int = Field(0, description="关联的客户组合数")
 
     class Config:
-        orm_mode = True 
\ No newline at end of file
+        orm_mode = True
+
+
+class ModelPortfolioLinkRequest(BaseModel):
+    """
+    关联客户组合到模型组合的请求模型。
+    """
+    portfolio_ids: List[int] = Field(..., min_length=1, description="客户组合ID")
+    keep_weights: bool = Field(False, description="是否将现有持仓与模型权重之差保存为偏离（关联后持仓不变）")
+
+
+class PortfolioWeightOverrideItem(BaseModel):
+    """
+    单个资产相对模型组合的权重偏离。
+    """
+    asset_id: int = Field(..., description="资产ID")
+    weight_delta: float = Field(..., ge=-100, le=100, description="权重偏离（百分点），正数加仓、负数减仓")
+
+
+class PortfolioWeightOverrideResponse(PortfolioWeightOverrideItem):
+    """
+    权重偏离响应模型。
+    """
+    portfolio_id: int
+
+    class Config:
+        orm_mode = True
+
+
+class ModelPortfolioFanOutResponse(BaseModel):
+    """
+    模型组合下发结果模型。
+    """
+    portfolios: int = Field(..., description="重写持仓的客户组合数")
+    variants: int = Field(..., description="去重后计算的 (模型, 偏离) 组合数")
+    holdings: int = Field(..., description="写入的持仓行数")
@@ -2,8 +2,8 @@
 AI投资策略引擎Schema
 定义API请求和响应的数据结构
 """
-from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
+from pydantic import BaseModel, Field, PositiveFloat, PositiveInt
+from typing import Optional, List, Dict, Any, Literal
 from datetime import datetime
 from enum import Enum
 
@@ -119,6 +119,34 @@ class StrategySignalResponse(StrategySignalBase):
         from_attributes = True
 
 
+class SignalFanoutRequest(BaseModel):
+    """将模型输出批量展开为逐标的策略信号的请求"""
+    source_type: Literal["macro_timing", "sector_rotation", "multi_factor"] = Field(..., description="模型输出类型")
+    source_ids: List[int] = Field(..., min_length=1, max_length=1000, description="模型输出ID列表")
+    strategy_id: Optional[int] = Field(None, description="策略ID，缺省使用模型输出关联的策略")
+    top_n: int = Field(50, ge=1, le=5000, description="多因子：买入排名前N的股票")
+    bottom_n: int = Field(0, ge=0, le=5000, description="多因子：卖出排名后N的股票")
+    weighting: Literal["equal", "score"] = Field("equal", description="多因子：买入标的等权或按评分加权")
+    per_industry: Optional[int] = Field(None, ge=1, description="行业轮动：每个行业按市值取前N只成分股，缺省为全部")
+    instrument_map: Optional[Dict[str, List[str]]] = Field(None, description="宏观择时：资产类别到标的代码的映射")
+    replace: bool = Field(False, description="模型输出已展开过时，是否删除旧信号后重新生成")
+
+
+class SignalFanoutSourceResult(BaseModel):
+    """单个模型输出的展开结果"""
+    source_id: int = Field(..., description="模型输出ID")
+    signal_count: int = Field(..., description="生成的策略信号数量")
+    derived_signal_id: Optional[int] = Field(None, description="回写到模型输出的首个策略信号ID")
+
+
+class SignalFanoutResponse(BaseModel):
+    """策略信号批量展开结果"""
+    created: int = Field(..., description="生成的策略信号总数")
+    replaced: int = Field(0, description="删除的旧信号数量")
+    sources: List[SignalFanoutSourceResult] = Field(..., description="各模型输出的展开结果")
+    unknown_symbols: List[str] = Field(default=[], description="市场数据中不存在的标的代码")
+
+
 # BacktestResult Schemas
 class BacktestResultBase(BaseModel):
     """回测结果基础Schema"""
@@ -286,6 +314,43 @@ class FactorModelResponse(FactorModelBase):
         from_attributes = True
 
 
+# RiskModel Schemas
+class RiskModelBuildRequest(BaseModel):
+    """风险模型估计请求Schema"""
+    dates: List[datetime] = Field(..., min_length=2, description="估计窗口内的交易日期(T)")
+    symbols: List[str] = Field(..., min_length=1, description="证券代码列表(N)")
+    exposures: List[List[List[float]]] = Field(..., description="因子暴露张量(T×N×K)，K与因子模型的因子列表一致")
+    returns: List[List[Optional[float]]] = Field(..., description="个股收益矩阵(T×N)，缺失为null")
+    regression_weights: Optional[List[float]] = Field(None, description="截面回归权重(N)，如市值平方根")
+    half_life: Optional[int] = Field(None, ge=1, description="因子协方差EWMA半衰期，缺省取模型参数")
+    newey_west_lags: Optional[int] = Field(None, ge=0, description="Newey-West滞后阶数，缺省取模型参数")
+    specific_half_life: Optional[int] = Field(None, ge=1, description="特异方差EWMA半衰期，缺省取模型参数")
+
+
+class RiskModelSummary(BaseModel):
+    """风险模型版本摘要Schema"""
+    id: int = Field(..., description="风险模型ID")
+    factor_model_id: int = Field(..., description="因子模型ID")
+    version: int = Field(..., description="版本号")
+    factors: List[str] = Field(..., description="因子列表")
+    start_date: Optional[datetime] = Field(None, description="估计窗口开始日期")
+    end_date: Optional[datetime] = Field(None, description="估计窗口结束日期")
+    parameters: Optional[Dict[str, Any]] = Field(None, description="估计参数")
+    model_version: Optional[str] = Field(None, description="模型版本")
+    created_at: datetime = Field(..., description="创建时间")
+
+    class Config:
+        from_attributes = True
+
+
+class RiskModelResponse(RiskModelSummary):
+    """风险模型版本详情Schema"""
+    symbols: List[str] = Field(..., description="证券代码列表")
+    factor_returns: Optional[List[List[float]]] = Field(None, description="因子收益矩阵(T×K)")
+    factor_covariance: List[List[float]] = Field(..., description="因子协方差矩阵(K×K)")
+    specific_variance: List[Optional[float]] = Field(..., description="个股特异方差(N)")
+
+
 # MarketRegime Schemas
 class MarketRegimeBase(BaseModel):
     """市场状态基础Schema"""
@@ -327,6 +392,218 @@ class MarketRegimeResponse(MarketRegimeBase):
         from_attributes = True
 
 
+class RegimeDetectionRequest(BaseModel):
+    """指数市场状态识别请求"""
+    index_code: str = Field(..., description="指数代码")
+    n_states: int = Field(3, ge=2, le=4, description="隐状态数量")
+    vol_window: int = Field(20, ge=5, le=120, description="滚动波动率窗口（交易日）")
+    start_date: Optional[datetime] = Field(None, description="拟合起始日期")
+    end_date: Optional[datetime] = Field(None, description="拟合截止日期")
+    max_iter: int = Field(100, ge=1, le=500, description="EM最大迭代次数")
+    include_path: bool = Field(False, description="是否返回逐日状态路径")
+
+
+class RegimePathPoint(BaseModel):
+    """单个交易日的滤波状态"""
+    date: datetime = Field(..., description="交易日期")
+    regime_name: str = Field(..., description="最可能的市场状态")
+    probabilities: Dict[str, float] = Field(..., description="各状态滤波概率")
+
+
+class RegimeDetectionResponse(BaseModel):
+    """指数市场状态识别结果"""
+    index_code: str = Field(..., description="指数代码")
+    n_states: int = Field(..., description="隐状态数量")
+    log_likelihood: Optional[float] = Field(None, description="拟合对数似然")
+    iterations: Optional[int] = Field(None, description="EM迭代次数（仅拟合时返回）")
+    converged: Optional[bool] = Field(None, description="是否收敛（仅拟合时返回）")
+    new_days: int = Field(..., description="本次处理的交易日数")
+    last_date: datetime = Field(..., description="最新交易日")
+    current_regime: str = Field(..., description="当前市场状态")
+    current_probabilities: Dict[str, float] = Field(..., description="当前各状态滤波概率")
+    transition_matrix: Dict[str, Dict[str, float]] = Field(..., description="状态转移矩阵")
+    regimes: List[MarketRegimeResponse] = Field(..., description="写入的市场状态")
+    path: List[RegimePathPoint] = Field(default=[], description="逐日状态路径")
+
+
+# 每日策略运行 Schemas
+class DailyRunRequest(BaseModel):
+    """触发每日策略运行请求"""
+    run_date: Optional[datetime] = Field(None, description="运行日期，缺省为当天")
+    strategy_ids: Optional[List[int]] = Field(None, description="只运行指定策略，缺省为全部活跃策略")
+    max_workers: Optional[int] = Field(None, ge=1, le=32, description="并行运行的策略数，缺省使用配置")
+
+
+class StrategyRunStepResponse(BaseModel):
+    """每日运行步骤记录"""
+    id: int = Field(..., description="记录ID")
+    run_date: datetime = Field(..., description="运行日期")
+    scope: str = Field(..., description="步骤范围：market 或 strategy:<id>")
+    strategy_id: Optional[int] = Field(None, description="策略ID")
+    step: str = Field(..., description="步骤名称")
+    status: str = Field(..., description="状态：pending/running/success/skipped/failed")
+    attempts: int = Field(..., description="执行次数")
+    started_at: Optional[datetime] = Field(None, description="开始时间")
+    finished_at: Optional[datetime] = Field(None, description="结束时间")
+    duration_ms: Optional[float] = Field(None, description="耗时(毫秒)")
+    output: Optional[Dict[str, Any]] = Field(None, description="步骤输出摘要")
+    error: Optional[str] = Field(None, description="错误信息")
+
+    class Config:
+        from_attributes = True
+
+
+class DailyRunAcceptedResponse(BaseModel):
+    """已受理的每日策略运行（后台执行）"""
+    run_date: datetime = Field(..., description="运行日期")
+    strategy_ids: Optional[List[int]] = Field(None, description="只运行的策略，为空表示全部活跃策略")
+
+
+class DailyRunResponse(BaseModel):
+    """每日策略运行结果"""
+    run_date: datetime = Field(..., description="运行日期")
+    strategies: int = Field(..., description="参与运行的策略数")
+    elapsed_seconds: float = Field(..., description="本次运行耗时(秒)")
+    window_minutes: int = Field(..., description="要求完成的时间窗口(分钟)")
+    within_window: bool = Field(..., description="是否在时间窗口内完成")
+    status_counts: Dict[str, int] = Field(..., description="各状态的步骤数")
+    steps: List[StrategyRunStepResponse] = Field(..., description="步骤记录")
+
+
+# 组合再平衡 Schemas
+class RebalanceRequest(BaseModel):
+    """组合再平衡请求"""
+    strategy_id: int = Field(..., description="策略ID")
+    portfolio_ids: Optional[List[int]] = Field(None, description="只处理指定组合，缺省为策略下全部未执行配置的组合")
+    portfolio_values: Dict[int, PositiveFloat] = Field(default={}, description="各组合市值")
+    default_portfolio_value: float = Field(1_000_000.0, gt=0, description="未指定市值的组合按此市值计算")
+    tolerance: float = Field(0.0, ge=0, le=1, description="绝对容忍带，偏离不超过该值的标的不调仓")
+    relative_tolerance: float = Field(0.0, ge=0, le=1, description="相对容忍带（目标权重的比例）")
+    max_turnover: Optional[float] = Field(None, gt=0, le=1, description="单个组合单边换手率上限")
+    min_trade_value: float = Field(0.0, ge=0, description="最小交易金额，低于该金额的指令不下发")
+    trade_to: Literal["target", "band"] = Field("target", description="触发调仓后调至目标权重或容忍带边缘")
+    lot_sizes: Dict[str, PositiveInt] = Field(default={}, description="按证券代码覆盖最小交易单位")
+    dry_run: bool = Field(False, description="只计算不保存指令")
+
+
+class RebalanceOrderResponse(BaseModel):
+    """调仓指令"""
+    id: Optional[int] = Field(None, description="指令ID，试算时为空")
+    allocation_id: int = Field(..., description="组合配置ID")
+    portfolio_id: int = Field(..., description="投资组合ID")
+    symbol: str = Field(..., description="证券代码")
+    side: str = Field(..., description="方向：BUY/SELL")
+    quantity: float = Field(..., description="数量")
+    price: float = Field(..., description="参考价格")
+    amount: float = Field(..., description="参考金额")
+    current_weight: Optional[float] = Field(None, description="调仓前权重")
+    target_weight: Optional[float] = Field(None, description="目标权重")
+    post_trade_weight: Optional[float] = Field(None, description="调仓后权重")
+    status: str = Field("pending", description="状态")
+
+    class Config:
+        from_attributes = True
+
+
+class RebalancePortfolioSummary(BaseModel):
+    """单个组合的调仓摘要"""
+    portfolio_id: int = Field(..., description="投资组合ID")
+    allocation_id: int = Field(..., description="组合配置ID")
+    portfolio_value: float = Field(..., description="组合市值")
+    orders: int = Field(..., description="指令数")
+    breaches: int = Field(..., description="超出容忍带的标的数")
+    turnover: float = Field(..., description="单边换手率")
+    cash_weight: float = Field(..., description="调仓后现金权重")
+
+
+class RebalanceResponse(BaseModel):
+    """组合再平衡结果"""
+    strategy_id: int = Field(..., description="策略ID")
+    portfolios: List[RebalancePortfolioSummary] = Field(..., description="各组合调仓摘要")
+    orders: List[RebalanceOrderResponse] = Field(..., description="调仓指令")
+    unpriced_symbols: List[str] = Field(default=[], description="无行情价格、未生成指令的标的")
+    dry_run: bool = Field(..., description="是否为试算")
+
+
+# 组合优化 Schemas
+class OptimizationRequest(BaseModel):
+    """组合优化请求"""
+    symbols: List[str] = Field(..., min_length=2, description="候选资产代码")
+    method: Literal["mean_variance", "min_variance", "risk_parity", "max_diversification"] = Field(
+        "min_variance", description="优化方法"
+    )
+    lookback_days: int = Field(252, ge=20, le=2520, description="估计协方差使用的交易日数")
+    end_date: Optional[datetime] = Field(None, description="估计截止日期，缺省为最新行情")
+    expected_returns: Optional[Dict[str, float]] = Field(None, description="年化预期收益，缺省使用历史均值")
+    risk_aversion: float = Field(1.0, gt=0, description="风险厌恶系数（均值-方差）")
+    target_return: Optional[float] = Field(None, description="最低年化预期收益约束（均值-方差）")
+    min_weight: float = Field(0.0, ge=0, le=1, description="单个资产权重下限")
+    max_weight: float = Field(1.0, gt=0, le=1, description="单个资产权重上限")
+    group_limits: Optional[Dict[str, float]] = Field(None, description="行业权重上限")
+    risk_budgets: Optional[Dict[str, float]] = Field(None, description="风险预算（风险平价），缺省为等风险")
+    strategy_id: Optional[int] = Field(None, description="保存为该策略的组合配置")
+    portfolio_ids: List[int] = Field(default=[], description="保存配置的投资组合")
+
+
+class OptimizationResponse(BaseModel):
+    """组合优化结果"""
+    method: str = Field(..., description="优化方法")
+    weights: Dict[str, float] = Field(..., description="最优权重")
+    expected_return: Optional[float] = Field(None, description="年化预期收益")
+    volatility: float = Field(..., description="年化波动率")
+    risk_contributions: Dict[str, float] = Field(..., description="各资产风险贡献占比")
+    diversification_ratio: Optional[float] = Field(None, description="分散化比率")
+    shrinkage: float = Field(..., description="Ledoit-Wolf 收缩强度")
+    observations: int = Field(..., description="估计使用的收益率观测数")
+    excluded_symbols: List[str] = Field(default=[], description="行情不足而剔除的资产")
+    iterations: int = Field(..., description="迭代次数")
+    converged: bool = Field(..., description="是否收敛")
+    solve_ms: float = Field(..., description="求解耗时(毫秒)")
+    allocation_ids: List[int] = Field(default=[], description="保存的组合配置ID")
+
+
+class BatchOptimizationRequest(BaseModel):
+    """批量个性化组合优化请求"""
+    strategy_id: int = Field(..., description="配置所属策略ID")
+    symbols: List[str] = Field(..., min_length=2, description="候选资产代码")
+    portfolio_ids: Optional[List[int]] = Field(None, description="只优化指定组合，缺省为全部活跃组合")
+    lookback_days: int = Field(252, ge=20, le=2520, description="估计协方差使用的交易日数")
+    end_date: Optional[datetime] = Field(None, description="估计截止日期，缺省为最新行情")
+    allocation_date: Optional[datetime] = Field(None, description="配置日期，缺省为估计截止日期")
+    expected_returns: Optional[Dict[str, float]] = Field(None, description="年化预期收益，缺省使用历史均值")
+    min_weight: float = Field(0.0, ge=0, le=1, description="单个资产权重下限")
+    max_weight: float = Field(1.0, gt=0, le=1, description="单个资产权重上限")
+    group_limits: Optional[Dict[str, float]] = Field(None, description="行业权重上限")
+    max_workers: int = Field(1, ge=1, le=32, description="并行求解的进程数")
+    by_segment: bool = Field(False, description="是否按持有人所属客群的约束配置，未分群的持有人按自身画像")
+    persist: bool = Field(True, description="是否保存为组合配置")
+
+
+class BatchOptimizationGroup(BaseModel):
+    """单个约束签名的优化结果"""
+    risk_level: int = Field(..., description="风险等级")
+    target_return: Optional[float] = Field(None, description="目标收益（离散化后）")
+    max_drawdown: Optional[float] = Field(None, description="最大回撤容忍度（离散化后）")
+    portfolios: int = Field(..., description="该签名下的组合数")
+    risk_aversion: Optional[float] = Field(None, description="最终风险厌恶系数，返回最小方差组合时为空")
+    expected_return: float = Field(..., description="年化预期收益")
+    volatility: float = Field(..., description="年化波动率")
+    target_met: bool = Field(..., description="是否达到目标收益")
+    risk_met: bool = Field(..., description="是否满足波动率上限")
+
+
+class BatchOptimizationResponse(BaseModel):
+    """批量个性化组合优化结果"""
+    strategy_id: int = Field(..., description="策略ID")
+    portfolios: int = Field(..., description="优化的组合数")
+    signatures: int = Field(..., description="约束签名数（实际求解次数）")
+    segmented_portfolios: int = Field(0, description="按客群约束配置的组合数")
+    allocations_written: int = Field(..., description="写入的组合配置数")
+    excluded_symbols: List[str] = Field(default=[], description="行情不足而剔除的资产")
+    elapsed_seconds: float = Field(..., description="耗时(秒)")
+    groups: List[BatchOptimizationGroup] = Field(..., description="各约束签名的结果")
+
+
 # 复合响应Schema
 class StrategyWithSignals(StrategyResponse):
     """包含信号的策略响应"""
@@ -387,6 +664,49 @@ class MacroTimingResponse(BaseModel):
     reasoning: Optional[str] = Field(None, description="推荐理由")
     signal_date: datetime = Field(..., description="信号生成日期")
 
+class MacroIndicatorPoint(BaseModel):
+    """宏观指标观测值Schema"""
+    indicator_code: str = Field(..., min_length=1, max_length=50, description="指标代码，如pmi、inflation、interest_rate")
+    observation_date: datetime = Field(..., description="观测日期")
+    value: float = Field(..., description="指标数值")
+
+class MacroIndicatorBulkRequest(BaseModel):
+    """宏观指标批量写入请求Schema（按指标代码+日期覆盖写入）"""
+    points: List[MacroIndicatorPoint] = Field(..., min_length=1, description="指标观测值列表")
+    source: Optional[str] = Field(None, max_length=50, description="数据来源")
+
+class MacroIndicatorBulkResponse(BaseModel):
+    """宏观指标批量写入响应Schema"""
+    inserted: int = Field(..., description="新增条数")
+    updated: int = Field(..., description="更新条数")
+
+class MacroIndicatorValueResponse(MacroIndicatorPoint):
+    """宏观指标数值响应Schema"""
+    id: int
+    source: Optional[str] = None
+    updated_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
+class MacroTimingHistoryRequest(BaseModel):
+    """基于宏观指标库的历史配置计算请求Schema"""
+    start_date: Optional[datetime] = Field(None, description="开始日期")
+    end_date: Optional[datetime] = Field(None, description="结束日期")
+    indicator_map: Optional[Dict[str, str]] = Field(None, description="模型指标到指标库代码的映射，如{'pmi':'CN_PMI'}，缺省为同名")
+    lookback: int = Field(3, ge=1, description="PMI动量回看期数")
+    inflation_threshold: float = Field(3.0, description="高通胀阈值(%)")
+    strategy_id: Optional[int] = Field(None, description="关联策略ID（生成实时信号时使用）")
+
+class MacroTimingHistoryResponse(BaseModel):
+    """历史资产配置表响应Schema"""
+    dates: List[datetime] = Field(..., description="日期列表(T)")
+    asset_classes: List[str] = Field(..., description="资产类别顺序")
+    economic_cycles: List[Optional[str]] = Field(..., description="各日期推断的经济周期")
+    composite_scores: List[float] = Field(..., description="各日期综合评分")
+    allocations: List[List[float]] = Field(..., description="配置矩阵(T×资产类别)")
+    confidence: List[float] = Field(..., description="各日期置信度")
+
 # === 行业轮动模型相关Schema ===
 class SectorRotationRequest(BaseModel):
     """行业轮动模型请求Schema"""
@@ -401,6 +721,24 @@ class SectorRotationResponse(BaseModel):
     reasoning: Optional[str] = Field(None, description="推荐理由")
     signal_date: datetime = Field(..., description="信号生成日期")
 
+class SectorRotationBatchRequest(BaseModel):
+    """基于行情聚合的批量行业轮动请求Schema"""
+    start_date: Optional[datetime] = Field(None, description="开始日期，缺省为全部历史")
+    end_date: Optional[datetime] = Field(None, description="结束日期")
+    lookback: int = Field(20, ge=2, le=250, description="动量与广度回看期数（交易日）")
+    flow_window: int = Field(5, ge=1, le=60, description="资金流向统计期数（交易日）")
+    incremental: bool = Field(True, description="是否只计算上次已生成信号之后的新日期")
+    persist: bool = Field(True, description="是否按日期保存行业轮动信号")
+    strategy_id: Optional[int] = Field(None, description="关联策略ID")
+
+class SectorRotationBatchResponse(BaseModel):
+    """批量行业轮动响应Schema"""
+    industries: List[str] = Field(..., description="行业列表(K)")
+    dates: List[datetime] = Field(..., description="本次生成信号的日期列表(T)")
+    scores: List[List[Optional[float]]] = Field(..., description="行业综合评分矩阵(T×K)，数据不足为null")
+    allocations: List[List[float]] = Field(..., description="行业配置矩阵(T×K)")
+    signal_ids: Optional[List[int]] = Field(None, description="持久化时各日期的信号ID")
+
 # === 多因子模型PLUS相关Schema ===
 class StockFactorData(BaseModel):
     """股票因子数据Schema"""
@@ -413,7 +751,10 @@ class MultiFactorRequest(BaseModel):
     stocks: List[StockFactorData] = Field(..., description="股票因子数据列表")
     factor_weights: Optional[Dict[str, float]] = Field(None, description="各因子权重，如{'价值':0.4,'成长':0.3}")
     market_regime: Optional[str] = Field(None, description="市场状态，用于动态调整因子权重")
+    market_regime_id: Optional[int] = Field(None, description="已存储的市场状态ID，提供时使用该状态的条件权重表（按转移概率混合），优先于market_regime")
     auto_discover: Optional[bool] = Field(False, description="是否启用因子挖掘")
+    top_k: Optional[int] = Field(None, ge=1, description="只返回前K名，为空时返回完整排名")
+    storage_mode: str = Field("compact", pattern="^(compact|full)$", description="存储模式：compact(输入去重+评分压缩)或full(逐股JSON)")
     additional_params: Optional[Dict[str, Any]] = Field(None, description="其他参数")
     strategy_id: Optional[int] = Field(None, description="关联策略ID")
 
@@ -425,10 +766,76 @@ class StockScore(BaseModel):
     factor_contribution: Dict[str, float] = Field(..., description="各因子贡献")
     rank: int = Field(..., description="排名")
 
+class RankingSummary(BaseModel):
+    """全体股票评分分布摘要Schema"""
+    count: int = Field(..., description="参与评分的股票数量")
+    mean: Optional[float] = Field(None, description="平均分")
+    std: Optional[float] = Field(None, description="标准差")
+    min: Optional[float] = Field(None, description="最低分")
+    p25: Optional[float] = Field(None, description="25分位数")
+    median: Optional[float] = Field(None, description="中位数")
+    p75: Optional[float] = Field(None, description="75分位数")
+    max: Optional[float] = Field(None, description="最高分")
+
 class MultiFactorResponse(BaseModel):
     """多因子模型响应Schema"""
     stock_scores: List[StockScore] = Field(..., description="股票评分列表")
+    summary: Optional[RankingSummary] = Field(None, description="全体股票评分摘要")
+    adjusted_weights: Dict[str, float] = Field(..., description="调整后的因子权重")
+    discovered_factors: Optional[Dict[str, float]] = Field(None, description="新发现的因子及其权重")
+    reasoning: Optional[str] = Field(None, description="模型推理过程")
+    signal_date: datetime = Field(..., description="信号生成日期") 
+
+class MultiFactorScoreSummary(BaseModel):
+    """多因子评分记录摘要Schema（不含逐股评分）"""
+    id: int = Field(..., description="评分记录ID")
+    strategy_id: Optional[int] = Field(None, description="关联策略ID")
+    storage_mode: Optional[str] = Field(None, description="存储模式")
+    market_regime: Optional[str] = Field(None, description="市场状态")
+    stock_count: Optional[int] = Field(None, description="评分股票数量")
+    top_symbols: Optional[List[str]] = Field(None, description="排名靠前的股票代码")
+    score_summary: Optional[RankingSummary] = Field(None, description="评分分布摘要")
     adjusted_weights: Dict[str, float] = Field(..., description="调整后的因子权重")
     discovered_factors: Optional[Dict[str, float]] = Field(None, description="新发现的因子及其权重")
     reasoning: Optional[str] = Field(None, description="模型推理过程")
-    signal_date: datetime = Field(..., description="信号生成日期") 
\ No newline at end of file
+    model_version: Optional[str] = Field(None, description="模型版本")
+    signal_date: datetime = Field(..., description="信号生成日期")
+
+    class Config:
+        from_attributes = True
+
+class RegimeWeightEntry(BaseModel):
+    """单个市场状态的条件因子权重Schema"""
+    regime_id: int = Field(..., description="市场状态ID")
+    regime_name: str = Field(..., description="状态名称")
+    own_weights: Dict[str, float] = Field(..., description="该状态自身的因子权重")
+    blended_weights: Dict[str, float] = Field(..., description="按转移概率混合后的因子权重")
+    transition: Dict[str, float] = Field(..., description="归一化后的转移概率（目标状态→概率）")
+
+class RegimeWeightTableResponse(BaseModel):
+    """市场状态条件权重表响应Schema"""
+    factors: List[str] = Field(..., description="因子顺序")
+    regimes: List[RegimeWeightEntry] = Field(..., description="各市场状态的权重")
+
+class MultiFactorBatchRequest(BaseModel):
+    """多日期批量多因子评分请求Schema"""
+    dates: List[datetime] = Field(..., min_length=1, description="评分日期列表(D)")
+    symbols: List[str] = Field(..., min_length=1, description="股票代码列表(N)")
+    names: Optional[List[Optional[str]]] = Field(None, description="股票名称列表(N)")
+    factors: List[str] = Field(..., min_length=1, description="因子列表(F)")
+    factor_values: List[List[List[Optional[float]]]] = Field(..., description="因子值张量(D×N×F)，缺失为null")
+    factor_weights: Optional[Dict[str, float]] = Field(None, description="各因子权重，缺省为等权")
+    market_regime: Optional[str] = Field(None, description="所有日期共用的市场状态")
+    market_regimes: Optional[List[Optional[str]]] = Field(None, description="每个日期的市场状态(D)，优先于market_regime")
+    include_ranks: bool = Field(True, description="是否返回排名矩阵")
+    persist: bool = Field(False, description="是否按日期保存评分记录（紧凑存储）")
+    strategy_id: Optional[int] = Field(None, description="关联策略ID")
+
+class MultiFactorBatchResponse(BaseModel):
+    """多日期批量多因子评分响应Schema"""
+    dates: List[datetime] = Field(..., description="评分日期列表(D)")
+    symbols: List[str] = Field(..., description="股票代码列表(N)")
+    scores: List[List[Optional[float]]] = Field(..., description="评分矩阵(D×N)，无因子值为null")
+    ranks: Optional[List[List[Optional[int]]]] = Field(None, description="排名矩阵(D×N)，1为最高分")
+    score_ids: Optional[List[int]] = Field(None, description="持久化时各日期的评分记录ID")
+    signal_date: datetime = Field(..., description="信号生成日期")
@@ -66,9 +66,12 @@ class RiskAssessmentBase(BaseModel):
     investment_horizon_score: Optional[int] = Field(None, description="投资期限得分")
     answers: Optional[Dict[str, Any]] = Field(None, description="问卷答案")
 
-class RiskAssessmentCreate(RiskAssessmentBase):
-    """创建风险测评请求模型"""
+class RiskAssessmentCreate(BaseModel):
+    """创建风险测评请求模型（总分、各维度得分与风险等级由服务端按问卷模板计算）"""
     user_id: int = Field(..., description="用户ID")
+    answers: Dict[str, Any] = Field(..., description="问卷答案：题目编号 -> 选项")
+    template_code: str = Field("default", description="问卷模板代码")
+    template_version: Optional[int] = Field(None, description="问卷模板版本，默认当前版本")
 
 class RiskAssessmentResponse(RiskAssessmentBase):
     """风险测评响应模型"""
@@ -77,10 +80,105 @@ class RiskAssessmentResponse(RiskAssessmentBase):
     risk_level: str = Field(..., description="风险等级")
     risk_tolerance: float = Field(..., description="风险承受能力 (1-10)")
     assessment_date: datetime
+    template_code: Optional[str] = Field(None, description="评分使用的问卷模板代码，客户端计分的历史记录为空")
+    template_version: Optional[int] = Field(None, description="评分使用的问卷模板版本")
 
     class Config:
         from_attributes = True
 
+# 问卷模板相关Schema
+class QuestionnaireQuestion(BaseModel):
+    """问卷题目"""
+    id: str = Field(..., description="题目编号，与答案的键对应")
+    text: Optional[str] = Field(None, description="题目内容")
+    dimension: Optional[str] = Field(None, description="计入的维度，为空时只计入总分")
+    weight: float = Field(1.0, description="题目权重")
+    options: Dict[str, float] = Field(..., description="选项 -> 分值")
+
+class QuestionnaireBand(BaseModel):
+    """风险等级分数区间"""
+    max_score: Optional[float] = Field(None, description="分数上限（含），最后一个区间可为空")
+    risk_level: str = Field(..., description="风险等级")
+
+class QuestionnaireTemplateCreate(BaseModel):
+    """发布问卷模板版本请求模型"""
+    code: str = Field(..., min_length=1, max_length=50, description="模板代码")
+    name: str = Field(..., min_length=1, max_length=100, description="模板名称")
+    description: Optional[str] = None
+    questions: List[QuestionnaireQuestion] = Field(..., description="题目")
+    bands: List[QuestionnaireBand] = Field(..., description="风险等级区间，按分数上限递增")
+    tolerance_divisor: float = Field(10.0, gt=0, description="风险承受能力 = 总分 / 换算系数，限制在1-10")
+    activate: bool = Field(True, description="是否设为该模板代码的当前版本")
+
+class QuestionnaireTemplateResponse(BaseModel):
+    """问卷模板响应模型"""
+    id: int
+    code: str
+    version: int
+    name: str
+    description: Optional[str] = None
+    questions: List[QuestionnaireQuestion]
+    bands: List[QuestionnaireBand]
+    tolerance_divisor: float
+    is_active: bool
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class QuestionnaireRescoreRequest(BaseModel):
+    """按模板版本批量重新评分请求模型"""
+    versions: Optional[List[int]] = Field(None, description="只重新评分由这些版本评分的测评，默认同一模板代码的全部版本")
+    include_legacy: bool = Field(False, description="是否一并评分没有评分记录（客户端计分）的历史测评")
+
+class QuestionnaireRescoreResponse(BaseModel):
+    """批量重新评分结果模型"""
+    template_id: int
+    code: str
+    version: int
+    assessments: int = Field(..., description="读取的测评数")
+    rescored: int = Field(..., description="重新评分的测评数")
+    changed_level: int = Field(..., description="风险等级发生变化的测评数")
+    invalid: int = Field(..., description="答案不符合模板、保持原结果的测评数")
+
+# 客户分群相关Schema
+class SegmentRefreshRequest(BaseModel):
+    """刷新客户分群请求模型"""
+    n_clusters: Optional[int] = Field(None, ge=1, le=100, description="客群数，默认沿用当前分群（首次为8），变化时全量分群")
+    refit: bool = Field(False, description="是否强制全量分群，否则只归类新增或更新过的画像")
+    seed: Optional[int] = Field(None, description="随机种子")
+
+class SegmentRefreshResponse(BaseModel):
+    """刷新客户分群结果模型"""
+    segmentation_id: Optional[int] = None
+    refitted: bool = Field(..., description="是否全量分群")
+    users: int = Field(..., description="画像总数")
+    assigned: int = Field(..., description="本次归类的画像数")
+    segments: int = Field(..., description="客群数")
+    inertia: Optional[float] = Field(None, description="全量分群时样本到所属中心的距离平方和")
+
+class ProfileSegmentResponse(BaseModel):
+    """客群响应模型"""
+    id: int
+    label: int
+    name: str
+    risk_level: int
+    size: int
+    center: Dict[str, float] = Field(..., description="客群中心（年收入为对数，投资期限为年）")
+    target_return: Optional[float] = None
+    max_drawdown_tolerance: Optional[float] = None
+
+class SegmentationResponse(BaseModel):
+    """当前客户分群响应模型"""
+    id: int
+    n_clusters: int
+    users: int
+    inertia: float
+    incremental_updates: int
+    fitted_at: datetime
+    updated_at: datetime
+    segments: List[ProfileSegmentResponse]
+
 # 投资目标相关Schema
 class InvestmentGoalBase(BaseModel):
     """投资目标基础模型"""
@@ -114,4 +212,56 @@ class InvestmentGoalResponse(InvestmentGoalBase):
     updated_at: datetime
 
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True
+
+class GoalPortfolioLinkRequest(BaseModel):
+    """投资目标关联组合请求模型"""
+    portfolio_id: int = Field(..., description="投资组合ID")
+    current_amount: float = Field(0.0, ge=0, description="当前投入该目标的金额")
+    monthly_contribution: float = Field(0.0, ge=0, description="每月定投金额")
+
+class GoalPortfolioLinkResponse(GoalPortfolioLinkRequest):
+    """投资目标关联组合响应模型"""
+    id: int
+    goal_id: int
+    valued_at: Optional[datetime] = Field(None, description="当前金额对应的组合净值日期")
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class GoalProjectionBand(BaseModel):
+    """目标价值分位数（按月）"""
+    month: int = Field(..., description="距今月数")
+    p5: float
+    p25: float
+    p50: float
+    p75: float
+    p95: float
+
+class GoalProjectionResult(BaseModel):
+    """单个投资目标的蒙特卡洛预测结果"""
+    goal_id: int
+    goal_name: str
+    status: str = Field(..., description="状态: projected/unlinked/incomplete")
+    portfolio_id: Optional[int] = None
+    target_amount: Optional[float] = None
+    target_date: Optional[datetime] = None
+    current_amount: Optional[float] = Field(None, description="按组合净值重估后的当前金额")
+    monthly_contribution: Optional[float] = None
+    progress: float = Field(0.0, description="完成进度 (0-100%)")
+    months: Optional[int] = Field(None, description="距目标日期的月数")
+    expected_return: Optional[float] = Field(None, description="组合年化收益估计")
+    volatility: Optional[float] = Field(None, description="组合年化波动率估计")
+    probability: Optional[float] = Field(None, description="到期达成目标的概率")
+    expected_value: Optional[float] = Field(None, description="到期价值均值")
+    percentiles: Optional[Dict[str, float]] = Field(None, description="到期价值分位数")
+    bands: List[GoalProjectionBand] = Field(default_factory=list, description="价值分位数区间")
+
+class GoalProjectionResponse(BaseModel):
+    """用户投资目标预测响应模型"""
+    user_id: int
+    run_date: datetime
+    paths: int = Field(..., description="模拟路径数")
+    goals: List[GoalProjectionResult]
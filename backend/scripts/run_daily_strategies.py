@@ -0,0 +1,39 @@
+"""
+每日策略运行脚本
+作为独立任务（如 cron）在收盘后运行全部活跃策略；同一日期重复运行时从失败的步骤继续
+
+用法: python scripts/run_daily_strategies.py [--date 2024-06-28] [--strategy-ids 1 2] [--workers 4]
+"""
+import argparse
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import SessionLocal
+from routers.strategy.daily_run import DailyStrategyRunner
+
+
+def main():
+    parser = argparse.ArgumentParser(description="运行每日策略")
+    parser.add_argument("--date", help="运行日期(YYYY-MM-DD)，缺省为当天")
+    parser.add_argument("--strategy-ids", type=int, nargs="*", help="只运行指定策略")
+    parser.add_argument("--workers", type=int, help="并行运行的策略数")
+    args = parser.parse_args()
+    
+    run_date = datetime.strptime(args.date, "%Y-%m-%d") if args.date else None
+    summary = DailyStrategyRunner(SessionLocal, run_date, args.workers).run(args.strategy_ids)
+    
+    print(f"运行日期: {summary['run_date'].date()}  策略数: {summary['strategies']}  "
+          f"耗时: {summary['elapsed_seconds']:.1f}秒  窗口内完成: {summary['within_window']}")
+    for step in summary["steps"]:
+        duration = f"{step.duration_ms:.0f}ms" if step.duration_ms is not None else "-"
+        print(f"  {step.scope:<16} {step.step:<14} {step.status:<8} {duration:>8}  {step.error or ''}")
+    
+    if summary["status_counts"].get("failed"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+"""
+服务层
+跨多张表的批量计算与写入（协方差估计、估值、适当性检查、压力测试、目标预测、分群、模型组合下发等），
+只写入会话不提交，由路由或每日运行统一提交；ORM模型只保留表结构与简单查询
+"""
@@ -0,0 +1,89 @@
+"""
+协方差估计服务
+按行情历史估计候选资产的年化收缩协方差与历史平均收益，供组合优化与组合风险分析共用
+"""
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from typing import Any, Dict, List, Optional
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+
+from utils.cache import TTLCache
+from models.market_data import MarketData, PriceHistory
+from models.ai_models import PortfolioOptimizer
+
+# 年化使用的交易日数
+TRADING_DAYS = 252
+# 资产有效收益率观测数低于窗口的该比例时剔除
+MIN_COVERAGE = 0.6
+
+# 协方差估计缓存，键包含行情版本（记录数与最新日期），行情更新后自动失效
+_covariance_cache = TTLCache(max_entries=64, ttl=600)
+
+
+def estimate_covariance(db: Session, symbols: List[str], lookback_days: int,
+                        end_date: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    一次查询候选资产的行情历史，估计年化 Ledoit-Wolf 协方差与历史平均收益
+
+    Returns:
+        symbols、market_data_ids、covariance、mean_returns、returns（日收益 T×N）、
+        dates、shrinkage、observations、excluded
+    """
+    instruments = db.query(MarketData.id, MarketData.symbol, MarketData.industry).filter(
+        MarketData.symbol.in_(symbols)
+    ).all()
+    by_id = {row.id: row for row in instruments}
+    query_filters = [PriceHistory.market_data_id.in_(list(by_id))]
+    end = end_date or db.query(func.max(PriceHistory.date)).filter(*query_filters).scalar()
+    if end is not None:
+        # 按自然日放宽取数区间，再截取最近 lookback_days 个交易日
+        query_filters += [PriceHistory.date <= end, PriceHistory.date >= end - timedelta(days=lookback_days * 2 + 10)]
+
+    version = tuple(db.query(func.count(PriceHistory.id), func.max(PriceHistory.date)).filter(*query_filters).one())
+    key = (tuple(sorted(by_id)), lookback_days, end_date, version)
+    cached = _covariance_cache.get(key)
+    if cached is not None:
+        return cached
+
+    rows = db.query(
+        PriceHistory.market_data_id, PriceHistory.date,
+        func.coalesce(PriceHistory.adjusted_close, PriceHistory.close_price)
+    ).filter(*query_filters).all() if by_id else []
+
+    if rows:
+        closes = pd.DataFrame(rows, columns=["market_data_id", "date", "close"]).pivot_table(
+            index="date", columns="market_data_id", values="close", aggfunc="last"
+        ).sort_index().tail(lookback_days + 1)
+        returns = closes.pct_change(fill_method=None).iloc[1:]
+    else:
+        returns = pd.DataFrame()
+
+    coverage = returns.notna().sum() if len(returns) else pd.Series(dtype=float)
+    usable = [int(i) for i in coverage.index if coverage[i] >= max(2, MIN_COVERAGE * len(returns))]
+    usable.sort(key=lambda i: by_id[i].symbol)
+    used_symbols = [by_id[i].symbol for i in usable]
+    matrix = returns[usable].to_numpy(dtype=float) if usable else np.empty((0, 0))
+
+    if len(usable) >= 2:
+        covariance, shrinkage = PortfolioOptimizer.ledoit_wolf(matrix)
+        covariance = covariance * TRADING_DAYS
+        mean_returns = np.nanmean(matrix, axis=0) * TRADING_DAYS
+    else:
+        covariance, shrinkage, mean_returns = np.empty((0, 0)), 0.0, np.empty(0)
+
+    result = {
+        "symbols": used_symbols,
+        "market_data_ids": usable,
+        "industries": [by_id[i].industry for i in usable],
+        "covariance": covariance,
+        "mean_returns": mean_returns,
+        "returns": matrix,
+        "dates": list(returns.index),
+        "shrinkage": shrinkage,
+        "observations": len(returns),
+        "excluded": sorted(set(symbols) - set(used_symbols)),
+    }
+    _covariance_cache.set(key, result)
+    return result
@@ -0,0 +1,166 @@
+"""
+投资目标预测服务
+按组合回测的收益分布对活跃投资目标做蒙特卡洛预测，每日运行时保存重估金额与预测结果
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import math
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert, update, tuple_
+
+from models.user_profile import InvestmentGoal, GoalPortfolioLink, GoalProjection
+from models.portfolio import Asset, PortfolioAsset, PortfolioNavSnapshot
+from models.market_data import MarketData, PriceHistory
+from models.ai_models import GoalProjectionEngine
+
+# 估计组合收益分布使用的回看交易日数
+LOOKBACK_DAYS = 756
+
+
+def portfolio_moments(db, portfolio_ids: List[int], lookback_days: int = LOOKBACK_DAYS,
+                      end_date: Optional[datetime] = None) -> Dict[int, Dict[str, float]]:
+    """各组合按当前权重回测的年化收益与波动率（一次查询持仓、一次查询行情）"""
+    holdings = pd.DataFrame(db.query(
+        PortfolioAsset.portfolio_id, PortfolioAsset.weight, MarketData.id
+    ).join(Asset, Asset.id == PortfolioAsset.asset_id).join(
+        MarketData, MarketData.symbol == Asset.code
+    ).filter(PortfolioAsset.portfolio_id.in_(portfolio_ids)).all(), columns=["portfolio_id", "weight", "market_data_id"])
+    market_data_ids = sorted(int(i) for i in holdings["market_data_id"].unique())
+    returns = PriceHistory.return_panel(db, market_data_ids, lookback_days, end_date).to_numpy(dtype=float)
+
+    row_of = {pid: i for i, pid in enumerate(portfolio_ids)}
+    column_of = {mid: j for j, mid in enumerate(market_data_ids)}
+    weights = np.zeros((len(portfolio_ids), len(market_data_ids)))
+    for pid, weight, mid in holdings.itertuples(index=False):
+        # 持仓权重以百分比存储，没有行情的持仓视为现金
+        weights[row_of[pid], column_of[int(mid)]] += weight / 100
+
+    if returns.shape[0] < 2:
+        return {pid: {"expected_return": 0.0, "volatility": 0.0, "observations": returns.shape[0]} for pid in portfolio_ids}
+    daily = np.nan_to_num(returns) @ weights.T
+    expected_returns = daily.mean(axis=0) * 252
+    volatilities = daily.std(axis=0, ddof=1) * np.sqrt(252)
+    return {
+        pid: {
+            "expected_return": float(expected_returns[i]),
+            "volatility": float(volatilities[i]),
+            "observations": returns.shape[0],
+        }
+        for pid, i in row_of.items()
+    }
+
+
+def project_goals(db, run_date: datetime, user_id: Optional[int] = None,
+                  paths: int = GoalProjectionEngine.DEFAULT_PATHS, seed: Optional[int] = None, persist: bool = False) -> List[Dict[str, Any]]:
+    """
+    预测活跃投资目标的达成概率与价值分位数
+
+    关联金额按组合净值快照从估值日重估至最新净值日；persist 为真时（每日运行）保存重估金额、
+    刷新目标完成进度并覆盖当日预测结果（未提交）。未关联组合或缺少目标金额/日期的目标只返回状态。
+    """
+    query = db.query(InvestmentGoal, GoalPortfolioLink).outerjoin(
+        GoalPortfolioLink, GoalPortfolioLink.goal_id == InvestmentGoal.id
+    ).filter(InvestmentGoal.is_active == True)
+    if user_id is not None:
+        query = query.filter(InvestmentGoal.user_id == user_id)
+    rows = query.order_by(InvestmentGoal.priority, InvestmentGoal.id).all()
+
+    # 关联金额按净值重估：最新净值 / 估值日净值
+    portfolio_ids = sorted({link.portfolio_id for _, link in rows if link is not None})
+    latest = PortfolioNavSnapshot.latest(db, portfolio_ids)
+    pairs = [(link.portfolio_id, link.valued_at) for _, link in rows if link is not None and link.valued_at is not None]
+    valued_navs = dict(((pid, date), nav) for pid, date, nav in db.query(
+        PortfolioNavSnapshot.portfolio_id, PortfolioNavSnapshot.date, PortfolioNavSnapshot.nav
+    ).filter(tuple_(PortfolioNavSnapshot.portfolio_id, PortfolioNavSnapshot.date).in_(pairs)).all()) if pairs else {}
+
+    results, projectable = [], []
+    for goal, link in rows:
+        result = {
+            "goal_id": goal.id,
+            "user_id": goal.user_id,
+            "goal_name": goal.goal_name,
+            "target_amount": goal.target_amount,
+            "target_date": goal.target_date,
+            "portfolio_id": link.portfolio_id if link is not None else None,
+            "monthly_contribution": link.monthly_contribution if link is not None else None,
+            "status": "unlinked" if link is None else "incomplete",
+            "progress": goal.progress,
+        }
+        if link is not None:
+            current = link.current_amount
+            snapshot = latest.get(link.portfolio_id)
+            if snapshot is not None and link.valued_at is not None and (link.portfolio_id, link.valued_at) in valued_navs:
+                current *= snapshot.nav / valued_navs[(link.portfolio_id, link.valued_at)]
+            result["current_amount"] = current
+            result["valued_at"] = snapshot.date if snapshot is not None else link.valued_at
+            if goal.target_amount and goal.target_amount > 0:
+                result["progress"] = min(100.0, current / goal.target_amount * 100)
+            if goal.target_amount and goal.target_date is not None:
+                result["status"] = "projected"
+                projectable.append(len(results))
+        results.append(result)
+
+    if projectable:
+        moments = portfolio_moments(db, sorted({results[i]["portfolio_id"] for i in projectable}), end_date=run_date)
+        months = np.array([
+            max(0, math.ceil((results[i]["target_date"] - run_date).days / 30.4375)) for i in projectable
+        ])
+        engine = GoalProjectionEngine(paths=paths, seed=seed)
+        projections = engine.project(
+            np.array([moments[results[i]["portfolio_id"]]["expected_return"] for i in projectable]),
+            np.array([moments[results[i]["portfolio_id"]]["volatility"] for i in projectable]),
+            months,
+            np.array([results[i]["current_amount"] for i in projectable]),
+            np.array([results[i]["monthly_contribution"] for i in projectable]),
+            np.array([results[i]["target_amount"] for i in projectable])
+        )
+        for k, i in enumerate(projectable):
+            results[i].update(projections[k])
+            results[i].update(months=int(months[k]), **{
+                key: moments[results[i]["portfolio_id"]][key] for key in ("expected_return", "volatility")
+            })
+
+    if persist:
+        _save(db, run_date, rows, results, projectable)
+    return results
+
+
+def _save(db, run_date: datetime, rows, results: List[Dict[str, Any]], projectable: List[int]):
+    """保存重估金额与完成进度，覆盖当日预测结果"""
+    link_updates = [
+        {"id": link.id, "current_amount": result["current_amount"], "valued_at": result["valued_at"]}
+        for (_, link), result in zip(rows, results) if link is not None
+    ]
+    if link_updates:
+        db.execute(update(GoalPortfolioLink), link_updates)
+    progress_updates = [
+        {"id": result["goal_id"], "progress": result["progress"]}
+        for (_, link), result in zip(rows, results) if link is not None
+    ]
+    if progress_updates:
+        db.execute(update(InvestmentGoal), progress_updates)
+
+    db.query(GoalProjection).filter(
+        GoalProjection.run_date == run_date, GoalProjection.goal_id.in_([goal.id for goal, _ in rows])
+    ).delete(synchronize_session=False)
+    if projectable:
+        db.execute(insert(GoalProjection), [
+            {
+                "goal_id": results[i]["goal_id"],
+                "run_date": run_date,
+                "portfolio_id": results[i]["portfolio_id"],
+                "months": results[i]["months"],
+                "current_amount": results[i]["current_amount"],
+                "monthly_contribution": results[i]["monthly_contribution"],
+                "target_amount": results[i]["target_amount"],
+                "expected_return": results[i]["expected_return"],
+                "volatility": results[i]["volatility"],
+                "probability": results[i]["probability"],
+                "expected_value": results[i]["expected_value"],
+                "percentiles": results[i]["percentiles"],
+                "bands": results[i]["bands"],
+                "created_at": datetime.utcnow(),
+            }
+            for i in projectable
+        ])
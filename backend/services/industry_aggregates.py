@@ -0,0 +1,141 @@
+"""
+行业/板块聚合指数服务
+由个股日线增量维护 industry_aggregates 表
+"""
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+import numpy as np
+import pandas as pd
+from sqlalchemy import func
+
+from models.market_data import MarketData, PriceHistory, IndustryAggregate
+from models.ai_models import SectorRotationModel
+
+
+def refresh_aggregates(db, since: Optional[datetime] = None, group_types: Iterable[str] = ("industry", "sector"),
+                       group_names: Optional[Dict[str, Iterable[str]]] = None) -> int:
+    """从since（含）起重新计算并覆盖聚合数据，since为空时全量重建（未提交），返回写入行数
+    
+    指数点位从since之前最近一日已保存的点位续接；历史市值按各股最新价格回推（股本视为不变），
+    缺失市值的股票按全部有归属股票的市值中位数处理。group_names 指定时只重算其中的分组
+    （分组类型 -> 名称），单只股票新增日线时只需重算其所属行业与板块。
+    """
+    load_from = None
+    if since is not None:
+        load_from = db.query(PriceHistory.date).filter(PriceHistory.date < since).distinct().order_by(
+            PriceHistory.date.desc()
+        ).offset(IndustryAggregate.WARMUP_DAYS - 1).limit(1).scalar()
+    if group_names is not None:
+        group_types = [group_type for group_type in group_types if group_names.get(group_type)]
+    
+    written = 0
+    for group_type in group_types:
+        group = IndustryAggregate.group_column(group_type)
+        names = sorted(set(group_names[group_type])) if group_names is not None else None
+        query = db.query(
+            PriceHistory.date, PriceHistory.market_data_id, PriceHistory.close_price, PriceHistory.adjusted_close,
+            PriceHistory.volume, PriceHistory.turnover, group.label("group_name"), MarketData.market_cap
+        ).join(MarketData, MarketData.id == PriceHistory.market_data_id).filter(group.isnot(None))
+        if names is not None:
+            query = query.filter(group.in_(names))
+        if load_from is not None:
+            query = query.filter(PriceHistory.date >= load_from)
+        bars = pd.DataFrame(query.all(), columns=[
+            "date", "market_data_id", "close_price", "adjusted_close", "volume", "turnover", "group_name", "market_cap"
+        ])
+        
+        stale = db.query(IndustryAggregate).filter(IndustryAggregate.group_type == group_type)
+        if names is not None:
+            stale = stale.filter(IndustryAggregate.group_name.in_(names))
+        if since is not None:
+            stale = stale.filter(IndustryAggregate.date >= since)
+        stale.delete(synchronize_session=False)
+        if bars.empty:
+            continue
+        
+        # 优先使用复权价；成交额缺失时用 成交量×收盘价 估算
+        bars["close"] = bars["adjusted_close"].fillna(bars["close_price"])
+        bars["amount"] = bars["turnover"].fillna(bars["volume"] * bars["close_price"])
+        closes = bars.pivot_table(index="date", columns="market_data_id", values="close", aggfunc="last")
+        amounts = bars.pivot_table(index="date", columns="market_data_id", values="amount", aggfunc="last").reindex_like(closes)
+        stocks = bars.drop_duplicates("market_data_id").set_index("market_data_id").loc[closes.columns]
+        reference = PriceHistory.latest_closes(db, [int(i) for i in closes.columns])
+        caps = stocks["market_cap"].to_numpy(dtype=float)
+        missing = ~(np.isfinite(caps) & (caps > 0))
+        if missing.any():
+            fallback = _median_market_cap(db, group_type)
+            if fallback is not None:
+                caps[missing] = fallback
+        
+        panel = SectorRotationModel.aggregate_industries(
+            closes.to_numpy(dtype=float),
+            stocks["group_name"].tolist(),
+            caps,
+            amounts.to_numpy(dtype=float),
+            np.array([reference.get(int(i), np.nan) for i in closes.columns], dtype=float)
+        )
+        
+        dates = pd.DatetimeIndex(closes.index)
+        rows = np.flatnonzero(dates >= pd.Timestamp(since)) if since is not None else np.arange(len(dates))
+        previous_levels = IndustryAggregate.previous_levels(db, group_type, since) if since is not None else {}
+        returns = panel["index_returns"][rows]
+        
+        records = []
+        for k, name in enumerate(panel["industries"]):
+            levels = previous_levels.get(name, IndustryAggregate.BASE_LEVEL) * np.cumprod(1.0 + np.nan_to_num(returns[:, k]))
+            for j, row in enumerate(rows):
+                # 当日没有任何成分股行情的分组不写入
+                members = int(panel["constituents"][row, k])
+                if members == 0 and panel["market_caps"][row, k] <= 0:
+                    continue
+                records.append(IndustryAggregate(
+                    group_type=group_type,
+                    group_name=name,
+                    date=dates[row].to_pydatetime(),
+                    index_level=float(levels[j]),
+                    daily_return=float(returns[j, k]) if np.isfinite(returns[j, k]) else None,
+                    market_cap=float(panel["market_caps"][row, k]),
+                    turnover=float(panel["turnover"][row, k]),
+                    signed_turnover=float(panel["signed_turnover"][row, k]),
+                    advancers=int(panel["advancers"][row, k]),
+                    constituents=members
+                ))
+        db.add_all(records)
+        written += len(records)
+    
+    db.flush()
+    return written
+
+
+def refresh_instrument(db, market_data: MarketData, date: datetime) -> int:
+    """单只股票新增或修改日线后，只从该日期起重算其所属行业与板块（未提交），返回写入行数
+    
+    追加最新交易日时只重写该日一行；补录历史日线时该分组此后各日的点位随之续接重写。
+    """
+    group_names = {
+        group_type: [name] for group_type, name in (("industry", market_data.industry), ("sector", market_data.sector))
+        if name
+    }
+    if not group_names:
+        return 0
+    return refresh_aggregates(db, date, group_types=list(group_names), group_names=group_names)
+
+
+def sync_aggregates(db, group_types: Iterable[str] = ("industry", "sector")) -> int:
+    """补齐聚合表中尚未覆盖的最新交易日（未提交），返回写入行数"""
+    latest_aggregate = db.query(func.max(IndustryAggregate.date)).filter(
+        IndustryAggregate.group_type.in_(list(group_types))
+    ).scalar()
+    if latest_aggregate is None:
+        return refresh_aggregates(db, None, group_types)
+    since = db.query(func.min(PriceHistory.date)).filter(PriceHistory.date > latest_aggregate).scalar()
+    if since is None:
+        return 0
+    return refresh_aggregates(db, since, group_types)
+
+
+def _median_market_cap(db, group_type: str) -> Optional[float]:
+    """有该类归属且市值为正的全部股票的市值中位数"""
+    group = IndustryAggregate.group_column(group_type)
+    caps = [cap for (cap,) in db.query(MarketData.market_cap).filter(group.isnot(None), MarketData.market_cap > 0).all()]
+    return float(np.median(caps)) if caps else None
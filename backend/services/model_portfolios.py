@@ -0,0 +1,115 @@
+"""
+模型组合服务
+按模型组合权重叠加客户偏离计算有效权重，关联客户组合并批量下发为组合持仓
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from models.portfolio import (
+    PortfolioAsset, ModelPortfolio, ModelPortfolioAsset, PortfolioModelLink, PortfolioWeightOverride
+)
+
+# 每批写入的持仓行数
+CHUNK_SIZE = 10000
+
+
+def effective_weights(base: Dict[int, float], deltas: Dict[int, float]) -> Dict[int, float]:
+    """模型权重叠加客户偏离（百分比）：负值截为0，合计超过100%时按比例缩至100%，不足部分视为现金"""
+    weights = dict(base)
+    for asset_id, delta in deltas.items():
+        weights[asset_id] = weights.get(asset_id, 0.0) + delta
+    weights = {asset_id: weight for asset_id, weight in weights.items() if weight > 1e-9}
+    total = sum(weights.values())
+    if total > 100:
+        weights = {asset_id: weight * 100 / total for asset_id, weight in weights.items()}
+    return weights
+
+
+def fan_out_holdings(db, model_ids: Optional[Iterable[int]] = None,
+                     portfolio_ids: Optional[Iterable[int]] = None) -> Dict[str, int]:
+    """
+    按模型组合与客户偏离重写关联组合的持仓（未提交）
+
+    关联组合按 (模型, 偏离) 分组，每组只计算一次有效权重；没有偏离的组合共用模型权重。
+    旧持仓一次删除，新持仓分批以核心层批量插入。
+    """
+    links = db.query(PortfolioModelLink.portfolio_id, PortfolioModelLink.model_id)
+    if model_ids is not None:
+        links = links.filter(PortfolioModelLink.model_id.in_(list(model_ids)))
+    if portfolio_ids is not None:
+        links = links.filter(PortfolioModelLink.portfolio_id.in_(list(portfolio_ids)))
+    linked = links.subquery()
+    pairs = db.query(linked.c.portfolio_id, linked.c.model_id).order_by(linked.c.portfolio_id).all()
+    if not pairs:
+        return {"portfolios": 0, "variants": 0, "holdings": 0}
+
+    model_weights: Dict[int, Dict[int, float]] = {}
+    for model_id, asset_id, weight in db.query(
+        ModelPortfolioAsset.model_id, ModelPortfolioAsset.asset_id, ModelPortfolioAsset.weight
+    ).filter(ModelPortfolioAsset.model_id.in_({model_id for _, model_id in pairs})).all():
+        model_weights.setdefault(model_id, {})[asset_id] = weight
+    deltas: Dict[int, Dict[int, float]] = {}
+    for portfolio_id, asset_id, delta in db.query(
+        PortfolioWeightOverride.portfolio_id, PortfolioWeightOverride.asset_id, PortfolioWeightOverride.weight_delta
+    ).join(linked, linked.c.portfolio_id == PortfolioWeightOverride.portfolio_id).all():
+        deltas.setdefault(portfolio_id, {})[asset_id] = delta
+
+    variants: Dict[tuple, Dict[int, float]] = {}
+    rows = []
+    for portfolio_id, model_id in pairs:
+        key = (model_id, tuple(sorted(deltas.get(portfolio_id, {}).items())))
+        weights = variants.get(key)
+        if weights is None:
+            weights = effective_weights(model_weights.get(model_id, {}), dict(key[1]))
+            variants[key] = weights
+        rows.extend({"portfolio_id": portfolio_id, "asset_id": asset_id, "weight": weight}
+                    for asset_id, weight in weights.items())
+
+    db.query(PortfolioAsset).filter(PortfolioAsset.portfolio_id.in_(
+        db.query(linked.c.portfolio_id)
+    )).delete(synchronize_session=False)
+    for start in range(0, len(rows), CHUNK_SIZE):
+        db.execute(PortfolioAsset.__table__.insert(), rows[start:start + CHUNK_SIZE])
+    return {"portfolios": len(pairs), "variants": len(variants), "holdings": len(rows)}
+
+
+def link_to_model(db, model: ModelPortfolio, portfolio_ids: List[int], keep_weights: bool = False) -> Dict[str, int]:
+    """
+    将客户组合关联到模型组合（未提交），已关联其他模型的组合改为关联本模型
+
+    keep_weights 为真时把组合现有持仓与模型权重之差保存为偏离，关联后持仓不变；
+    否则清除原有偏离，持仓重写为模型权重。
+    """
+    existing = {portfolio_id for (portfolio_id,) in db.query(PortfolioModelLink.portfolio_id).filter(
+        PortfolioModelLink.portfolio_id.in_(portfolio_ids)
+    ).all()}
+    now = datetime.utcnow()
+    if existing:
+        db.query(PortfolioModelLink).filter(PortfolioModelLink.portfolio_id.in_(existing)).update(
+            {"model_id": model.id, "linked_at": now}, synchronize_session=False
+        )
+    new_links = [{"portfolio_id": pid, "model_id": model.id, "linked_at": now}
+                 for pid in portfolio_ids if pid not in existing]
+    for start in range(0, len(new_links), CHUNK_SIZE):
+        db.execute(PortfolioModelLink.__table__.insert(), new_links[start:start + CHUNK_SIZE])
+
+    db.query(PortfolioWeightOverride).filter(PortfolioWeightOverride.portfolio_id.in_(portfolio_ids)).delete(
+        synchronize_session=False
+    )
+    if keep_weights:
+        base = {asset.asset_id: asset.weight for asset in model.model_assets}
+        current: Dict[int, Dict[int, float]] = {pid: {} for pid in portfolio_ids}
+        for portfolio_id, asset_id, weight in db.query(
+            PortfolioAsset.portfolio_id, PortfolioAsset.asset_id, PortfolioAsset.weight
+        ).filter(PortfolioAsset.portfolio_id.in_(portfolio_ids)).all():
+            current[portfolio_id][asset_id] = current[portfolio_id].get(asset_id, 0.0) + weight
+        overrides = [
+            {"portfolio_id": pid, "asset_id": asset_id, "weight_delta": delta}
+            for pid, weights in current.items()
+            for asset_id in sorted(set(weights) | set(base))
+            for delta in [weights.get(asset_id, 0.0) - base.get(asset_id, 0.0)]
+            if abs(delta) > 1e-9
+        ]
+        for start in range(0, len(overrides), CHUNK_SIZE):
+            db.execute(PortfolioWeightOverride.__table__.insert(), overrides[start:start + CHUNK_SIZE])
+    return fan_out_holdings(db, portfolio_ids=portfolio_ids)
@@ -0,0 +1,120 @@
+"""
+组合净值估值服务
+按交易日增量计算全部活跃组合的净值快照
+"""
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, insert
+
+from models.portfolio import Portfolio, Asset, PortfolioAsset, PortfolioNavSnapshot
+from models.market_data import MarketData, PriceHistory, IndustryAggregate
+from models.ai_models import PortfolioValuationEngine
+
+
+def refresh_nav_snapshots(db, end_date: Optional[datetime] = None, start_date: Optional[datetime] = None,
+                          portfolio_ids: Optional[Iterable[int]] = None) -> Dict[str, int]:
+    """
+    增量计算组合净值快照（未提交）
+
+    已有快照的组合从最近一条快照续算至end_date；尚无快照的组合以start_date起第一个交易日
+    （未指定时为end_date前最近一个交易日）为基准日，写入净值为1的基准快照。
+    持仓代码（Asset.code）按市场数据代码（MarketData.symbol）匹配行情，全部组合一次批量计算。
+    """
+    portfolio_query = db.query(Portfolio.id).filter(Portfolio.is_active == True)
+    if portfolio_ids is not None:
+        portfolio_query = portfolio_query.filter(Portfolio.id.in_(list(portfolio_ids)))
+    ids = [row.id for row in portfolio_query.order_by(Portfolio.id).all()]
+    if not ids:
+        return {"portfolios": 0, "snapshots": 0}
+
+    holdings = pd.DataFrame(db.query(
+        PortfolioAsset.portfolio_id, PortfolioAsset.weight, Asset.code, MarketData.id
+    ).join(Asset, Asset.id == PortfolioAsset.asset_id).outerjoin(
+        MarketData, MarketData.symbol == Asset.code
+    ).filter(PortfolioAsset.portfolio_id.in_(ids)).all(), columns=["portfolio_id", "weight", "code", "market_data_id"])
+    priced = holdings.dropna(subset=["market_data_id"])
+    market_data_ids = sorted(int(i) for i in priced["market_data_id"].unique())
+
+    date_query = db.query(PriceHistory.date).filter(PriceHistory.market_data_id.in_(market_data_ids))
+    if end_date is not None:
+        date_query = date_query.filter(PriceHistory.date <= end_date)
+    last_trading_day = date_query.with_entities(func.max(PriceHistory.date)).scalar() if market_data_ids else None
+    if last_trading_day is None:
+        return {"portfolios": 0, "snapshots": 0}
+
+    # 各组合的基准日：最近一次快照日，或新组合的起始交易日
+    previous = PortfolioNavSnapshot.latest(db, ids)
+    first_trading_day = last_trading_day
+    if start_date is not None:
+        first_trading_day = date_query.filter(PriceHistory.date >= start_date).with_entities(
+            func.min(PriceHistory.date)
+        ).scalar()
+    base_dates = {pid: previous[pid].date if pid in previous else first_trading_day for pid in ids}
+    pending = [
+        pid for pid in ids if base_dates[pid] is not None and (
+            base_dates[pid] < last_trading_day if pid in previous else base_dates[pid] <= last_trading_day
+        )
+    ]
+    if not pending:
+        return {"portfolios": 0, "snapshots": 0}
+
+    # 多加载几个交易日以便停牌标的沿用前收盘价
+    load_from = min(base_dates[pid] for pid in pending)
+    warmup = date_query.filter(PriceHistory.date < load_from).distinct().order_by(
+        PriceHistory.date.desc()
+    ).offset(IndustryAggregate.WARMUP_DAYS - 1).limit(1).scalar()
+    bars = pd.DataFrame(db.query(
+        PriceHistory.date, PriceHistory.market_data_id,
+        func.coalesce(PriceHistory.adjusted_close, PriceHistory.close_price)
+    ).filter(
+        PriceHistory.market_data_id.in_(market_data_ids),
+        PriceHistory.date >= (warmup or load_from),
+        PriceHistory.date <= last_trading_day
+    ).all(), columns=["date", "market_data_id", "close"])
+    closes = bars.pivot_table(index="date", columns="market_data_id", values="close", aggfunc="last").reindex(
+        columns=market_data_ids
+    ).sort_index()
+    dates = pd.DatetimeIndex(closes.index)
+
+    row_of = {pid: i for i, pid in enumerate(pending)}
+    column_of = {mid: j for j, mid in enumerate(market_data_ids)}
+    weights = np.zeros((len(pending), len(market_data_ids)))
+    codes = [None] * len(market_data_ids)
+    for pid, weight, code, mid in priced.itertuples(index=False):
+        if pid in row_of:
+            # 持仓权重以百分比存储
+            weights[row_of[pid], column_of[int(mid)]] += weight / 100
+            codes[column_of[int(mid)]] = code
+    total_weights = holdings.groupby("portfolio_id")["weight"].sum() / 100
+
+    base_rows = np.array([dates.searchsorted(pd.Timestamp(base_dates[pid]), side="right") - 1 for pid in pending])
+    base_navs = np.array([
+        previous[pid].nav if pid in previous else PortfolioValuationEngine.BASE_NAV for pid in pending
+    ], dtype=float)
+    result = PortfolioValuationEngine().valuate(weights, closes.to_numpy(dtype=float), base_rows, base_navs)
+
+    rows = []
+    for i, pid in enumerate(pending):
+        held = np.flatnonzero(weights[i])
+        total = float(total_weights.get(pid, 0.0))
+        # 新组合从基准日本身开始写入，已有快照的组合从基准日之后开始
+        first = base_rows[i] if pid not in previous else base_rows[i] + 1
+        for t in range(max(first, 0), len(dates)):
+            nav = float(result["nav"][t, i])
+            rows.append({
+                "portfolio_id": pid,
+                "date": dates[t].to_pydatetime(),
+                "nav": nav,
+                "daily_return": float(result["daily_return"][t, i]),
+                "cumulative_return": nav / PortfolioValuationEngine.BASE_NAV - 1.0,
+                "coverage": float(result["covered_weight"][t, i] / total) if total > 0 else 1.0,
+                "contributions": {
+                    codes[j]: float(weights[i, j] * result["asset_returns"][t, j]) for j in held
+                } if t > base_rows[i] else {},
+                "created_at": datetime.utcnow(),
+            })
+    if rows:
+        db.execute(insert(PortfolioNavSnapshot), rows)
+    return {"portfolios": len({row["portfolio_id"] for row in rows}), "snapshots": len(rows)}
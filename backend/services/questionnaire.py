@@ -0,0 +1,116 @@
+"""
+风险测评问卷服务
+编译问卷模板评分器、发布模板新版本，并按模板版本批量重新评分历史测评
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import numpy as np
+from sqlalchemy import func, insert, and_, or_, bindparam
+
+from models.user_profile import QuestionnaireTemplate, RiskAssessment, RiskAssessmentScoring
+from models.ai_models import QuestionnaireScorer
+
+# 编译后的评分器，模板版本不可修改，按 (ID, 创建时间) 缓存
+_scorers: Dict[Any, QuestionnaireScorer] = {}
+
+
+def template_scorer(template: QuestionnaireTemplate) -> QuestionnaireScorer:
+    """编译（或取缓存的）模板评分器"""
+    key = (template.id, template.created_at)
+    scorer = _scorers.get(key)
+    if scorer is None:
+        scorer = QuestionnaireScorer(template.questions, template.bands, template.tolerance_divisor)
+        _scorers[key] = scorer
+    return scorer
+
+
+def publish_template(db, code: str, name: str, questions: List[Dict[str, Any]], bands: List[Dict[str, Any]],
+                     tolerance_divisor: float = 10.0, description: Optional[str] = None,
+                     activate: bool = True) -> QuestionnaireTemplate:
+    """发布模板新版本（未提交），定义无效时抛出 ValueError"""
+    QuestionnaireScorer(questions, bands, tolerance_divisor)
+    if code == QuestionnaireTemplate.DEFAULT_CODE:
+        QuestionnaireTemplate.ensure_default(db)
+    latest = db.query(func.max(QuestionnaireTemplate.version)).filter(QuestionnaireTemplate.code == code).scalar()
+    if activate:
+        db.query(QuestionnaireTemplate).filter(QuestionnaireTemplate.code == code).update(
+            {"is_active": False}, synchronize_session=False
+        )
+    template = QuestionnaireTemplate(
+        code=code, version=(latest or 0) + 1, name=name, description=description, questions=questions,
+        bands=bands, tolerance_divisor=tolerance_divisor, is_active=activate
+    )
+    db.add(template)
+    db.flush()
+    return template
+
+
+def score_rows(result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """评分结果转换为各答卷对应的测评记录字段"""
+    columns = {
+        "total_score": np.rint(result["total"]).astype(int).tolist(),
+        "risk_level": result["risk_level"],
+        "risk_tolerance": result["risk_tolerance"].tolist(),
+    }
+    for j, dimension in enumerate(QuestionnaireScorer.DIMENSIONS):
+        values = result["dimensions"][:, j]
+        columns[f"{dimension}_score"] = [None] * len(values) if np.isnan(values).all() else np.rint(values).astype(int).tolist()
+    return [dict(zip(columns, row)) for row in zip(*columns.values())]
+
+
+def rescore_assessments(db, template: QuestionnaireTemplate, versions: Optional[List[int]] = None,
+                        include_legacy: bool = False, chunk_size: int = 1000) -> Dict[str, int]:
+    """
+    按指定模板版本重新评分同一模板代码（可限定版本）下的全部历史测评（未提交）
+
+    按ID分批读取与回写，每批一次矩阵评分、一次批量更新；答案不符合该版本的测评保持原结果并计入 invalid。
+    include_legacy 为真时一并评分没有评分记录（由客户端计分）的测评。
+    """
+    scorer = template_scorer(template)
+    template_ids = db.query(QuestionnaireTemplate.id).filter(QuestionnaireTemplate.code == template.code)
+    if versions:
+        template_ids = template_ids.filter(QuestionnaireTemplate.version.in_(versions))
+    source = RiskAssessmentScoring.template_id.in_(template_ids.scalar_subquery())
+    if include_legacy:
+        source = or_(source, and_(RiskAssessmentScoring.id.is_(None), RiskAssessment.answers.isnot(None)))
+    query = db.query(
+        RiskAssessment.id, RiskAssessment.answers, RiskAssessment.risk_level, RiskAssessmentScoring.id
+    ).outerjoin(RiskAssessmentScoring, RiskAssessmentScoring.assessment_id == RiskAssessment.id).filter(source)
+
+    counts = {"assessments": 0, "rescored": 0, "changed_level": 0, "invalid": 0}
+    last_id = 0
+    while True:
+        rows = query.filter(RiskAssessment.id > last_id).order_by(RiskAssessment.id).limit(chunk_size).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        result = scorer.score([answers if isinstance(answers, dict) else {} for _, answers, _, _ in rows])
+        scored_at = datetime.utcnow()
+        assessment_updates, scoring_updates, scoring_inserts = [], [], []
+        for (assessment_id, _, risk_level, scoring_id), fields, invalid in zip(
+            rows, score_rows(result), result["invalid"]
+        ):
+            if invalid:
+                counts["invalid"] += 1
+                continue
+            counts["changed_level"] += int(fields["risk_level"] != risk_level)
+            fields["assessment_id"] = assessment_id
+            assessment_updates.append(fields)
+            if scoring_id is None:
+                scoring_inserts.append({"assessment_id": assessment_id, "template_id": template.id, "scored_at": scored_at})
+            else:
+                scoring_updates.append({"scoring_id": scoring_id, "template_id": template.id, "scored_at": scored_at})
+        # 按主键的核心层 executemany，避免ORM批量更新逐行整理参数的开销
+        if assessment_updates:
+            db.execute(RiskAssessment.__table__.update().where(
+                RiskAssessment.__table__.c.id == bindparam("assessment_id")
+            ), assessment_updates)
+        if scoring_updates:
+            db.execute(RiskAssessmentScoring.__table__.update().where(
+                RiskAssessmentScoring.__table__.c.id == bindparam("scoring_id")
+            ), scoring_updates)
+        if scoring_inserts:
+            db.execute(insert(RiskAssessmentScoring), scoring_inserts)
+        counts["assessments"] += len(rows)
+        counts["rescored"] += len(assessment_updates)
+    return counts
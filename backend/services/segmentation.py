@@ -0,0 +1,185 @@
+"""
+客户分群服务
+按用户画像特征小批量K均值全量分群，或把变更画像增量归入当前客群
+"""
+from datetime import datetime
+from typing import Any, Dict, Optional
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, insert, or_, bindparam
+
+from models.user_profile import UserProfile, ProfileSegmentation, ProfileSegment, UserSegment
+from models.ai_models import ProfileSegmenter, SuitabilityEngine
+
+DEFAULT_CLUSTERS = 8
+# 增量变更的画像超过全部画像的该比例时重新全量分群
+REFIT_FRACTION = 0.2
+# 每批写入的用户归属数
+CHUNK_SIZE = 10000
+# 客群名称使用的风险等级称谓
+LEVEL_NAMES = {1: "保守", 2: "稳健", 3: "平衡", 4: "积极", 5: "激进"}
+
+
+def _profile_query(db):
+    return db.query(
+        UserProfile.user_id, UserProfile.updated_at, UserProfile.target_return, UserProfile.max_drawdown_tolerance,
+        *[getattr(UserProfile, name) for name in ProfileSegmenter.FEATURES]
+    )
+
+
+def _profiles(rows) -> pd.DataFrame:
+    profiles = pd.DataFrame(rows, columns=["user_id", "updated_at", "target_return", "max_drawdown_tolerance",
+                                           *ProfileSegmenter.FEATURES])
+    # 画像更新时间按原值写回归属记录，缺失保持为空
+    profiles["updated_at"] = profiles["updated_at"].astype(object).where(profiles["updated_at"].notna(), None)
+    return profiles
+
+
+def refresh_segmentation(db, n_clusters: Optional[int] = None, refit: bool = False, seed: Optional[int] = None,
+                         batch_size: int = 1024) -> Dict[str, Any]:
+    """
+    刷新客户分群（未提交）
+
+    没有当前分群、显式要求、客群数变化或变更画像超过 REFIT_FRACTION 时全量分群：
+    标准化全部画像特征后小批量K均值聚类，重写全部用户归属；
+    否则只把新增或更新过的画像（画像更新时间晚于归属记录）按当前分群的标准化参数归入最近的客群。
+    """
+    current = db.query(ProfileSegmentation).filter(ProfileSegmentation.is_active == True).order_by(
+        ProfileSegmentation.id.desc()
+    ).first()
+    total = db.query(func.count(UserProfile.id)).scalar()
+    if total == 0:
+        return {"segmentation_id": current.id if current else None, "refitted": False, "users": 0, "assigned": 0,
+                "segments": current.n_clusters if current else 0, "inertia": current.inertia if current else None}
+
+    if current is not None and not refit and (n_clusters is None or n_clusters == current.n_clusters):
+        profiles = _profiles(_profile_query(db).outerjoin(
+            UserSegment, UserSegment.user_id == UserProfile.user_id
+        ).filter(or_(
+            UserSegment.id.is_(None),
+            UserSegment.segmentation_id != current.id,
+            UserProfile.updated_at > UserSegment.profile_updated_at,
+        )).all())
+        if len(profiles) <= REFIT_FRACTION * total:
+            return _assign_incremental(db, current, profiles, total)
+
+    profiles = _profiles(_profile_query(db).order_by(UserProfile.user_id).all())
+    return _fit(db, profiles, n_clusters or (current.n_clusters if current else None) or DEFAULT_CLUSTERS,
+                seed, batch_size)
+
+
+def _fit(db, profiles: pd.DataFrame, n_clusters: int, seed: Optional[int], batch_size: int) -> Dict[str, Any]:
+    """全量分群并重写全部用户归属"""
+    raw = ProfileSegmenter.features(profiles)
+    points, means, scales = ProfileSegmenter.standardize(raw)
+    segmenter = ProfileSegmenter(n_clusters=n_clusters, batch_size=batch_size, seed=seed)
+    fitted = segmenter.fit(points)
+    centers = fitted["centers"]
+
+    # 客群按中心的风险承受评分从低到高编号，结果与聚类标签顺序无关
+    tolerance = centers[:, 0] * scales[0] + means[0]
+    order = np.argsort(tolerance, kind="stable")
+    levels = SuitabilityEngine.allowed_levels(tolerance).astype(int)
+    labels = np.empty(len(order), dtype=int)
+    labels[order] = np.arange(len(order))
+    user_labels = labels[fitted["labels"]]
+
+    fitted_at = datetime.utcnow()
+    db.query(ProfileSegmentation).filter(ProfileSegmentation.is_active == True).update(
+        {"is_active": False}, synchronize_session=False
+    )
+    segmentation = ProfileSegmentation(
+        n_clusters=len(centers), features=list(ProfileSegmenter.FEATURES), means=means.tolist(),
+        scales=scales.tolist(), centers=centers[order].tolist(), inertia=fitted["inertia"], users=len(profiles),
+        incremental_updates=0, is_active=True, fitted_at=fitted_at, updated_at=fitted_at
+    )
+    db.add(segmentation)
+    db.flush()
+
+    targets = profiles["target_return"].to_numpy(dtype=float)
+    drawdowns = profiles["max_drawdown_tolerance"].to_numpy(dtype=float)
+    sizes = np.bincount(user_labels, minlength=len(order))
+    ordinal: Dict[int, int] = {}
+    segments = []
+    for label, cluster in enumerate(order):
+        level = int(levels[cluster])
+        ordinal[level] = ordinal.get(level, 0) + 1
+        members = user_labels == label
+        segments.append(ProfileSegment(
+            segmentation_id=segmentation.id, label=label,
+            name=f"{LEVEL_NAMES[level]}型客群{ordinal[level]}", risk_level=level,
+            size=int(sizes[label]), center=(centers[cluster] * scales + means).tolist(),
+            target_return=_median(targets[members]),
+            max_drawdown_tolerance=_median(drawdowns[members]),
+        ))
+    db.add_all(segments)
+    db.flush()
+
+    segment_ids = np.array([segment.id for segment in segments])
+    db.query(UserSegment).delete(synchronize_session=False)
+    rows = [
+        {"user_id": int(user_id), "segmentation_id": segmentation.id, "segment_id": int(segment_id),
+         "distance": float(distance), "profile_updated_at": updated_at, "assigned_at": fitted_at}
+        for user_id, segment_id, distance, updated_at in zip(
+            profiles["user_id"], segment_ids[user_labels], fitted["distances"], profiles["updated_at"]
+        )
+    ]
+    # 全量重写使用核心层批量插入，避免ORM批量插入逐行整理参数的开销
+    for start in range(0, len(rows), CHUNK_SIZE):
+        db.execute(UserSegment.__table__.insert(), rows[start:start + CHUNK_SIZE])
+    return {"segmentation_id": segmentation.id, "refitted": True, "users": len(profiles), "assigned": len(rows),
+            "segments": len(segments), "inertia": segmentation.inertia}
+
+
+def _assign_incremental(db, current: ProfileSegmentation, profiles: pd.DataFrame, total: int) -> Dict[str, Any]:
+    """按当前分群的标准化参数与中心归类变更画像，更新客群人数"""
+    assigned_at = datetime.utcnow()
+    if len(profiles):
+        raw = ProfileSegmenter.features(profiles)
+        points, _, _ = ProfileSegmenter.standardize(raw, np.array(current.means), np.array(current.scales))
+        labels, distances = ProfileSegmenter().assign(points, np.array(current.centers))
+        segment_of = dict(db.query(ProfileSegment.label, ProfileSegment.id).filter(
+            ProfileSegment.segmentation_id == current.id
+        ).all())
+        existing = dict(db.query(UserSegment.user_id, UserSegment.id).filter(
+            UserSegment.user_id.in_(profiles["user_id"].tolist())
+        ).all())
+        updates, inserts = [], []
+        for user_id, label, distance, updated_at in zip(
+            profiles["user_id"], labels, distances, profiles["updated_at"]
+        ):
+            row = {"segmentation_id": current.id, "segment_id": segment_of[int(label)], "distance": float(distance),
+                   "profile_updated_at": updated_at, "assigned_at": assigned_at}
+            if int(user_id) in existing:
+                updates.append({"user_segment_id": existing[int(user_id)], **row})
+            else:
+                inserts.append({"user_id": int(user_id), **row})
+        table = UserSegment.__table__
+        for start in range(0, max(len(updates), len(inserts)), CHUNK_SIZE):
+            chunk = updates[start:start + CHUNK_SIZE]
+            if chunk:
+                db.execute(table.update().where(table.c.id == bindparam("user_segment_id")), chunk)
+            chunk = inserts[start:start + CHUNK_SIZE]
+            if chunk:
+                db.execute(insert(UserSegment), chunk)
+
+    # 删除画像已不存在的用户归属，按归属记录重算客群人数
+    db.query(UserSegment).filter(~UserSegment.user_id.in_(db.query(UserProfile.user_id))).delete(
+        synchronize_session=False
+    )
+    sizes = dict(db.query(UserSegment.segment_id, func.count(UserSegment.id)).filter(
+        UserSegment.segmentation_id == current.id
+    ).group_by(UserSegment.segment_id).all())
+    for segment in db.query(ProfileSegment).filter(ProfileSegment.segmentation_id == current.id).all():
+        segment.size = sizes.get(segment.id, 0)
+    current.users = total
+    current.incremental_updates = (current.incremental_updates or 0) + len(profiles)
+    current.updated_at = assigned_at
+    db.flush()
+    return {"segmentation_id": current.id, "refitted": False, "users": total, "assigned": len(profiles),
+            "segments": current.n_clusters, "inertia": current.inertia}
+
+
+def _median(values: np.ndarray) -> Optional[float]:
+    values = values[~np.isnan(values)]
+    return float(np.median(values)) if len(values) else None
@@ -0,0 +1,166 @@
+"""
+压力测试服务
+按情景冲击批量计算全部活跃组合的情景收益并写入测试结果
+"""
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert
+
+from models.portfolio import Portfolio, PortfolioAsset, Asset
+from models.market_data import MarketData, PriceHistory, MarketIndex, IndexHistory
+from models.risk import StressScenario, StressTestResult
+from models.ai_models import StressTestEngine
+
+# 历史区间端点向前寻找收盘价的自然日数
+ANCHOR_DAYS = 10
+
+
+def _window_returns(panel, start: datetime, end: datetime):
+    """区间收益：区间内最后一个收盘价与起点前最后一个收盘价之比，任一端缺失为NaN"""
+    if panel.empty:
+        return np.full(len(panel.columns), np.nan)
+    before = panel[panel.index < start].ffill()
+    within = panel[(panel.index >= start) & (panel.index <= end)].ffill()
+    if before.empty or within.empty:
+        return np.full(len(panel.columns), np.nan)
+    return (within.iloc[-1] / before.iloc[-1] - 1.0).to_numpy(dtype=float)
+
+
+def stress_test_portfolios(db, run_date: datetime, scenario_ids: Optional[List[int]] = None,
+                           lookback_days: int = 252, end_date: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """
+    对全部活跃组合执行压力测试并覆盖测试日的结果（未提交），返回各情景的汇总
+
+    组合持仓与行情各一次集合查询，情景冲击合成 资产×情景 矩阵后与 组合×资产 权重矩阵相乘。
+    历史情景缺少基准指数区间行情、或因子冲击引用的指数不存在时跳过该情景。
+    """
+    query = db.query(StressScenario)
+    if scenario_ids:
+        query = query.filter(StressScenario.id.in_(scenario_ids))
+    scenarios = query.order_by(StressScenario.id).all()
+    if not scenarios:
+        return []
+
+    portfolios = pd.DataFrame(db.query(Portfolio.id, Portfolio.user_id).filter(
+        Portfolio.is_active == True
+    ).order_by(Portfolio.id).all(), columns=["portfolio_id", "user_id"])
+    holdings = pd.DataFrame(db.query(
+        PortfolioAsset.portfolio_id, PortfolioAsset.weight, MarketData.id, MarketData.symbol
+    ).join(Portfolio, Portfolio.id == PortfolioAsset.portfolio_id).join(
+        Asset, Asset.id == PortfolioAsset.asset_id
+    ).join(MarketData, MarketData.symbol == Asset.code).filter(
+        Portfolio.is_active == True
+    ).all(), columns=["portfolio_id", "weight", "market_data_id", "symbol"])
+    instruments = holdings.drop_duplicates("market_data_id").sort_values("market_data_id")
+    market_data_ids = [int(i) for i in instruments["market_data_id"]]
+    symbols = list(instruments["symbol"])
+    column_of = {symbol: j for j, symbol in enumerate(symbols)}
+
+    # 因子：历史情景的基准指数与自定义冲击引用的指数
+    codes = sorted({s.index_code for s in scenarios if s.scenario_type == "historical" and s.index_code} |
+                   {code for s in scenarios for code in (s.factor_shocks or {})})
+    index_ids = dict(db.query(MarketIndex.code, MarketIndex.id).filter(MarketIndex.code.in_(codes)).all()) if codes else {}
+    asset_returns = PriceHistory.return_panel(db, market_data_ids, lookback_days, end_date)
+    if len(asset_returns) and index_ids:
+        index_returns = IndexHistory.close_panel(
+            db, list(index_ids.values()),
+            asset_returns.index[0] - timedelta(days=ANCHOR_DAYS), asset_returns.index[-1]
+        ).pct_change(fill_method=None).reindex(asset_returns.index)
+    else:
+        index_returns = pd.DataFrame(index=asset_returns.index, columns=list(index_ids.values()), dtype=float)
+
+    summaries, evaluated, factor_sets = [], [], {}
+    factor_shocks = []
+    replayed = np.full((len(market_data_ids), len(scenarios)), np.nan)
+    overrides = np.full((len(market_data_ids), len(scenarios)), np.nan)
+    for k, scenario in enumerate(scenarios):
+        summary = {"scenario_id": scenario.id, "name": scenario.name, "status": "completed", "index_return": None}
+        shocks = dict(scenario.factor_shocks or {})
+        missing = [code for code in shocks if code not in index_ids]
+        if scenario.scenario_type == "historical":
+            if scenario.index_code not in index_ids:
+                missing.append(scenario.index_code)
+            else:
+                start = scenario.start_date - timedelta(days=ANCHOR_DAYS)
+                index_return = _window_returns(IndexHistory.close_panel(
+                    db, [index_ids[scenario.index_code]], start, scenario.end_date
+                ), scenario.start_date, scenario.end_date)[0]
+                if np.isnan(index_return):
+                    summary["status"] = "skipped"
+                    summary["reason"] = "基准指数缺少情景区间行情"
+                else:
+                    summary["index_return"] = float(index_return)
+                    shocks[scenario.index_code] = shocks.get(scenario.index_code, 0.0) + index_return
+                    replayed[:, k] = _window_returns(PriceHistory.close_panel(
+                        db, market_data_ids, start, scenario.end_date
+                    ), scenario.start_date, scenario.end_date)
+        if missing:
+            summary["status"] = "skipped"
+            summary["reason"] = f"指数不存在: {', '.join(sorted(set(str(code) for code in missing)))}"
+        if summary["status"] == "completed":
+            for symbol, shock in (scenario.symbol_shocks or {}).items():
+                if symbol in column_of:
+                    overrides[column_of[symbol], k] = shock
+            # 冲击相同因子组合的情景共用一组Beta
+            shocks = {code: shock for code, shock in shocks.items() if shock != 0}
+            factor_sets.setdefault(tuple(sorted(shocks)), []).append(len(evaluated))
+            factor_shocks.append(shocks)
+            evaluated.append(k)
+        summaries.append(summary)
+
+    implied = np.full((len(market_data_ids), len(evaluated)), np.nan)
+    for factor_set, members in factor_sets.items():
+        if not factor_set:
+            continue
+        columns = [index_ids[code] for code in factor_set]
+        betas = StressTestEngine.betas(
+            asset_returns.to_numpy(dtype=float), index_returns[columns].to_numpy(dtype=float)
+        )
+        implied[:, members] = StressTestEngine.implied_shocks(betas, np.array([
+            [factor_shocks[j][code] for j in members] for code in factor_set
+        ], dtype=float).reshape(len(factor_set), len(members)))
+
+    db.query(StressTestResult).filter(
+        StressTestResult.run_date == run_date, StressTestResult.scenario_id.in_([s.id for s in scenarios])
+    ).delete(synchronize_session=False)
+    if not evaluated or portfolios.empty:
+        for k in evaluated:
+            summaries[k].update(portfolios=0, mean_return=None, worst_return=None, mean_coverage=None)
+        return summaries
+
+    shocks = StressTestEngine.asset_shocks(implied, replayed[:, evaluated], overrides[:, evaluated])
+    row_of = pd.Series(np.arange(len(portfolios)), index=portfolios["portfolio_id"])
+    weights = np.zeros((len(portfolios), len(market_data_ids)))
+    np.add.at(weights, (
+        row_of[holdings["portfolio_id"]].to_numpy(),
+        np.array([column_of[symbol] for symbol in holdings["symbol"]], dtype=int)
+    ), holdings["weight"].to_numpy(dtype=float) / 100)
+    result = StressTestEngine().apply(weights, shocks)
+
+    created_at = datetime.utcnow()
+    portfolio_ids = portfolios["portfolio_id"].to_numpy()
+    user_ids = portfolios["user_id"].to_numpy()
+    rows = []
+    for j, k in enumerate(evaluated):
+        returns, coverage = result["returns"][:, j], result["coverage"][:, j]
+        worst_asset, worst_contribution = result["worst_asset"][:, j], result["worst_contribution"][:, j]
+        rows.extend({
+            "run_date": run_date,
+            "scenario_id": scenarios[k].id,
+            "portfolio_id": int(portfolio_ids[i]),
+            "user_id": int(user_ids[i]),
+            "portfolio_return": float(returns[i]),
+            "coverage": float(coverage[i]),
+            "worst_symbol": symbols[worst_asset[i]] if worst_asset[i] >= 0 else None,
+            "worst_contribution": float(worst_contribution[i]),
+            "created_at": created_at,
+        } for i in range(len(portfolio_ids)))
+        summaries[k].update(
+            portfolios=len(portfolio_ids), mean_return=float(returns.mean()),
+            worst_return=float(returns.min()), mean_coverage=float(coverage.mean())
+        )
+    db.execute(insert(StressTestResult), rows)
+    return summaries
+
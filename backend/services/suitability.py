@@ -0,0 +1,103 @@
+"""
+组合适当性检查服务
+按持有人画像批量检查全部活跃组合的实际风险
+"""
+from datetime import datetime
+from typing import Dict, Optional
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert
+
+from models.portfolio import Portfolio, PortfolioAsset, Asset
+from models.user_profile import UserProfile
+from models.market_data import MarketData, PriceHistory
+from models.risk import SuitabilityCheck
+from models.ai_models import SuitabilityEngine, BatchPortfolioOptimizer
+
+
+def check_suitability(db, run_date: datetime, lookback_days: int = 252,
+                      end_date: Optional[datetime] = None) -> Dict[str, int]:
+    """
+    对全部活跃组合执行适当性检查并覆盖检查日的结果（未提交），返回各状态的组合数
+
+    组合、画像、持仓与行情各一次集合查询，风险指标按 组合×资产 权重矩阵批量计算。
+    """
+    portfolios = pd.DataFrame(db.query(
+        Portfolio.id, Portfolio.user_id, Portfolio.risk_level, UserProfile.id,
+        UserProfile.risk_tolerance_score, UserProfile.max_drawdown_tolerance, UserProfile.liquidity_needs
+    ).outerjoin(UserProfile, UserProfile.user_id == Portfolio.user_id).filter(
+        Portfolio.is_active == True
+    ).order_by(Portfolio.id).all(), columns=[
+        "portfolio_id", "user_id", "risk_level", "profile_id", "risk_tolerance_score",
+        "max_drawdown_tolerance", "liquidity_needs"
+    ])
+    db.query(SuitabilityCheck).filter(SuitabilityCheck.run_date == run_date).delete(synchronize_session=False)
+    if portfolios.empty:
+        return {"portfolios": 0, "pass": 0, "breach": 0, "unassessed": 0}
+
+    holdings = pd.DataFrame(db.query(
+        PortfolioAsset.portfolio_id, PortfolioAsset.weight, MarketData.id
+    ).join(Portfolio, Portfolio.id == PortfolioAsset.portfolio_id).join(
+        Asset, Asset.id == PortfolioAsset.asset_id
+    ).outerjoin(MarketData, MarketData.symbol == Asset.code).filter(
+        Portfolio.is_active == True
+    ).all(), columns=["portfolio_id", "weight", "market_data_id"])
+    # 持仓权重以百分比存储
+    holdings["weight"] = holdings["weight"] / 100
+    listed = holdings.dropna(subset=["market_data_id"])
+    market_data_ids = sorted(int(i) for i in listed["market_data_id"].unique())
+
+    returns = PriceHistory.return_panel(db, market_data_ids, lookback_days, end_date).to_numpy(dtype=float)
+
+    row_of = pd.Series(np.arange(len(portfolios)), index=portfolios["portfolio_id"])
+    column_of = pd.Series(np.arange(len(market_data_ids)), index=market_data_ids, dtype=int)
+    weights = np.zeros((len(portfolios), len(market_data_ids)))
+    np.add.at(weights, (
+        row_of[listed["portfolio_id"]].to_numpy(), column_of[listed["market_data_id"].astype(int)].to_numpy()
+    ), listed["weight"].to_numpy(dtype=float))
+    illiquid = holdings[holdings["market_data_id"].isna()].groupby("portfolio_id")["weight"].sum()
+    illiquid_weights = illiquid.reindex(portfolios["portfolio_id"]).fillna(0.0).to_numpy(dtype=float)
+
+    engine = SuitabilityEngine()
+    measured = engine.measure(weights, returns)
+    tolerances = np.array([
+        abs(BatchPortfolioOptimizer._as_ratio(value)) if pd.notna(value) else np.nan
+        for value in portfolios["max_drawdown_tolerance"]
+    ], dtype=float)
+    checks = engine.evaluate(
+        portfolios["risk_level"].to_numpy(dtype=float),
+        measured["volatility"],
+        measured["max_drawdown"],
+        portfolios["risk_tolerance_score"].to_numpy(dtype=float),
+        tolerances,
+        illiquid_weights,
+        np.array([
+            engine.liquidity_limit(value if pd.notna(value) else None) for value in portfolios["liquidity_needs"]
+        ], dtype=float)
+    )
+    flags = np.column_stack([checks[name] for name in SuitabilityCheck.BREACH_TYPES])
+    has_profile = portfolios["profile_id"].notna().to_numpy()
+    statuses = np.where(flags.any(axis=1), "breach", np.where(has_profile, "pass", "unassessed"))
+
+    rows = []
+    for i, portfolio in enumerate(portfolios.itertuples(index=False)):
+        allowed = checks["allowed_level"][i]
+        rows.append({
+            "run_date": run_date,
+            "portfolio_id": int(portfolio.portfolio_id),
+            "user_id": int(portfolio.user_id),
+            "risk_level": int(portfolio.risk_level),
+            "allowed_risk_level": int(allowed) if np.isfinite(allowed) else None,
+            "volatility": float(measured["volatility"][i]),
+            "max_drawdown": float(measured["max_drawdown"][i]),
+            "expected_drawdown": float(checks["expected_drawdown"][i]),
+            "drawdown_tolerance": float(tolerances[i]) if np.isfinite(tolerances[i]) else None,
+            "illiquid_weight": float(illiquid_weights[i]),
+            "liquidity_needs": portfolio.liquidity_needs if pd.notna(portfolio.liquidity_needs) else None,
+            "status": str(statuses[i]),
+            "breaches": [name for name, flag in zip(SuitabilityCheck.BREACH_TYPES, flags[i]) if flag],
+            "created_at": datetime.utcnow(),
+        })
+    db.execute(insert(SuitabilityCheck), rows)
+    counts = {status: int((statuses == status).sum()) for status in ("pass", "breach", "unassessed")}
+    return {"portfolios": len(rows), **counts}
@@ -0,0 +1,171 @@
+"""
+批量个性化组合优化测试
+测试按约束签名分组求解、用户画像约束、多进程并行、幂等写入及每日运行集成
+"""
+import pytest
+import numpy as np
+from sqlalchemy import insert
+from datetime import datetime, timedelta
+
+from conftest import sqlite_test_client
+from models.user import User
+from models.user_profile import UserProfile
+from models.portfolio import Portfolio
+from models.market_data import MarketData, PriceHistory, AssetType
+from models.strategy import Strategy, StrategyType, AssetClass, PortfolioAllocation
+from models.ai_models import BatchPortfolioOptimizer
+
+# 使用独立的测试数据库
+engine, TestingSessionLocal, client = sqlite_test_client("test_batch_optimization.db")
+
+SYMBOLS = [f"B{i}" for i in range(10)]
+N_DAYS = 200
+N_PORTFOLIOS = 10000
+# 用户画像：(目标收益, 最大回撤容忍度)，回撤同时覆盖小数与百分数两种录入方式
+PROFILES = [(None, None), (0.05, 0.25), (0.08, 30.0), (0.5, None), (None, 0.02)]
+
+
+@pytest.fixture(scope="module")
+def headers(client):
+    client.post("/users/", json={
+        "username": "batch_opt_user",
+        "email": "batch_opt@test.com",
+        "password": "testpassword123"
+    })
+    resp = client.post("/auth/token", data={"username": "batch_opt_user", "password": "testpassword123"})
+    assert resp.status_code == 200
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def setup(headers):
+    db = TestingSessionLocal()
+    try:
+        rng = np.random.default_rng(11)
+        market = rng.normal(0.0005, 0.01, N_DAYS)
+        betas = np.linspace(0.3, 1.6, len(SYMBOLS))
+        returns = market[:, None] * betas + rng.normal(0, 0.008, (N_DAYS, len(SYMBOLS)))
+        closes = 10 * np.cumprod(1 + returns, axis=0)
+        for j, symbol in enumerate(SYMBOLS):
+            instrument = MarketData(symbol=symbol, name=symbol, asset_type=AssetType.STOCK, exchange="SSE",
+                                    industry="银行" if j < 3 else "科技")
+            db.add(instrument)
+            db.flush()
+            db.add_all([
+                PriceHistory(market_data_id=instrument.id, date=datetime(2024, 1, 1) + timedelta(days=t),
+                             close_price=float(closes[t, j]))
+                for t in range(N_DAYS)
+            ])
+        
+        user_ids = [row.id for row in db.execute(insert(User).returning(User.id), [
+            {"username": f"client{i}", "email": f"client{i}@test.com", "password_hash": "x"}
+            for i in range(len(PROFILES))
+        ])]
+        db.execute(insert(UserProfile), [
+            {"user_id": user_id, "target_return": target, "max_drawdown_tolerance": drawdown}
+            for user_id, (target, drawdown) in zip(user_ids, PROFILES)
+        ])
+        # 一万个客户组合：画像与风险等级交替分布
+        db.execute(insert(Portfolio), [
+            {"name": f"客户组合{i}", "risk_level": i % 5 + 1, "user_id": user_ids[i // 5 % len(PROFILES)]}
+            for i in range(N_PORTFOLIOS)
+        ])
+        strategy = Strategy(name="个性化配置", strategy_type=StrategyType.CUSTOM, asset_class=AssetClass.STOCK)
+        db.add(strategy)
+        db.commit()
+        return {"strategy": strategy.id}
+    finally:
+        db.close()
+
+
+def test_signature_normalizes_profiles():
+    batch = BatchPortfolioOptimizer()
+    assert batch.signature(3, 0.0512, 30.0) == batch.signature(3, 0.05, 0.3) == (3, 0.05, 0.3)
+    assert batch.signature(9, None, None) == (5, None, None)
+    assert batch.profile((2, None, 0.2))["max_volatility"] == pytest.approx(0.1)
+
+
+def test_batch_optimization(client, headers, setup):
+    """一万个组合按约束签名求解，写入个性化配置"""
+    payload = {"strategy_id": setup["strategy"], "symbols": SYMBOLS, "max_weight": 0.4, "group_limits": {"银行": 0.5}}
+    resp = client.post("/strategy/optimize/batch", json=payload, headers=headers)
+    assert resp.status_code == 200, resp.text
+    data = resp.json()
+    assert data["portfolios"] == N_PORTFOLIOS
+    assert data["allocations_written"] == N_PORTFOLIOS
+    assert data["signatures"] == 25
+    
+    groups = {(g["risk_level"], g["target_return"], g["max_drawdown"]): g for g in data["groups"]}
+    assert sum(g["portfolios"] for g in groups.values()) == N_PORTFOLIOS
+    # 无约束时风险等级越高波动率越高
+    unconstrained = [groups[(level, None, None)]["volatility"] for level in range(1, 6)]
+    assert unconstrained == sorted(unconstrained)
+    # 回撤约束换算的波动率上限
+    for level in range(1, 6):
+        capped = groups[(level, 0.05, 0.25)]
+        assert capped["risk_met"] and capped["volatility"] <= 0.125 * 1.001
+    # 目标收益超出可达范围时放弃目标；回撤容忍度过低时退化为最小方差组合
+    assert not groups[(5, 0.5, None)]["target_met"]
+    tight = groups[(5, None, 0.02)]
+    assert not tight["risk_met"] and tight["risk_aversion"] is None
+    
+    db = TestingSessionLocal()
+    try:
+        allocations = db.query(PortfolioAllocation).filter(PortfolioAllocation.strategy_id == setup["strategy"])
+        assert allocations.count() == N_PORTFOLIOS
+        sample = allocations.first()
+        assert sum(sample.target_weights.values()) == pytest.approx(1.0, abs=1e-4)
+        assert max(sample.target_weights.values()) <= 0.4 + 1e-4
+        assert sum(w for s, w in sample.target_weights.items() if s in SYMBOLS[:3]) <= 0.5 + 1e-3
+    finally:
+        db.close()
+    
+    # 重跑替换同一配置日期的未执行配置
+    resp = client.post("/strategy/optimize/batch", json=payload, headers=headers)
+    db = TestingSessionLocal()
+    try:
+        assert db.query(PortfolioAllocation).count() == N_PORTFOLIOS
+    finally:
+        db.close()
+
+
+def test_process_pool_matches_serial(client, headers, setup):
+    """多进程求解与单进程结果一致"""
+    payload = {"strategy_id": setup["strategy"], "symbols": SYMBOLS, "persist": False}
+    serial = client.post("/strategy/optimize/batch", json=payload, headers=headers).json()
+    parallel = client.post("/strategy/optimize/batch", json={**payload, "max_workers": 3}, headers=headers).json()
+    assert parallel["allocations_written"] == 0
+    for a, b in zip(serial["groups"], parallel["groups"]):
+        assert a["risk_level"] == b["risk_level"]
+        assert a["volatility"] == pytest.approx(b["volatility"], rel=1e-3)
+
+
+def test_daily_run_step(client, headers, setup):
+    """策略参数配置 batch_optimization 后由每日运行生成当日配置"""
+    db = TestingSessionLocal()
+    try:
+        strategy = Strategy(name="每日个性化配置", strategy_type=StrategyType.CUSTOM, asset_class=AssetClass.STOCK,
+                            parameters={"batch_optimization": {"symbols": SYMBOLS, "portfolio_ids": [1, 2, 3]}})
+        db.add(strategy)
+        # 手动触发每日运行需管理员权限
+        db.query(User).filter(User.username == "batch_opt_user").update({"is_admin": True})
+        db.commit()
+        strategy_id = strategy.id
+    finally:
+        db.close()
+    
+    resp = client.post("/strategy/daily_runs", json={"run_date": "2024-07-18T00:00:00",
+                                                     "strategy_ids": [strategy_id]}, headers=headers)
+    assert resp.status_code == 202
+    resp = client.get("/strategy/daily_runs", params={"run_date": "2024-07-18T00:00:00",
+                                                      "strategy_id": strategy_id}, headers=headers)
+    steps = resp.json()
+    assert [(s["step"], s["status"]) for s in steps] == [("optimized_allocations", "success")]
+    assert steps[0]["output"]["allocations"] == 3
+    
+    db = TestingSessionLocal()
+    try:
+        dates = {a.allocation_date for a in db.query(PortfolioAllocation).filter(PortfolioAllocation.strategy_id == strategy_id)}
+        assert dates == {datetime(2024, 7, 18)}
+    finally:
+        db.close()
@@ -0,0 +1,259 @@
+"""
+每日策略运行测试
+测试按步骤顺序运行全部活跃策略、步骤耗时记录、幂等重跑与断点续跑
+"""
+import pytest
+import numpy as np
+from datetime import datetime, timedelta
+
+from conftest import sqlite_test_client
+from models.user import User
+from models.portfolio import Portfolio
+from models.market_data import MarketData, PriceHistory, AssetType
+from models.strategy import (
+    Strategy, StrategyType, AssetClass, StrategySignal, StrategyRunStep, PortfolioAllocation,
+    MacroIndicatorValue, MultiFactorInput, MultiFactorScore, SectorRotationSignal
+)
+from routers.strategy.daily_run import DailyStrategyRunner
+from utils.scheduler import DailyScheduler
+
+# 使用独立的测试数据库
+engine, TestingSessionLocal, client = sqlite_test_client("test_daily_run.db", timeout=30)
+
+RUN_DATE = datetime(2024, 6, 28)
+N_DAYS = 30
+INDUSTRIES = ["银行", "银行", "半导体", "半导体", "白酒", "白酒"]
+
+
+def _login(client, username, is_admin=False):
+    client.post("/users/", json={
+        "username": username,
+        "email": f"{username}@test.com",
+        "password": "testpassword123"
+    })
+    db = TestingSessionLocal()
+    try:
+        db.query(User).filter(User.username == username).update({"is_admin": is_admin})
+        db.commit()
+    finally:
+        db.close()
+    resp = client.post("/auth/token", data={"username": username, "password": "testpassword123"})
+    assert resp.status_code == 200
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def headers(client):
+    return _login(client, "daily_run_user", is_admin=True)
+
+
+@pytest.fixture(scope="module")
+def strategies(client, headers):
+    db = TestingSessionLocal()
+    try:
+        user = db.query(User).filter(User.username == "daily_run_user").first()
+        portfolio = Portfolio(name="跟随组合", risk_level=3, user_id=user.id)
+        db.add(portfolio)
+        
+        # 行情与宏观指标
+        rng = np.random.default_rng(5)
+        stocks = [
+            MarketData(symbol=f"D{i}", name=f"股票{i}", asset_type=AssetType.STOCK, exchange="SSE",
+                       industry=INDUSTRIES[i], market_cap=1e10 * (i + 1))
+            for i in range(len(INDUSTRIES))
+        ] + [MarketData(symbol="510300", name="沪深300ETF", asset_type=AssetType.ETF, exchange="SSE")]
+        db.add_all(stocks)
+        db.flush()
+        closes = 10 * np.cumprod(1 + rng.normal(0.001, 0.02, (N_DAYS, len(INDUSTRIES))), axis=0)
+        db.add_all([
+            PriceHistory(market_data_id=stocks[i].id, date=RUN_DATE - timedelta(days=N_DAYS - 1 - t),
+                         close_price=float(closes[t, i]), turnover=1e8)
+            for t in range(N_DAYS) for i in range(len(INDUSTRIES))
+        ])
+        for m in range(8):
+            date = datetime(2023, 11 + m, 1) if m < 2 else datetime(2024, m - 1, 1)
+            for code, value in {"pmi": 49.0 + m * 0.5, "inflation": 2.0, "interest_rate": 2.5, "sentiment": 0.7}.items():
+                db.add(MacroIndicatorValue(indicator_code=code, observation_date=date, value=value))
+        
+        stocks_data = [
+            {"symbol": f"D{i}", "name": f"股票{i}", "factor_values": {"价值": float(i), "成长": float(5 - i)}}
+            for i in range(len(INDUSTRIES))
+        ]
+        db_input = MultiFactorInput.get_or_create(db, stocks_data)
+        db.flush()
+        
+        multi = Strategy(name="每日多因子", strategy_type=StrategyType.MULTI_FACTOR, asset_class=AssetClass.STOCK,
+                         parameters={"multi_factor_input_id": db_input.id, "top_n": 3, "portfolio_ids": [portfolio.id]})
+        sector = Strategy(name="每日行业轮动", strategy_type=StrategyType.SECTOR_ROTATION, asset_class=AssetClass.STOCK,
+                          parameters={"sector_rotation": {"lookback": 5, "flow_window": 3}, "per_industry": 1})
+        macro = Strategy(name="每日宏观择时", strategy_type=StrategyType.MACRO_TIMING, asset_class=AssetClass.STOCK,
+                         parameters={"macro_timing": {"lookback": "bad"}, "instrument_map": {"STOCK": ["510300"]}})
+        other = Strategy(name="动量策略", strategy_type=StrategyType.MOMENTUM, asset_class=AssetClass.STOCK)
+        inactive = Strategy(name="停用策略", strategy_type=StrategyType.MULTI_FACTOR, asset_class=AssetClass.STOCK, is_active=False)
+        db.add_all([multi, sector, macro, other, inactive])
+        db.commit()
+        return {"multi": multi.id, "sector": sector.id, "macro": macro.id, "portfolio": portfolio.id}
+    finally:
+        db.close()
+
+
+def steps_by_scope(steps):
+    return {(step["scope"], step["step"]): step for step in steps}
+
+
+def run_daily(client, headers, **payload):
+    """触发每日运行（TestClient 在返回前执行后台任务）并读取该运行日期的步骤记录"""
+    resp = client.post("/strategy/daily_runs", json={"run_date": RUN_DATE.isoformat(), **payload}, headers=headers)
+    assert resp.status_code == 202
+    assert resp.json()["run_date"] == RUN_DATE.isoformat()
+    resp = client.get("/strategy/daily_runs", params={"run_date": RUN_DATE.isoformat()}, headers=headers)
+    assert resp.status_code == 200
+    return resp.json()
+
+
+def test_daily_run_requires_admin(client, strategies):
+    """每日运行覆盖全部策略，普通用户不能触发"""
+    resp = client.post("/strategy/daily_runs", json={"run_date": RUN_DATE.isoformat()},
+                       headers=_login(client, "daily_run_plain"))
+    assert resp.status_code == 403
+    db = TestingSessionLocal()
+    try:
+        assert db.query(StrategyRunStep).count() == 0
+    finally:
+        db.close()
+
+
+def test_daily_run_executes_dag(client, headers, strategies):
+    """运行全部活跃策略，记录各步骤状态与耗时，单个策略失败不影响其他策略"""
+    data = run_daily(client, headers, max_workers=3)
+    assert {step["strategy_id"] for step in data} == {None, strategies["multi"], strategies["sector"], strategies["macro"]}
+    
+    steps = steps_by_scope(data)
+    assert steps[("market", "ingest")]["status"] == "success"
+    assert steps[("market", "ingest")]["output"]["aggregate_rows"] > 0
+    assert steps[("market", "indicators")]["status"] == "success"
+    assert all(step["duration_ms"] is not None for step in data)
+    
+    multi = f"strategy:{strategies['multi']}"
+    assert steps[(multi, "factor_scores")]["status"] == "success"
+    assert steps[(multi, "allocations")]["output"]["signals"] == 3
+    sector = f"strategy:{strategies['sector']}"
+    assert steps[(sector, "signals")]["status"] == "success"
+    assert steps[(sector, "allocations")]["status"] == "success"
+    
+    # 宏观择时参数错误：信号步骤失败，后续步骤不执行
+    macro = f"strategy:{strategies['macro']}"
+    assert steps[(macro, "signals")]["status"] == "failed"
+    assert (macro, "allocations") not in steps
+    assert [step["status"] for step in data].count("failed") == 1
+    
+    db = TestingSessionLocal()
+    try:
+        score = db.query(MultiFactorScore).filter(MultiFactorScore.strategy_id == strategies["multi"]).one()
+        assert score.signal_date == RUN_DATE
+        assert score.derived_signal_id is not None
+        allocation = db.query(PortfolioAllocation).filter(PortfolioAllocation.strategy_id == strategies["multi"]).one()
+        assert allocation.portfolio_id == strategies["portfolio"]
+        assert sum(allocation.target_weights.values()) == pytest.approx(1.0)
+        assert db.query(SectorRotationSignal).filter(SectorRotationSignal.strategy_id == strategies["sector"]).count() > 0
+    finally:
+        db.close()
+
+
+def test_rerun_is_idempotent_and_resumes(client, headers, strategies):
+    """修复失败原因后重跑：已完成的步骤跳过，失败的步骤从断点继续"""
+    db = TestingSessionLocal()
+    try:
+        signal_count = db.query(StrategySignal).count()
+        macro = db.get(Strategy, strategies["macro"])
+        macro.parameters = {"macro_timing": {"lookback": 1}, "instrument_map": {"STOCK": ["510300"]},
+                            "portfolio_ids": [strategies["portfolio"]]}
+        db.commit()
+    finally:
+        db.close()
+    
+    data = run_daily(client, headers)
+    steps = steps_by_scope(data)
+    macro = f"strategy:{strategies['macro']}"
+    assert steps[(macro, "signals")]["status"] == "success"
+    assert steps[(macro, "signals")]["attempts"] == 2
+    assert steps[(macro, "allocations")]["output"]["signals"] == 1
+    assert steps[(f"strategy:{strategies['multi']}", "factor_scores")]["attempts"] == 1
+    assert all(step["status"] != "failed" for step in data)
+    
+    # 再次运行不产生任何新数据
+    run_daily(client, headers)
+    db = TestingSessionLocal()
+    try:
+        assert db.query(StrategySignal).count() == signal_count + 1
+        assert db.query(MultiFactorScore).count() == 1
+        assert db.query(StrategyRunStep).filter(StrategyRunStep.status == "running").count() == 0
+    finally:
+        db.close()
+    
+    resp = client.get("/strategy/daily_runs", params={"strategy_id": strategies["macro"]}, headers=headers)
+    assert [step["step"] for step in resp.json()] == ["signals", "allocations"]
+
+
+def test_runner_skips_without_inputs(client, strategies):
+    """新日期没有新行情时行业轮动沿用最新信号；缺少输入的步骤记为跳过"""
+    next_day = RUN_DATE + timedelta(days=1)
+    db = TestingSessionLocal()
+    try:
+        db.add(Strategy(name="无输入多因子", strategy_type=StrategyType.MULTI_FACTOR, asset_class=AssetClass.STOCK))
+        db.commit()
+    finally:
+        db.close()
+    
+    summary = DailyStrategyRunner(TestingSessionLocal, next_day, max_workers=2).run()
+    skipped = [step for step in summary["steps"] if step.status == "skipped"]
+    assert {step.step for step in skipped} == {"factor_scores", "allocations"}
+    assert skipped[0].output["reason"] == "策略没有可用的多因子输入数据"
+
+
+def test_concurrent_runs_do_not_collide(client, strategies, monkeypatch):
+    """并发运行同一日期：正在执行的步骤不重复执行，插入或提交冲突不抛出异常"""
+    run_date = RUN_DATE + timedelta(days=10)
+    db = TestingSessionLocal()
+    try:
+        db.add(StrategyRunStep(run_date=run_date, scope="market", step="ingest", status="running",
+                               attempts=1, started_at=datetime.utcnow()))
+        db.add(StrategyRunStep(run_date=run_date, scope="market", step="valuation", status="running",
+                               attempts=1, started_at=datetime.utcnow() - timedelta(days=1)))
+        db.commit()
+    finally:
+        db.close()
+    
+    runner = DailyStrategyRunner(TestingSessionLocal, run_date)
+    calls = []
+    runner.step_functions["valuation"] = lambda db, strategy: calls.append("valuation") or {}
+    # 其他运行正在执行：直接返回，后续步骤不执行
+    assert runner.run_chain("market", None, ["ingest", "valuation"]) is False
+    assert calls == []
+    # 超出时间窗口仍在执行的步骤视为中断，重新认领执行
+    assert runner.run_step("market", None, "valuation") == "success"
+    assert calls == ["valuation"]
+    
+    # 查询时尚无记录、插入时已被其他运行插入
+    lookups = [None]
+    find_step = runner.find_step
+    monkeypatch.setattr(runner, "find_step", lambda db, scope, step: lookups.pop() if lookups else find_step(db, scope, step))
+    assert runner.run_step("market", None, "ingest") == "running"
+    
+    # 步骤写入与已有记录冲突：回滚并记为失败
+    runner.step_functions["goals"] = lambda db, strategy: db.add(StrategyRunStep(
+        run_date=run_date, scope="market", step="ingest", status="success", attempts=1)) or {}
+    assert runner.run_step("market", None, "goals") == "failed"
+    db = TestingSessionLocal()
+    try:
+        record = runner.find_step(db, "market", "goals")
+        assert record.status == "failed" and "IntegrityError" in record.error
+        assert db.query(StrategyRunStep).filter(StrategyRunStep.run_date == run_date).count() == 3
+    finally:
+        db.close()
+
+
+def test_scheduler_next_run_skips_weekend():
+    scheduler = DailyScheduler("15:30", lambda scheduled: None)
+    assert scheduler.next_run(datetime(2024, 6, 28, 9, 0)) == datetime(2024, 6, 28, 15, 30)
+    assert scheduler.next_run(datetime(2024, 6, 28, 16, 0)) == datetime(2024, 7, 1, 15, 30)
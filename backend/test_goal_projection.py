@@ -0,0 +1,219 @@
+"""
+投资目标达成预测测试
+测试目标关联组合、蒙特卡洛达成概率与分位数区间、净值重估当前金额及每日刷新完成进度
+"""
+import math
+import pytest
+import numpy as np
+from datetime import datetime, timedelta
+
+from conftest import sqlite_test_client
+from models.portfolio import Asset
+from models.market_data import MarketData, PriceHistory, AssetType
+from models.user_profile import InvestmentGoal, GoalPortfolioLink, GoalProjection
+from models.ai_models import GoalProjectionEngine
+from services.goal_projection import project_goals
+
+# 使用独立的测试数据库
+engine, TestingSessionLocal, client = sqlite_test_client("test_goal_projection.db")
+
+TODAY = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+DAYS = [TODAY - timedelta(days=60 - i) for i in range(60)]
+# 稳健标的每日上涨0.1%（波动率为0），波动标的涨跌交替
+CLOSES = {
+    "STEADY": [10.0 * 1.001 ** i for i in range(60)],
+    "SWING": [10.0 * np.prod([1.02 if k % 2 else 0.98 for k in range(i)]) for i in range(60)],
+}
+
+
+def _register(client, username):
+    user = client.post("/users/", json={
+        "username": username,
+        "email": f"{username}@test.com",
+        "password": "testpassword123"
+    }).json()
+    resp = client.post("/auth/token", data={"username": username, "password": "testpassword123"})
+    assert resp.status_code == 200
+    return user["id"], {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def setup(client):
+    user_id, headers = _register(client, "goal_user")
+    db = TestingSessionLocal()
+    try:
+        asset_ids = {}
+        for symbol, closes in CLOSES.items():
+            instrument = MarketData(symbol=symbol, name=symbol, asset_type=AssetType.STOCK, exchange="SSE")
+            db.add(instrument)
+            db.flush()
+            db.add_all([
+                PriceHistory(market_data_id=instrument.id, date=day, close_price=close)
+                for day, close in zip(DAYS, closes)
+            ])
+            asset = Asset(code=symbol, name=symbol, asset_type="股票")
+            db.add(asset)
+            db.flush()
+            asset_ids[symbol] = asset.id
+        db.commit()
+    finally:
+        db.close()
+
+    portfolios = {}
+    for symbol, asset_id in asset_ids.items():
+        resp = client.post("/portfolios/", json={
+            "name": f"{symbol}组合", "risk_level": 3, "assets": [{"asset_id": asset_id, "weight": 100}]
+        }, headers=headers)
+        assert resp.status_code == 201
+        portfolios[symbol] = resp.json()["id"]
+
+    def goal(name, target_amount, years):
+        resp = client.post("/user-profile/investment-goals", json={
+            "user_id": user_id, "goal_name": name, "goal_type": "retirement",
+            "target_amount": target_amount,
+            "target_date": (TODAY + timedelta(days=int(365.25 * years))).isoformat() if years else None,
+        })
+        assert resp.status_code == 201
+        return resp.json()["id"]
+
+    goals = {
+        "steady": goal("稳健目标", 100000, 10),
+        "swing": goal("波动目标", 30000, 5),
+        "unlinked": goal("未关联目标", 50000, 3),
+        "undated": goal("无期限目标", 50000, None),
+    }
+    return {"user_id": user_id, "headers": headers, "portfolios": portfolios, "goals": goals}
+
+
+def test_projection_engine_matches_closed_form_without_volatility():
+    """波动率为0时全部路径相同，期末价值等于复利与定投的确定值"""
+    engine = GoalProjectionEngine(paths=200, seed=1)
+    result, = engine.project(np.array([0.06]), np.array([0.0]), np.array([24]),
+                             np.array([1000.0]), np.array([100.0]), np.array([3000.0]))
+    monthly = math.exp(0.06 / 12)
+    expected = 1000 * monthly ** 24 + 100 * sum(monthly ** k for k in range(24))
+    assert result["expected_value"] == pytest.approx(expected)
+    assert result["percentiles"]["p5"] == pytest.approx(expected)
+    assert result["probability"] == 1.0
+    assert [band["month"] for band in result["bands"]] == [12, 24]
+
+
+def test_link_goal_to_portfolio(client, setup):
+    """关联组合需属于目标所属用户，重复关联覆盖原设置"""
+    goals, portfolios = setup["goals"], setup["portfolios"]
+    resp = client.put(f"/user-profile/investment-goals/{goals['steady']}/portfolio", json={
+        "portfolio_id": portfolios["STEADY"], "current_amount": 10000, "monthly_contribution": 0
+    })
+    assert resp.status_code == 200
+    assert resp.json()["goal_id"] == goals["steady"] and resp.json()["valued_at"] is None
+
+    resp = client.put(f"/user-profile/investment-goals/{goals['swing']}/portfolio", json={
+        "portfolio_id": portfolios["STEADY"], "current_amount": 5000, "monthly_contribution": 100
+    })
+    link_id = resp.json()["id"]
+    resp = client.put(f"/user-profile/investment-goals/{goals['swing']}/portfolio", json={
+        "portfolio_id": portfolios["SWING"], "current_amount": 10000, "monthly_contribution": 200
+    })
+    assert resp.status_code == 200
+    assert resp.json()["id"] == link_id and resp.json()["portfolio_id"] == portfolios["SWING"]
+
+    _, other_headers = _register(client, "goal_other")
+    other = client.post("/portfolios/", json={"name": "他人组合", "risk_level": 1, "assets": []}, headers=other_headers)
+    resp = client.put(f"/user-profile/investment-goals/{goals['unlinked']}/portfolio", json={"portfolio_id": other.json()["id"]})
+    assert resp.status_code == 400
+    resp = client.put("/user-profile/investment-goals/99999/portfolio", json={"portfolio_id": portfolios["STEADY"]})
+    assert resp.status_code == 404
+
+
+def test_projections_for_all_user_goals(client, setup):
+    """一次请求预测用户全部活跃目标，未关联或缺少目标日期的目标只返回状态"""
+    resp = client.get(f"/user-profile/investment-goals/{setup['user_id']}/projections",
+                      params={"paths": 2000, "seed": 7}, headers=setup["headers"])
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["paths"] == 2000
+    goals = {goal["goal_id"]: goal for goal in body["goals"]}
+    assert goals[setup["goals"]["unlinked"]]["status"] == "unlinked"
+    assert goals[setup["goals"]["undated"]]["status"] == "unlinked"
+
+    steady = goals[setup["goals"]["steady"]]
+    assert steady["status"] == "projected"
+    assert steady["expected_return"] == pytest.approx(0.001 * 252)
+    assert steady["volatility"] == pytest.approx(0.0, abs=1e-9)
+    assert steady["expected_value"] == pytest.approx(10000 * math.exp(steady["expected_return"] * steady["months"] / 12))
+    assert steady["probability"] == 1.0
+    assert steady["progress"] == pytest.approx(10.0)
+
+    swing = goals[setup["goals"]["swing"]]
+    assert swing["volatility"] > 0.1
+    assert 0.0 < swing["probability"] < 1.0
+    assert swing["bands"][-1]["month"] == swing["months"]
+    for band in swing["bands"]:
+        assert band["p5"] <= band["p25"] <= band["p50"] <= band["p75"] <= band["p95"]
+
+    # 相同随机种子结果可复现
+    again = client.get(f"/user-profile/investment-goals/{setup['user_id']}/projections",
+                       params={"paths": 2000, "seed": 7}, headers=setup["headers"]).json()
+    assert again["goals"] == body["goals"]
+
+
+def test_projection_access_and_budget(client, setup):
+    """需登录且只能预测自己的目标，路径数与模拟规模有上限"""
+    url = f"/user-profile/investment-goals/{setup['user_id']}/projections"
+    assert client.get(url).status_code == 401
+    assert client.get("/user-profile/investment-goals/99999/projections", headers=setup["headers"]).status_code == 403
+    assert client.get(url, params={"paths": 100000}, headers=setup["headers"]).status_code == 422
+
+    engine = GoalProjectionEngine(paths=20000, seed=1)
+    ones = np.ones(1)
+    with pytest.raises(ValueError):
+        engine.project(0.05 * ones, 0.1 * ones, np.array([GoalProjectionEngine.MAX_MONTHS]), ones, ones, ones)
+    assert engine.project(0.05 * ones, 0.1 * ones, np.array([120]), ones, ones, ones)[0]["probability"] >= 0
+
+
+def test_daily_refresh_revalues_amounts_and_progress(client, setup):
+    """每日运行按净值重估关联金额、刷新目标进度并覆盖当日预测结果"""
+    goals, portfolios = setup["goals"], setup["portfolios"]
+    # 估值至倒数第11个交易日后关联，金额以该日净值为基准
+    resp = client.post("/portfolios/me/nav", json={
+        "start_date": DAYS[0].isoformat(), "end_date": DAYS[-11].isoformat()
+    }, headers=setup["headers"])
+    assert resp.status_code == 200
+    resp = client.put(f"/user-profile/investment-goals/{goals['steady']}/portfolio", json={
+        "portfolio_id": portfolios["STEADY"], "current_amount": 10000, "monthly_contribution": 0
+    })
+    assert resp.json()["valued_at"][:10] == DAYS[-11].date().isoformat()
+    client.post("/portfolios/me/nav", json={}, headers=setup["headers"])
+
+    db = TestingSessionLocal()
+    try:
+        for _ in range(2):
+            results = project_goals(db, TODAY, paths=500, seed=1, persist=True)
+            db.commit()
+        assert {result["status"] for result in results} == {"projected", "unlinked"}
+
+        link = db.query(GoalPortfolioLink).filter(GoalPortfolioLink.goal_id == goals["steady"]).one()
+        assert link.current_amount == pytest.approx(10000 * 1.001 ** 10)
+        assert link.valued_at == DAYS[-1]
+        goal = db.query(InvestmentGoal).filter(InvestmentGoal.id == goals["steady"]).one()
+        assert goal.progress == pytest.approx(10 * 1.001 ** 10)
+
+        # 同一日期重复运行不产生重复预测
+        projections = db.query(GoalProjection).filter(GoalProjection.run_date == TODAY).all()
+        assert sorted(p.goal_id for p in projections) == sorted([goals["steady"], goals["swing"]])
+        assert projections[0].bands and projections[0].percentiles["p50"] > 0
+    finally:
+        db.close()
+
+
+def test_links_and_projections_removed_with_portfolio(client, setup):
+    """删除组合时一并删除其目标关联与预测结果，其他组合不受影响"""
+    steady = setup["portfolios"]["STEADY"]
+    assert client.delete(f"/portfolios/{steady}", headers=setup["headers"]).status_code == 200
+    db = TestingSessionLocal()
+    try:
+        assert db.query(GoalPortfolioLink).filter(GoalPortfolioLink.portfolio_id == steady).count() == 0
+        assert db.query(GoalProjection).filter(GoalProjection.portfolio_id == steady).count() == 0
+        assert db.query(GoalProjection).filter(GoalProjection.goal_id == setup["goals"]["swing"]).count() > 0
+    finally:
+        db.close()
@@ -0,0 +1,176 @@
+"""
+行业/板块聚合指数测试
+测试批量导入价格、聚合指数增量更新以及按日期区间查询
+"""
+import pytest
+import numpy as np
+from datetime import datetime, timedelta
+
+from conftest import sqlite_test_client
+from models.ai_models import SectorRotationModel
+from models.market_data import MarketData, AssetType, IndustryAggregate
+
+# 使用独立的测试数据库
+engine, TestingSessionLocal, client = sqlite_test_client("test_industry_aggregates.db")
+
+INDUSTRIES = ["银行", "银行", "半导体", "半导体", "白酒", "白酒"]
+SECTORS = ["金融", "金融", "科技", "科技", "消费", "消费"]
+CAPS = [5e10, 1e10, 3e10, 2e10, 8e10, 4e10]
+N_DATES = 40
+START = datetime(2024, 3, 1)
+
+
+@pytest.fixture(scope="module")
+def headers(client):
+    client.post("/users/", json={
+        "username": "aggregate_user",
+        "email": "aggregate@test.com",
+        "password": "testpassword123"
+    })
+    resp = client.post("/auth/token", data={"username": "aggregate_user", "password": "testpassword123"})
+    assert resp.status_code == 200
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def prices(client):
+    db = TestingSessionLocal()
+    try:
+        db.add_all([
+            MarketData(symbol=f"A{i}", name=f"股票{i}", asset_type=AssetType.STOCK, exchange="SZSE",
+                       industry=INDUSTRIES[i], sector=SECTORS[i], market_cap=CAPS[i])
+            for i in range(len(INDUSTRIES))
+        ])
+        db.commit()
+    finally:
+        db.close()
+    rng = np.random.default_rng(7)
+    closes = 20 * np.cumprod(1 + rng.normal(0.001, 0.02, (N_DATES, len(INDUSTRIES))), axis=0)
+    turnover = rng.uniform(1e7, 1e9, (N_DATES, len(INDUSTRIES)))
+    return closes, turnover
+
+
+def bars_for(closes, turnover, days):
+    return [
+        {"symbol": f"A{i}", "date": (START + timedelta(days=t)).isoformat(),
+         "close_price": float(closes[t, i]), "turnover": float(turnover[t, i])}
+        for t in days for i in range(len(INDUSTRIES))
+    ]
+
+
+def get_aggregates(client, headers, **params):
+    resp = client.get("/market-data/industry-aggregates", params=params, headers=headers)
+    assert resp.status_code == 200
+    return resp.json()
+
+
+def test_bulk_import_builds_aggregates(client, headers, prices):
+    """批量导入后生成行业与板块聚合，收益为市值加权"""
+    closes, turnover = prices
+    payload = {"bars": bars_for(closes, turnover, range(25)) + [
+        {"symbol": "UNKNOWN", "date": START.isoformat(), "close_price": 1.0}
+    ]}
+    resp = client.post("/market-data/price-history/bulk", json=payload, headers=headers)
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["inserted"] == 25 * len(INDUSTRIES)
+    assert data["unknown_symbols"] == ["UNKNOWN"]
+    # 3个行业 + 3个板块，每日各一行
+    assert data["aggregate_rows"] == 25 * 6
+    
+    rows = get_aggregates(client, headers, group_type="industry", group_name="半导体")
+    assert len(rows) == 25
+    assert rows[0]["index_level"] == pytest.approx(1000.0)
+    assert rows[0]["daily_return"] is None
+    
+    panel = SectorRotationModel.aggregate_industries(closes[:25], INDUSTRIES, np.array(CAPS), turnover[:25])
+    k = panel["industries"].index("半导体")
+    np.testing.assert_allclose([r["daily_return"] for r in rows[1:]], panel["index_returns"][1:, k])
+    np.testing.assert_allclose([r["turnover"] for r in rows], panel["turnover"][:, k])
+    assert rows[5]["constituents"] == 2
+    
+    sectors = get_aggregates(client, headers, group_type="sector", start_date=(START + timedelta(days=10)).isoformat(),
+                             end_date=(START + timedelta(days=12)).isoformat())
+    assert {r["group_name"] for r in sectors} == {"金融", "科技", "消费"}
+    assert len(sectors) == 9
+
+
+def test_incremental_import_extends_index(client, headers, prices):
+    """新增交易日只重新计算新日期，指数点位从已保存的点位续接"""
+    closes, turnover = prices
+    before = get_aggregates(client, headers, group_type="industry", group_name="白酒")
+    
+    resp = client.post("/market-data/price-history/bulk", json={"bars": bars_for(closes, turnover, range(25, N_DATES))}, headers=headers)
+    assert resp.json()["aggregate_rows"] == (N_DATES - 25) * 6
+    
+    after = get_aggregates(client, headers, group_type="industry", group_name="白酒")
+    assert len(after) == N_DATES
+    # 已有日期保持不变
+    assert [r["index_level"] for r in after[:25]] == [r["index_level"] for r in before]
+    for prev, row in zip(after[24:], after[25:]):
+        assert row["index_level"] == pytest.approx(prev["index_level"] * (1 + row["daily_return"]))
+
+
+def test_update_existing_bar_recomputes_from_date(client, headers, prices):
+    """覆盖已有日线后从该日期起重新计算"""
+    closes, turnover = prices
+    day = 35
+    bar = {"symbol": "A4", "date": (START + timedelta(days=day)).isoformat(),
+           "close_price": float(closes[day, 4] * 1.1), "turnover": float(turnover[day, 4])}
+    before = get_aggregates(client, headers, group_type="industry", group_name="白酒")
+    
+    resp = client.post("/market-data/price-history/bulk", json={"bars": [bar]}, headers=headers)
+    data = resp.json()
+    assert data["inserted"] == 0 and data["updated"] == 1
+    assert data["aggregate_rows"] == (N_DATES - day) * 6
+    
+    after = get_aggregates(client, headers, group_type="industry", group_name="白酒")
+    assert after[day - 1]["index_level"] == before[day - 1]["index_level"]
+    assert after[day]["daily_return"] > before[day]["daily_return"]
+    
+    db = TestingSessionLocal()
+    try:
+        assert db.query(IndustryAggregate).count() == N_DATES * 6
+    finally:
+        db.close()
+
+
+def test_rebuild_from_date(client, headers):
+    """按日期重建只重写该日期之后的聚合行"""
+    before = get_aggregates(client, headers, group_type="sector", group_name="消费")
+    since = (START + timedelta(days=30)).isoformat()
+    resp = client.post("/market-data/industry-aggregates/rebuild", params={"since": since}, headers=headers)
+    assert resp.status_code == 200
+    assert resp.json()["rows"] == (N_DATES - 30) * 6
+    
+    after = get_aggregates(client, headers, group_type="sector", group_name="消费")
+    np.testing.assert_allclose([r["index_level"] for r in after], [r["index_level"] for r in before])
+
+
+def test_single_bar_updates_only_its_groups(client, headers, prices):
+    """单条日线只重算该股所属行业与板块在该日期的聚合，其他分组与已有日期不变"""
+    closes, _ = prices
+    db = TestingSessionLocal()
+    try:
+        market_data_id = db.query(MarketData.id).filter(MarketData.symbol == "A0").scalar()
+        existing = {row.id for row in db.query(IndustryAggregate.id).all()}
+    finally:
+        db.close()
+    
+    day = START + timedelta(days=N_DATES)
+    resp = client.post(f"/market-data/{market_data_id}/price-history", json={
+        "date": day.isoformat(), "close_price": float(closes[-1, 0] * 1.05), "turnover": 1e8
+    }, headers=headers)
+    assert resp.status_code == 201
+    
+    db = TestingSessionLocal()
+    try:
+        rows = db.query(IndustryAggregate).all()
+        assert existing <= {row.id for row in rows}
+        added = {(row.group_type, row.group_name) for row in rows if row.id not in existing}
+        assert added == {("industry", "银行"), ("sector", "金融")}
+    finally:
+        db.close()
+    bank = get_aggregates(client, headers, group_type="industry", group_name="银行")
+    assert bank[-1]["daily_return"] == pytest.approx(0.05)
+    assert bank[-1]["index_level"] == pytest.approx(bank[-2]["index_level"] * 1.05)
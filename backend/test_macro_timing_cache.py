@@ -0,0 +1,113 @@
+"""
+宏观择时信号缓存测试
+测试规范化哈希、TTL缓存以及相同输入每天只保存一条信号
+"""
+import time
+import pytest
+
+from conftest import sqlite_test_client
+from models.model_config import ModelConfig
+from models.strategy import MacroTimingSignal
+from routers.strategy import macro_timing
+from utils.cache import TTLCache, canonical_hash
+
+# 使用独立的测试数据库
+engine, TestingSessionLocal, db_client = sqlite_test_client("test_macro_timing_cache.db", name="db_client")
+
+
+@pytest.fixture(scope="module")
+def client(db_client):
+    # 缓存为进程级，清空其他测试模块留下的条目
+    macro_timing._signal_cache.clear()
+    macro_timing._persisted_signals.clear()
+    yield db_client
+    macro_timing._signal_cache.clear()
+    macro_timing._persisted_signals.clear()
+
+
+@pytest.fixture(scope="module")
+def headers(client):
+    client.post("/users/", json={
+        "username": "macro_cache_user",
+        "email": "macro_cache@test.com",
+        "password": "testpassword123"
+    })
+    resp = client.post("/auth/token", data={"username": "macro_cache_user", "password": "testpassword123"})
+    assert resp.status_code == 200
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+def count_signals():
+    db = TestingSessionLocal()
+    try:
+        return db.query(MacroTimingSignal).count()
+    finally:
+        db.close()
+
+
+def test_canonical_hash():
+    """键顺序与整数/浮点写法不影响哈希"""
+    a = canonical_hash({"cycle": "复苏", "factors": {"interest_rate": 3, "inflation": 2.5}})
+    b = canonical_hash({"factors": {"inflation": 2.5, "interest_rate": 3.0}, "cycle": "复苏"})
+    assert a == b
+    assert a != canonical_hash({"cycle": "复苏", "factors": {"interest_rate": 3.5, "inflation": 2.5}})
+
+
+def test_ttl_cache_expiry_and_eviction():
+    """过期条目失效，超出容量淘汰最久未使用的条目"""
+    cache = TTLCache(max_entries=2, ttl=0.05)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    time.sleep(0.06)
+    assert cache.get("a") is None
+    assert len(cache) == 1
+
+
+def test_identical_requests_saved_once(client, headers):
+    """相同输入命中缓存且当天只保存一条信号"""
+    req = {"economic_cycle": "复苏", "market_sentiment": "乐观", "additional_factors": {"interest_rate": 3}}
+    misses = macro_timing._signal_cache.misses
+    resp1 = client.post("/strategy/macro_timing_signal", json=req, headers=headers)
+    assert resp1.status_code == 200
+    assert macro_timing._signal_cache.misses == misses + 1
+    
+    # 参数写法不同但内容相同
+    resp2 = client.post("/strategy/macro_timing_signal", json={
+        "market_sentiment": "乐观", "economic_cycle": "复苏", "additional_factors": {"interest_rate": 3.0}
+    }, headers=headers)
+    assert resp2.status_code == 200
+    assert macro_timing._signal_cache.misses == misses + 1
+    assert resp2.json() == resp1.json()
+    assert count_signals() == 1
+    
+    # 清空进程缓存后仍按数据库中的去重键去重
+    macro_timing._persisted_signals.clear()
+    client.post("/strategy/macro_timing_signal", json=req, headers=headers)
+    assert count_signals() == 1
+    
+    # 不同输入保存新记录
+    client.post("/strategy/macro_timing_signal", json={"economic_cycle": "衰退", "market_sentiment": "悲观"}, headers=headers)
+    assert count_signals() == 2
+
+
+def test_active_config_change_invalidates_cache(client, headers):
+    """激活的模型配置变化后重新计算"""
+    req = {"economic_cycle": "过热", "market_sentiment": "中性"}
+    client.post("/strategy/macro_timing_signal", json=req, headers=headers)
+    misses = macro_timing._signal_cache.misses
+    
+    db = TestingSessionLocal()
+    try:
+        db.add(ModelConfig(model_name="macro_timing", model_version="2.0", parameters={"economic_cycle_weight": 0.5}, is_active=True))
+        db.commit()
+    finally:
+        db.close()
+    
+    client.post("/strategy/macro_timing_signal", json=req, headers=headers)
+    assert macro_timing._signal_cache.misses == misses + 1
+    # 配置变化视为不同输入，单独保存
+    assert count_signals() == 4
@@ -0,0 +1,128 @@
+"""
+数据驱动宏观择时测试
+测试向量化历史配置与逐次计算一致、指标库写入以及历史/实时信号接口
+"""
+import pytest
+import numpy as np
+import pandas as pd
+
+from conftest import sqlite_test_client
+from models.ai_models import MacroTimingModel
+from models.strategy import MacroTimingSignal
+
+# 使用独立的测试数据库
+engine, TestingSessionLocal, client = sqlite_test_client("test_macro_timing_history.db")
+
+
+@pytest.fixture(scope="module")
+def headers(client):
+    client.post("/users/", json={
+        "username": "macro_history_user",
+        "email": "macro_history@test.com",
+        "password": "testpassword123"
+    })
+    resp = client.post("/auth/token", data={"username": "macro_history_user", "password": "testpassword123"})
+    assert resp.status_code == 200
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+def make_indicators(n_dates=120, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2015-01-01", periods=n_dates, freq="MS")
+    frame = pd.DataFrame({
+        "pmi": rng.uniform(46, 55, n_dates),
+        "inflation": rng.uniform(0.5, 5.5, n_dates),
+        "interest_rate": rng.uniform(1.0, 6.5, n_dates),
+        "sentiment": rng.choice([0.2, 0.5, 0.8], n_dates),
+        "geopolitical_risk": rng.uniform(0, 1, n_dates),
+    }, index=index)
+    # 部分利率缺失，按前值填充
+    frame.loc[index[1::9], "interest_rate"] = np.nan
+    return frame
+
+
+def test_table_matches_scalar_allocation():
+    """向量化配置表与逐日调用generate_asset_allocation结果一致"""
+    model = MacroTimingModel()
+    frame = make_indicators()
+    table = model.compute_allocation_table(frame)
+    filled = frame.ffill()
+    sentiment_labels = {v: k for k, v in model.SENTIMENT_SCORES.items()}
+    
+    for i in range(len(frame)):
+        row = filled.iloc[i]
+        factors = {k: float(row[k]) for k in model.ADDITIONAL_FACTOR_KEYS if k in row.index and pd.notna(row[k])}
+        allocation, _, confidence = model.generate_asset_allocation(
+            table["economic_cycles"][i], sentiment_labels[row["sentiment"]], factors
+        )
+        np.testing.assert_allclose(table["allocations"][i], [allocation[a] for a in model.asset_classes])
+        assert table["confidence"][i] == confidence
+
+
+def test_infer_economic_cycles():
+    """投资时钟：增长与通胀方向决定经济周期"""
+    cycles = MacroTimingModel.infer_economic_cycles(
+        np.array([52.0, 52.0, 47.0, 47.0, np.nan]),
+        np.array([1.0, 4.0, 4.0, 1.0, 2.0]),
+        lookback=1
+    )
+    assert list(cycles) == ["复苏", "过热", "滞胀", "衰退", None]
+
+
+def test_history_and_live_endpoints(client, headers):
+    """写入指标库后计算历史配置表并生成实时信号"""
+    frame = make_indicators(n_dates=36, seed=1)
+    points = [
+        {"indicator_code": "CN_PMI" if name == "pmi" else name, "observation_date": date.isoformat(), "value": float(value)}
+        for name in frame.columns for date, value in frame[name].dropna().items()
+    ]
+    resp = client.post("/strategy/macro_indicators", json={"points": points, "source": "test"}, headers=headers)
+    assert resp.status_code == 200
+    assert resp.json() == {"inserted": len(points), "updated": 0}
+    
+    # 重复写入相同数据不产生更新
+    resp = client.post("/strategy/macro_indicators", json={"points": points[:5]}, headers=headers)
+    assert resp.json() == {"inserted": 0, "updated": 0}
+    
+    request = {"indicator_map": {"pmi": "CN_PMI"}}
+    resp = client.post("/strategy/macro_timing_signal/history", json=request, headers=headers)
+    assert resp.status_code == 200
+    history = resp.json()
+    expected = MacroTimingModel().compute_allocation_table(frame)
+    assert len(history["dates"]) == 36
+    np.testing.assert_allclose(history["allocations"], expected["allocations"])
+    assert history["economic_cycles"] == list(expected["economic_cycles"])
+    
+    resp = client.post("/strategy/macro_timing_signal/history", json={
+        **request, "start_date": frame.index[12].isoformat(), "end_date": frame.index[23].isoformat()
+    }, headers=headers)
+    assert len(resp.json()["dates"]) == 12
+    
+    resp = client.post("/strategy/macro_timing_signal/live", json=request, headers=headers)
+    assert resp.status_code == 200
+    live = resp.json()
+    assert list(live["recommended_allocation"].values()) == pytest.approx(history["allocations"][-1])
+    
+    # 更新最新一期PMI后缓存失效，实时信号随之变化
+    last_date = frame.index[-1].isoformat()
+    resp = client.post("/strategy/macro_indicators", json={"points": [
+        {"indicator_code": "CN_PMI", "observation_date": last_date, "value": 40.0},
+        {"indicator_code": "inflation", "observation_date": last_date, "value": 1.0},
+    ]}, headers=headers)
+    assert resp.json()["updated"] == 2
+    resp = client.post("/strategy/macro_timing_signal/history", json=request, headers=headers)
+    assert resp.json()["economic_cycles"][-1] == "衰退"
+    
+    db = TestingSessionLocal()
+    try:
+        assert db.query(MacroTimingSignal).count() == 1
+    finally:
+        db.close()
+
+
+def test_history_without_data(client, headers):
+    """指标库中没有对应指标时返回404"""
+    resp = client.post("/strategy/macro_timing_signal/history", json={
+        "indicator_map": {k: "MISSING_" + k for k in ["pmi", "inflation", "interest_rate", "sentiment", "exchange_rate", "geopolitical_risk"]}
+    }, headers=headers)
+    assert resp.status_code == 404
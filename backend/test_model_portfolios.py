@@ -0,0 +1,199 @@
+"""
+模型组合测试
+测试模型权重叠加客户偏离、关联与解除关联、模型调整后的批量下发及按去重权重计算的估值与风险
+"""
+import pytest
+import numpy as np
+
+from conftest import sqlite_test_client
+from models.user import User
+from models.portfolio import Asset, ModelPortfolio
+from models.ai_models import PortfolioValuationEngine, SuitabilityEngine, StressTestEngine
+from services.model_portfolios import effective_weights
+
+# 使用独立的测试数据库
+engine, TestingSessionLocal, client = sqlite_test_client("test_model_portfolios.db")
+
+
+def _login(client, username, is_admin=False):
+    client.post("/users/", json={
+        "username": username,
+        "email": f"{username}@test.com",
+        "password": "testpassword123"
+    })
+    db = TestingSessionLocal()
+    try:
+        db.query(User).filter(User.username == username).update({"is_admin": is_admin})
+        db.commit()
+    finally:
+        db.close()
+    resp = client.post("/auth/token", data={"username": username, "password": "testpassword123"})
+    assert resp.status_code == 200
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def headers(client):
+    return _login(client, "model_user", is_admin=True)
+
+
+@pytest.fixture(scope="module")
+def other_headers(client):
+    return _login(client, "model_other")
+
+
+@pytest.fixture(scope="module")
+def setup(client, headers):
+    db = TestingSessionLocal()
+    try:
+        assets = {}
+        for code in ("EQUITY", "BOND", "GOLD"):
+            asset = Asset(code=code, name=code, asset_type="基金")
+            db.add(asset)
+            db.flush()
+            assets[code] = asset.id
+        db.commit()
+    finally:
+        db.close()
+
+    portfolios = []
+    for i in range(3):
+        resp = client.post("/portfolios/", json={
+            "name": f"客户组合{i}", "risk_level": 3,
+            "assets": [{"asset_id": assets["EQUITY"], "weight": 70}, {"asset_id": assets["GOLD"], "weight": 30}]
+        }, headers=headers)
+        assert resp.status_code == 201
+        portfolios.append(resp.json()["id"])
+    return {"assets": assets, "portfolios": portfolios}
+
+
+def _holdings(client, headers, portfolio_id, assets):
+    code_of = {asset_id: code for code, asset_id in assets.items()}
+    portfolio = client.get(f"/portfolios/{portfolio_id}", headers=headers).json()
+    return {code_of[item["asset_id"]]: pytest.approx(item["weight"]) for item in portfolio["portfolio_assets"]}
+
+
+def test_effective_weights():
+    """偏离叠加后负值截为0，合计超过100%时按比例缩至100%"""
+    assert effective_weights({1: 60, 2: 40}, {1: -10, 3: 10}) == {1: 50, 2: 40, 3: 10}
+    assert effective_weights({1: 60, 2: 40}, {2: -50}) == {1: 60}
+    assert effective_weights({1: 60, 2: 40}, {1: 20, 2: 30}) == pytest.approx({1: 80 / 1.5, 2: 70 / 1.5})
+
+
+def test_engines_compute_unique_weights_once():
+    """重复权重去重计算后展开，结果与逐组合计算一致"""
+    rng = np.random.default_rng(0)
+    distinct = rng.dirichlet(np.ones(4), 3)
+    weights = distinct[[0, 1, 0, 2, 0, 1]]
+    closes = 10 * np.cumprod(1 + rng.normal(0, 0.01, (30, 4)), axis=0)
+    base_rows = np.array([0, 0, 5, 0, 0, 3])
+    base_navs = np.array([1.0, 1.0, 1.2, 1.0, 0.9, 1.1])
+    result = PortfolioValuationEngine().valuate(weights, closes, base_rows, base_navs)
+    for i in range(len(weights)):
+        single = PortfolioValuationEngine().valuate(weights[i:i + 1], closes, base_rows[i:i + 1], base_navs[i:i + 1])
+        assert np.allclose(result["nav"][:, i], single["nav"][:, 0])
+        assert np.allclose(result["covered_weight"][:, i], single["covered_weight"][:, 0])
+
+    returns = rng.normal(0, 0.01, (60, 4))
+    measured = SuitabilityEngine().measure(weights, returns)
+    assert measured["volatility"][0] == measured["volatility"][2] == measured["volatility"][4]
+    assert measured["volatility"][3] == pytest.approx(SuitabilityEngine().measure(distinct[2:3], returns)["volatility"][0])
+
+    shocks = rng.normal(-0.1, 0.05, (4, 2))
+    applied = StressTestEngine().apply(weights, shocks)
+    assert np.allclose(applied["returns"], weights @ shocks)
+    assert applied["worst_asset"].shape == (6, 2)
+
+
+def test_model_portfolio_lifecycle(client, headers, setup):
+    """关联时重写持仓或保留为偏离，客户偏离与模型调整都会重新下发持仓"""
+    assets, portfolios = setup["assets"], setup["portfolios"]
+    resp = client.post("/model-portfolios/", json={
+        "name": "平衡模型", "risk_level": 3,
+        "assets": [{"asset_id": assets["EQUITY"], "weight": 60}, {"asset_id": assets["BOND"], "weight": 40}]
+    }, headers=headers)
+    assert resp.status_code == 201
+    model = resp.json()
+    assert model["portfolios"] == 0 and len(model["model_assets"]) == 2
+
+    resp = client.post(f"/model-portfolios/{model['id']}/portfolios", json={"portfolio_ids": portfolios[:2]}, headers=headers)
+    assert resp.json() == {"portfolios": 2, "variants": 1, "holdings": 4}
+    assert _holdings(client, headers, portfolios[0], assets) == {"EQUITY": 60, "BOND": 40}
+
+    # 保留现有持仓：差额保存为偏离，持仓不变
+    resp = client.post(f"/model-portfolios/{model['id']}/portfolios",
+                       json={"portfolio_ids": [portfolios[2]], "keep_weights": True}, headers=headers)
+    assert resp.status_code == 200
+    assert _holdings(client, headers, portfolios[2], assets) == {"EQUITY": 70, "GOLD": 30}
+    overrides = client.get(f"/portfolios/{portfolios[2]}/overrides", headers=headers).json()
+    assert {o["asset_id"]: o["weight_delta"] for o in overrides} == {
+        assets["EQUITY"]: 10, assets["BOND"]: -40, assets["GOLD"]: 30
+    }
+
+    resp = client.put(f"/portfolios/{portfolios[1]}/overrides", json=[
+        {"asset_id": assets["EQUITY"], "weight_delta": -10}, {"asset_id": assets["GOLD"], "weight_delta": 10}
+    ], headers=headers)
+    assert resp.status_code == 200
+    assert _holdings(client, headers, portfolios[1], assets) == {"EQUITY": 50, "BOND": 40, "GOLD": 10}
+
+    # 调整模型：三个组合分属三种 (模型, 偏离) 组合
+    resp = client.put(f"/model-portfolios/{model['id']}/assets", json=[
+        {"asset_id": assets["EQUITY"], "weight": 50}, {"asset_id": assets["BOND"], "weight": 50}
+    ], headers=headers)
+    assert resp.json() == {"portfolios": 3, "variants": 3, "holdings": 2 + 3 + 3}
+    assert _holdings(client, headers, portfolios[0], assets) == {"EQUITY": 50, "BOND": 50}
+    assert _holdings(client, headers, portfolios[1], assets) == {"EQUITY": 40, "BOND": 50, "GOLD": 10}
+    assert _holdings(client, headers, portfolios[2], assets) == {"EQUITY": 60, "BOND": 10, "GOLD": 30}
+    assert client.get(f"/model-portfolios/{model['id']}", headers=headers).json()["portfolios"] == 3
+
+
+def test_linked_portfolio_guards(client, headers, setup):
+    """关联组合不可直接修改持仓，解除关联后恢复；被模型引用的资产不可删除"""
+    assets, portfolios = setup["assets"], setup["portfolios"]
+    model_id = client.get("/model-portfolios/", headers=headers).json()[0]["id"]
+    payload = [{"asset_id": assets["GOLD"], "weight": 100}]
+    assert client.put(f"/portfolios/{portfolios[0]}/assets", json=payload, headers=headers).status_code == 400
+    assert client.delete(f"/model-portfolios/{model_id}/portfolios/{portfolios[0]}", headers=headers).status_code == 200
+    assert client.put(f"/portfolios/{portfolios[0]}/assets", json=payload, headers=headers).status_code == 200
+    assert client.put(f"/portfolios/{portfolios[0]}/overrides", json=[], headers=headers).status_code == 400
+    assert client.get("/model-portfolios/", headers=headers).json()[0]["portfolios"] == 2
+
+    resp = client.post("/model-portfolios/", json={
+        "name": "超额模型", "risk_level": 5,
+        "assets": [{"asset_id": assets["EQUITY"], "weight": 80}, {"asset_id": assets["BOND"], "weight": 30}]
+    }, headers=headers)
+    assert resp.status_code == 400
+    assert client.post(f"/model-portfolios/{model_id}/portfolios", json={"portfolio_ids": [99999]},
+                       headers=headers).status_code == 404
+    assert client.delete(f"/assets/{assets['BOND']}").status_code == 400
+
+
+def test_non_owner_cannot_modify_model(client, headers, other_headers, setup):
+    """非管理员且非创建者不可创建或修改模型组合；创建者只能关联和解除自己的组合"""
+    assets, portfolios = setup["assets"], setup["portfolios"]
+    model_id = client.get("/model-portfolios/", headers=headers).json()[0]["id"]
+    payload = [{"asset_id": assets["EQUITY"], "weight": 100}]
+    assert client.post("/model-portfolios/", json={"name": "越权模型", "risk_level": 3, "assets": payload},
+                       headers=other_headers).status_code == 403
+    assert client.put(f"/model-portfolios/{model_id}/assets", json=payload, headers=other_headers).status_code == 403
+    assert client.post(f"/model-portfolios/{model_id}/portfolios", json={"portfolio_ids": [portfolios[0]]},
+                       headers=other_headers).status_code == 403
+    assert client.delete(f"/model-portfolios/{model_id}/portfolios/{portfolios[1]}",
+                         headers=other_headers).status_code == 403
+
+    # 非管理员创建者：他人的组合按不存在处理
+    db = TestingSessionLocal()
+    try:
+        other_id = db.query(User.id).filter(User.username == "model_other").scalar()
+        db.query(ModelPortfolio).filter(ModelPortfolio.id == model_id).update({"created_by": other_id})
+        db.commit()
+    finally:
+        db.close()
+    assert client.post(f"/model-portfolios/{model_id}/portfolios", json={"portfolio_ids": [portfolios[0]]},
+                       headers=other_headers).status_code == 404
+    assert client.delete(f"/model-portfolios/{model_id}/portfolios/{portfolios[1]}",
+                         headers=other_headers).status_code == 404
+    own = client.post("/portfolios/", json={"name": "自有组合", "risk_level": 3, "assets": payload},
+                      headers=other_headers).json()["id"]
+    resp = client.post(f"/model-portfolios/{model_id}/portfolios", json={"portfolio_ids": [own]}, headers=other_headers)
+    assert resp.status_code == 200 and resp.json()["portfolios"] == 1
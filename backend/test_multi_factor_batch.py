@@ -0,0 +1,121 @@
+"""
+多日期批量多因子评分测试
+测试张量评分与单日排名一致、排名矩阵以及批量持久化接口
+"""
+import pytest
+import numpy as np
+from datetime import datetime, timedelta
+
+from conftest import sqlite_test_client
+from models.ai_models import MultiFactorModel
+from models.strategy import MultiFactorScore, MultiFactorInput
+
+# 使用独立的测试数据库
+engine, TestingSessionLocal, client = sqlite_test_client("test_multi_factor_batch.db")
+
+
+@pytest.fixture(scope="module")
+def headers(client):
+    client.post("/users/", json={
+        "username": "batch_user",
+        "email": "batch@test.com",
+        "password": "testpassword123"
+    })
+    resp = client.post("/auth/token", data={"username": "batch_user", "password": "testpassword123"})
+    assert resp.status_code == 200
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+FACTORS = ["价值", "成长", "质量", "动量"]
+
+
+def make_tensor(n_dates=6, n_stocks=20, seed=11):
+    rng = np.random.default_rng(seed)
+    values = rng.uniform(size=(n_dates, n_stocks, len(FACTORS)))
+    values[0, 3, :] = np.nan      # 某日无数据的股票
+    values[1, 5, 2] = np.nan      # 单个因子缺失
+    return values
+
+
+def test_score_tensor_matches_single_date_ranking():
+    """张量评分与逐日调用单日排名结果一致"""
+    model = MultiFactorModel()
+    values = make_tensor()
+    weights = {"价值": 0.3, "成长": 0.3, "质量": 0.2, "动量": 0.2}
+    regimes = ["牛市", "熊市", None, "牛市", "震荡市", None]
+    scores, _, regime_weights = model.score_tensor(values, FACTORS, weights, regimes)
+    ranks = model.rank_matrix(scores)
+    assert set(regime_weights) == {"牛市", "熊市", None, "震荡市"}
+
+    for d in range(values.shape[0]):
+        stocks = [{
+            "symbol": str(i),
+            "factor_values": {f: values[d, i, j] for j, f in enumerate(FACTORS) if np.isfinite(values[d, i, j])}
+        } for i in range(values.shape[1]) if np.isfinite(values[d, i]).any()]
+        ranking, _, _, _, _ = model.generate_stock_ranking(stocks, weights, regimes[d])
+        for item in ranking:
+            i = int(item["symbol"])
+            assert scores[d, i] == pytest.approx(item["total_score"])
+            assert ranks[d, i] == item["rank"]
+    assert np.isnan(scores[0, 3]) and ranks[0, 3] == 0
+
+
+def test_batch_api_without_persistence(client, headers):
+    values = make_tensor()
+    start = datetime(2023, 1, 2)
+    payload = {
+        "dates": [(start + timedelta(days=d)).isoformat() for d in range(values.shape[0])],
+        "symbols": [f"{i:06d}.SZ" for i in range(values.shape[1])],
+        "factors": FACTORS,
+        "factor_values": np.where(np.isnan(values), None, values).tolist()
+    }
+    resp = client.post("/strategy/multi_factor_signal/batch", json=payload, headers=headers)
+    assert resp.status_code == 200
+    data = resp.json()
+    assert len(data["scores"]) == 6 and len(data["scores"][0]) == 20
+    assert data["scores"][0][3] is None and data["ranks"][0][3] is None
+    assert data["score_ids"] is None
+    assert client.get("/strategy/multi_factor_scores", headers=headers).json() == []
+
+    factor_values = payload["factor_values"]
+    payload["factor_values"] = factor_values[:2]
+    resp = client.post("/strategy/multi_factor_signal/batch", json=payload, headers=headers)
+    assert resp.status_code == 400
+
+    # 参差不齐的张量：某只股票缺少一个因子
+    ragged = [[row[:] for row in day] for day in factor_values]
+    ragged[1][5] = ragged[1][5][:-1]
+    resp = client.post("/strategy/multi_factor_signal/batch", json={**payload, "factor_values": ragged}, headers=headers)
+    assert resp.status_code == 400
+
+
+def test_batch_api_with_persistence(client, headers):
+    values = make_tensor()
+    values[2] = values[1]  # 相同输入只保存一份
+    start = datetime(2023, 1, 2)
+    payload = {
+        "dates": [(start + timedelta(days=d)).isoformat() for d in range(values.shape[0])],
+        "symbols": [f"{i:06d}.SZ" for i in range(values.shape[1])],
+        "factors": FACTORS,
+        "factor_values": np.where(np.isnan(values), None, values).tolist(),
+        "market_regime": "熊市",
+        "persist": True
+    }
+    resp = client.post("/strategy/multi_factor_signal/batch", json=payload, headers=headers)
+    assert resp.status_code == 200
+    data = resp.json()
+    assert len(data["score_ids"]) == 6
+
+    db = TestingSessionLocal()
+    try:
+        assert db.query(MultiFactorScore).count() == 6
+        assert db.query(MultiFactorInput).count() == 5
+    finally:
+        db.close()
+
+    detail = client.get(f"/strategy/multi_factor_scores/{data['score_ids'][0]}", headers=headers).json()
+    assert len(detail["stock_scores"]) == 19
+    top = detail["stock_scores"][0]
+    i = payload["symbols"].index(top["symbol"])
+    assert data["ranks"][0][i] == 1
+    assert top["total_score"] == pytest.approx(data["scores"][0][i])
@@ -0,0 +1,94 @@
+"""
+多因子Top-K排名测试
+测试argpartition前K名选取、评分摘要和流式排名输出
+"""
+import json
+import pytest
+import numpy as np
+
+from conftest import sqlite_test_client
+from models.ai_models import MultiFactorModel
+from models.strategy import MultiFactorScore
+
+# 使用独立的测试数据库
+engine, TestingSessionLocal, client = sqlite_test_client("test_multi_factor_ranking.db")
+
+
+@pytest.fixture(scope="module")
+def headers(client):
+    client.post("/users/", json={
+        "username": "ranking_user",
+        "email": "ranking@test.com",
+        "password": "testpassword123"
+    })
+    resp = client.post("/auth/token", data={"username": "ranking_user", "password": "testpassword123"})
+    assert resp.status_code == 200
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+def make_stocks(n_stocks=500, seed=3):
+    rng = np.random.default_rng(seed)
+    # 保留两位小数以制造同分情况
+    values = np.round(rng.uniform(size=(n_stocks, 4)), 2)
+    return [{
+        "symbol": f"{i:06d}.SZ",
+        "name": f"股票{i}",
+        "factor_values": dict(zip(["价值", "成长", "质量", "动量"], row.tolist()))
+    } for i, row in enumerate(values)]
+
+
+def test_top_k_matches_full_ranking():
+    """前K名与完整排名的前K项评分一致"""
+    model = MultiFactorModel()
+    stocks = make_stocks()
+    full, _, _, _, _ = model.generate_stock_ranking(stocks, market_regime="牛市")
+    top, summary, _, _, _, _ = model.generate_top_k_ranking(stocks, top_k=50, market_regime="牛市")
+    assert len(top) == 50
+    assert [s["rank"] for s in top] == list(range(1, 51))
+    assert [s["total_score"] for s in top] == [s["total_score"] for s in full[:50]]
+    assert summary["count"] == 500
+    assert summary["max"] == pytest.approx(top[0]["total_score"])
+    assert summary["mean"] == pytest.approx(np.mean([s["total_score"] for s in full]))
+
+
+def test_missing_factor_excluded_from_contribution():
+    """缺失的因子不计入贡献"""
+    model = MultiFactorModel()
+    stocks = [
+        {"symbol": "A", "factor_values": {"价值": 1.0}},
+        {"symbol": "B", "factor_values": {"价值": 0.5, "成长": 1.0}},
+    ]
+    ranking, _, _, _, _ = model.generate_stock_ranking(stocks, {"价值": 0.5, "成长": 0.5})
+    assert ranking[0]["symbol"] == "B"
+    assert set(ranking[1]["factor_contribution"]) == {"价值"}
+
+
+def test_select_top_k_edge_cases():
+    scores = np.array([0.1, 0.5, 0.5, 0.3])
+    assert MultiFactorModel.select_top_k(scores, 10).tolist() == [1, 2, 3, 0]
+    assert MultiFactorModel.select_top_k(scores, 2).tolist() == [1, 2]
+    assert MultiFactorModel.select_top_k(scores, 0).tolist() == []
+
+
+def test_top_k_and_stream_api(client, headers):
+    """接口只返回前K名和摘要，流式接口按排名输出完整列表"""
+    stocks = make_stocks(n_stocks=100)
+    resp = client.post("/strategy/multi_factor_signal", json={"stocks": stocks, "top_k": 5}, headers=headers)
+    assert resp.status_code == 200
+    data = resp.json()
+    assert len(data["stock_scores"]) == 5
+    assert data["summary"]["count"] == 100
+    db = TestingSessionLocal()
+    try:
+        # 记录的股票数量为参与排名的全部股票，而非返回的前K名
+        score = db.query(MultiFactorScore).order_by(MultiFactorScore.id.desc()).first()
+        assert score.stock_count == 100 and len(score.top_symbols) <= 5
+    finally:
+        db.close()
+
+    resp = client.post("/strategy/multi_factor_signal/stream", json={"stocks": stocks}, headers=headers)
+    assert resp.status_code == 200
+    lines = [json.loads(line) for line in resp.text.splitlines() if line]
+    assert len(lines) == 100
+    assert [line["rank"] for line in lines] == list(range(1, 101))
+    assert lines[0]["symbol"] == data["stock_scores"][0]["symbol"]
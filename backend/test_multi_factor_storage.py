@@ -0,0 +1,116 @@
+"""
+多因子评分紧凑存储测试
+测试输入按内容哈希去重、评分压缩存储、摘要列表和逐股评分按需加载
+"""
+import pytest
+from sqlalchemy import event
+
+from conftest import sqlite_test_client
+from models.strategy import MultiFactorScore, MultiFactorInput
+
+# 使用独立的测试数据库
+engine, TestingSessionLocal, client = sqlite_test_client("test_multi_factor_storage.db")
+
+
+@pytest.fixture(scope="module")
+def headers(client):
+    client.post("/users/", json={
+        "username": "storage_user",
+        "email": "storage@test.com",
+        "password": "testpassword123"
+    })
+    resp = client.post("/auth/token", data={"username": "storage_user", "password": "testpassword123"})
+    assert resp.status_code == 200
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+STOCKS = [{
+    "symbol": f"{i:06d}.SH",
+    "name": f"股票{i}",
+    "factor_values": {"价值": (i % 7) / 7, "成长": (i % 5) / 5, "质量": (i % 3) / 3}
+} for i in range(30)]
+
+
+def test_pack_unpack_roundtrip():
+    stock_scores = [
+        {"symbol": "A", "name": "甲", "total_score": 0.9, "factor_contribution": {"价值": 0.5, "成长": 0.4}, "rank": 1},
+        {"symbol": "B", "name": None, "total_score": 0.2, "factor_contribution": {"价值": 0.2}, "rank": 2},
+    ]
+    blob = MultiFactorScore.pack_scores(stock_scores)
+    assert MultiFactorScore.unpack_scores(blob) == stock_scores
+    assert MultiFactorScore.unpack_scores(blob, offset=1, limit=5) == stock_scores[1:]
+
+
+def test_input_hash_is_canonical():
+    reordered = [{"factor_values": s["factor_values"], "name": s["name"], "symbol": s["symbol"]} for s in STOCKS]
+    assert MultiFactorInput.compute_hash(STOCKS) == MultiFactorInput.compute_hash(reordered)
+
+
+def test_compact_storage_dedup_and_lazy_detail(client, headers):
+    """相同输入只保存一份，列表只返回摘要，详情按需还原"""
+    for _ in range(2):
+        resp = client.post("/strategy/multi_factor_signal", json={"stocks": STOCKS}, headers=headers)
+        assert resp.status_code == 200
+
+    db = TestingSessionLocal()
+    try:
+        assert db.query(MultiFactorInput).count() == 1
+        row = db.query(MultiFactorScore).first()
+        assert row.storage_mode == "compact"
+        assert row.stock_scores is None and row.scores_blob is not None
+    finally:
+        db.close()
+
+    resp = client.get("/strategy/multi_factor_scores", headers=headers)
+    assert resp.status_code == 200
+    summaries = resp.json()
+    assert len(summaries) == 2
+    assert "stock_scores" not in summaries[0]
+    assert summaries[0]["stock_count"] == 30
+    assert len(summaries[0]["top_symbols"]) == 10
+
+    score_id = summaries[0]["id"]
+    detail = client.get(f"/strategy/multi_factor_scores/{score_id}", headers=headers).json()
+    assert len(detail["stock_scores"]) == 30
+    assert detail["stock_scores"][0]["symbol"] == summaries[0]["top_symbols"][0]
+
+    page = client.get(f"/strategy/multi_factor_scores/{score_id}/stocks?offset=10&limit=5", headers=headers).json()
+    assert [s["rank"] for s in page] == [11, 12, 13, 14, 15]
+    assert page == detail["stock_scores"][10:15]
+
+
+def test_full_storage_mode_still_supported(client, headers):
+    resp = client.post("/strategy/multi_factor_signal", json={"stocks": STOCKS, "storage_mode": "full"}, headers=headers)
+    assert resp.status_code == 200
+    summaries = client.get("/strategy/multi_factor_scores", headers=headers).json()
+    full = [s for s in summaries if s["storage_mode"] == "full"][0]
+    detail = client.get(f"/strategy/multi_factor_scores/{full['id']}", headers=headers).json()
+    assert detail["stock_scores"] == resp.json()["stock_scores"]
+
+
+def test_get_or_create_tolerates_concurrent_insert(client):
+    """查询后、写入前其他请求已写入相同输入：回滚保存点后复用已有记录"""
+    stocks = [{**stock, "name": f"并发{stock['name']}"} for stock in STOCKS]
+    db = TestingSessionLocal()
+    try:
+        @event.listens_for(db, "do_orm_execute")
+        def insert_concurrently(state):
+            if not (state.is_select and state.bind_mapper and state.bind_mapper.class_ is MultiFactorInput):
+                return None
+            event.remove(db, "do_orm_execute", insert_concurrently)
+            result = state.invoke_statement().freeze()
+            other = TestingSessionLocal()
+            try:
+                MultiFactorInput.get_or_create(other, stocks)
+                other.commit()
+            finally:
+                other.close()
+            return result()
+        
+        inputs = MultiFactorInput.get_or_create_many(db, [stocks, stocks[:5], stocks])
+        db.commit()
+        assert inputs[0] is inputs[2] and inputs[1].stock_count == 5
+        content_hash = MultiFactorInput.compute_hash(stocks)
+        assert [row.id for row in db.query(MultiFactorInput).filter(MultiFactorInput.content_hash == content_hash)] == [inputs[0].id]
+    finally:
+        db.close()
@@ -0,0 +1,132 @@
+"""
+组合净值估值测试
+测试持仓代码匹配行情、恒定权重日收益与收益贡献、净值快照增量续算及组合列表业绩展示
+"""
+import pytest
+from datetime import datetime
+
+from conftest import sqlite_test_client
+from models.portfolio import Asset, PortfolioNavSnapshot
+from models.market_data import MarketData, PriceHistory, AssetType
+
+# 使用独立的测试数据库
+engine, TestingSessionLocal, client = sqlite_test_client("test_portfolio_nav.db")
+
+DAYS = [datetime(2024, 7, 1), datetime(2024, 7, 2), datetime(2024, 7, 3)]
+# B 在第三个交易日停牌，沿用前收盘价
+CLOSES = {"A": [10.0, 11.0, 12.1], "B": [20.0, 19.0, None]}
+
+
+@pytest.fixture(scope="module")
+def headers(client):
+    client.post("/users/", json={
+        "username": "nav_user",
+        "email": "nav@test.com",
+        "password": "testpassword123"
+    })
+    resp = client.post("/auth/token", data={"username": "nav_user", "password": "testpassword123"})
+    assert resp.status_code == 200
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def setup(client, headers):
+    db = TestingSessionLocal()
+    try:
+        for symbol, closes in CLOSES.items():
+            instrument = MarketData(symbol=symbol, name=symbol, asset_type=AssetType.STOCK, exchange="SSE")
+            db.add(instrument)
+            db.flush()
+            db.add_all([
+                PriceHistory(market_data_id=instrument.id, date=day, close_price=close)
+                for day, close in zip(DAYS, closes) if close is not None
+            ])
+        assets = {code: Asset(code=code, name=code, asset_type="股票") for code in ["A", "B", "现金理财"]}
+        db.add_all(assets.values())
+        db.commit()
+        asset_ids = {code: asset.id for code, asset in assets.items()}
+    finally:
+        db.close()
+    
+    balanced = client.post("/portfolios/", json={
+        "name": "均衡组合", "risk_level": 3,
+        "assets": [
+            {"asset_id": asset_ids["A"], "weight": 50},
+            {"asset_id": asset_ids["B"], "weight": 30},
+            {"asset_id": asset_ids["现金理财"], "weight": 20},
+        ]
+    }, headers=headers)
+    single = client.post("/portfolios/", json={
+        "name": "单一持仓", "risk_level": 5, "assets": [{"asset_id": asset_ids["A"], "weight": 100}]
+    }, headers=headers)
+    assert balanced.status_code == 201 and single.status_code == 201
+    return {"balanced": balanced.json()["id"], "single": single.json()["id"], "assets": asset_ids}
+
+
+def test_nav_snapshots_use_constant_weights(client, headers, setup):
+    """首次估值从起始交易日建立基准净值，日收益为权重与标的收益的乘积之和"""
+    resp = client.post("/portfolios/me/nav", json={
+        "start_date": "2024-07-01T00:00:00", "end_date": "2024-07-02T23:59:59"
+    }, headers=headers)
+    assert resp.status_code == 200
+    assert resp.json() == {"portfolios": 2, "snapshots": 4}
+    
+    resp = client.get(f"/portfolios/{setup['balanced']}/nav", headers=headers)
+    assert resp.status_code == 200
+    base, day2 = resp.json()
+    assert base["nav"] == 1.0 and base["daily_return"] == 0.0 and base["contributions"] == {}
+    assert day2["daily_return"] == pytest.approx(0.5 * 0.1 + 0.3 * -0.05)
+    assert day2["contributions"] == pytest.approx({"A": 0.05, "B": -0.015})
+    # 现金理财没有行情，不计入覆盖率
+    assert day2["coverage"] == pytest.approx(0.8)
+
+
+def test_nav_snapshots_extend_incrementally(client, headers, setup):
+    """再次估值只追加最近快照之后的交易日，停牌标的当日收益为0"""
+    resp = client.post("/portfolios/me/nav", json={}, headers=headers)
+    assert resp.json() == {"portfolios": 2, "snapshots": 2}
+    resp = client.post("/portfolios/me/nav", json={}, headers=headers)
+    assert resp.json() == {"portfolios": 0, "snapshots": 0}
+    
+    navs = client.get(f"/portfolios/{setup['balanced']}/nav", headers=headers).json()
+    assert [snapshot["date"][:10] for snapshot in navs] == ["2024-07-01", "2024-07-02", "2024-07-03"]
+    assert navs[-1]["nav"] == pytest.approx(1.035 * 1.05)
+    assert navs[-1]["coverage"] == pytest.approx(0.5)
+    
+    single = client.get(f"/portfolios/{setup['single']}/nav", headers=headers).json()
+    assert single[-1]["cumulative_return"] == pytest.approx(0.21)
+
+
+def test_my_portfolios_show_latest_performance(client, headers, setup):
+    """组合列表附带最近一次净值快照，尚未估值的新组合业绩为空"""
+    created = client.post("/portfolios/", json={
+        "name": "新组合", "risk_level": 2, "assets": [{"asset_id": setup["assets"]["B"], "weight": 60}]
+    }, headers=headers).json()
+    
+    resp = client.get("/portfolios/me", headers=headers)
+    assert resp.status_code == 200
+    performance = {p["id"]: p["performance"] for p in resp.json()}
+    assert performance[created["id"]] is None
+    assert performance[setup["balanced"]]["date"][:10] == "2024-07-03"
+    assert performance[setup["balanced"]]["nav"] == pytest.approx(1.035 * 1.05)
+    
+    # 新组合以最近交易日为基准日建立净值
+    resp = client.post("/portfolios/me/nav", json={}, headers=headers)
+    assert resp.json() == {"portfolios": 1, "snapshots": 1}
+    performance = {p["id"]: p["performance"] for p in client.get("/portfolios/me", headers=headers).json()}
+    assert performance[created["id"]]["nav"] == 1.0
+
+
+def test_nav_history_is_private_and_removed_with_portfolio(client, headers, setup):
+    """净值序列仅限组合所有者查看，删除组合时一并删除快照"""
+    client.post("/users/", json={"username": "nav_other", "email": "nav_other@test.com", "password": "testpassword123"})
+    token = client.post("/auth/token", data={"username": "nav_other", "password": "testpassword123"}).json()["access_token"]
+    resp = client.get(f"/portfolios/{setup['single']}/nav", headers={"Authorization": f"Bearer {token}"})
+    assert resp.status_code == 404
+    
+    assert client.delete(f"/portfolios/{setup['single']}", headers=headers).status_code == 200
+    db = TestingSessionLocal()
+    try:
+        assert db.query(PortfolioNavSnapshot).filter(PortfolioNavSnapshot.portfolio_id == setup["single"]).count() == 0
+    finally:
+        db.close()
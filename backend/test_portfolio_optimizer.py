@@ -0,0 +1,206 @@
+"""
+组合优化测试
+测试 Ledoit-Wolf 收缩协方差估计，以及均值-方差、最小方差、风险平价、最大分散化优化
+"""
+import time
+import pytest
+import numpy as np
+from datetime import datetime, timedelta
+
+from conftest import sqlite_test_client
+from models.user import User
+from models.portfolio import Portfolio
+from models.market_data import MarketData, PriceHistory, AssetType
+from models.strategy import Strategy, StrategyType, AssetClass, PortfolioAllocation
+from models.ai_models import PortfolioOptimizer
+from routers.strategy import optimizer as optimizer_module
+
+# 使用独立的测试数据库
+engine, TestingSessionLocal, client = sqlite_test_client("test_portfolio_optimizer.db")
+
+SYMBOLS = [f"O{i}" for i in range(8)]
+INDUSTRIES = ["银行", "银行", "银行", "半导体", "半导体", "白酒", "白酒", "白酒"]
+N_DAYS = 160
+
+
+@pytest.fixture(scope="module")
+def headers(client):
+    client.post("/users/", json={
+        "username": "optimizer_user",
+        "email": "optimizer@test.com",
+        "password": "testpassword123"
+    })
+    resp = client.post("/auth/token", data={"username": "optimizer_user", "password": "testpassword123"})
+    assert resp.status_code == 200
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+def simulate_returns(n_days, n_assets, seed):
+    """单因子收益率：各资产贝塔与特异波动不同"""
+    rng = np.random.default_rng(seed)
+    market = rng.normal(0.0004, 0.01, n_days)
+    betas = np.linspace(0.5, 1.5, n_assets)
+    specific = np.linspace(0.005, 0.03, n_assets)
+    return market[:, None] * betas[None, :] + rng.normal(0, 1, (n_days, n_assets)) * specific[None, :]
+
+
+@pytest.fixture(scope="module")
+def market(headers):
+    db = TestingSessionLocal()
+    try:
+        returns = simulate_returns(N_DAYS, len(SYMBOLS), seed=7)
+        closes = 10 * np.cumprod(1 + returns, axis=0)
+        start = datetime(2024, 1, 1)
+        for j, symbol in enumerate(SYMBOLS):
+            instrument = MarketData(symbol=symbol, name=symbol, asset_type=AssetType.STOCK, exchange="SSE",
+                                    industry=INDUSTRIES[j])
+            db.add(instrument)
+            db.flush()
+            db.add_all([
+                PriceHistory(market_data_id=instrument.id, date=start + timedelta(days=t), close_price=float(closes[t, j]))
+                for t in range(N_DAYS)
+            ])
+        # 行情不足的资产应被剔除
+        short = MarketData(symbol="NEW", name="新股", asset_type=AssetType.STOCK, exchange="SSE")
+        db.add(short)
+        db.flush()
+        db.add_all([PriceHistory(market_data_id=short.id, date=start + timedelta(days=N_DAYS - 1 - t), close_price=5.0)
+                    for t in range(3)])
+        db.commit()
+    finally:
+        db.close()
+    return SYMBOLS + ["NEW"]
+
+
+def test_ledoit_wolf_shrinkage():
+    """样本越少收缩越强，收缩后协方差正定"""
+    returns = simulate_returns(1000, 50, seed=1)
+    covariance, shrinkage_long = PortfolioOptimizer.ledoit_wolf(returns)
+    _, shrinkage_short = PortfolioOptimizer.ledoit_wolf(returns[:40])
+    assert 0 < shrinkage_long < shrinkage_short <= 1
+    assert np.linalg.eigvalsh(covariance).min() > 0
+    sample = np.cov(returns, rowvar=False, bias=True)
+    assert np.abs(covariance - sample).max() < np.abs(sample).max() * 0.1
+
+
+def test_optimization_methods(client, headers, market):
+    """四种方法的权重满足约束且各自最优"""
+    results = {}
+    for method in ["min_variance", "risk_parity", "max_diversification", "mean_variance"]:
+        resp = client.post("/strategy/optimize", json={
+            "symbols": market, "method": method, "lookback_days": 120, "risk_aversion": 3.0
+        }, headers=headers)
+        assert resp.status_code == 200, resp.text
+        data = resp.json()
+        assert data["converged"]
+        assert data["excluded_symbols"] == ["NEW"]
+        assert data["observations"] == 120
+        assert sum(data["weights"].values()) == pytest.approx(1.0)
+        assert min(data["weights"].values()) >= -1e-9
+        results[method] = data
+    
+    rc = np.array(list(results["risk_parity"]["risk_contributions"].values()))
+    assert rc == pytest.approx(np.full(len(SYMBOLS), 1 / len(SYMBOLS)), abs=1e-6)
+    assert results["min_variance"]["volatility"] <= min(r["volatility"] for r in results.values()) + 1e-6
+    assert results["max_diversification"]["diversification_ratio"] >= \
+        max(r["diversification_ratio"] for r in results.values()) - 1e-4
+    # 最小方差偏向低波动资产
+    weights = results["min_variance"]["weights"]
+    assert weights["O0"] > weights["O7"]
+
+
+def test_constraints(client, headers, market):
+    """单资产上限、行业上限与最低收益约束"""
+    resp = client.post("/strategy/optimize", json={
+        "symbols": market, "method": "min_variance", "max_weight": 0.2, "group_limits": {"银行": 0.3}
+    }, headers=headers)
+    data = resp.json()
+    assert max(data["weights"].values()) <= 0.2 + 1e-4
+    assert sum(data["weights"][s] for s, ind in zip(SYMBOLS, INDUSTRIES) if ind == "银行") <= 0.3 + 1e-4
+    
+    expected = {symbol: 0.02 * (i + 1) for i, symbol in enumerate(SYMBOLS)}
+    resp = client.post("/strategy/optimize", json={
+        "symbols": market, "method": "mean_variance", "expected_returns": expected,
+        "risk_aversion": 50.0, "target_return": 0.12
+    }, headers=headers)
+    assert resp.json()["expected_return"] >= 0.12 - 1e-4
+    
+    resp = client.post("/strategy/optimize", json={
+        "symbols": market, "method": "min_variance", "max_weight": 0.1
+    }, headers=headers)
+    assert resp.status_code == 400
+    resp = client.post("/strategy/optimize", json={"symbols": ["NEW", "NONE"]}, headers=headers)
+    assert resp.status_code == 400
+
+
+def test_save_allocations(client, headers, market, monkeypatch):
+    """优化结果保存为策略在各组合上的配置"""
+    db = TestingSessionLocal()
+    try:
+        user = db.query(User).filter(User.username == "optimizer_user").first()
+        portfolio = Portfolio(name="优化组合", risk_level=3, user_id=user.id)
+        strategy = Strategy(name="风险平价", strategy_type=StrategyType.CUSTOM, asset_class=AssetClass.STOCK)
+        db.add_all([portfolio, strategy])
+        db.commit()
+        ids = {"portfolio": portfolio.id, "strategy": strategy.id}
+    finally:
+        db.close()
+    
+    resp = client.post("/strategy/optimize", json={
+        "symbols": market, "method": "risk_parity",
+        "strategy_id": ids["strategy"], "portfolio_ids": [ids["portfolio"]]
+    }, headers=headers)
+    data = resp.json()
+    assert len(data["allocation_ids"]) == 1
+    
+    db = TestingSessionLocal()
+    try:
+        allocation = db.get(PortfolioAllocation, data["allocation_ids"][0])
+        assert allocation.target_weights == pytest.approx(data["weights"])
+        assert allocation.risk_metrics["volatility"] == pytest.approx(data["volatility"])
+        assert allocation.allocation_date == datetime(2024, 1, 1) + timedelta(days=N_DAYS - 1)
+    finally:
+        db.close()
+    
+    resp = client.post("/strategy/optimize", json={
+        "symbols": market, "strategy_id": ids["strategy"], "portfolio_ids": [9999]
+    }, headers=headers)
+    assert resp.status_code == 404
+    
+    # 未收敛的解不保存
+    monkeypatch.setattr(optimizer_module.portfolio_optimizer, "max_iter", 5)
+    resp = client.post("/strategy/optimize", json={
+        "symbols": market, "method": "mean_variance",
+        "strategy_id": ids["strategy"], "portfolio_ids": [ids["portfolio"]]
+    }, headers=headers)
+    assert resp.status_code == 400 and "未收敛" in resp.json()["detail"]
+    db = TestingSessionLocal()
+    try:
+        assert db.query(PortfolioAllocation).count() == 1
+    finally:
+        db.close()
+
+
+def test_large_universe():
+    """500只资产的优化可在请求路径内完成，热启动减少迭代"""
+    returns = simulate_returns(300, 500, seed=3)
+    covariance, _ = PortfolioOptimizer.ledoit_wolf(returns)
+    covariance *= 252
+    mu = returns.mean(axis=0) * 252
+    groups = np.zeros((10, 500))
+    groups[np.arange(500) % 10, np.arange(500)] = 1
+    optimizer = PortfolioOptimizer()
+    
+    for method in PortfolioOptimizer.METHODS:
+        started = time.perf_counter()
+        result = optimizer.optimize(method, covariance, mu, risk_aversion=5.0, max_weight=0.05,
+                                    groups=groups, group_limits=np.full(10, 0.15))
+        elapsed = time.perf_counter() - started
+        assert result["converged"]
+        assert result["weights"].sum() == pytest.approx(1.0)
+        assert elapsed < 1.0
+    
+    first = optimizer.optimize("mean_variance", covariance, mu, risk_aversion=5.0, max_weight=0.05)
+    warm = optimizer.optimize("mean_variance", covariance, mu * 1.02, risk_aversion=5.0, max_weight=0.05,
+                              warm_start=first["state"])
+    assert warm["iterations"] < first["iterations"]
@@ -0,0 +1,202 @@
+"""
+组合风险分析测试
+测试VaR/CVaR、波动率、Beta、最大回撤及风险贡献的计算，以及200资产组合的批量计算
+"""
+import time
+import numpy as np
+import pytest
+from sqlalchemy import insert
+from datetime import datetime, timedelta
+from statistics import NormalDist
+
+from conftest import sqlite_test_client
+from models.portfolio import Asset
+from models.market_data import MarketData, PriceHistory, MarketIndex, IndexHistory, AssetType
+
+# 使用独立的测试数据库
+engine, TestingSessionLocal, client = sqlite_test_client("test_portfolio_risk.db")
+
+N_ASSETS = 200
+N_DAYS = 260
+
+
+@pytest.fixture(scope="module")
+def headers(client):
+    client.post("/users/", json={
+        "username": "risk_user",
+        "email": "risk@test.com",
+        "password": "testpassword123"
+    })
+    resp = client.post("/auth/token", data={"username": "risk_user", "password": "testpassword123"})
+    assert resp.status_code == 200
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def market():
+    """单因子行情：资产收益 = beta × 指数收益 + 特质收益"""
+    rng = np.random.default_rng(42)
+    days = [datetime(2023, 1, 2) + timedelta(days=i) for i in range(N_DAYS + 1)]
+    index_returns = rng.normal(0.0003, 0.01, N_DAYS)
+    betas = rng.uniform(0.5, 1.5, N_ASSETS)
+    asset_returns = index_returns[:, None] * betas[None, :] + rng.normal(0, 0.01, (N_DAYS, N_ASSETS))
+    index_closes = 3000 * np.concatenate([[1.0], np.cumprod(1 + index_returns)])
+    asset_closes = 10 * np.vstack([np.ones(N_ASSETS), np.cumprod(1 + asset_returns, axis=0)])
+    
+    db = TestingSessionLocal()
+    try:
+        index = MarketIndex(code="000300", name="沪深300")
+        db.add(index)
+        db.flush()
+        db.execute(insert(IndexHistory), [
+            {"market_index_id": index.id, "date": day, "close_value": float(close)} for day, close in zip(days, index_closes)
+        ])
+        ids = db.execute(insert(MarketData).returning(MarketData.id), [
+            {"symbol": f"S{j:03d}", "name": f"S{j:03d}", "asset_type": AssetType.STOCK, "exchange": "SSE"}
+            for j in range(N_ASSETS)
+        ]).scalars().all()
+        db.execute(insert(PriceHistory), [
+            {"market_data_id": ids[j], "date": day, "close_price": float(asset_closes[t, j])}
+            for t, day in enumerate(days) for j in range(N_ASSETS)
+        ])
+        assets = db.execute(insert(Asset).returning(Asset.id), [
+            {"code": f"S{j:03d}", "name": f"S{j:03d}", "asset_type": "股票"} for j in range(N_ASSETS)
+        ] + [{"code": "现金理财", "name": "现金理财", "asset_type": "现金"}]).scalars().all()
+        db.commit()
+    finally:
+        db.close()
+    return {"betas": betas, "returns": asset_returns, "assets": assets}
+
+
+def _create_portfolio(client, headers, assets):
+    resp = client.post("/portfolios/", json={
+        "name": "风险测试组合", "risk_level": 3,
+        "assets": [{"asset_id": asset_id, "weight": weight} for asset_id, weight in assets]
+    }, headers=headers)
+    assert resp.status_code == 201
+    return resp.json()["id"]
+
+
+def test_portfolio_risk_metrics(client, headers, market):
+    """两资产组合的各项风险指标与直接计算一致"""
+    asset_ids = market["assets"]
+    portfolio_id = _create_portfolio(client, headers, [(asset_ids[0], 60), (asset_ids[1], 30), (asset_ids[-1], 10)])
+    resp = client.get(f"/portfolios/{portfolio_id}/risk", params={"index_code": "000300", "confidence": 0.99}, headers=headers)
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["observations"] == 252 and data["excluded"] == ["现金理财"]
+    assert data["coverage"] == pytest.approx(0.9)
+    
+    weights = np.array([0.6, 0.3])
+    daily = market["returns"][-252:, :2] @ weights
+    assert data["historical_var"] == pytest.approx(-np.quantile(daily, 0.01))
+    assert data["historical_cvar"] >= data["historical_var"]
+    nav = np.cumprod(1 + daily)
+    assert data["max_drawdown"] == pytest.approx((1 - nav / np.maximum.accumulate(np.maximum(nav, 1))).max())
+    assert data["beta"] == pytest.approx(weights @ market["betas"][:2], abs=0.1)
+    
+    # 参数法VaR与年化波动率一致
+    daily_vol = data["volatility"] / np.sqrt(252)
+    z = NormalDist().inv_cdf(0.99)
+    assert data["parametric_var"] == pytest.approx(z * daily_vol - daily.mean(), rel=1e-6)
+    assert data["parametric_cvar"] > data["parametric_var"]
+    assert sum(c["risk_contribution"] for c in data["risk_contributions"]) == pytest.approx(1.0)
+    
+    # 多日持有期按平方根法则放大
+    ten_day = client.get(f"/portfolios/{portfolio_id}/risk", params={"horizon_days": 10}, headers=headers).json()
+    assert ten_day["historical_var"] == pytest.approx(-np.quantile(daily, 0.05) * np.sqrt(10))
+    assert ten_day["beta"] is None
+
+
+def test_large_portfolio_risk_uses_cached_covariance(client, headers, market):
+    """200资产组合：风险贡献覆盖全部资产，重复请求命中协方差缓存"""
+    weights = np.full(N_ASSETS, 100 / N_ASSETS)
+    portfolio_id = _create_portfolio(client, headers, list(zip(market["assets"][:N_ASSETS], weights.tolist())))
+    
+    first = client.get(f"/portfolios/{portfolio_id}/risk", params={"index_code": "000300"}, headers=headers)
+    assert first.status_code == 200
+    started = time.perf_counter()
+    second = client.get(f"/portfolios/{portfolio_id}/risk", params={"index_code": "000300"}, headers=headers)
+    elapsed = time.perf_counter() - started
+    assert second.json() == first.json()
+    assert elapsed < 1.0
+    
+    data = first.json()
+    assert len(data["risk_contributions"]) == N_ASSETS
+    # 分散化后组合Beta接近平均Beta，特质风险基本分散
+    assert data["beta"] == pytest.approx(market["betas"].mean(), abs=0.05)
+    assert data["volatility"] < 0.01 * np.sqrt(252) * 1.2
+
+
+def test_portfolio_risk_errors(client, headers, market):
+    """无权限、基准不存在、没有行情时返回错误"""
+    cash_only = _create_portfolio(client, headers, [(market["assets"][-1], 100)])
+    assert client.get(f"/portfolios/{cash_only}/risk", headers=headers).status_code == 400
+    
+    portfolio_id = _create_portfolio(client, headers, [(market["assets"][0], 100)])
+    resp = client.get(f"/portfolios/{portfolio_id}/risk", params={"index_code": "UNKNOWN"}, headers=headers)
+    assert resp.status_code == 404
+    single = client.get(f"/portfolios/{portfolio_id}/risk", headers=headers).json()
+    assert single["risk_contributions"][0]["risk_contribution"] == pytest.approx(1.0)
+    
+    client.post("/users/", json={"username": "risk_other", "email": "risk_other@test.com", "password": "testpassword123"})
+    token = client.post("/auth/token", data={"username": "risk_other", "password": "testpassword123"}).json()["access_token"]
+    resp = client.get(f"/portfolios/{portfolio_id}/risk", headers={"Authorization": f"Bearer {token}"})
+    assert resp.status_code == 404
+
+
+def test_what_if_compares_proposed_weights(client, headers, market):
+    """试算返回当前与建议权重的风险收益、换手与成本，且不修改持仓"""
+    asset_ids = market["assets"]
+    portfolio_id = _create_portfolio(client, headers, [(asset_ids[0], 60), (asset_ids[1], 40)])
+    proposal = {
+        "assets": [{"asset_id": asset_ids[0], "weight": 30}, {"asset_id": asset_ids[2], "weight": 50},
+                   {"asset_id": asset_ids[-1], "weight": 20}],
+        "cost_rate": 0.002,
+        "portfolio_value": 1_000_000,
+    }
+    resp = client.post(f"/portfolios/{portfolio_id}/what-if", json=proposal, headers=headers)
+    assert resp.status_code == 200
+    data = resp.json()
+    
+    # 历史法指标只依赖收益序列，与风险面板一致
+    risk = client.get(f"/portfolios/{portfolio_id}/risk", headers=headers).json()
+    assert data["current"]["historical_var"] == pytest.approx(risk["historical_var"])
+    assert data["current"]["max_drawdown"] == pytest.approx(risk["max_drawdown"])
+    assert data["current"]["volatility"] == pytest.approx(risk["volatility"], rel=0.05)
+    
+    proposed = market["returns"][-252:, [0, 2]] @ np.array([0.3, 0.5])
+    assert data["proposed"]["historical_var"] == pytest.approx(-np.quantile(proposed, 0.05))
+    assert data["proposed"]["expected_return"] == pytest.approx(proposed.mean() * 252)
+    
+    changes = {c["code"]: c["change"] for c in data["changes"]}
+    assert changes == pytest.approx({"S000": -0.3, "S001": -0.4, "S002": 0.5, "现金理财": 0.2})
+    assert data["turnover"] == pytest.approx(0.7)
+    assert data["estimated_cost"] == pytest.approx(1.4 * 0.002)
+    assert data["estimated_cost_amount"] == pytest.approx(2800)
+    assert data["excluded"] == ["现金理财"]
+    
+    holdings = client.get(f"/portfolios/{portfolio_id}", headers=headers).json()["portfolio_assets"]
+    assert sorted(a["weight"] for a in holdings) == [40.0, 60.0]
+
+
+def test_what_if_is_fast_for_repeated_proposals(client, headers, market):
+    """同一资产范围内反复试算命中缓存"""
+    asset_ids = market["assets"][:N_ASSETS]
+    portfolio_id = _create_portfolio(client, headers, [(asset_id, 0.5) for asset_id in asset_ids])
+    rng = np.random.default_rng(1)
+    client.post(f"/portfolios/{portfolio_id}/what-if", json={
+        "assets": [{"asset_id": asset_id, "weight": 0.5} for asset_id in asset_ids]
+    }, headers=headers)
+    
+    started = time.perf_counter()
+    for _ in range(5):
+        weights = rng.dirichlet(np.ones(N_ASSETS)) * 100
+        resp = client.post(f"/portfolios/{portfolio_id}/what-if", json={
+            "assets": [{"asset_id": asset_id, "weight": float(w)} for asset_id, w in zip(asset_ids, weights)]
+        }, headers=headers)
+        assert resp.status_code == 200
+    assert (time.perf_counter() - started) / 5 < 0.5
+    
+    resp = client.post(f"/portfolios/{portfolio_id}/what-if", json={"assets": [{"asset_id": 999999, "weight": 10}]}, headers=headers)
+    assert resp.status_code == 400
@@ -4,7 +4,7 @@ from main import app
 from sqlalchemy.orm import sessionmaker
 from models import Base
 from database import get_db
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 import os
 from datetime import datetime, timezone
 
@@ -58,6 +58,23 @@ def register_and_login(client, username, password, email):
     assert token, "未获取到token"
     return token
 
+
+class QueryCounter:
+    """统计测试数据库执行的SQL语句数"""
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(engine, "before_cursor_execute", self)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(engine, "before_cursor_execute", self)
+
+
 def test_portfolio_crud(client):
     # 注册并登录
     token = register_and_login(client, "user1", "password123", "user1@example.com")
@@ -187,4 +204,69 @@ def test_portfolio_with_assets(client):
     assert len(portfolio["portfolio_assets"]) == 2
     weights = {a["asset"]["code"]: a["weight"] for a in portfolio["portfolio_assets"]}
     assert weights["600519"] == 30.0
-    assert weights["510300"] == 70.0
\ No newline at end of file
+    assert weights["510300"] == 70.0
+
+
+def test_portfolio_queries_do_not_grow_with_portfolios(client):
+    token = register_and_login(client, "user3", "password789", "user3@example.com")
+    headers = {"Authorization": f"Bearer {token}"}
+    asset_ids = []
+    for i in range(10):
+        resp = client.post("/assets/", json={"code": f"QC{i:03d}", "name": f"资产{i}", "asset_type": "股票"})
+        assert resp.status_code == 201
+        asset_ids.append(resp.json()["id"])
+
+    # 创建组合时资产校验为一次 IN 查询，与资产数量无关
+    with QueryCounter() as small:
+        resp = client.post("/portfolios/", json={
+            "name": "组合0", "risk_level": 3,
+            "assets": [{"asset_id": asset_id, "weight": 50.0} for asset_id in asset_ids[:2]]
+        }, headers=headers)
+    assert resp.status_code == 201
+    with QueryCounter() as large:
+        resp = client.post("/portfolios/", json={
+            "name": "组合1", "risk_level": 3,
+            "assets": [{"asset_id": asset_id, "weight": 10.0} for asset_id in asset_ids]
+        }, headers=headers)
+    assert resp.status_code == 201
+    assert len(resp.json()["portfolio_assets"]) == 10
+    assert large.count == small.count
+
+    # 资产不存在时不创建组合
+    resp = client.post("/portfolios/", json={
+        "name": "无效组合", "risk_level": 3,
+        "assets": [{"asset_id": asset_ids[0], "weight": 50.0}, {"asset_id": 999999, "weight": 50.0}]
+    }, headers=headers)
+    assert resp.status_code == 400
+    assert resp.json()["detail"] == "资产ID 999999 不存在"
+    assert len(client.get("/portfolios/me", headers=headers).json()) == 2
+
+    with QueryCounter() as few:
+        resp = client.get("/portfolios/me", headers=headers)
+    assert len(resp.json()) == 2
+    for i in range(2, 20):
+        client.post("/portfolios/", json={
+            "name": f"组合{i}", "risk_level": 3,
+            "assets": [{"asset_id": asset_id, "weight": 20.0} for asset_id in asset_ids[i % 5:i % 5 + 5]]
+        }, headers=headers)
+    with QueryCounter() as many:
+        resp = client.get("/portfolios/me", headers=headers)
+    assert resp.status_code == 200
+    assert len(resp.json()) == 20
+    assert all(len(p["portfolio_assets"]) in (5, 10, 2) for p in resp.json())
+    # 用户、组合、资产关联、资产、净值快照各一次查询
+    assert many.count == few.count <= 5
+
+    # 更新资产同样与资产数量无关
+    portfolio_id = resp.json()[0]["id"]
+    with QueryCounter() as update_small:
+        resp = client.put(f"/portfolios/{portfolio_id}/assets", json=[
+            {"asset_id": asset_id, "weight": 50.0} for asset_id in asset_ids[:2]
+        ], headers=headers)
+    with QueryCounter() as update_large:
+        resp = client.put(f"/portfolios/{portfolio_id}/assets", json=[
+            {"asset_id": asset_id, "weight": 10.0} for asset_id in asset_ids
+        ], headers=headers)
+    assert resp.status_code == 200
+    assert len(resp.json()["portfolio_assets"]) == 10
+    assert update_large.count == update_small.count
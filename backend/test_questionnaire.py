@@ -0,0 +1,186 @@
+"""
+风险测评问卷模板测试
+测试服务端按模板版本计分、答案以原生JSON保存、发布新版本与历史测评批量重新评分
+"""
+import json
+import pytest
+import numpy as np
+from sqlalchemy import text
+
+from conftest import sqlite_test_client
+from models.user import User
+from models.user_profile import RiskAssessment, RiskAssessmentScoring, QuestionnaireTemplate
+from models.ai_models import QuestionnaireScorer
+
+# 使用独立的测试数据库
+engine, TestingSessionLocal, client = sqlite_test_client("test_questionnaire.db")
+
+# 默认模板下 2+8+14+20+14 = 58 分
+ANSWERS = {"1": "60以上", "2": "1-3年", "3": "10%-20%", "4": "高风险高收益", "5": "保持不动"}
+
+
+@pytest.fixture(scope="module")
+def user_id(client):
+    resp = client.post("/users/", json={
+        "username": "questionnaire_user",
+        "email": "questionnaire@test.com",
+        "password": "testpassword123"
+    })
+    assert resp.status_code in (200, 201)
+    return resp.json()["id"]
+
+
+def _login(client, username, is_admin=False):
+    client.post("/users/", json={
+        "username": username,
+        "email": f"{username}@test.com",
+        "password": "testpassword123"
+    })
+    db = TestingSessionLocal()
+    try:
+        db.query(User).filter(User.username == username).update({"is_admin": is_admin})
+        db.commit()
+    finally:
+        db.close()
+    resp = client.post("/auth/token", data={"username": username, "password": "testpassword123"})
+    assert resp.status_code == 200
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def admin_headers(client):
+    return _login(client, "questionnaire_admin", is_admin=True)
+
+
+def test_scorer_scores_batch_with_weight_matrix():
+    """一批答卷一次矩阵评分，未使用的维度为空，缺答的答卷标记无效"""
+    scorer = QuestionnaireScorer(
+        [{"id": "a", "dimension": "risk_attitude", "weight": 2, "options": {"x": 1, "y": 5}},
+         {"id": "b", "options": {"x": 3, "y": 0}}],
+        [{"max_score": 5, "risk_level": "低"}, {"max_score": None, "risk_level": "高"}],
+        tolerance_divisor=1.0
+    )
+    result = scorer.score([{"a": "x", "b": "x"}, {"a": "y", "b": "y"}, {"a": "y"}])
+    assert result["total"][:2].tolist() == [5.0, 10.0]
+    assert result["risk_level"][:2] == ["低", "高"]
+    assert result["risk_tolerance"][:2].tolist() == [5.0, 10.0]
+    assert result["dimensions"][1, QuestionnaireScorer.DIMENSIONS.index("risk_attitude")] == 10.0
+    assert np.isnan(result["dimensions"][0, QuestionnaireScorer.DIMENSIONS.index("investment_horizon")])
+    assert result["invalid"] == [[], [], ["b"]]
+    with pytest.raises(ValueError):
+        QuestionnaireScorer([{"id": "a", "options": {"x": 1}}], [{"max_score": 5, "risk_level": "低"},
+                                                               {"max_score": 3, "risk_level": "高"}])
+
+
+def test_template_list_is_read_only(client):
+    """查询模板列表不补建默认模板"""
+    assert client.get("/user-profile/questionnaire-templates").json() == []
+    db = TestingSessionLocal()
+    try:
+        assert db.query(QuestionnaireTemplate).count() == 0
+    finally:
+        db.close()
+
+
+def test_assessment_is_scored_server_side(client, user_id):
+    """客户端提交的总分被忽略，按默认模板计分并以原生JSON保存答案"""
+    resp = client.post("/user-profile/risk-assessment", json={
+        "user_id": user_id, "total_score": 100, "answers": ANSWERS
+    })
+    assert resp.status_code == 201
+    body = resp.json()
+    assert body["total_score"] == 58 and body["risk_level"] == "积极"
+    assert body["risk_tolerance"] == pytest.approx(5.8)
+    assert body["risk_attitude_score"] == 28 and body["investment_knowledge_score"] is None
+    assert body["template_code"] == "default" and body["template_version"] == 1
+    assert body["answers"] == ANSWERS
+
+    with engine.connect() as conn:
+        raw = conn.execute(text("SELECT answers FROM risk_assessments WHERE id = :id"), {"id": body["id"]}).scalar()
+    assert json.loads(raw) == ANSWERS
+
+    resp = client.post("/user-profile/risk-assessment", json={"user_id": user_id, "answers": {"1": "18-30"}})
+    assert resp.status_code == 400
+    resp = client.post("/user-profile/risk-assessment", json={
+        "user_id": user_id, "answers": ANSWERS, "template_code": "missing"
+    })
+    assert resp.status_code == 404
+
+
+def test_publish_new_version_and_rescore(client, user_id, admin_headers):
+    """发布新版本后批量重新评分历史测评，可选纳入客户端计分的历史记录"""
+    templates = client.get("/user-profile/questionnaire-templates", params={"code": "default"}).json()
+    assert [t["version"] for t in templates] == [1]
+    # 客户端计分的历史记录：答案曾被 json.dumps 后存为文本
+    db = TestingSessionLocal()
+    try:
+        db.execute(text(
+            "INSERT INTO risk_assessments (user_id, total_score, risk_level, risk_tolerance, answers, assessment_date) "
+            "VALUES (:user_id, 99, '激进', 9.9, :answers, '2023-01-01 00:00:00')"
+        ), {"user_id": user_id, "answers": json.dumps(ANSWERS)})
+        db.commit()
+    finally:
+        db.close()
+
+    resp = client.post("/user-profile/questionnaire-templates", json={
+        "code": "default", "name": "默认风险测评问卷（收紧）",
+        "questions": templates[0]["questions"],
+        "bands": [{"max_score": 30, "risk_level": "保守"}, {"max_score": 60, "risk_level": "稳健"},
+                  {"max_score": None, "risk_level": "积极"}],
+        "tolerance_divisor": 12
+    }, headers=admin_headers)
+    assert resp.status_code == 201
+    v2 = resp.json()
+    assert v2["version"] == 2 and v2["is_active"]
+    versions = client.get("/user-profile/questionnaire-templates", params={"code": "default"}).json()
+    assert [t["is_active"] for t in versions] == [False, True]
+
+    resp = client.post(f"/user-profile/questionnaire-templates/{v2['id']}/rescore", json={}, headers=admin_headers)
+    assert resp.json() == {"template_id": v2["id"], "code": "default", "version": 2,
+                           "assessments": 1, "rescored": 1, "changed_level": 1, "invalid": 0}
+    resp = client.post(f"/user-profile/questionnaire-templates/{v2['id']}/rescore", json={"include_legacy": True},
+                       headers=admin_headers)
+    assert resp.json()["assessments"] == 2 and resp.json()["rescored"] == 2
+
+    assessments = client.get(f"/user-profile/risk-assessment/{user_id}").json()
+    assert {a["risk_level"] for a in assessments} == {"稳健"}
+    assert all(a["answers"] == ANSWERS and a["template_version"] == 2 for a in assessments)
+    assert assessments[0]["risk_tolerance"] == pytest.approx(58 / 12)
+    db = TestingSessionLocal()
+    try:
+        assert db.query(RiskAssessmentScoring).count() == db.query(RiskAssessment).count() == 2
+    finally:
+        db.close()
+
+    # 新测评默认使用当前版本，也可指定历史版本
+    resp = client.post("/user-profile/risk-assessment", json={"user_id": user_id, "answers": ANSWERS, "template_version": 1})
+    assert resp.json()["risk_level"] == "积极" and resp.json()["template_version"] == 1
+
+
+def test_invalid_template_is_rejected(client, admin_headers):
+    """题目编号重复或等级区间未递增的模板不能发布"""
+    resp = client.post("/user-profile/questionnaire-templates", json={
+        "code": "broken", "name": "无效模板",
+        "questions": [{"id": "1", "options": {"是": 1}}, {"id": "1", "options": {"否": 0}}],
+        "bands": [{"risk_level": "保守"}]
+    }, headers=admin_headers)
+    assert resp.status_code == 400
+    resp = client.post("/user-profile/questionnaire-templates", json={
+        "code": "broken", "name": "无效模板",
+        "questions": [{"id": "1", "dimension": "unknown", "options": {"是": 1}}],
+        "bands": [{"risk_level": "保守"}]
+    }, headers=admin_headers)
+    assert resp.status_code == 400
+    resp = client.post("/user-profile/questionnaire-templates/99999/rescore", json={}, headers=admin_headers)
+    assert resp.status_code == 404
+
+
+def test_template_management_requires_admin(client):
+    """发布模板与重新评分影响全部客户的风险等级，需管理员权限"""
+    template = {"code": "plain", "name": "普通用户模板",
+                "questions": [{"id": "1", "options": {"是": 1}}], "bands": [{"risk_level": "保守"}]}
+    assert client.post("/user-profile/questionnaire-templates", json=template).status_code == 401
+    headers = _login(client, "questionnaire_plain")
+    assert client.post("/user-profile/questionnaire-templates", json=template, headers=headers).status_code == 403
+    resp = client.post("/user-profile/questionnaire-templates/1/rescore", json={}, headers=headers)
+    assert resp.status_code == 403
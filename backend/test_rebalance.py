@@ -0,0 +1,213 @@
+"""
+组合再平衡测试
+测试目标权重与当前持仓求差、容忍带、换手率上限、手数取整及批量组合调仓
+"""
+import pytest
+from sqlalchemy import insert
+from datetime import datetime
+
+from conftest import sqlite_test_client
+from models.user import User
+from models.portfolio import Portfolio, Asset, PortfolioAsset
+from models.market_data import MarketData, PriceHistory, AssetType
+from models.strategy import Strategy, StrategyType, AssetClass, PortfolioAllocation, RebalanceOrder
+
+# 使用独立的测试数据库
+engine, TestingSessionLocal, client = sqlite_test_client("test_rebalance.db")
+
+PRICES = {"A": (AssetType.STOCK, 10.0), "B": (AssetType.STOCK, 25.3), "E": (AssetType.ETF, 4.0), "X": (AssetType.STOCK, 8.0)}
+TARGET = {"A": 0.4, "B": 0.3, "E": 0.2, "UNKNOWN": 0.1}
+
+
+def _login(client, username, is_admin=False):
+    client.post("/users/", json={
+        "username": username,
+        "email": f"{username}@test.com",
+        "password": "testpassword123"
+    })
+    db = TestingSessionLocal()
+    try:
+        db.query(User).filter(User.username == username).update({"is_admin": is_admin})
+        db.commit()
+    finally:
+        db.close()
+    resp = client.post("/auth/token", data={"username": username, "password": "testpassword123"})
+    assert resp.status_code == 200
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def headers(client):
+    return _login(client, "rebalance_user", is_admin=True)
+
+
+@pytest.fixture(scope="module")
+def setup(headers):
+    db = TestingSessionLocal()
+    try:
+        user = db.query(User).filter(User.username == "rebalance_user").first()
+        for symbol, (asset_type, price) in PRICES.items():
+            instrument = MarketData(symbol=symbol, name=symbol, asset_type=asset_type, exchange="SSE")
+            db.add(instrument)
+            db.flush()
+            db.add(PriceHistory(market_data_id=instrument.id, date=datetime(2024, 6, 27), close_price=price * 0.9))
+            db.add(PriceHistory(market_data_id=instrument.id, date=datetime(2024, 6, 28), close_price=price))
+        assets = {code: Asset(code=code, name=code, asset_type="股票") for code in ["A", "B", "X", "现金理财"]}
+        db.add_all(assets.values())
+        
+        strategy = Strategy(name="模型组合", strategy_type=StrategyType.MULTI_FACTOR, asset_class=AssetClass.STOCK)
+        db.add(strategy)
+        portfolios = [Portfolio(name=f"客户组合{i}", risk_level=3, user_id=user.id) for i in range(3)]
+        db.add_all(portfolios)
+        db.flush()
+        
+        holdings = [
+            (portfolios[0], "A", 50.0), (portfolios[0], "X", 20.0), (portfolios[0], "现金理财", 10.0),
+            (portfolios[1], "A", 38.0), (portfolios[1], "B", 30.0),
+        ]
+        db.add_all([PortfolioAsset(portfolio_id=p.id, asset_id=assets[code].id, weight=w) for p, code, w in holdings])
+        # 同一组合的旧配置应被最新配置取代
+        db.add(PortfolioAllocation(strategy_id=strategy.id, portfolio_id=portfolios[0].id,
+                                   allocation_date=datetime(2024, 6, 1), target_weights={"A": 1.0}))
+        db.add_all([
+            PortfolioAllocation(strategy_id=strategy.id, portfolio_id=p.id,
+                                allocation_date=datetime(2024, 6, 28), target_weights=TARGET)
+            for p in portfolios
+        ])
+        db.commit()
+        return {"strategy": strategy.id, "portfolios": [p.id for p in portfolios], "user": user.id}
+    finally:
+        db.close()
+
+
+def test_rebalance_generates_lot_sized_orders(client, headers, setup):
+    """按目标权重生成调仓指令：容忍带内不交易、按手数取整、清仓卖出零股"""
+    p0, p1, p2 = setup["portfolios"]
+    resp = client.post("/strategy/rebalance", json={
+        "strategy_id": setup["strategy"],
+        "portfolio_values": {str(p0): 1_000_000, str(p1): 500_000},
+        "tolerance": 0.03,
+        "dry_run": True,
+    }, headers=headers)
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["unpriced_symbols"] == ["UNKNOWN"]
+    
+    orders = {(o["portfolio_id"], o["symbol"]): o for o in data["orders"]}
+    assert all(o["id"] is None for o in data["orders"])
+    assert orders[(p0, "A")]["side"] == "SELL" and orders[(p0, "A")]["quantity"] == 10000
+    assert orders[(p0, "X")]["side"] == "SELL" and orders[(p0, "X")]["quantity"] == 25000
+    assert orders[(p0, "B")]["quantity"] == 11800  # 300000 / 25.3 = 11857 股，向下取整到整手
+    assert orders[(p0, "E")]["quantity"] == 50000
+    # 组合1 的 A 偏离 2%，在容忍带内；B 已在目标权重
+    assert (p1, "A") not in orders and (p1, "B") not in orders
+    assert orders[(p1, "E")]["quantity"] == 25000
+    # 空组合按默认市值全部买入
+    assert orders[(p2, "A")]["amount"] == pytest.approx(400_000)
+    
+    summaries = {s["portfolio_id"]: s for s in data["portfolios"]}
+    assert summaries[p0]["breaches"] == 4
+    assert summaries[p1]["breaches"] == 1
+    # 未能映射到行情的持仓与无价格目标权重保留为现金之外的部分
+    assert summaries[p0]["cash_weight"] == pytest.approx(1 - 0.1 - 0.4 - 11800 * 25.3 / 1e6 - 0.2)
+    assert all(o["quantity"] % 100 == 0 or o["symbol"] == "X" for o in data["orders"])
+
+
+def test_turnover_cap_and_band(client, headers, setup):
+    """换手率上限等比缩减交易，调至容忍带边缘时交易量更小"""
+    base = {"strategy_id": setup["strategy"], "dry_run": True, "lot_sizes": {"A": 1, "B": 1, "E": 1}}
+    capped = client.post("/strategy/rebalance", json={**base, "max_turnover": 0.1}, headers=headers).json()
+    assert all(s["turnover"] <= 0.1 + 1e-9 for s in capped["portfolios"])
+    
+    full = client.post("/strategy/rebalance", json=base, headers=headers).json()
+    band = client.post("/strategy/rebalance", json={**base, "tolerance": 0.05, "trade_to": "band"}, headers=headers).json()
+    p2 = setup["portfolios"][2]
+    full_a = next(o for o in full["orders"] if o["portfolio_id"] == p2 and o["symbol"] == "A")
+    band_a = next(o for o in band["orders"] if o["portfolio_id"] == p2 and o["symbol"] == "A")
+    assert band_a["quantity"] == full_a["quantity"] - 5000
+
+
+def test_orders_persisted_and_replaced(client, headers, setup):
+    """保存指令后重跑替换未成交指令，不重复写入"""
+    payload = {"strategy_id": setup["strategy"], "tolerance": 0.03}
+    first = client.post("/strategy/rebalance", json=payload, headers=headers).json()
+    assert all(o["id"] is not None for o in first["orders"])
+    second = client.post("/strategy/rebalance", json=payload, headers=headers).json()
+    assert len(second["orders"]) == len(first["orders"])
+    
+    db = TestingSessionLocal()
+    try:
+        assert db.query(RebalanceOrder).count() == len(first["orders"])
+    finally:
+        db.close()
+    
+    resp = client.get("/strategy/rebalance/orders", params={"portfolio_id": setup["portfolios"][0]}, headers=headers)
+    assert {o["symbol"] for o in resp.json()} == {"A", "B", "E", "X"}
+    
+    resp = client.post("/strategy/rebalance", json={"strategy_id": 9999}, headers=headers)
+    assert resp.status_code == 404
+
+
+def test_non_admin_can_only_dry_run(client, setup):
+    """保存指令影响全部关联组合，非管理员只能试算"""
+    other = _login(client, "rebalance_client")
+    payload = {"strategy_id": setup["strategy"], "tolerance": 0.03}
+    assert client.post("/strategy/rebalance", json=payload, headers=other).status_code == 403
+    resp = client.post("/strategy/rebalance", json={**payload, "dry_run": True}, headers=other)
+    assert resp.status_code == 200 and resp.json()["orders"]
+
+
+def test_rejects_non_positive_values(client, headers, setup):
+    """组合市值与最小交易单位必须为正数"""
+    base = {"strategy_id": setup["strategy"], "dry_run": True}
+    p0 = setup["portfolios"][0]
+    for overrides in ({"portfolio_values": {str(p0): 0}}, {"portfolio_values": {str(p0): -1_000_000}},
+                      {"lot_sizes": {"A": 0}}, {"lot_sizes": {"A": -100}}):
+        resp = client.post("/strategy/rebalance", json={**base, **overrides}, headers=headers)
+        assert resp.status_code == 422
+
+
+def test_rebalance_many_portfolios(client, headers, setup):
+    """同一模型配置一次下发给大量客户组合"""
+    db = TestingSessionLocal()
+    try:
+        strategy = Strategy(name="批量模型组合", strategy_type=StrategyType.MULTI_FACTOR, asset_class=AssetClass.STOCK)
+        db.add(strategy)
+        db.flush()
+        ids = [row.id for row in db.execute(insert(Portfolio).returning(Portfolio.id), [
+            {"name": f"批量组合{i}", "risk_level": 3, "user_id": setup["user"]} for i in range(2000)
+        ])]
+        db.execute(insert(PortfolioAllocation), [
+            {"strategy_id": strategy.id, "portfolio_id": pid, "allocation_date": datetime(2024, 6, 28),
+             "target_weights": TARGET, "is_executed": False} for pid in ids
+        ])
+        db.commit()
+        strategy_id = strategy.id
+    finally:
+        db.close()
+    
+    resp = client.post("/strategy/rebalance", json={
+        "strategy_id": strategy_id, "default_portfolio_value": 200_000, "dry_run": True
+    }, headers=headers)
+    data = resp.json()
+    assert len(data["portfolios"]) == 2000
+    assert len(data["orders"]) == 2000 * 3
+    assert {o["quantity"] for o in data["orders"] if o["symbol"] == "B"} == {2300}
+
+
+def test_orders_removed_with_portfolio(client, headers, setup):
+    """删除组合时一并删除其调仓指令"""
+    p0 = setup["portfolios"][0]
+    db = TestingSessionLocal()
+    try:
+        assert db.query(RebalanceOrder).filter(RebalanceOrder.portfolio_id == p0).count() > 0
+    finally:
+        db.close()
+    
+    assert client.delete(f"/portfolios/{p0}", headers=headers).status_code == 200
+    db = TestingSessionLocal()
+    try:
+        assert db.query(RebalanceOrder).filter(RebalanceOrder.portfolio_id == p0).count() == 0
+        assert db.query(RebalanceOrder).count() > 0
+    finally:
+        db.close()
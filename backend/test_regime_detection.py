@@ -0,0 +1,156 @@
+"""
+隐马尔可夫市场状态识别测试
+测试指数历史拟合、市场状态写入以及逐日增量滤波
+"""
+import pytest
+import numpy as np
+from datetime import datetime, timedelta
+
+from conftest import sqlite_test_client
+from models.ai_models import MarketRegimeHMM
+from models.market_data import MarketIndex, IndexHistory
+from models.strategy import RegimeDetectionState
+
+# 使用独立的测试数据库
+engine, TestingSessionLocal, client = sqlite_test_client("test_regime_detection.db")
+
+START = datetime(2022, 1, 3)
+N_FIT = 400
+N_TOTAL = 430
+
+
+@pytest.fixture(scope="module")
+def headers(client):
+    client.post("/users/", json={
+        "username": "regime_hmm_user",
+        "email": "regime_hmm@test.com",
+        "password": "testpassword123"
+    })
+    resp = client.post("/auth/token", data={"username": "regime_hmm_user", "password": "testpassword123"})
+    assert resp.status_code == 200
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+def simulate_closes(n, seed=1):
+    """两状态马尔可夫切换：平稳上涨的低波动段与下跌的高波动段"""
+    rng = np.random.default_rng(seed)
+    transmat = np.array([[0.98, 0.02], [0.04, 0.96]])
+    mu, sigma = [0.001, -0.002], [0.007, 0.025]
+    state, returns = 0, []
+    for _ in range(n - 1):
+        state = rng.choice(2, p=transmat[state])
+        returns.append(rng.normal(mu[state], sigma[state]))
+    return 3000 * np.exp(np.r_[0.0, np.cumsum(returns)])
+
+
+@pytest.fixture(scope="module")
+def closes(client):
+    closes = simulate_closes(N_TOTAL)
+    db = TestingSessionLocal()
+    try:
+        index = MarketIndex(code="000300", name="沪深300")
+        db.add(index)
+        db.flush()
+        db.add_all([
+            IndexHistory(market_index_id=index.id, date=START + timedelta(days=t), close_value=float(closes[t]))
+            for t in range(N_FIT)
+        ])
+        db.commit()
+    finally:
+        db.close()
+    return closes
+
+
+def test_hmm_filter_step_matches_forward_pass():
+    """逐日滤波结果与整段前向算法一致"""
+    model = MarketRegimeHMM(n_states=2, vol_window=10)
+    X = model.features(simulate_closes(300, seed=11))
+    result = model.fit(X)
+    assert result["converged"]
+    np.testing.assert_allclose(result["transmat"].sum(axis=1), 1.0)
+    
+    alpha = result["filtered"][199]
+    for t in range(200, len(X)):
+        alpha = model.filter_step(alpha, X[t], result["transmat"], result["means"], result["variances"])
+    np.testing.assert_allclose(alpha, result["filtered"][-1], atol=1e-12)
+
+
+def test_detect_writes_regimes(client, headers, closes):
+    """拟合后按状态写入市场状态及转移概率"""
+    resp = client.post("/strategy/regimes/detect", json={
+        "index_code": "000300", "n_states": 2, "include_path": True
+    }, headers=headers)
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["n_states"] == 2
+    assert data["new_days"] == N_FIT - 20
+    assert len(data["path"]) == N_FIT - 20
+    
+    regimes = {r["regime_name"]: r for r in data["regimes"]}
+    assert set(regimes) == {"牛市", "熊市"}
+    assert regimes["牛市"]["volatility_regime"] == "低波动"
+    assert regimes["熊市"]["regime_indicators"]["method"] == "gaussian_hmm"
+    assert regimes["熊市"]["regime_indicators"]["mean_return"] < regimes["牛市"]["regime_indicators"]["mean_return"]
+    name_of = {str(r["id"]): r["regime_name"] for r in data["regimes"]}
+    for regime in data["regimes"]:
+        assert sum(regime["transition_probabilities"].values()) == pytest.approx(1.0)
+        assert {name_of[key]: prob for key, prob in regime["transition_probabilities"].items()} == \
+            data["transition_matrix"][regime["regime_name"]]
+    
+    current = regimes[data["current_regime"]]
+    assert current["end_date"] is None
+    assert current["start_date"] is not None
+    assert sum(data["current_probabilities"].values()) == pytest.approx(1.0)
+    
+    # 重新拟合时更新已有状态而不是重复创建
+    resp = client.post("/strategy/regimes/detect", json={"index_code": "000300", "n_states": 2}, headers=headers)
+    assert {r["id"] for r in resp.json()["regimes"]} == {r["id"] for r in data["regimes"]}
+    
+    listed = client.get("/strategy/regimes", headers=headers).json()
+    assert len(listed) == 2
+
+
+def test_incremental_update_matches_full_filter(client, headers, closes):
+    """新增交易日增量滤波与用同一参数整段滤波结果一致"""
+    db = TestingSessionLocal()
+    try:
+        index = db.query(MarketIndex).filter(MarketIndex.code == "000300").first()
+        db.add_all([
+            IndexHistory(market_index_id=index.id, date=START + timedelta(days=t), close_value=float(closes[t]))
+            for t in range(N_FIT, N_TOTAL)
+        ])
+        db.commit()
+    finally:
+        db.close()
+    
+    resp = client.post("/strategy/regimes/detect/000300/update", params={"include_path": True}, headers=headers)
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["new_days"] == N_TOTAL - N_FIT
+    assert data["last_date"].startswith((START + timedelta(days=N_TOTAL - 1)).date().isoformat())
+    
+    db = TestingSessionLocal()
+    try:
+        state = db.query(RegimeDetectionState).first()
+        params = {key: np.array(value) for key, value in state.parameters.items()}
+        model = MarketRegimeHMM(n_states=2, vol_window=20)
+        log_b = model.log_emission(model.features(closes), params["means"], params["variances"])
+        alpha, _, _, _ = model.forward_backward(log_b, params["startprob"], params["transmat"])
+        np.testing.assert_allclose(state.filtered_probabilities, alpha[-1], atol=1e-10)
+        names = [r["regime_name"] for r in data["regimes"]]
+        assert [p["regime_name"] for p in data["path"]] == [names[k] for k in alpha[-(N_TOTAL - N_FIT):].argmax(axis=1)]
+    finally:
+        db.close()
+    
+    # 没有新数据时不做处理
+    resp = client.post("/strategy/regimes/detect/000300/update", headers=headers)
+    assert resp.json()["new_days"] == 0
+
+
+def test_detect_errors(client, headers, closes):
+    resp = client.post("/strategy/regimes/detect", json={"index_code": "UNKNOWN"}, headers=headers)
+    assert resp.status_code == 404
+    resp = client.post("/strategy/regimes/detect", json={
+        "index_code": "000300", "end_date": (START + timedelta(days=30)).isoformat()
+    }, headers=headers)
+    assert resp.status_code == 400
@@ -0,0 +1,135 @@
+"""
+市场状态条件权重表测试
+测试各状态权重计算、转移概率混合、缓存复用以及多因子接口使用存储的市场状态
+"""
+import pytest
+import numpy as np
+
+from conftest import sqlite_test_client
+from models.ai_models import MultiFactorModel, RegimeWeightTable
+
+# 使用独立的测试数据库
+engine, TestingSessionLocal, client = sqlite_test_client("test_regime_weights.db")
+
+BASE_WEIGHTS = {"价值": 0.25, "成长": 0.25, "质量": 0.25, "动量": 0.25}
+
+
+@pytest.fixture(scope="module")
+def headers(client):
+    client.post("/users/", json={
+        "username": "regime_weight_user",
+        "email": "regime_weight@test.com",
+        "password": "testpassword123"
+    })
+    resp = client.post("/auth/token", data={"username": "regime_weight_user", "password": "testpassword123"})
+    assert resp.status_code == 200
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+def test_own_weights_sources():
+    """显式权重、均值-方差最优权重和内置规则"""
+    table = RegimeWeightTable(MultiFactorModel())
+    explicit = table.regime_weights({"regime_name": "自定义", "regime_indicators": {"factor_weights": {"价值": 0.75}}}, BASE_WEIGHTS)
+    assert explicit["价值"] == pytest.approx(0.75 / 1.5)
+    assert sum(explicit.values()) == pytest.approx(1.0)
+    
+    optimal = table.regime_weights({"regime_name": "自定义", "regime_indicators": {
+        "factor_expected_returns": {"价值": 0.04, "动量": 0.02, "成长": -0.01},
+        "factor_volatilities": {"价值": 0.2, "动量": 0.1, "成长": 0.1}
+    }}, BASE_WEIGHTS)
+    # 0.04/0.04=1 与 0.02/0.01=2，负收益因子不配置
+    assert optimal == pytest.approx({"价值": 1 / 3, "动量": 2 / 3, "成长": 0.0})
+    
+    legacy = table.regime_weights({"regime_name": "牛市状态"}, BASE_WEIGHTS)
+    assert legacy == pytest.approx(MultiFactorModel()._adjust_weights_by_regime(BASE_WEIGHTS, "牛市"))
+
+
+def test_blend_by_transition_probabilities():
+    """混合权重等于按转移概率加权的各状态权重，概率不足部分保持当前状态"""
+    model = MultiFactorModel()
+    table = RegimeWeightTable(model)
+    regimes = [
+        {"id": 1, "regime_name": "牛市", "regime_indicators": None,
+         "transition_probabilities": {"bull_to_bull": 0.5, "bull_to_bear": 0.2, "bull_to_sideways": 0.3}},
+        {"id": 2, "regime_name": "熊市", "regime_indicators": None,
+         "transition_probabilities": {"bear_to_bull": 0.4}},
+    ]
+    result = table.build(regimes, BASE_WEIGHTS)
+    factors = result["factors"]
+    
+    def vector(name):
+        weights = model._adjust_weights_by_regime(BASE_WEIGHTS, name)
+        return np.array([weights.get(f, 0.0) for f in factors])
+    
+    # 震荡市未存储，按内置规则作为虚拟状态参与混合
+    assert "震荡市" in result["states"]
+    expected_bull = 0.5 * vector("牛市") + 0.2 * vector("熊市") + 0.3 * vector("震荡市")
+    expected_bear = 0.4 * vector("牛市") + 0.6 * vector("熊市")
+    np.testing.assert_allclose(result["blended_weights"][0], expected_bull / expected_bull.sum())
+    np.testing.assert_allclose(result["blended_weights"][1], expected_bear / expected_bear.sum())
+
+
+def test_transitions_keyed_by_regime_id():
+    """不同指数的同名状态按ID区分转移目标"""
+    model = MultiFactorModel()
+    table = RegimeWeightTable(model)
+    regimes = [
+        {"id": 1, "regime_name": "牛市", "regime_indicators": None, "transition_probabilities": {"1": 0.9, "2": 0.1}},
+        {"id": 2, "regime_name": "熊市", "regime_indicators": None, "transition_probabilities": {"1": 0.1, "2": 0.9}},
+        {"id": 3, "regime_name": "牛市", "regime_indicators": {"factor_weights": {"价值": 1.0}},
+         "transition_probabilities": {"3": 0.8, "4": 0.2}},
+        {"id": 4, "regime_name": "熊市", "regime_indicators": {"factor_weights": {"动量": 1.0}},
+         "transition_probabilities": {"3": 0.3, "4": 0.7}},
+    ]
+    result = table.build(regimes, BASE_WEIGHTS)
+    np.testing.assert_allclose(result["transition_matrix"][2], [0, 0, 0.8, 0.2])
+    np.testing.assert_allclose(result["transition_matrix"][3], [0, 0, 0.3, 0.7])
+    np.testing.assert_allclose(result["transition_matrix"][0], [0.9, 0.1, 0, 0])
+
+
+def test_table_is_cached():
+    """状态内容不变时复用缓存，内容变化时重新计算"""
+    table = RegimeWeightTable(MultiFactorModel())
+    regimes = [{"id": 1, "regime_name": "牛市", "regime_indicators": None, "transition_probabilities": None}]
+    first = table.get_table(regimes, BASE_WEIGHTS)
+    assert table.get_table(regimes, BASE_WEIGHTS) is first
+    
+    changed = [dict(regimes[0], regime_indicators={"factor_weights": {"价值": 1.0}})]
+    assert table.get_table(changed, BASE_WEIGHTS) is not first
+    factors, vector = table.get_weight_vector(changed, 1, BASE_WEIGHTS)
+    assert vector[factors.index("价值")] == pytest.approx(1.0 / 1.75)
+
+
+def test_multi_factor_signal_with_stored_regime(client, headers):
+    """多因子接口使用存储的市场状态权重表"""
+    resp = client.post("/strategy/regimes", json={
+        "regime_name": "价值偏好",
+        "regime_indicators": {"factor_weights": {"价值": 1.0, "成长": 0.0, "质量": 0.0, "动量": 0.0}}
+    }, headers=headers)
+    assert resp.status_code == 201
+    regime_id = resp.json()["id"]
+    
+    payload = {
+        "stocks": [
+            {"symbol": "A", "name": "A", "factor_values": {"价值": 0.9, "成长": 0.1}},
+            {"symbol": "B", "name": "B", "factor_values": {"价值": 0.2, "成长": 0.9}},
+        ],
+        "factor_weights": BASE_WEIGHTS,
+        "market_regime_id": regime_id
+    }
+    resp = client.post("/strategy/multi_factor_signal", json=payload, headers=headers)
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["adjusted_weights"]["价值"] == pytest.approx(1.0)
+    assert data["stock_scores"][0]["symbol"] == "A"
+    assert data["stock_scores"][0]["total_score"] == pytest.approx(0.9)
+    assert "价值偏好" in data["reasoning"]
+    
+    resp = client.get("/strategy/multi_factor_regime_weights", headers=headers)
+    assert resp.status_code == 200
+    entry = next(r for r in resp.json()["regimes"] if r["regime_id"] == regime_id)
+    assert entry["blended_weights"]["价值"] == pytest.approx(1.0)
+    
+    payload["market_regime_id"] = 999999
+    resp = client.post("/strategy/multi_factor_signal", json=payload, headers=headers)
+    assert resp.status_code == 404
@@ -0,0 +1,151 @@
+"""
+因子风险模型测试
+测试因子收益回归、EWMA/Newey-West协方差、特异方差估计及版本化存储接口
+"""
+import pytest
+import numpy as np
+from datetime import datetime, timedelta
+
+from conftest import sqlite_test_client
+from models.ai_models import FactorRiskModel
+from routers.strategy import factor_model as factor_model_module
+
+# 使用独立的测试数据库
+engine, TestingSessionLocal, client = sqlite_test_client("test_risk_model.db")
+
+
+@pytest.fixture(scope="module")
+def headers(client):
+    client.post("/users/", json={
+        "username": "risk_model_user",
+        "email": "risk_model@test.com",
+        "password": "testpassword123"
+    })
+    resp = client.post("/auth/token", data={"username": "risk_model_user", "password": "testpassword123"})
+    assert resp.status_code == 200
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+def make_panel(n_dates=120, n_stocks=40, n_factors=3, noise=0.001, seed=7):
+    """构造已知因子收益的模拟截面数据"""
+    rng = np.random.default_rng(seed)
+    exposures = rng.normal(size=(n_dates, n_stocks, n_factors))
+    factor_returns = rng.normal(scale=0.01, size=(n_dates, n_factors))
+    returns = np.einsum("tnk,tk->tn", exposures, factor_returns) + rng.normal(scale=noise, size=(n_dates, n_stocks))
+    return exposures, returns, factor_returns
+
+
+def test_factor_returns_recovered():
+    """批量截面回归应恢复真实因子收益"""
+    exposures, returns, true_factor_returns = make_panel()
+    estimated, residuals = FactorRiskModel().estimate_factor_returns(exposures, returns)
+    assert estimated.shape == true_factor_returns.shape
+    assert np.allclose(estimated, true_factor_returns, atol=1e-3)
+    assert residuals.shape == returns.shape
+
+
+def test_missing_returns_are_ignored():
+    """缺失收益不参与回归，残差对应位置为NaN"""
+    exposures, returns, true_factor_returns = make_panel()
+    returns[0, :5] = np.nan
+    estimated, residuals = FactorRiskModel().estimate_factor_returns(exposures, returns)
+    assert np.isnan(residuals[0, :5]).all()
+    assert np.allclose(estimated[0], true_factor_returns[0], atol=1e-3)
+
+
+def test_covariance_and_specific_variance():
+    """协方差矩阵对称半正定，特异方差与噪声水平一致"""
+    exposures, returns, _ = make_panel(noise=0.02)
+    result = FactorRiskModel(half_life=60, newey_west_lags=2).build(exposures, returns)
+    covariance = result["factor_covariance"]
+    assert covariance.shape == (3, 3)
+    assert np.allclose(covariance, covariance.T)
+    assert np.linalg.eigvalsh(covariance).min() > -1e-12
+    assert result["specific_variance"].shape == (40,)
+    assert np.all(result["specific_variance"] > 0)
+    assert np.median(result["specific_variance"]) == pytest.approx(0.02 ** 2, rel=0.5)
+
+
+def test_build_and_version_risk_model(client, headers):
+    """通过接口估计风险模型，每次估计生成新版本"""
+    resp = client.post("/strategy/factors", json={
+        "name": "风险模型测试",
+        "factors": ["market", "size", "value"],
+        "factor_weights": {"market": 0.4, "size": 0.3, "value": 0.3},
+        "model_parameters": {"half_life": 30}
+    }, headers=headers)
+    assert resp.status_code == 201
+    factor_model_id = resp.json()["id"]
+
+    exposures, returns, _ = make_panel(n_dates=20, n_stocks=10)
+    start = datetime(2024, 1, 1)
+    payload = {
+        "dates": [(start + timedelta(days=i)).isoformat() for i in range(20)],
+        "symbols": [f"{i:06d}.SZ" for i in range(10)],
+        "exposures": exposures.tolist(),
+        "returns": returns.tolist()
+    }
+    resp = client.post(f"/strategy/factors/{factor_model_id}/risk_models", json=payload, headers=headers)
+    assert resp.status_code == 201
+    data = resp.json()
+    assert data["version"] == 1
+    assert data["parameters"]["half_life"] == 30
+    assert len(data["factor_covariance"]) == 3
+    assert len(data["specific_variance"]) == 10
+
+    resp = client.post(f"/strategy/factors/{factor_model_id}/risk_models", json=payload, headers=headers)
+    assert resp.json()["version"] == 2
+
+    resp = client.get(f"/strategy/factors/{factor_model_id}/risk_models", headers=headers)
+    assert [v["version"] for v in resp.json()] == [2, 1]
+    resp = client.get(f"/strategy/factors/{factor_model_id}/risk_models/latest", headers=headers)
+    assert resp.json()["version"] == 2
+    resp = client.get(f"/strategy/factors/{factor_model_id}/risk_models/1", headers=headers)
+    assert resp.status_code == 200
+
+    # 维度不一致应返回400
+    payload["exposures"] = exposures[:, :, :2].tolist()
+    resp = client.post(f"/strategy/factors/{factor_model_id}/risk_models", json=payload, headers=headers)
+    assert resp.status_code == 400
+
+
+def test_build_validates_and_orders_dates(client, headers, monkeypatch):
+    """参差不齐与重复日期返回400；乱序日期按日期排序后估计；版本号冲突时重试"""
+    resp = client.post("/strategy/factors", json={
+        "name": "风险模型日期测试", "factors": ["market", "size", "value"],
+        "factor_weights": {"market": 0.4, "size": 0.3, "value": 0.3}
+    }, headers=headers)
+    factor_model_id = resp.json()["id"]
+    url = f"/strategy/factors/{factor_model_id}/risk_models"
+
+    exposures, returns, _ = make_panel(n_dates=20, n_stocks=10)
+    start = datetime(2024, 1, 1)
+    dates = [(start + timedelta(days=i)).isoformat() for i in range(20)]
+    payload = {"dates": dates, "symbols": [f"{i:06d}.SZ" for i in range(10)],
+               "exposures": exposures.tolist(), "returns": returns.tolist(), "half_life": 5}
+
+    ragged = exposures.tolist()
+    ragged[3][2] = ragged[3][2][:2]
+    assert client.post(url, json={**payload, "exposures": ragged}, headers=headers).status_code == 400
+    ragged = returns.tolist()
+    ragged[4] = ragged[4][:9]
+    assert client.post(url, json={**payload, "returns": ragged}, headers=headers).status_code == 400
+    assert client.post(url, json={**payload, "dates": dates[:19] + dates[18:19]}, headers=headers).status_code == 400
+
+    ordered = client.post(url, json=payload, headers=headers).json()
+    order = np.random.default_rng(0).permutation(20)
+    shuffled = client.post(url, json={
+        **payload, "dates": [dates[i] for i in order],
+        "exposures": exposures[order].tolist(), "returns": returns[order].tolist()
+    }, headers=headers).json()
+    assert shuffled["version"] == ordered["version"] + 1
+    assert np.allclose(shuffled["factor_returns"], ordered["factor_returns"])
+    assert np.allclose(shuffled["factor_covariance"], ordered["factor_covariance"])
+
+    # 第一次取到已被占用的版本号，唯一约束冲突后按新的最大版本号重试
+    next_version = factor_model_module._next_version
+    stale = iter([1])
+    monkeypatch.setattr(factor_model_module, "_next_version",
+                        lambda db, fid: next(stale, None) or next_version(db, fid))
+    resp = client.post(url, json=payload, headers=headers)
+    assert resp.status_code == 201 and resp.json()["version"] == 3
@@ -0,0 +1,133 @@
+"""
+基于行情聚合的行业轮动测试
+测试行业聚合、批量配置与逐次计算一致，以及增量生成信号接口
+"""
+import pytest
+import numpy as np
+from datetime import datetime, timedelta
+
+from conftest import sqlite_test_client
+from models.ai_models import SectorRotationModel
+from models.market_data import MarketData, PriceHistory, AssetType
+from models.strategy import SectorRotationSignal
+
+# 使用独立的测试数据库
+engine, TestingSessionLocal, client = sqlite_test_client("test_sector_rotation_batch.db")
+
+INDUSTRIES = ["科技", "消费", "金融", "医药", "能源"]
+N_DATES, N_STOCKS = 50, 20
+START = datetime(2024, 1, 1)
+
+
+@pytest.fixture(scope="module")
+def headers(client):
+    client.post("/users/", json={
+        "username": "rotation_batch_user",
+        "email": "rotation_batch@test.com",
+        "password": "testpassword123"
+    })
+    resp = client.post("/auth/token", data={"username": "rotation_batch_user", "password": "testpassword123"})
+    assert resp.status_code == 200
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+def make_prices(seed=0):
+    rng = np.random.default_rng(seed)
+    drift = np.linspace(-0.004, 0.004, len(INDUSTRIES))
+    industries = [INDUSTRIES[i % len(INDUSTRIES)] for i in range(N_STOCKS)]
+    returns = rng.normal(0, 0.015, (N_DATES, N_STOCKS)) + drift[[INDUSTRIES.index(ind) for ind in industries]]
+    closes = 10 * np.cumprod(1 + returns, axis=0)
+    turnover = rng.uniform(1e6, 1e8, (N_DATES, N_STOCKS))
+    caps = rng.uniform(1e9, 1e11, N_STOCKS)
+    return closes, turnover, caps, industries
+
+
+@pytest.fixture(scope="module")
+def seeded(client):
+    closes, turnover, caps, industries = make_prices()
+    db = TestingSessionLocal()
+    try:
+        stocks = [MarketData(symbol=f"S{i:03d}", name=f"股票{i}", asset_type=AssetType.STOCK, exchange="SSE",
+                             industry=industries[i], market_cap=float(caps[i])) for i in range(N_STOCKS)]
+        db.add_all(stocks)
+        db.flush()
+        db.add_all([
+            PriceHistory(market_data_id=stocks[i].id, date=START + timedelta(days=t),
+                         close_price=float(closes[t, i]), turnover=float(turnover[t, i]))
+            for t in range(N_DATES) for i in range(N_STOCKS)
+        ])
+        db.commit()
+    finally:
+        db.close()
+    return closes, turnover, caps, industries
+
+
+def test_aggregate_industries_cap_weighted():
+    """行业收益为前一日市值加权的个股收益"""
+    closes = np.array([[10.0, 20.0, 5.0], [11.0, 19.0, 5.5], [11.0, 19.0, np.nan]])
+    panel = SectorRotationModel.aggregate_industries(closes, ["A", "A", "B"], np.array([100.0, 300.0, 50.0]))
+    # 市值按最后收盘价回推：第一日A的两只股票市值为100/11*10与300/19*20
+    w = np.array([100.0 / 11 * 10, 300.0 / 19 * 20])
+    expected = (w @ np.array([0.1, -0.05])) / w.sum()
+    assert panel["industries"] == ["A", "B"]
+    assert panel["index_returns"][1, 0] == pytest.approx(expected)
+    assert panel["advancers"][1].tolist() == [1.0, 1.0]
+    assert panel["constituents"][2].tolist() == [2.0, 0.0]
+    assert np.isnan(panel["index_returns"][2, 1])
+
+
+def test_allocate_batch_matches_scalar():
+    """批量配置与逐日调用generate_industry_allocation一致"""
+    model = SectorRotationModel()
+    closes, turnover, caps, industries = make_prices(seed=3)
+    panel = model.aggregate_industries(closes, industries, caps, turnover)
+    signals = model.compute_rotation_scores(panel, lookback=10, flow_window=5)
+    allocations, confidence = model.allocate_batch(signals["scores"], signals["fund_flow"])
+    
+    rows = np.flatnonzero(np.isfinite(signals["scores"]).any(axis=1))
+    assert rows[0] == 10
+    for t in rows:
+        scores = dict(zip(panel["industries"], signals["scores"][t]))
+        flows = dict(zip(panel["industries"], signals["fund_flow"][t]))
+        allocation, _, conf = model.generate_industry_allocation(scores, flows)
+        np.testing.assert_allclose(allocations[t], [allocation[name] for name in panel["industries"]])
+        assert confidence[t] == pytest.approx(conf)
+
+
+def test_batch_endpoint_incremental(client, headers, seeded):
+    """首次生成到指定日期，再次调用只为新日期生成信号，结果与全量计算一致"""
+    cutoff = START + timedelta(days=34)
+    resp = client.post("/strategy/sector_rotation_signal/batch", json={
+        "lookback": 10, "flow_window": 5, "end_date": cutoff.isoformat()
+    }, headers=headers)
+    assert resp.status_code == 200
+    first = resp.json()
+    assert first["industries"] == sorted(INDUSTRIES)
+    assert len(first["dates"]) == 35 - 10
+    assert len(first["signal_ids"]) == len(first["dates"])
+    
+    resp = client.post("/strategy/sector_rotation_signal/batch", json={"lookback": 10, "flow_window": 5}, headers=headers)
+    second = resp.json()
+    assert len(second["dates"]) == N_DATES - 35
+    assert second["dates"][0].startswith((cutoff + timedelta(days=1)).date().isoformat())
+    
+    # 不持久化的全量计算
+    resp = client.post("/strategy/sector_rotation_signal/batch", json={
+        "lookback": 10, "flow_window": 5, "incremental": False, "persist": False
+    }, headers=headers)
+    full = resp.json()
+    assert full["signal_ids"] is None
+    np.testing.assert_allclose(full["allocations"], first["allocations"] + second["allocations"])
+    np.testing.assert_allclose(full["scores"], first["scores"] + second["scores"])
+    
+    # 全部日期已生成，再次增量调用没有新信号
+    resp = client.post("/strategy/sector_rotation_signal/batch", json={"lookback": 10, "flow_window": 5}, headers=headers)
+    assert resp.json()["dates"] == []
+    
+    db = TestingSessionLocal()
+    try:
+        saved = db.query(SectorRotationSignal).filter(SectorRotationSignal.signal_source == "price_history").all()
+        assert len(saved) == N_DATES - 10
+        assert abs(sum(saved[-1].recommended_industry_allocation.values()) - 1.0) < 1e-9
+    finally:
+        db.close()
@@ -0,0 +1,191 @@
+"""
+客户分群测试
+测试画像特征标准化与小批量K均值、全量分群、画像变更后的增量归类及按客群批量优化配置
+"""
+import pytest
+import numpy as np
+from sqlalchemy import insert
+from datetime import datetime, timedelta
+
+from conftest import sqlite_test_client
+from models.user import User
+from models.user_profile import UserProfile, UserSegment, ProfileSegment
+from models.portfolio import Portfolio
+from models.market_data import MarketData, PriceHistory, AssetType
+from models.strategy import Strategy, StrategyType, AssetClass, PortfolioAllocation
+from models.ai_models import ProfileSegmenter
+
+# 使用独立的测试数据库
+engine, TestingSessionLocal, client = sqlite_test_client("test_segmentation.db")
+
+SYMBOLS = [f"S{i}" for i in range(5)]
+# 三类客户各10人：(风险承受评分, 年收入, 投资期限, 损失厌恶, 目标收益, 最大回撤容忍度)
+GROUPS = [
+    (2.0, 80000, "1年", 8.0, 0.03, 0.05),
+    (5.0, 300000, "3-5年", 5.0, 0.06, 0.15),
+    (9.0, 2000000, "长期", 2.0, 0.12, 0.35),
+]
+
+
+def _login(client, username, is_admin=False):
+    client.post("/users/", json={
+        "username": username,
+        "email": f"{username}@test.com",
+        "password": "testpassword123"
+    })
+    db = TestingSessionLocal()
+    try:
+        db.query(User).filter(User.username == username).update({"is_admin": is_admin})
+        db.commit()
+    finally:
+        db.close()
+    resp = client.post("/auth/token", data={"username": username, "password": "testpassword123"})
+    assert resp.status_code == 200
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def headers(client):
+    return _login(client, "segment_user", is_admin=True)
+
+
+@pytest.fixture(scope="module")
+def setup(client, headers):
+    rng = np.random.default_rng(5)
+    db = TestingSessionLocal()
+    try:
+        user_ids = [row.id for row in db.execute(insert(User).returning(User.id), [
+            {"username": f"segment_client{i}", "email": f"segment_client{i}@test.com", "password_hash": "x"}
+            for i in range(31)
+        ])]
+        db.execute(insert(UserProfile), [
+            {"user_id": user_id, "risk_tolerance_score": tolerance + rng.normal(0, 0.2),
+             "annual_income": income * rng.uniform(0.9, 1.1), "investment_horizon": horizon,
+             "loss_aversion_score": aversion + rng.normal(0, 0.2), "target_return": target,
+             "max_drawdown_tolerance": drawdown}
+            for user_id, (tolerance, income, horizon, aversion, target, drawdown)
+            in zip(user_ids[:30], [group for group in GROUPS for _ in range(10)])
+        ])
+        db.execute(insert(Portfolio), [
+            {"name": f"客户组合{i}", "risk_level": 3, "user_id": user_id} for i, user_id in enumerate(user_ids)
+        ])
+
+        returns = rng.normal(0.0005, 0.01, (120, len(SYMBOLS))) * np.linspace(0.5, 2.0, len(SYMBOLS))
+        closes = 10 * np.cumprod(1 + returns, axis=0)
+        for j, symbol in enumerate(SYMBOLS):
+            instrument = MarketData(symbol=symbol, name=symbol, asset_type=AssetType.STOCK, exchange="SSE")
+            db.add(instrument)
+            db.flush()
+            db.add_all([
+                PriceHistory(market_data_id=instrument.id, date=datetime(2024, 1, 1) + timedelta(days=t),
+                             close_price=float(closes[t, j]))
+                for t in range(len(closes))
+            ])
+        strategy = Strategy(name="客群配置", strategy_type=StrategyType.CUSTOM, asset_class=AssetClass.STOCK)
+        db.add(strategy)
+        db.commit()
+        return {"user_ids": user_ids, "strategy": strategy.id}
+    finally:
+        db.close()
+
+
+def _segment_of(user_id):
+    db = TestingSessionLocal()
+    try:
+        return db.query(ProfileSegment).join(UserSegment, UserSegment.segment_id == ProfileSegment.id).filter(
+            UserSegment.user_id == user_id
+        ).one()
+    finally:
+        db.close()
+
+
+def test_segmenter_recovers_separated_clusters():
+    """标准化后小批量K均值可分开明显分离的客群，缺失特征按均值处理"""
+    assert ProfileSegmenter.horizon_years("3-5年") == 4.0
+    assert ProfileSegmenter.horizon_years("6个月") == 0.5
+    assert ProfileSegmenter.horizon_years("长期") == 7.0
+    assert np.isnan(ProfileSegmenter.horizon_years("不确定"))
+
+    rng = np.random.default_rng(0)
+    truth = np.repeat(np.arange(3), 200)
+    points = np.array([[0, 0], [10, 0], [0, 10]])[truth] + rng.normal(0, 0.5, (600, 2))
+    points[0, 1] = np.nan
+    standardized, means, scales = ProfileSegmenter.standardize(points)
+    assert standardized[0, 1] == 0.0 and np.isfinite(standardized).all()
+    fitted = ProfileSegmenter(n_clusters=3, batch_size=64, seed=1).fit(standardized)
+    # 同一真实客群的样本全部分到同一簇
+    assert len(set(zip(truth, fitted["labels"]))) == 3
+    assert fitted["inertia"] < 0.1 * ((standardized - standardized.mean(axis=0)) ** 2).sum()
+
+
+def test_refresh_requires_admin(client, setup):
+    """刷新客户分群需要管理员登录"""
+    payload = {"n_clusters": 3, "seed": 1}
+    assert client.post("/user-profile/segments/refresh", json=payload).status_code == 401
+    other_headers = _login(client, "segment_other")
+    assert client.post("/user-profile/segments/refresh", json=payload, headers=other_headers).status_code == 403
+
+
+def test_full_segmentation(client, headers, setup):
+    """首次刷新全量分群，客群按风险承受评分编号并记录约束中位数"""
+    assert client.get("/user-profile/segments").status_code == 404
+    resp = client.post("/user-profile/segments/refresh", json={"n_clusters": 3, "seed": 1}, headers=headers)
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["refitted"] and body["users"] == 30 and body["assigned"] == 30 and body["segments"] == 3
+
+    segmentation = client.get("/user-profile/segments").json()
+    segments = segmentation["segments"]
+    assert [segment["size"] for segment in segments] == [10, 10, 10]
+    assert [segment["risk_level"] for segment in segments] == [1, 3, 5]
+    assert [segment["name"] for segment in segments] == ["保守型客群1", "平衡型客群1", "激进型客群1"]
+    assert [segment["target_return"] for segment in segments] == pytest.approx([0.03, 0.06, 0.12])
+    assert segments[1]["center"]["investment_horizon"] == pytest.approx(4.0)
+    assert _segment_of(setup["user_ids"][0]).label == 0
+
+
+def test_incremental_refresh_assigns_changed_profiles(client, headers, setup):
+    """只归类新增或更新过的画像，不重新分群"""
+    user_ids = setup["user_ids"]
+    resp = client.put(f"/user-profile/{user_ids[0]}", json={"risk_tolerance_score": 9.0, "annual_income": 2000000,
+                                                             "investment_horizon": "长期", "loss_aversion_score": 2.0})
+    assert resp.status_code == 200
+    resp = client.post("/user-profile/", json={"user_id": user_ids[30], "risk_tolerance_score": 5.0,
+                                               "annual_income": 300000, "investment_horizon": "4年"})
+    assert resp.status_code == 201
+
+    segmentation_id = client.get("/user-profile/segments").json()["id"]
+    resp = client.post("/user-profile/segments/refresh", json={}, headers=headers)
+    body = resp.json()
+    assert not body["refitted"] and body["segmentation_id"] == segmentation_id
+    assert body["users"] == 31 and body["assigned"] == 2
+    assert _segment_of(user_ids[0]).label == 2 and _segment_of(user_ids[30]).label == 1
+
+    segmentation = client.get("/user-profile/segments").json()
+    assert [segment["size"] for segment in segmentation["segments"]] == [9, 11, 11]
+    assert segmentation["incremental_updates"] == 2
+    assert client.post("/user-profile/segments/refresh", json={}, headers=headers).json()["assigned"] == 0
+
+    # 显式要求时全量重新分群
+    resp = client.post("/user-profile/segments/refresh", json={"refit": True, "seed": 2}, headers=headers)
+    assert resp.json()["refitted"] and resp.json()["segmentation_id"] != segmentation_id
+
+
+def test_batch_optimization_by_segment(client, headers, setup):
+    """按客群配置时每个客群只求解一次，配置原因注明客群"""
+    payload = {"strategy_id": setup["strategy"], "symbols": SYMBOLS, "max_weight": 0.6}
+    per_profile = client.post("/strategy/optimize/batch", json={**payload, "persist": False}, headers=headers).json()
+    resp = client.post("/strategy/optimize/batch", json={**payload, "by_segment": True}, headers=headers)
+    assert resp.status_code == 200, resp.text
+    body = resp.json()
+    # 登录用户没有画像与组合，31个客户组合全部按客群配置
+    assert body["segmented_portfolios"] == 31
+    assert body["signatures"] <= 3 < per_profile["signatures"]
+    assert body["allocations_written"] == 31
+
+    db = TestingSessionLocal()
+    try:
+        reasons = {reason for (reason,) in db.query(PortfolioAllocation.rebalance_reason).all()}
+    finally:
+        db.close()
+    assert {reason.split("：")[0] for reason in reasons} == {"保守型客群1", "平衡型客群1", "激进型客群1"}
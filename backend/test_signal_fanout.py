@@ -0,0 +1,183 @@
+"""
+策略信号批量展开测试
+测试宏观择时、行业轮动、多因子输出展开为逐标的策略信号
+"""
+import pytest
+from sqlalchemy import event
+from datetime import datetime
+
+from conftest import sqlite_test_client
+from models.market_data import MarketData, AssetType
+from models.strategy import (
+    Strategy, StrategyType, AssetClass, StrategySignal,
+    MacroTimingSignal, SectorRotationSignal, MultiFactorScore
+)
+
+# 使用独立的测试数据库
+engine, TestingSessionLocal, client = sqlite_test_client("test_signal_fanout.db")
+
+N_STOCKS = 2000
+SIGNAL_DATE = datetime(2024, 6, 28)
+
+
+@pytest.fixture(scope="module")
+def headers(client):
+    client.post("/users/", json={
+        "username": "fanout_user",
+        "email": "fanout@test.com",
+        "password": "testpassword123"
+    })
+    resp = client.post("/auth/token", data={"username": "fanout_user", "password": "testpassword123"})
+    assert resp.status_code == 200
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def sources(client):
+    db = TestingSessionLocal()
+    try:
+        strategy = Strategy(name="信号展开策略", strategy_type=StrategyType.MULTI_FACTOR, asset_class=AssetClass.STOCK)
+        db.add(strategy)
+        db.add_all([
+            MarketData(symbol=f"S{i:04d}", name=f"股票{i}", asset_type=AssetType.STOCK, exchange="SSE",
+                       industry=["银行", "半导体", "白酒"][i % 3], market_cap=float(i + 1))
+            for i in range(N_STOCKS)
+        ] + [
+            MarketData(symbol="510300", name="沪深300ETF", asset_type=AssetType.ETF, exchange="SSE"),
+            MarketData(symbol="511010", name="国债ETF", asset_type=AssetType.ETF, exchange="SSE"),
+        ])
+        db.flush()
+        
+        stock_scores = [{
+            "symbol": f"S{i:04d}", "name": None, "total_score": 1.0 - i / N_STOCKS,
+            "factor_contribution": {"value": 0.5 - i / N_STOCKS}
+        } for i in range(N_STOCKS)]
+        stock_scores.insert(3, {"symbol": "NOPE", "name": None, "total_score": 0.999, "factor_contribution": {}})
+        score = MultiFactorScore(
+            strategy_id=strategy.id, storage_mode="compact", scores_blob=MultiFactorScore.pack_scores(stock_scores),
+            stock_count=len(stock_scores), adjusted_weights={"value": 1.0}, signal_date=SIGNAL_DATE
+        )
+        sector = SectorRotationSignal(
+            strategy_id=strategy.id, industry_scores={"银行": 0.2, "半导体": 0.9, "白酒": 0.5},
+            recommended_industry_allocation={"银行": 0.0, "半导体": 0.6, "白酒": 0.4},
+            confidence_score=0.7, signal_date=SIGNAL_DATE
+        )
+        macro = MacroTimingSignal(
+            economic_cycle="复苏", market_sentiment="乐观",
+            recommended_allocation={"STOCK": 0.65, "BOND": 0.2, "CASH": 0.15},
+            confidence_score=0.8, signal_date=SIGNAL_DATE
+        )
+        db.add_all([score, sector, macro])
+        db.commit()
+        return {"strategy": strategy.id, "score": score.id, "sector": sector.id, "macro": macro.id}
+    finally:
+        db.close()
+
+
+def test_multi_factor_fanout_single_lookup(client, headers, sources):
+    """多因子展开：一次市场数据查询、一次批量写入，并回写 derived_signal_id"""
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        resp = client.post("/strategy/signals/fanout", json={
+            "source_type": "multi_factor", "source_ids": [sources["score"]],
+            "top_n": 1500, "bottom_n": 300, "weighting": "score"
+        }, headers=headers)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert resp.status_code == 201
+    data = resp.json()
+    assert data["created"] == 1799
+    assert data["unknown_symbols"] == ["NOPE"]
+    assert sum("FROM market_data" in s for s in statements) == 1
+    assert sum(s.startswith("INSERT INTO strategy_signals") for s in statements) <= 2
+    
+    db = TestingSessionLocal()
+    try:
+        score = db.get(MultiFactorScore, sources["score"])
+        derived = db.get(StrategySignal, score.derived_signal_id)
+        assert derived.factors["rank"] == 1
+        assert derived.market_data.symbol == "S0000"
+        signals = db.query(StrategySignal).filter(StrategySignal.strategy_id == sources["strategy"]).all()
+        buys = [s for s in signals if s.signal_type.value == "BUY"]
+        sells = [s for s in signals if s.signal_type.value == "SELL"]
+        assert len(buys) == 1499 and len(sells) == 300
+        # 按评分加权，权重随排名递减；未知代码 NOPE 的权重不再分配
+        buys.sort(key=lambda s: s.factors["rank"])
+        assert all(a.target_weight > b.target_weight for a, b in zip(buys, buys[1:]))
+        assert 0.99 < sum(s.target_weight for s in buys) < 1.0
+        assert all(s.target_weight == 0 for s in sells)
+    finally:
+        db.close()
+    
+    # 重复展开需要显式替换
+    resp = client.post("/strategy/signals/fanout", json={
+        "source_type": "multi_factor", "source_ids": [sources["score"]], "top_n": 10
+    }, headers=headers)
+    assert resp.status_code == 409
+    resp = client.post("/strategy/signals/fanout", json={
+        "source_type": "multi_factor", "source_ids": [sources["score"]], "top_n": 10, "replace": True
+    }, headers=headers)
+    assert resp.status_code == 201
+    assert resp.json()["replaced"] == 1799
+    assert resp.json()["created"] == 9
+
+
+def test_sector_rotation_fanout(client, headers, sources):
+    """行业轮动展开：行业权重按成分股市值拆分"""
+    resp = client.post("/strategy/signals/fanout", json={
+        "source_type": "sector_rotation", "source_ids": [sources["sector"]], "per_industry": 5
+    }, headers=headers)
+    assert resp.status_code == 201
+    data = resp.json()
+    assert data["created"] == 15
+    
+    db = TestingSessionLocal()
+    try:
+        signals = db.query(StrategySignal).filter(
+            StrategySignal.id.in_([r["derived_signal_id"] for r in data["sources"]])
+        ).all()
+        assert signals[0].factors["industry"] == "半导体"
+        semis = [s for s in db.query(StrategySignal).all()
+                 if s.factors.get("source") == "sector_rotation" and s.factors["industry"] == "半导体"]
+        assert sum(s.target_weight for s in semis) == pytest.approx(0.6)
+        banks = [s for s in db.query(StrategySignal).all()
+                 if s.factors.get("source") == "sector_rotation" and s.factors["industry"] == "银行"]
+        assert {s.signal_type.value for s in banks} == {"SELL"}
+    finally:
+        db.close()
+
+
+def test_macro_timing_fanout(client, headers, sources):
+    """宏观择时展开：需指定策略与资产类别映射"""
+    body = {"source_type": "macro_timing", "source_ids": [sources["macro"]]}
+    resp = client.post("/strategy/signals/fanout", json=body, headers=headers)
+    assert resp.status_code == 400
+    
+    body["strategy_id"] = sources["strategy"]
+    resp = client.post("/strategy/signals/fanout", json=body, headers=headers)
+    assert resp.status_code == 400
+    
+    body["instrument_map"] = {"STOCK": ["510300"], "BOND": ["511010"]}
+    resp = client.post("/strategy/signals/fanout", json=body, headers=headers)
+    assert resp.status_code == 201
+    assert resp.json()["created"] == 2
+    
+    signal_id = resp.json()["sources"][0]["derived_signal_id"]
+    signal = client.get(f"/strategy/signals/{signal_id}", headers=headers).json()
+    assert signal["target_weight"] == pytest.approx(0.65)
+    assert signal["confidence_score"] == pytest.approx(0.8)
+
+
+def test_fanout_missing_source(client, headers, sources):
+    resp = client.post("/strategy/signals/fanout", json={
+        "source_type": "multi_factor", "source_ids": [99999]
+    }, headers=headers)
+    assert resp.status_code == 404
+
+
+def test_multi_factor_intents_without_scores():
+    """没有逐股评分时不生成信号意图"""
+    for score in (MultiFactorScore(id=1, stock_scores=[]), MultiFactorScore(id=2, storage_mode="compact")):
+        assert score.signal_intents(strategy_id=1, top_n=10, bottom_n=5) == []
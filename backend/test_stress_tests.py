@@ -0,0 +1,217 @@
+"""
+压力测试测试
+测试内置历史情景重放、Beta传导的因子冲击、标的指定冲击及全量组合测试结果的保存与查询
+"""
+import numpy as np
+import pytest
+from datetime import datetime, timedelta
+
+from conftest import sqlite_test_client
+from models.user import User
+from models.portfolio import Asset
+from models.market_data import MarketData, PriceHistory, MarketIndex, IndexHistory, AssetType
+from models.risk import StressTestResult
+
+# 使用独立的测试数据库
+engine, TestingSessionLocal, client = sqlite_test_client("test_stress_tests.db")
+
+# 近期行情用于估计Beta：各标的日收益为沪深300日收益的固定倍数
+RECENT = [datetime(2024, 1, 1) + timedelta(days=i) for i in range(80)]
+BETAS = {"HIBETA": 1.5, "LOWBETA": 0.5, "OLDSTOCK": 1.0}
+# 2015年情景区间：沪深300下跌40%，OLDSTOCK 当时已上市，实际下跌50%
+INDEX_2015 = {datetime(2015, 6, 10): 100.0, datetime(2015, 6, 11): 100.0,
+              datetime(2015, 7, 15): 70.0, datetime(2015, 8, 26): 60.0}
+OLDSTOCK_2015 = {datetime(2015, 6, 11): 10.0, datetime(2015, 7, 15): 6.0, datetime(2015, 8, 26): 5.0}
+
+
+def _login(client, username, is_admin=False):
+    client.post("/users/", json={
+        "username": username,
+        "email": f"{username}@test.com",
+        "password": "testpassword123"
+    })
+    db = TestingSessionLocal()
+    try:
+        db.query(User).filter(User.username == username).update({"is_admin": is_admin})
+        db.commit()
+    finally:
+        db.close()
+    resp = client.post("/auth/token", data={"username": username, "password": "testpassword123"})
+    assert resp.status_code == 200
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def headers(client):
+    return _login(client, "stress_user", is_admin=True)
+
+
+@pytest.fixture(scope="module")
+def setup(client, headers):
+    rng = np.random.default_rng(3)
+    market_returns = rng.normal(0, 0.01, len(RECENT) - 1)
+    db = TestingSessionLocal()
+    try:
+        index = MarketIndex(code="000300", name="沪深300")
+        db.add(index)
+        db.flush()
+        index_closes = 3000 * np.cumprod(np.concatenate([[1.0], 1 + market_returns]))
+        db.add_all([IndexHistory(market_index_id=index.id, date=day, close_value=close) for day, close in INDEX_2015.items()])
+        db.add_all([IndexHistory(market_index_id=index.id, date=day, close_value=float(close))
+                    for day, close in zip(RECENT, index_closes)])
+        asset_ids = {}
+        for symbol, beta in BETAS.items():
+            instrument = MarketData(symbol=symbol, name=symbol, asset_type=AssetType.STOCK, exchange="SSE")
+            db.add(instrument)
+            db.flush()
+            closes = 10 * np.cumprod(np.concatenate([[1.0], 1 + beta * market_returns]))
+            db.add_all([PriceHistory(market_data_id=instrument.id, date=day, close_price=float(close))
+                        for day, close in zip(RECENT, closes)])
+            if symbol == "OLDSTOCK":
+                db.add_all([PriceHistory(market_data_id=instrument.id, date=day, close_price=close)
+                            for day, close in OLDSTOCK_2015.items()])
+        for code in list(BETAS) + ["现金理财"]:
+            asset = Asset(code=code, name=code, asset_type="股票")
+            db.add(asset)
+            db.flush()
+            asset_ids[code] = asset.id
+        db.commit()
+    finally:
+        db.close()
+
+    def portfolio(name, holdings):
+        resp = client.post("/portfolios/", json={
+            "name": name, "risk_level": 3,
+            "assets": [{"asset_id": asset_ids[code], "weight": weight} for code, weight in holdings.items()]
+        }, headers=headers)
+        assert resp.status_code == 201
+        return resp.json()["id"]
+
+    return {
+        "growth": portfolio("进取组合", {"HIBETA": 60, "现金理财": 40}),
+        "balanced": portfolio("平衡组合", {"OLDSTOCK": 50, "LOWBETA": 50}),
+    }
+
+
+def test_builtin_scenarios_are_seeded(client, headers):
+    """首次查询时补齐内置历史情景，内置情景不可删除"""
+    resp = client.get("/stress-tests/scenarios", headers=headers)
+    assert resp.status_code == 200
+    scenarios = resp.json()
+    assert len(scenarios) == 5 and all(s["is_builtin"] and s["index_code"] == "000300" for s in scenarios)
+    assert len(client.get("/stress-tests/scenarios", headers=headers).json()) == 5
+    assert client.delete(f"/stress-tests/scenarios/{scenarios[0]['id']}", headers=headers).status_code == 400
+
+
+def test_create_scenario_validation(client, headers, setup):
+    """自定义情景引用的指数必须存在，历史情景需要有效区间"""
+    resp = client.post("/stress-tests/scenarios", json={
+        "name": "中证500下跌", "factor_shocks": {"000905": -0.3}
+    }, headers=headers)
+    assert resp.status_code == 404
+    resp = client.post("/stress-tests/scenarios", json={
+        "name": "倒序区间", "scenario_type": "historical", "index_code": "000300",
+        "start_date": "2020-03-01T00:00:00", "end_date": "2020-01-01T00:00:00"
+    }, headers=headers)
+    assert resp.status_code == 400
+    resp = client.post("/stress-tests/scenarios", json={"name": "空情景"}, headers=headers)
+    assert resp.status_code == 400
+    resp = client.post("/stress-tests/scenarios", json={
+        "name": "过度冲击", "factor_shocks": {"000300": -1.5}
+    }, headers=headers)
+    assert resp.status_code == 422
+
+
+def test_historical_replay_and_factor_shocks(client, headers, setup):
+    """历史情景优先使用标的区间实际收益，否则按Beta传导指数区间收益；指定冲击优先于其他来源"""
+    scenarios = {s["name"]: s["id"] for s in client.get("/stress-tests/scenarios", headers=headers).json()}
+    resp = client.post("/stress-tests/scenarios", json={
+        "name": "沪深300下跌20%", "factor_shocks": {"000300": -0.2}, "symbol_shocks": {"LOWBETA": 0.05}
+    }, headers=headers)
+    assert resp.status_code == 201
+    factor_id = resp.json()["id"]
+
+    resp = client.post("/stress-tests/runs", json={"run_date": "2024-07-01T00:00:00"}, headers=headers)
+    assert resp.status_code == 200
+    summaries = {s["scenario_id"]: s for s in resp.json()["scenarios"]}
+    replay = summaries[scenarios["2015年股市异常波动"]]
+    assert replay["status"] == "completed" and replay["index_return"] == pytest.approx(-0.4)
+    # 其他内置情景区间没有指数行情
+    assert summaries[scenarios["2008年全球金融危机"]]["status"] == "skipped"
+    assert summaries[factor_id]["portfolios"] == 2
+
+    results = client.get("/stress-tests/results", params={"scenario_id": scenarios["2015年股市异常波动"]},
+                         headers=headers).json()
+    by_portfolio = {r["portfolio_id"]: r for r in results}
+    growth, balanced = by_portfolio[setup["growth"]], by_portfolio[setup["balanced"]]
+    # 现金理财没有行情，不计入覆盖率
+    assert growth["portfolio_return"] == pytest.approx(0.6 * 1.5 * -0.4, abs=1e-6)
+    assert growth["coverage"] == pytest.approx(0.6)
+    assert balanced["portfolio_return"] == pytest.approx(0.5 * -0.5 + 0.5 * 0.5 * -0.4, abs=1e-6)
+    assert balanced["worst_symbol"] == "OLDSTOCK" and balanced["worst_contribution"] == pytest.approx(-0.25)
+    assert [r["portfolio_return"] for r in results] == sorted(r["portfolio_return"] for r in results)
+
+    results = client.get("/stress-tests/results", params={"scenario_id": factor_id}, headers=headers).json()
+    by_portfolio = {r["portfolio_id"]: r for r in results}
+    assert by_portfolio[setup["growth"]]["portfolio_return"] == pytest.approx(0.6 * 1.5 * -0.2, abs=1e-6)
+    assert by_portfolio[setup["balanced"]]["portfolio_return"] == pytest.approx(0.5 * -0.2 + 0.5 * 0.05, abs=1e-6)
+
+
+def test_rerun_replaces_results(client, headers, setup):
+    """同一测试日重复运行覆盖已有结果，删除自定义情景时一并删除其结果"""
+    scenario = client.post("/stress-tests/scenarios", json={
+        "name": "HIBETA 腰斩", "symbol_shocks": {"HIBETA": -0.5}
+    }, headers=headers).json()
+    for _ in range(2):
+        resp = client.post("/stress-tests/runs", json={
+            "run_date": "2024-07-01T00:00:00", "scenario_ids": [scenario["id"]]
+        }, headers=headers)
+        assert resp.status_code == 200
+    db = TestingSessionLocal()
+    try:
+        assert db.query(StressTestResult).filter(StressTestResult.scenario_id == scenario["id"]).count() == 2
+    finally:
+        db.close()
+    results = client.get("/stress-tests/results", params={"portfolio_id": setup["growth"], "scenario_id": scenario["id"]},
+                         headers=headers).json()
+    assert results[0]["portfolio_return"] == pytest.approx(-0.3) and results[0]["coverage"] == pytest.approx(0.6)
+
+    assert client.delete(f"/stress-tests/scenarios/{scenario['id']}", headers=headers).status_code == 200
+    db = TestingSessionLocal()
+    try:
+        assert db.query(StressTestResult).filter(StressTestResult.scenario_id == scenario["id"]).count() == 0
+    finally:
+        db.close()
+    resp = client.post("/stress-tests/runs", json={"scenario_ids": [scenario["id"]]}, headers=headers)
+    assert resp.status_code == 404
+
+
+def test_non_admin_access(client, headers, setup):
+    """非管理员不可执行全量测试、不可删除他人情景，结果只包含自己的组合"""
+    other = _login(client, "stress_client")
+    scenario = client.post("/stress-tests/scenarios", json={
+        "name": "LOWBETA 下跌", "symbol_shocks": {"LOWBETA": -0.2}
+    }, headers=headers).json()
+    assert client.post("/stress-tests/runs", json={"run_date": "2024-07-01T00:00:00"}, headers=other).status_code == 403
+    assert client.delete(f"/stress-tests/scenarios/{scenario['id']}", headers=other).status_code == 403
+    assert client.get("/stress-tests/results", headers=other).json() == []
+    assert client.get("/stress-tests/results", headers=headers).json()
+
+    own = client.post("/stress-tests/scenarios", json={
+        "name": "自建情景", "symbol_shocks": {"HIBETA": -0.1}
+    }, headers=other).json()
+    assert client.delete(f"/stress-tests/scenarios/{own['id']}", headers=other).status_code == 200
+    assert client.delete(f"/stress-tests/scenarios/{scenario['id']}", headers=headers).status_code == 200
+
+
+def test_results_removed_with_portfolio(client, headers, setup):
+    """删除组合时一并删除其压力测试结果"""
+    resp = client.post("/stress-tests/runs", json={"run_date": "2024-07-01T00:00:00"}, headers=headers)
+    assert resp.status_code == 200
+    assert client.delete(f"/portfolios/{setup['growth']}", headers=headers).status_code == 200
+    db = TestingSessionLocal()
+    try:
+        assert db.query(StressTestResult).filter(StressTestResult.portfolio_id == setup["growth"]).count() == 0
+        assert db.query(StressTestResult).filter(StressTestResult.portfolio_id == setup["balanced"]).count() > 0
+    finally:
+        db.close()
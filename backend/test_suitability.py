@@ -0,0 +1,180 @@
+"""
+组合适当性检查测试
+测试组合实际风险与持有人画像（风险承受评分、回撤容忍度、流动性需求）的批量比对及合规报告
+"""
+import numpy as np
+import pytest
+from sqlalchemy import insert
+from datetime import datetime, timedelta
+
+from conftest import sqlite_test_client
+from models.user import User
+from models.user_profile import UserProfile
+from models.portfolio import Portfolio, Asset, PortfolioAsset
+from models.market_data import MarketData, PriceHistory, AssetType
+from models.risk import SuitabilityCheck
+
+# 使用独立的测试数据库
+engine, TestingSessionLocal, client = sqlite_test_client("test_suitability.db")
+
+# (用户名, 画像, 组合风险等级, 持仓)；画像为 (风险承受评分, 回撤容忍度, 流动性需求)
+BOOK = [
+    ("over_level", (4, None, None), 4, {"LOW": 100}),
+    ("aggressive", (10, 0.3, "低"), 5, {"LOW": 100}),
+    ("illiquid", (8, 5, "高"), 3, {"HIGH": 50, "私募基金": 50}),
+    ("no_profile_risky", None, 1, {"HIGH": 100}),
+    ("no_profile_safe", None, 2, {"LOW": 80}),
+]
+
+
+def _login(client, username, is_admin=False):
+    client.post("/users/", json={
+        "username": username,
+        "email": f"{username}@test.com",
+        "password": "testpassword123"
+    })
+    db = TestingSessionLocal()
+    try:
+        db.query(User).filter(User.username == username).update({"is_admin": is_admin})
+        db.commit()
+    finally:
+        db.close()
+    resp = client.post("/auth/token", data={"username": username, "password": "testpassword123"})
+    assert resp.status_code == 200
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def headers(client):
+    return _login(client, "compliance_user", is_admin=True)
+
+
+@pytest.fixture(scope="module")
+def book(headers):
+    """高波动（日波动2%）与低波动（日波动0.2%）两只标的，以及一只没有行情的私募基金"""
+    rng = np.random.default_rng(7)
+    days = [datetime(2024, 1, 1) + timedelta(days=i) for i in range(201)]
+    db = TestingSessionLocal()
+    try:
+        for symbol, daily_vol in [("HIGH", 0.02), ("LOW", 0.002)]:
+            instrument = MarketData(symbol=symbol, name=symbol, asset_type=AssetType.STOCK, exchange="SSE")
+            db.add(instrument)
+            db.flush()
+            closes = 10 * np.cumprod(np.concatenate([[1.0], 1 + rng.normal(0, daily_vol, 200)]))
+            db.execute(insert(PriceHistory), [
+                {"market_data_id": instrument.id, "date": day, "close_price": float(close)} for day, close in zip(days, closes)
+            ])
+        assets = {code: Asset(code=code, name=code, asset_type="股票") for code in ["HIGH", "LOW", "私募基金"]}
+        db.add_all(assets.values())
+        
+        portfolio_ids = {}
+        for username, profile, risk_level, holdings in BOOK:
+            user = User(username=username, email=f"{username}@test.com", password_hash="x")
+            db.add(user)
+            db.flush()
+            if profile is not None:
+                score, drawdown, liquidity = profile
+                db.add(UserProfile(user_id=user.id, risk_tolerance_score=score,
+                                   max_drawdown_tolerance=drawdown, liquidity_needs=liquidity))
+            portfolio = Portfolio(name=username, risk_level=risk_level, user_id=user.id)
+            db.add(portfolio)
+            db.flush()
+            db.add_all([PortfolioAsset(portfolio_id=portfolio.id, asset_id=assets[code].id, weight=weight)
+                        for code, weight in holdings.items()])
+            portfolio_ids[username] = portfolio.id
+        # 停用的组合不检查
+        inactive = Portfolio(name="inactive", risk_level=5, user_id=user.id, is_active=False)
+        db.add(inactive)
+        db.commit()
+        return portfolio_ids
+    finally:
+        db.close()
+
+
+def test_suitability_checks_flag_breaches(client, headers, book):
+    """逐项比对组合实际风险与持有人画像"""
+    resp = client.post("/suitability/checks", json={"run_date": "2024-07-20T08:00:00"}, headers=headers)
+    assert resp.status_code == 200
+    assert resp.json() == {
+        "run_date": "2024-07-20T00:00:00", "portfolios": 5, "passed": 1, "breached": 3, "unassessed": 1
+    }
+    
+    report = client.get("/suitability/report", headers=headers).json()
+    checks = {check["portfolio_id"]: check for check in report["checks"]}
+    # 风险承受评分4只允许风险等级2
+    over_level = checks[book["over_level"]]
+    assert over_level["allowed_risk_level"] == 2 and over_level["breaches"] == ["risk_level"]
+    assert checks[book["aggressive"]]["status"] == "pass"
+    # 回撤容忍度按百分数录入（5即5%），高流动性需求下私募基金权重超限
+    illiquid = checks[book["illiquid"]]
+    assert illiquid["drawdown_tolerance"] == pytest.approx(0.05)
+    assert illiquid["illiquid_weight"] == pytest.approx(0.5)
+    assert illiquid["breaches"] == ["drawdown", "liquidity"]
+    # 没有画像时仍按组合自身风险等级检查波动率
+    risky = checks[book["no_profile_risky"]]
+    assert risky["status"] == "breach" and risky["breaches"] == ["volatility"]
+    assert risky["volatility"] == pytest.approx(0.02 * np.sqrt(252), rel=0.2)
+    assert checks[book["no_profile_safe"]]["status"] == "unassessed"
+
+
+def test_suitability_report_summary_and_filters(client, headers, book):
+    """报告汇总各状态与越限项数量，支持按状态与越限项过滤明细"""
+    report = client.get("/suitability/report", params={"status": "breach"}, headers=headers).json()
+    assert report["portfolios"] == 5
+    assert report["status_counts"] == {"pass": 1, "breach": 3, "unassessed": 1}
+    assert report["breach_counts"] == {"risk_level": 1, "drawdown": 1, "liquidity": 1, "volatility": 1}
+    assert len(report["checks"]) == 3
+    
+    liquidity = client.get("/suitability/report", params={"breach": "liquidity"}, headers=headers).json()
+    assert [check["portfolio_id"] for check in liquidity["checks"]] == [book["illiquid"]]
+    
+    resp = client.get("/suitability/report", params={"run_date": "2024-01-01T00:00:00"}, headers=headers)
+    assert resp.status_code == 404
+
+
+def test_suitability_rerun_replaces_results(client, headers, book):
+    """同一检查日重跑覆盖原结果，画像更新后越限项随之变化"""
+    db = TestingSessionLocal()
+    try:
+        owner = db.query(Portfolio.user_id).filter(Portfolio.id == book["over_level"]).scalar()
+        db.query(UserProfile).filter(UserProfile.user_id == owner).update({"risk_tolerance_score": 8})
+        db.commit()
+    finally:
+        db.close()
+    
+    resp = client.post("/suitability/checks", json={"run_date": "2024-07-20T00:00:00"}, headers=headers)
+    assert resp.json()["passed"] == 2 and resp.json()["breached"] == 2
+    db = TestingSessionLocal()
+    try:
+        assert db.query(SuitabilityCheck).count() == 5
+    finally:
+        db.close()
+
+
+def test_non_admin_limited_to_own_portfolios(client, book):
+    """非管理员不可执行检查，报告只包含自己的组合"""
+    client_headers = _login(client, "suitability_client")
+    db = TestingSessionLocal()
+    try:
+        user_id = db.query(User.id).filter(User.username == "suitability_client").scalar()
+        db.query(Portfolio).filter(Portfolio.id == book["over_level"]).update({"user_id": user_id})
+        db.commit()
+    finally:
+        db.close()
+    
+    assert client.post("/suitability/checks", json={}, headers=client_headers).status_code == 403
+    report = client.get("/suitability/report", headers=client_headers).json()
+    assert report["portfolios"] == 1
+    assert [check["portfolio_id"] for check in report["checks"]] == [book["over_level"]]
+
+
+def test_checks_removed_with_portfolio(client, book):
+    """删除组合时一并删除其适当性检查结果"""
+    client_headers = _login(client, "suitability_client")
+    assert client.delete(f"/portfolios/{book['over_level']}", headers=client_headers).status_code == 200
+    db = TestingSessionLocal()
+    try:
+        assert db.query(SuitabilityCheck).filter(SuitabilityCheck.portfolio_id == book["over_level"]).count() == 0
+        assert db.query(SuitabilityCheck).count() == 4
+    finally:
+        db.close()
@@ -141,4 +141,22 @@ def get_current_active_user(current_user: User = Depends(get_current_user)):
     """
     if not bool(current_user.is_active):
         raise HTTPException(status_code=400, detail="用户已被禁用")
-    return current_user
\ No newline at end of file
+    return current_user
+
+
+def get_current_admin_user(current_user: User = Depends(get_current_active_user)):
+    """
+    获取当前管理员用户的依赖函数
+    
+    Args:
+        current_user: 当前活跃用户对象
+        
+    Returns:
+        User: 当前管理员用户对象
+        
+    Raises:
+        HTTPException: 如果用户不是管理员
+    """
+    if not bool(current_user.is_admin):
+        raise HTTPException(status_code=403, detail="需要管理员权限")
+    return current_user
@@ -0,0 +1,61 @@
+"""
+进程内定时任务模块
+在后台线程中每天固定时间执行一次任务
+"""
+import logging
+import threading
+from datetime import datetime, time, timedelta
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class DailyScheduler:
+    """
+    每日定时任务调度器
+    
+    在守护线程中等待到每天的 run_time 执行 job(当前时间)；默认跳过周末。
+    任务异常只记录日志，不影响后续调度。
+    """
+    
+    def __init__(self, run_time: str, job: Callable[[datetime], None], weekdays_only: bool = True):
+        hour, minute = (int(part) for part in run_time.split(":"))
+        self.run_time = time(hour, minute)
+        self.job = job
+        self.weekdays_only = weekdays_only
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def next_run(self, now: datetime) -> datetime:
+        """计算 now 之后的下一次运行时间"""
+        candidate = datetime.combine(now.date(), self.run_time)
+        if candidate <= now:
+            candidate += timedelta(days=1)
+        while self.weekdays_only and candidate.weekday() >= 5:
+            candidate += timedelta(days=1)
+        return candidate
+    
+    def start(self):
+        """启动后台线程（重复调用无副作用）"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="daily-scheduler", daemon=True)
+        self._thread.start()
+    
+    def stop(self, timeout: Optional[float] = None):
+        """停止调度，正在执行的任务会运行完毕"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+    
+    def _loop(self):
+        while not self._stop.is_set():
+            scheduled = self.next_run(datetime.now())
+            logger.info("下一次每日任务时间: %s", scheduled)
+            if self._stop.wait(max((scheduled - datetime.now()).total_seconds(), 0)):
+                break
+            try:
+                self.job(scheduled)
+            except Exception:
+                logger.exception("每日任务执行失败")